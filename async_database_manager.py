@@ -0,0 +1,243 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable
+
+from connection_pool import ConnectionPool
+from database_manager import DatabaseManager, UserSleepState
+
+# Получение экземпляра логгера
+logger = logging.getLogger(f'my_app.{__name__}')
+
+
+class AsyncDatabaseManager:
+    """
+    Асинхронный фасад над DatabaseManager для ботов, работающих в цикле событий asyncio.
+
+    Методы повторяют методы DatabaseManager (start_sleep_session, get_sleep_statistic и т.д.), но являются
+    корутинами: запрос выполняется в отдельном ограниченном пуле потоков (max_workers потоков), а цикл событий
+    в это время обслуживает другие чаты. Каждый поток пула работает со своим постоянным соединением
+    из ConnectionPool, поэтому тысячи одновременных чатов обслуживаются несколькими потоками и соединениями.
+
+    Ограничение нагрузки: одновременно принимается не больше max_pending запросов (выполняемых и ожидающих
+    свободного потока). Следующий запрос ждет освобождения места; если задан submit_timeout и место
+    не освободилось за это время, выбрасывается TimeoutError. Так очередь не растет без ограничений,
+    когда БД не успевает за входящими обновлениями.
+
+    Отмена: если корутину отменили до того, как запрос начал выполняться, запрос не выполняется.
+    Уже начатый запрос всегда выполняется в потоке до конца, поэтому транзакция (`with conn:`) фиксируется
+    или откатывается целиком, а соединение возвращается в пул; место в очереди освобождается
+    только после завершения запроса.
+
+    Если готовый менеджер не передан, создается DatabaseManager из manager_kwargs (db_name,
+    write_behind_interval и т.д.) с собственным пулом соединений; он закрывается вместе с фасадом.
+    Экземпляр привязывается к циклу событий, в котором был выполнен первый запрос.
+
+    Attributes:
+        manager (DatabaseManager): Синхронный менеджер, методы которого выполняются в пуле потоков.
+        max_workers (int): Количество потоков (и постоянных соединений) для запросов.
+        max_pending (int): Максимальное количество одновременно принятых запросов.
+        submit_timeout (float | None): Максимальное время ожидания места в очереди (None - ждать без ограничения).
+        rejected (int): Количество запросов, отклоненных из-за переполнения очереди.
+    """
+    def __init__(self, manager: DatabaseManager | None = None, max_workers: int = 4, max_pending: int = 1000,
+                 submit_timeout: float | None = None, **manager_kwargs):
+        if max_workers < 1 or max_pending < 1:
+            raise ValueError('max_workers и max_pending должны быть больше нуля.')
+        self._owns_manager: bool = manager is None
+        if manager is None:
+            # Соединения потоков запросов, потока отложенной записи и потока, создавшего менеджер
+            manager_kwargs.setdefault('pool', ConnectionPool(max_connections=max_workers + 2))
+            manager = DatabaseManager(**manager_kwargs)
+        self.manager: DatabaseManager = manager
+        self.max_workers: int = max_workers
+        self.max_pending: int = max_pending
+        self.submit_timeout: float | None = submit_timeout
+        self.rejected: int = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='async-db')
+        self._slots: asyncio.Semaphore | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._pending: int = 0
+        self._closed: bool = False
+
+    async def __aenter__(self) -> 'AsyncDatabaseManager':
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
+
+    @property
+    def pending(self) -> int:
+        """Количество принятых, но еще не завершенных запросов."""
+        return self._pending
+
+    def stats(self) -> dict[str, int]:
+        """
+        Возвращает счетчики очереди запросов.
+        :return: dict[str, int]: Количество незавершенных запросов, предел очереди и количество отклоненных запросов.
+        """
+        return {'pending': self._pending, 'max_pending': self.max_pending, 'rejected': self.rejected}
+
+    async def close(self):
+        """
+        Перестает принимать запросы, дожидается завершения принятых и закрывает собственный менеджер
+        (записывает отложенные изменения и закрывает соединения). Переданный снаружи менеджер не закрывается.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        # Ожидание потоков и закрытие соединений блокируют, поэтому выполняются вне цикла событий
+        await asyncio.to_thread(self._executor.shutdown, True)
+        if self._owns_manager:
+            await asyncio.to_thread(self.manager.close)
+        logger.info('Асинхронный менеджер базы данных закрыт.')
+
+    async def _run(self, method: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Выполняет метод синхронного менеджера в пуле потоков с учетом ограничения очереди.
+        :param method: Callable[..., Any]: Метод DatabaseManager.
+        :return: Any: Результат метода.
+        """
+        if self._closed:
+            raise RuntimeError('Асинхронный менеджер базы данных закрыт.')
+        slots = self._get_slots()
+        if self.submit_timeout is None:
+            await slots.acquire()
+        elif not await self._acquire_slot(slots):
+            self.rejected += 1
+            logger.warning(f'Очередь запросов к БД переполнена ({self.max_pending}), запрос отклонен.')
+            raise TimeoutError('Очередь запросов к базе данных переполнена.')
+        self._pending += 1
+        try:
+            future = self._executor.submit(method, *args, **kwargs)
+        except RuntimeError:
+            self._finish(slots)
+            raise
+        # Место освобождается по завершении запроса в потоке, а не при отмене ожидающей корутины
+        loop = self._loop
+        future.add_done_callback(lambda _: self._call_in_loop(loop, self._finish, slots))
+        # Отмена корутины отменяет только еще не начатый запрос
+        return await asyncio.wrap_future(future)
+
+    async def _acquire_slot(self, slots: asyncio.Semaphore) -> bool:
+        """
+        Занимает место в очереди, ожидая не дольше submit_timeout.
+        asyncio.wait_for(slots.acquire(), ...) в Python 3.10/3.11 теряет место, если захват завершился
+        одновременно с истечением времени: семафор уменьшен, а вызывающий получает TimeoutError. Поэтому захват
+        выполняется отдельной задачей, а место, занятое уже после отказа (или отмены), возвращается в семафор.
+        :param slots: asyncio.Semaphore: Семафор очереди.
+        :return: bool: True, если место занято, False, если истекло время ожидания.
+        """
+        acquire = asyncio.ensure_future(slots.acquire())
+        try:
+            await asyncio.wait({acquire}, timeout=self.submit_timeout)
+        except BaseException:
+            self._abandon_slot(acquire, slots)
+            raise
+        if acquire.done() and not acquire.cancelled():
+            return True
+        self._abandon_slot(acquire, slots)
+        return False
+
+    @staticmethod
+    def _abandon_slot(acquire: asyncio.Future, slots: asyncio.Semaphore):
+        """Отменяет ненужный захват места; если захват все же завершился, место освобождается."""
+        def release_if_acquired(task: asyncio.Future):
+            if not task.cancelled() and task.exception() is None:
+                slots.release()
+        acquire.cancel()
+        acquire.add_done_callback(release_if_acquired)
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        """Возвращает семафор очереди, создавая его в текущем цикле событий при первом запросе."""
+        loop = asyncio.get_running_loop()
+        if self._slots is None:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.max_pending)
+        elif loop is not self._loop:
+            raise RuntimeError('Асинхронный менеджер базы данных используется в другом цикле событий.')
+        return self._slots
+
+    def _finish(self, slots: asyncio.Semaphore):
+        """Отмечает завершение запроса и освобождает место в очереди. Вызывается в цикле событий."""
+        self._pending -= 1
+        slots.release()
+
+    @staticmethod
+    def _call_in_loop(loop: asyncio.AbstractEventLoop, callback: Callable, *args):
+        """Передает вызов в цикл событий из потока пула; если цикл уже закрыт, вызов не нужен."""
+        try:
+            loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            pass
+
+    def sleep_day(self, moment: datetime) -> datetime.date:
+        """
+        Возвращает "сутки сна" для момента времени (без обращения к БД, поэтому не корутина).
+        :param moment: datetime: Момент времени (например, время пробуждения).
+        :return: datetime.date: Дата суток сна.
+        """
+        return self.manager.sleep_day(moment)
+
+    async def add_user(self, user_id: int, user_name: str):
+        """Асинхронная версия DatabaseManager.add_user()."""
+        await self._run(self.manager.add_user, user_id, user_name)
+
+    async def get_user_by_id(self, user_id: int) -> tuple[int, str] | None:
+        """Асинхронная версия DatabaseManager.get_user_by_id()."""
+        return await self._run(self.manager.get_user_by_id, user_id)
+
+    async def start_sleep_session(self, user_id: int, sleep_time: datetime) -> int | None:
+        """Асинхронная версия DatabaseManager.start_sleep_session()."""
+        return await self._run(self.manager.start_sleep_session, user_id, sleep_time)
+
+    async def end_sleep_session(self, sleep_record_id: int, wake_time: datetime):
+        """Асинхронная версия DatabaseManager.end_sleep_session()."""
+        await self._run(self.manager.end_sleep_session, sleep_record_id, wake_time)
+
+    async def finish_latest_sleep_session(
+            self, user_id: int, wake_time: datetime
+    ) -> tuple[int, datetime, datetime] | tuple[None, None, None]:
+        """Асинхронная версия DatabaseManager.finish_latest_sleep_session()."""
+        return await self._run(self.manager.finish_latest_sleep_session, user_id, wake_time)
+
+    async def rebuild_sleep_statistics(self, user_id: int | None = None) -> bool:
+        """Асинхронная версия DatabaseManager.rebuild_sleep_statistics()."""
+        return await self._run(self.manager.rebuild_sleep_statistics, user_id)
+
+    async def update_sleep_quality(self, sleep_record_id: int, quality: int):
+        """Асинхронная версия DatabaseManager.update_sleep_quality()."""
+        await self._run(self.manager.update_sleep_quality, sleep_record_id, quality)
+
+    async def add_note(self, sleep_record_id: int, note_text: str):
+        """Асинхронная версия DatabaseManager.add_note()."""
+        await self._run(self.manager.add_note, sleep_record_id, note_text)
+
+    async def get_latest_unfinished_sleep_session(self, user_id: int) -> tuple[int, datetime] | tuple[None, None]:
+        """Асинхронная версия DatabaseManager.get_latest_unfinished_sleep_session()."""
+        return await self._run(self.manager.get_latest_unfinished_sleep_session, user_id)
+
+    async def get_latest_finished_sleep_session_without_quality(
+            self, user_id: int, date: datetime.date = None
+    ) -> tuple[int, datetime, datetime] | tuple[None, None, None]:
+        """Асинхронная версия DatabaseManager.get_latest_finished_sleep_session_without_quality()."""
+        return await self._run(self.manager.get_latest_finished_sleep_session_without_quality, user_id, date)
+
+    async def get_latest_finished_sleep_session_with_quality(
+            self, user_id: int, date: datetime.date = None
+    ) -> tuple[int, datetime, datetime] | None:
+        """Асинхронная версия DatabaseManager.get_latest_finished_sleep_session_with_quality()."""
+        return await self._run(self.manager.get_latest_finished_sleep_session_with_quality, user_id, date)
+
+    async def get_user_state(self, user_id: int, date: datetime.date = None) -> UserSleepState:
+        """Асинхронная версия DatabaseManager.get_user_state()."""
+        return await self._run(self.manager.get_user_state, user_id, date)
+
+    async def get_note_by_sleep_record_id(self, sleep_record_id: int) -> str | None:
+        """Асинхронная версия DatabaseManager.get_note_by_sleep_record_id()."""
+        return await self._run(self.manager.get_note_by_sleep_record_id, sleep_record_id)
+
+    async def get_sleep_statistic(self, user_id: int) -> tuple[int, int, float]:
+        """Асинхронная версия DatabaseManager.get_sleep_statistic()."""
+        return await self._run(self.manager.get_sleep_statistic, user_id)
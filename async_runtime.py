@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from telebot import TeleBot, asyncio_helper, types
+from telebot.async_telebot import AsyncTeleBot
+
+# Получение экземпляра логгера
+logger = logging.getLogger(f'my_app.{__name__}')
+
+# Вызов метода Bot API, записанный обработчиком: имя метода, позиционные и именованные аргументы
+RecordedCall = tuple[str, tuple, dict]
+
+
+class AsyncBotBridge:
+    """
+    Запускает синхронные обработчики бота (handle_sleep, handle_wake, handle_quality_callback и т.д.)
+    на асинхронном клиенте AsyncTeleBot без переписывания их на async.
+
+    Мост подменяет объект bot, который используют обработчики. Обработчик выполняется в ограниченном пуле
+    потоков (max_workers) - там остаются только запросы к SQLite. Вызовы bot.send_message(),
+    bot.edit_message_text(), bot.answer_callback_query() и т.д. не выполняют сетевых запросов, а записываются.
+    После завершения обработчика записанные вызовы выполняются в цикле событий через AsyncTeleBot
+    в том же порядке, поэтому поток не простаивает в ожидании ответа Telegram.
+
+    Все запросы к Bot API идут через одну общую сессию aiohttp модуля telebot.asyncio_helper,
+    размер пула ее соединений равен max_concurrency. Одновременно обрабатывается не больше
+    max_concurrency обновлений, остальные ждут своей очереди.
+
+    bot.register_next_step_handler() поддерживается мостом: следующее сообщение из чата передается
+    зарегистрированной функции раньше остальных обработчиков, как в синхронном TeleBot.
+
+    Attributes:
+        async_bot (AsyncTeleBot): Асинхронный клиент, выполняющий запросы к Bot API.
+        max_concurrency (int): Максимальное количество одновременно обрабатываемых обновлений.
+        max_workers (int): Количество потоков для синхронных обработчиков.
+        failed_calls (int): Количество вызовов Bot API, завершившихся ошибкой.
+    """
+    def __init__(self, async_bot: AsyncTeleBot, max_concurrency: int = 64, max_workers: int = 8):
+        if max_concurrency < 1 or max_workers < 1:
+            raise ValueError('max_concurrency и max_workers должны быть больше нуля.')
+        self.async_bot: AsyncTeleBot = async_bot
+        self.max_concurrency: int = max_concurrency
+        self.max_workers: int = max_workers
+        self.failed_calls: int = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bot-handler')
+        # Записанные вызовы Bot API текущего обработчика (у каждого потока свой список)
+        self._local = threading.local()
+        self._slots: asyncio.Semaphore | None = None
+        # ID чата -> (функция следующего шага, позиционные и именованные аргументы)
+        self._next_steps: dict[int, tuple[Callable, tuple, dict]] = {}
+        self._next_steps_lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Callable[..., None]:
+        """
+        Возвращает функцию, записывающую вызов метода Bot API (send_message, reply_to и т.д.).
+        :param name: str: Имя метода AsyncTeleBot.
+        :return: Callable[..., None]: Функция, сохраняющая вызов до завершения обработчика.
+        """
+        async_bot = self.__dict__.get('async_bot')
+        if name.startswith('_') or not callable(getattr(async_bot, name, None)):
+            raise AttributeError(name)
+
+        def record(*args, **kwargs):
+            calls = getattr(self._local, 'calls', None)
+            if calls is None:
+                raise RuntimeError(f'Метод {name} можно вызывать только из обработчика бота.')
+            calls.append((name, args, kwargs))
+        return record
+
+    def register_next_step_handler(self, message: types.Message, callback: Callable, *args, **kwargs):
+        """
+        Передает следующее сообщение из чата функции callback (аналог TeleBot.register_next_step_handler).
+        :param message: types.Message: Сообщение, из чата которого ожидается ответ.
+        :param callback: Callable: Функция, которая получит следующее сообщение.
+        """
+        with self._next_steps_lock:
+            self._next_steps[message.chat.id] = (callback, args, kwargs)
+
+    def register_handlers(self, sync_bot: TeleBot):
+        """
+        Регистрирует в AsyncTeleBot обработчики сообщений и нажатий кнопок синхронного бота с теми же фильтрами.
+        :param sync_bot: TeleBot: Бот, на котором обработчики зарегистрированы декораторами.
+        """
+        # Следующий шаг диалога проверяется раньше остальных обработчиков
+        self.async_bot.add_message_handler({'function': self._run_next_step, 'pass_bot': False,
+                                            'filters': {'func': self._has_next_step}})
+        for handler in sync_bot.message_handlers:
+            self.async_bot.add_message_handler(self._wrap(handler))
+        for handler in sync_bot.callback_query_handlers:
+            self.async_bot.add_callback_query_handler(self._wrap(handler))
+        logger.info(f'В асинхронном боте зарегистрировано {len(sync_bot.message_handlers)} обработчиков сообщений '
+                    f'и {len(sync_bot.callback_query_handlers)} обработчиков кнопок.')
+
+    async def polling(self, timeout: int = 20):
+        """
+        Получает обновления (long polling) и обрабатывает их до остановки. По завершении закрывает общую
+        HTTP-сессию и пул потоков обработчиков.
+        :param timeout: int: Время ожидания новых обновлений одним запросом getUpdates в секундах.
+        """
+        # Размер пула соединений общей сессии aiohttp (применяется при ее создании)
+        asyncio_helper.REQUEST_LIMIT = self.max_concurrency
+        logger.info(f'Асинхронный режим: до {self.max_concurrency} обновлений одновременно, '
+                    f'{self.max_workers} потоков для обработчиков.')
+        try:
+            await self.async_bot.polling(non_stop=True, interval=0, timeout=timeout)
+        finally:
+            await asyncio.to_thread(self._executor.shutdown, True)
+
+    def _wrap(self, handler: dict) -> dict:
+        """Создает описание асинхронного обработчика AsyncTeleBot для синхронной функции с теми же фильтрами."""
+        function = handler['function']
+
+        async def run(update: Any):
+            await self._dispatch(function, update)
+        run.__name__ = function.__name__
+        return {'function': run, 'pass_bot': False, 'filters': dict(handler['filters'])}
+
+    def _has_next_step(self, message: types.Message) -> bool:
+        """Проверяет, ожидается ли в чате ответ для следующего шага диалога."""
+        with self._next_steps_lock:
+            return message.chat.id in self._next_steps
+
+    async def _run_next_step(self, message: types.Message):
+        """Передает сообщение функции следующего шага, зарегистрированной для чата."""
+        with self._next_steps_lock:
+            step = self._next_steps.pop(message.chat.id, None)
+        if step is not None:
+            callback, args, kwargs = step
+            await self._dispatch(callback, message, *args, **kwargs)
+
+    async def _dispatch(self, function: Callable, update: Any, *args, **kwargs):
+        """
+        Выполняет синхронный обработчик в пуле потоков, затем по порядку выполняет записанные вызовы Bot API.
+        :param function: Callable: Синхронный обработчик.
+        :param update: Any: Сообщение или CallbackQuery.
+        """
+        async with self._get_slots():
+            loop = asyncio.get_running_loop()
+            calls = await loop.run_in_executor(self._executor, self._call_handler, function, update, args, kwargs)
+            for name, call_args, call_kwargs in calls:
+                try:
+                    await getattr(self.async_bot, name)(*call_args, **call_kwargs)
+                except Exception as e:
+                    self.failed_calls += 1
+                    logger.error(f'Ошибка при вызове {name} из обработчика {function.__name__}: {e}', exc_info=True)
+
+    def _call_handler(self, function: Callable, update: Any, args: tuple, kwargs: dict) -> list[RecordedCall]:
+        """Выполняет обработчик в потоке пула и возвращает записанные им вызовы Bot API."""
+        self._local.calls = []
+        try:
+            function(update, *args, **kwargs)
+        except Exception as e:
+            logger.error(f'Ошибка в обработчике {function.__name__}: {e}', exc_info=True)
+        finally:
+            calls, self._local.calls = self._local.calls, None
+        return calls
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        """Возвращает семафор, ограничивающий количество одновременно обрабатываемых обновлений."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        return self._slots
@@ -0,0 +1,140 @@
+"""
+Сравнение синхронного (TeleBot с пулом потоков) и асинхронного (AsyncTeleBot) режимов работы бота.
+
+Обе реализации обрабатывают одинаковый поток команд /sleep от разных пользователей одними и теми же
+обработчиками sleep_bot. Запросы к Bot API отправляются на локальный имитатор (fake_bot_api.FakeBotApi)
+с задержкой ответа, имитирующей сеть; база данных - временный файл.
+
+Запуск:
+    python bench_bot_runtime.py [--updates 500] [--latency 0.05] [--threads 8] [--concurrency 64]
+"""
+import os
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+
+# Токен ботов замера; запросы все равно уходят на локальный имитатор
+os.environ.setdefault('API_TOKEN', '123456:BENCHMARK')
+
+from telebot import apihelper, asyncio_helper, types
+from telebot.async_telebot import AsyncTeleBot
+
+import sleep_bot
+from async_runtime import AsyncBotBridge
+from bot_app import BotApp, BotSettings
+from fake_bot_api import FakeBotApi
+
+
+def make_updates(count: int, first_chat_id: int) -> list[types.Update]:
+    """
+    Создает обновления с командой /sleep от count разных пользователей.
+    :param count: int: Количество обновлений.
+    :param first_chat_id: int: ID чата первого пользователя.
+    :return: list[types.Update]: Обновления.
+    """
+    updates = []
+    for i in range(count):
+        chat_id = first_chat_id + i
+        updates.append(types.Update.de_json({
+            'update_id': i + 1,
+            'message': {'message_id': i + 1, 'date': int(time.time()), 'text': '/sleep',
+                        'chat': {'id': chat_id, 'type': 'private'},
+                        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+                        'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}]},
+        }))
+    return updates
+
+
+def make_app(directory: str, name: str, threads: int) -> BotApp:
+    """
+    Создает экземпляр бота с временной базой данных и пулом из threads потоков обработчиков.
+    :param directory: str: Каталог для файла БД.
+    :param name: str: Имя экземпляра (и файла БД).
+    :param threads: int: Количество потоков обработчиков.
+    :return: BotApp: Экземпляр бота.
+    """
+    return sleep_bot.create_app(BotSettings(name=name, token=os.environ['API_TOKEN'],
+                                            db_name=os.path.join(directory, f'{name}.db'),
+                                            db_pool_size=threads + 2, worker_threads=threads, warm_start_users=0))
+
+
+def bench_threaded(app: BotApp, updates: list[types.Update], api: FakeBotApi) -> float:
+    """
+    Замеряет время обработки обновлений синхронным TeleBot экземпляра с пулом потоков.
+    :return: float: Время в секундах до получения имитатором всех ответов бота.
+    """
+    expected = len(api.requests) + 2 * len(updates)
+    started = time.perf_counter()
+    app.bot.process_new_updates(updates)
+    if not api.wait_for(expected, timeout=600):
+        raise RuntimeError('Синхронный бот не ответил на все обновления.')
+    return time.perf_counter() - started
+
+
+def bench_async(app: BotApp, updates: list[types.Update], threads: int, concurrency: int) -> float:
+    """
+    Замеряет время обработки обновлений AsyncTeleBot через AsyncBotBridge.
+    :return: float: Время в секундах до завершения всех обработчиков и запросов к Bot API.
+    """
+    bridge = AsyncBotBridge(AsyncTeleBot(app.settings.token), max_concurrency=concurrency, max_workers=threads)
+    bridge.register_handlers(app.bot)
+    app.bot = bridge
+    asyncio_helper.REQUEST_LIMIT = concurrency
+
+    async def run() -> float:
+        started = time.perf_counter()
+        await bridge.async_bot.process_new_updates(updates)
+        elapsed = time.perf_counter() - started
+        await bridge.async_bot.close_session()
+        return elapsed
+
+    return asyncio.run(run())
+
+
+def main(argv: list[str] | None = None):
+    """
+    Запускает оба замера и выводит результаты.
+    :param argv: list[str] | None: Аргументы командной строки (по умолчанию sys.argv).
+    """
+    parser = argparse.ArgumentParser(description='Сравнение синхронного и асинхронного режимов бота.')
+    parser.add_argument('--updates', type=int, default=500, help='Количество обновлений /sleep.')
+    parser.add_argument('--latency', type=float, default=0.05, help='Задержка ответа Bot API в секундах.')
+    parser.add_argument('--threads', type=int, default=8, help='Количество потоков обработчиков.')
+    parser.add_argument('--concurrency', type=int, default=64,
+                        help='Максимум одновременно обрабатываемых обновлений в асинхронном режиме.')
+    args = parser.parse_args(argv)
+
+    # Журнал каждого обработчика искажает замер
+    logging.getLogger('my_app').setLevel(logging.WARNING)
+    logging.getLogger('TeleBot').setLevel(logging.CRITICAL)
+    logging.getLogger('urllib3').setLevel(logging.WARNING)
+    logging.getLogger('asyncio').setLevel(logging.WARNING)
+    api = FakeBotApi(latency=args.latency).start()
+    apihelper.API_URL = api.api_url
+    asyncio_helper.API_URL = api.api_url
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            # У каждого режима свой экземпляр бота со своей БД
+            app = make_app(directory, 'threaded', args.threads)
+            threaded = bench_threaded(app, make_updates(args.updates, 1), api)
+            app.close()
+            app.bot.worker_pool.close()
+
+            app = make_app(directory, 'async', args.threads)
+            # Потоки TeleBot не нужны: обработчики выполняет пул AsyncBotBridge
+            app.bot.worker_pool.close()
+            asynchronous = bench_async(app, make_updates(args.updates, 1), args.threads, args.concurrency)
+            app.close()
+    finally:
+        api.stop()
+
+    print(f'Обновлений: {args.updates}, задержка Bot API: {args.latency * 1000:.0f} мс, '
+          f'потоков: {args.threads}, одновременных обновлений (async): {args.concurrency}')
+    for mode, elapsed in (('threaded', threaded), ('async', asynchronous)):
+        print(f'{mode:>9}: {elapsed:8.3f} с, {args.updates / elapsed:8.1f} обновлений/с')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Замер времени запуска бота: импорт sleep_bot (python -X importtime) и время от запуска процесса
+до ответа на первое обновление (time-to-first-update).
+
+Оба замера выполняются в новом процессе интерпретатора во временном каталоге, поэтому учитываются
+запуск Python, импорт модулей, настройка логирования, открытие БД и прогрев кэшей. Запросы к Bot API
+отправляются на локальный имитатор (fake_bot_api.FakeBotApi), который возвращает одно обновление /start.
+Бюджеты IMPORT_TIME_BUDGET и FIRST_UPDATE_BUDGET проверяются тестами (test_bench_startup.py).
+
+Запуск:
+    python bench_startup.py [--repeat 3]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+from fake_bot_api import FakeBotApi
+
+# Каталог проекта: дочерний процесс импортирует модули отсюда, а работает во временном каталоге
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Бюджет времени импорта sleep_bot (с зависимостями) в секундах
+IMPORT_TIME_BUDGET = 1.0
+# Бюджет времени от запуска процесса до ответа на первое обновление в секундах
+FIRST_UPDATE_BUDGET = 5.0
+# Дочерний процесс: запросы к Bot API уходят на имитатор, адрес которого передается аргументом
+FIRST_UPDATE_CODE = ('import sys\n'
+                     'from telebot import apihelper\n'
+                     'apihelper.API_URL = sys.argv[1]\n'
+                     'import sleep_bot\n'
+                     'sleep_bot.main()\n')
+
+
+def child_env() -> dict[str, str]:
+    """
+    Окружение дочернего процесса: модули проекта, тестовый токен и конфигурация логирования проекта.
+    :return: dict[str, str]: Переменные окружения.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, (PROJECT_DIR, env.get('PYTHONPATH'))))
+    env['API_TOKEN'] = '123456:BENCHMARK'
+    env['LOG_CFG'] = os.path.join(PROJECT_DIR, 'my_logging_config.yaml')
+    return env
+
+
+def measure_import(module: str = 'sleep_bot', workdir: str | None = None) -> dict[str, float]:
+    """
+    Импортирует модуль в новом процессе с python -X importtime.
+    :param module: str: Имя модуля.
+    :param workdir: str | None: Рабочий каталог процесса (по умолчанию временный каталог).
+    :return: dict[str, float]: Время импорта (с зависимостями) каждого загруженного модуля в секундах.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                cwd=workdir or directory, env=child_env(), capture_output=True, text=True,
+                                check=True)
+    times = {}
+    # Строки вида "import time:  self [us] | cumulative | imported package"
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1_000_000
+    return times
+
+
+def measure_first_update(workdir: str | None = None, timeout: float = 60.0) -> float:
+    """
+    Запускает бота (sleep_bot.main) в новом процессе и замеряет время до ответа на первое обновление /start.
+    После замера бот останавливается сигналом SIGTERM.
+    :param workdir: str | None: Рабочий каталог процесса: в нем создаются БД и журналы (по умолчанию временный).
+    :param timeout: float: Максимальное время ожидания ответа в секундах.
+    :return: float: Время в секундах от запуска процесса до получения имитатором ответа бота.
+    """
+    api = FakeBotApi().start()
+    api.add_update({'update_id': 1,
+                    'message': {'message_id': 1, 'date': int(time.time()), 'text': '/start',
+                                'chat': {'id': 1, 'type': 'private'},
+                                'from': {'id': 1, 'is_bot': False, 'first_name': 'Bench'},
+                                'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}]}})
+    directory = None if workdir else tempfile.TemporaryDirectory()
+    try:
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, '-c', FIRST_UPDATE_CODE, api.api_url],
+                                   cwd=workdir or directory.name, env=child_env(),
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not api.wait_for(1, timeout=timeout, method='sendMessage'):
+                raise RuntimeError(f'Бот не ответил на первое обновление за {timeout} с.')
+            return time.perf_counter() - started
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+    finally:
+        api.stop()
+        if directory is not None:
+            directory.cleanup()
+
+
+def main(argv: list[str] | None = None):
+    """
+    Выполняет замеры несколько раз и выводит лучшие результаты и бюджеты.
+    :param argv: list[str] | None: Аргументы командной строки (по умолчанию sys.argv).
+    """
+    parser = argparse.ArgumentParser(description='Замер времени запуска бота.')
+    parser.add_argument('--repeat', type=int, default=3, help='Количество повторов каждого замера.')
+    args = parser.parse_args(argv)
+
+    imports = [measure_import() for _ in range(args.repeat)]
+    import_time = min(times['sleep_bot'] for times in imports)
+    first_update = min(measure_first_update() for _ in range(args.repeat))
+
+    slowest = sorted(((name, seconds) for name, seconds in imports[-1].items() if name != 'sleep_bot'),
+                     key=lambda item: item[1], reverse=True)[:5]
+    print(f'Импорт sleep_bot: {import_time * 1000:8.1f} мс (бюджет {IMPORT_TIME_BUDGET * 1000:.0f} мс)')
+    print('  самые долгие импорты: ' + ', '.join(f'{name} {seconds * 1000:.0f} мс' for name, seconds in slowest))
+    print(f'До первого ответа: {first_update * 1000:7.1f} мс (бюджет {FIRST_UPDATE_BUDGET * 1000:.0f} мс)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+import time
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from telebot import apihelper
+
+# Получение экземпляра логгера
+logger = logging.getLogger(f'my_app.{__name__}')
+
+
+class BotApiSession:
+    """
+    Общая HTTP-сессия с пулом постоянных (keep-alive) соединений для всех запросов telebot к Bot API.
+
+    По умолчанию telebot создает отдельную сессию requests в каждом потоке и пересоздает ее каждые 10 минут,
+    поэтому потоки обработчиков не делят соединения, а после пересоздания снова устанавливают TLS-соединение.
+    BotApiSession создает одну сессию с пулом из pool_size соединений на хост (pool_block=True: при нехватке
+    соединений запрос ждет свободное, а не открывает лишнее) и подключает ее к telebot.apihelper.
+
+    Если http2=True и установлен httpx с поддержкой HTTP/2 (pip install httpx[http2]), запросы выполняются
+    через httpx.Client по HTTP/2 (несколько запросов в одном соединении), иначе - через requests по HTTP/1.1.
+
+    Для каждого метода Bot API собирается время ответа (до получения заголовков ответа), а для пула
+    requests - количество открытых соединений, по которому видно, переиспользуются ли они.
+
+    Attributes:
+        pool_size (int): Максимальное количество соединений с одним хостом.
+        connect_timeout (float): Время ожидания установки соединения в секундах.
+        read_timeout (float): Время ожидания ответа в секундах.
+        http2 (bool): True, если запросы выполняются по HTTP/2.
+    """
+    def __init__(self, pool_size: int = 32, connect_timeout: float = 5.0, read_timeout: float = 30.0,
+                 http2: bool = False):
+        if pool_size < 1:
+            raise ValueError('pool_size должен быть больше нуля.')
+        self.pool_size: int = pool_size
+        self.connect_timeout: float = connect_timeout
+        self.read_timeout: float = read_timeout
+        self.http2: bool = False
+        self._lock = threading.Lock()
+        # Имя метода Bot API -> [количество запросов, суммарное время, максимальное время]
+        self._latency: dict[str, list[float]] = {}
+        self._http2_client = None
+        if http2:
+            self._http2_client = self._create_http2_client()
+            self.http2 = self._http2_client is not None
+        self.session = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('https://', self._adapter)
+        self.session.mount('http://', self._adapter)
+        self.session.headers['Connection'] = 'keep-alive'
+        self.session.hooks['response'].append(self._record_response)
+
+    def install(self) -> 'BotApiSession':
+        """
+        Подключает сессию к telebot.apihelper: все потоки используют ее, сессия не пересоздается.
+        :return: BotApiSession: Эта сессия.
+        """
+        apihelper.session = self.session
+        apihelper.SESSION_TIME_TO_LIVE = None
+        apihelper.CONNECT_TIMEOUT = self.connect_timeout
+        apihelper.READ_TIMEOUT = self.read_timeout
+        apihelper.CUSTOM_REQUEST_SENDER = self._send_http2 if self.http2 else None
+        # Сессия, уже сохраненная telebot для текущего потока, заменяется общей
+        apihelper._get_req_session(reset=True)
+        logger.info(f'Запросы к Bot API выполняются через общий пул из {self.pool_size} соединений '
+                    f'({"HTTP/2" if self.http2 else "HTTP/1.1 keep-alive"}).')
+        return self
+
+    def stats(self) -> dict:
+        """
+        Возвращает метрики запросов.
+        :return: dict: Количество запросов (requests) и открытых соединений (connections_opened, для HTTP/1.1),
+            время ответа по методам Bot API (methods: количество, среднее и максимальное время в секундах).
+        """
+        with self._lock:
+            methods = {name: {'count': int(count), 'avg': total / count, 'max': peak}
+                       for name, (count, total, peak) in self._latency.items()}
+        connections = None
+        if not self.http2:
+            pools = self._adapter.poolmanager.pools
+            connections = sum(pool.num_connections for pool in map(pools.get, pools.keys()) if pool is not None)
+        return {'requests': sum(method['count'] for method in methods.values()),
+                'connections_opened': connections, 'methods': methods}
+
+    def close(self):
+        """Закрывает соединения пула."""
+        self.session.close()
+        if self._http2_client is not None:
+            self._http2_client.close()
+
+    def _record(self, url: str, elapsed: float):
+        """Учитывает время ответа метода Bot API (имя метода - последняя часть пути запроса)."""
+        name = urlsplit(url).path.rsplit('/', 1)[-1]
+        with self._lock:
+            count_total_peak = self._latency.setdefault(name, [0, 0.0, 0.0])
+            count_total_peak[0] += 1
+            count_total_peak[1] += elapsed
+            count_total_peak[2] = max(count_total_peak[2], elapsed)
+
+    def _record_response(self, response: requests.Response, *args, **kwargs):
+        """Хук requests: учитывает время ответа."""
+        self._record(response.request.url, response.elapsed.total_seconds())
+
+    def _create_http2_client(self):
+        """Создает httpx.Client с HTTP/2 или возвращает None, если httpx или h2 не установлены."""
+        try:
+            import httpx
+            import h2  # noqa: F401 - нужен httpx для HTTP/2
+        except ImportError:
+            logger.warning('HTTP/2 недоступен (нужен пакет httpx[http2]), используется HTTP/1.1 keep-alive.')
+            return None
+        limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+        return httpx.Client(http2=True, limits=limits)
+
+    def _send_http2(self, method: str, url: str, params=None, files=None, timeout=None, proxies=None):
+        """Отправитель запросов для apihelper.CUSTOM_REQUEST_SENDER через httpx по HTTP/2."""
+        import httpx
+
+        connect_timeout, read_timeout = timeout or (self.connect_timeout, self.read_timeout)
+        started = time.perf_counter()
+        response = self._http2_client.request(method.upper(), url, params=params, files=files,
+                                              timeout=httpx.Timeout(read_timeout, connect=connect_timeout))
+        self._record(url, time.perf_counter() - started)
+        return response
@@ -0,0 +1,338 @@
+import os
+import logging
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from datetime import timedelta
+from typing import Any, Callable, NamedTuple
+
+import telebot
+
+from database_manager import DatabaseManager
+from connection_pool import ConnectionPool
+from conversation_state import ConversationStateStore
+
+# Получение экземпляра логгера
+logger = logging.getLogger(f'my_app.{__name__}')
+
+# Обработчик и его фильтры telebot (commands, func, content_types и т.д.)
+HandlerSpec = tuple[Callable, dict]
+
+# Экземпляр бота, обновление которого обрабатывается в текущем потоке (или задаче asyncio)
+_current_app: ContextVar['BotApp'] = ContextVar('current_bot_app')
+
+
+class BotSettings(NamedTuple):
+    """
+    Настройки одного экземпляра бота.
+
+    Attributes:
+        name (str): Имя экземпляра (префикс его переменных окружения и подпись в журнале), '' - единственный бот.
+        token (str | None): Токен бота.
+        db_name (str): Путь к файлу базы данных SQLite экземпляра.
+        db_pool_size (int): Максимальное количество постоянных соединений с БД.
+        worker_threads (int): Количество потоков обработчиков telebot.
+        checkpoint_interval (float | None): Интервал фоновых контрольных точек WAL в секундах.
+        write_behind_interval (float | None): Интервал отложенной записи в секундах (None - запись сразу).
+        day_start_hour (float): Час начала "суток сна" для команд /quality и /notes.
+        conversation_ttl (float): Время жизни шага диалога в секундах.
+        conversation_max_entries (int): Максимальное количество хранимых шагов диалога.
+        warm_start_users (int): Количество недавно активных пользователей, загружаемых в кэши при запуске.
+        update_dedup_window (int): Размер окна ID для отбрасывания повторных обновлений (0 - отключить).
+    """
+    name: str = ''
+    token: str | None = None
+    db_name: str = 'sleep_tracker.db'
+    db_pool_size: int = 32
+    worker_threads: int = 2
+    checkpoint_interval: float | None = 60.0
+    write_behind_interval: float | None = None
+    day_start_hour: float = 0.0
+    conversation_ttl: float = 3600.0
+    conversation_max_entries: int = 10000
+    warm_start_users: int = 1000
+    update_dedup_window: int = 4096
+
+    @classmethod
+    def from_env(cls, name: str = '') -> 'BotSettings':
+        """
+        Читает настройки экземпляра из переменных окружения.
+        У именованного экземпляра переменная с префиксом '<NAME>_' (например, ALPHA_CONVERSATION_TTL) важнее
+        общей (CONVERSATION_TTL). Токен (<NAME>_API_TOKEN) и файл БД (<NAME>_DB_NAME, по умолчанию
+        <name>_sleep_tracker.db) общими не бывают.
+        :param name: str: Имя экземпляра ('' - единственный бот: API_TOKEN, DB_NAME и т.д.).
+        :return: BotSettings: Настройки.
+        """
+        prefix = f'{name.upper()}_' if name else ''
+
+        def getenv(key: str, default: Any) -> Any:
+            value = os.getenv(prefix + key) or (os.getenv(key) if prefix else None)
+            return value or default
+
+        defaults = cls._field_defaults
+        default_db_name = f'{name}_sleep_tracker.db' if name else defaults['db_name']
+        write_behind_interval = getenv('DB_WRITE_BEHIND_INTERVAL', None)
+        return cls(name=name,
+                   token=os.getenv(f'{prefix}API_TOKEN'),
+                   db_name=os.getenv(f'{prefix}DB_NAME') or default_db_name,
+                   db_pool_size=int(getenv('DB_POOL_SIZE', defaults['db_pool_size'])),
+                   worker_threads=int(getenv('BOT_WORKER_THREADS', defaults['worker_threads'])),
+                   checkpoint_interval=float(getenv('DB_CHECKPOINT_INTERVAL', defaults['checkpoint_interval'])),
+                   write_behind_interval=float(write_behind_interval) if write_behind_interval else None,
+                   day_start_hour=float(getenv('SLEEP_DAY_START_HOUR', defaults['day_start_hour'])),
+                   conversation_ttl=float(getenv('CONVERSATION_TTL', defaults['conversation_ttl'])),
+                   conversation_max_entries=int(getenv('CONVERSATION_MAX_ENTRIES',
+                                                       defaults['conversation_max_entries'])),
+                   warm_start_users=int(getenv('DB_WARM_START_USERS', defaults['warm_start_users'])),
+                   update_dedup_window=int(getenv('BOT_UPDATE_DEDUP_WINDOW', defaults['update_dedup_window'])))
+
+
+def settings_from_env() -> list[BotSettings]:
+    """
+    Настройки всех экземпляров бота процесса: по одному на каждое имя из BOT_TENANTS (через запятую)
+    или единственный бот, если BOT_TENANTS не задана.
+    :return: list[BotSettings]: Настройки экземпляров.
+    """
+    names = [name.strip() for name in os.getenv('BOT_TENANTS', '').split(',') if name.strip()]
+    return [BotSettings.from_env(name) for name in names] or [BotSettings.from_env()]
+
+
+def current_app() -> 'BotApp':
+    """
+    Возвращает экземпляр бота, обновление которого сейчас обрабатывается.
+    :return: BotApp: Экземпляр бота.
+    :raises RuntimeError: Если функция вызвана не из обработчика экземпляра (см. BotApp.bind).
+    """
+    app = _current_app.get(None)
+    if app is None:
+        raise RuntimeError('Нет текущего экземпляра бота: обработчики вызываются ботом, созданным create_app().')
+    return app
+
+
+class AppAttribute:
+    """
+    Ссылка на атрибут текущего экземпляра бота (current_app) для глобальных имен модуля обработчиков.
+
+    Обработчики обращаются к глобальным bot, db и conversations, а AppAttribute передает обращение
+    (атрибуты и проверку "in") объекту экземпляра, получившего обновление. Поэтому одни и те же функции
+    обработчиков обслуживают несколько экземпляров в одном процессе.
+    """
+    __slots__ = ('_name',)
+
+    def __init__(self, name: str):
+        object.__setattr__(self, '_name', name)
+
+    def _target(self) -> Any:
+        """Возвращает атрибут текущего экземпляра бота."""
+        return getattr(current_app(), self._name)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._target(), name)
+
+    def __setattr__(self, name: str, value: Any):
+        setattr(self._target(), name, value)
+
+    def __delattr__(self, name: str):
+        delattr(self._target(), name)
+
+    def __contains__(self, item: Any) -> bool:
+        return item in self._target()
+
+    def __repr__(self) -> str:
+        return f'<AppAttribute {self._name}>'
+
+
+class BotWorkerPool:
+    """
+    Пул задач обработчиков одного бота поверх общего для нескольких ботов ThreadPoolExecutor.
+
+    Заменяет util.ThreadPool telebot (тот же интерфейс: put, exception_event, raise_exceptions, clear_exceptions,
+    close), но состояние ошибок у каждого бота свое: ошибку обработчика получает exception_handler этого бота,
+    а необработанная ошибка поднимается только в его polling. close() закрывает пул бота, а не общие потоки.
+
+    Attributes:
+        telebot (telebot.TeleBot): Бот, задачи которого выполняет пул.
+        name (str): Имя экземпляра бота для журнала.
+        executor (ThreadPoolExecutor): Общий пул потоков.
+        exception_event (threading.Event): Установлено, если обработчик завершился необработанной ошибкой.
+        exception_info (Exception | None): Последняя необработанная ошибка обработчика.
+    """
+    def __init__(self, bot: telebot.TeleBot, executor: ThreadPoolExecutor, name: str = ''):
+        self.telebot = bot
+        self.name: str = name
+        self.executor: ThreadPoolExecutor = executor
+        self.exception_event = threading.Event()
+        self.exception_info: Exception | None = None
+        self._closed: bool = False
+
+    def put(self, func: Callable, *args, **kwargs):
+        """
+        Ставит задачу в общий пул потоков.
+        :param func: Callable: Задача (обработчик telebot).
+        """
+        if self._closed:
+            logger.warning('Пул обработчиков бота закрыт: задача отброшена.')
+            return
+        self.executor.submit(self._run, func, args, kwargs)
+
+    def raise_exceptions(self):
+        """Поднимает необработанную ошибку обработчика (вызывается из polling бота)."""
+        if self.exception_event.is_set():
+            raise self.exception_info
+
+    def clear_exceptions(self):
+        """Сбрасывает признак необработанной ошибки."""
+        self.exception_event.clear()
+
+    def close(self):
+        """Перестает принимать задачи бота (общий пул потоков остается работать для остальных ботов)."""
+        self._closed = True
+
+    def _run(self, func: Callable, args: tuple, kwargs: dict):
+        """Выполняет задачу и передает ее ошибку обработчику ошибок своего бота."""
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            handler = self.telebot.exception_handler
+            if handler is not None and handler.handle(e):
+                return
+            logger.error(f'Ошибка обработчика бота "{self.name or "default"}": {e!r}', exc_info=True)
+            self.exception_info = e
+            self.exception_event.set()
+
+
+class SharedPoolTeleBot(telebot.TeleBot):
+    """
+    TeleBot, обработчики которого выполняются в общем ThreadPoolExecutor через свой BotWorkerPool
+    вместо собственных потоков util.ThreadPool.
+    """
+    def __init__(self, token: str, executor: ThreadPoolExecutor, name: str = '', **kwargs):
+        # Собственные потоки telebot не создаются (threaded=False), их заменяет пул задач бота
+        super().__init__(token, threaded=False, **kwargs)
+        self.threaded = True
+        self.worker_pool = BotWorkerPool(self, executor, name)
+
+
+class BotApp:
+    """
+    Экземпляр бота: TeleBot с обработчиками, свой менеджер базы данных, хранилище шагов диалога и настройки.
+
+    Обработчики и их фильтры подключаются обернутыми (bind): на время их вызова экземпляр становится
+    текущим (current_app), и глобальные bot, db и conversations модуля обработчиков указывают на его объекты.
+    Несколько экземпляров (например, разные токены или арендаторы) могут использовать общий пул потоков
+    обработчиков telebot и общий пул соединений SQLite (create_apps).
+
+    Attributes:
+        settings (BotSettings): Настройки экземпляра.
+        bot (telebot.TeleBot): Бот (или обертка над ним, например RateLimitedBot или AsyncBotBridge).
+        db (DatabaseManager): Менеджер базы данных экземпляра.
+        conversations (ConversationStateStore): Хранилище шагов диалога экземпляра.
+        executor (ThreadPoolExecutor | None): Общий пул потоков обработчиков или None, если у бота свои потоки.
+    """
+    executor: ThreadPoolExecutor | None = None
+
+    def __init__(self, settings: BotSettings, bot: telebot.TeleBot, db: DatabaseManager,
+                 conversations: ConversationStateStore):
+        self.settings: BotSettings = settings
+        self.bot = bot
+        self.db: DatabaseManager = db
+        self.conversations: ConversationStateStore = conversations
+
+    @classmethod
+    def create(cls, settings: BotSettings, message_handlers: list[HandlerSpec],
+               callback_query_handlers: list[HandlerSpec], executor: ThreadPoolExecutor | None = None,
+               connection_pool: ConnectionPool | None = None) -> 'BotApp':
+        """
+        Создает экземпляр бота и подключает обработчики в заданном порядке.
+        :param settings: BotSettings: Настройки экземпляра.
+        :param message_handlers: list[HandlerSpec]: Обработчики сообщений с фильтрами.
+        :param callback_query_handlers: list[HandlerSpec]: Обработчики нажатий inline кнопок с фильтрами.
+        :param executor: ThreadPoolExecutor | None: Общий пул потоков обработчиков (по умолчанию свой пул
+            telebot из settings.worker_threads потоков).
+        :param connection_pool: ConnectionPool | None: Общий пул соединений SQLite (по умолчанию свой пул
+            из settings.db_pool_size соединений).
+        :return: BotApp: Экземпляр бота.
+        """
+        if executor is None:
+            bot = telebot.TeleBot(settings.token, num_threads=settings.worker_threads)
+        else:
+            bot = SharedPoolTeleBot(settings.token, executor, settings.name)
+        if connection_pool is None:
+            connection_pool = ConnectionPool(max_connections=settings.db_pool_size)
+        db = DatabaseManager(db_name=settings.db_name, pool=connection_pool,
+                             checkpoint_interval=settings.checkpoint_interval,
+                             write_behind_interval=settings.write_behind_interval,
+                             day_start_offset=timedelta(hours=settings.day_start_hour))
+        conversations = ConversationStateStore(db.db_name, pool=db.pool, ttl=settings.conversation_ttl,
+                                               max_entries=settings.conversation_max_entries)
+        app = cls(settings, bot, db, conversations)
+        app.executor = executor
+        for handler, filters in message_handlers:
+            bot.register_message_handler(app.bind(handler), **app._bind_filters(filters))
+        for handler, filters in callback_query_handlers:
+            bot.register_callback_query_handler(app.bind(handler), **app._bind_filters(filters))
+        logger.info(f'Создан экземпляр бота "{settings.name or "default"}" (БД {settings.db_name}).')
+        return app
+
+    def bind(self, function: Callable) -> Callable:
+        """
+        Оборачивает функцию: на время ее вызова этот экземпляр становится текущим (current_app).
+        :param function: Callable: Обработчик или фильтр.
+        :return: Callable: Обернутая функция (исходная доступна через __wrapped__).
+        """
+        @functools.wraps(function)
+        def bound(*args, **kwargs):
+            token = _current_app.set(self)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _current_app.reset(token)
+        return bound
+
+    def close(self):
+        """Записывает отложенные изменения и закрывает соединения с БД экземпляра (общий пул остается открытым)."""
+        self.db.close()
+
+    def _bind_filters(self, filters: dict) -> dict:
+        """Оборачивает фильтр-функцию (func): она тоже может обращаться к объектам экземпляра."""
+        if filters.get('func') is None:
+            return filters
+        return {**filters, 'func': self.bind(filters['func'])}
+
+
+def create_apps(settings: list[BotSettings], message_handlers: list[HandlerSpec],
+                callback_query_handlers: list[HandlerSpec]) -> list[BotApp]:
+    """
+    Создает несколько экземпляров бота с общим пулом потоков обработчиков и общим пулом соединений SQLite.
+    Размеры общих пулов берутся из настроек первого экземпляра (worker_threads и db_pool_size).
+    :param settings: list[BotSettings]: Настройки экземпляров (у каждого свои токен и файл БД).
+    :param message_handlers: list[HandlerSpec]: Обработчики сообщений с фильтрами.
+    :param callback_query_handlers: list[HandlerSpec]: Обработчики нажатий inline кнопок с фильтрами.
+    :return: list[BotApp]: Экземпляры в порядке настроек.
+    """
+    if not settings:
+        raise ValueError('Нужны настройки хотя бы одного экземпляра бота.')
+    names = [instance.name for instance in settings]
+    db_names = [instance.db_name for instance in settings]
+    if len(set(names)) != len(names) or len(set(db_names)) != len(db_names):
+        raise ValueError('У экземпляров бота должны быть разные имена и файлы БД.')
+    connection_pool = ConnectionPool(max_connections=settings[0].db_pool_size)
+    # Единственный бот использует собственные потоки telebot
+    executor = ThreadPoolExecutor(max_workers=settings[0].worker_threads,
+                                  thread_name_prefix='bot-worker') if len(settings) > 1 else None
+    return [BotApp.create(instance, message_handlers, callback_query_handlers,
+                          executor=executor, connection_pool=connection_pool)
+            for instance in settings]
+
+
+def close_shared_pools(apps: list[BotApp]):
+    """
+    Закрывает общие пулы экземпляров, созданных create_apps: пул соединений SQLite и пул потоков обработчиков.
+    Вызывается после закрытия баз данных всех экземпляров (BotApp.close).
+    :param apps: list[BotApp]: Экземпляры бота.
+    """
+    for connection_pool in {id(app.db.pool): app.db.pool for app in apps}.values():
+        connection_pool.close_all()
+    for executor in {id(app.executor): app.executor for app in apps if app.executor is not None}.values():
+        executor.shutdown(wait=False)
@@ -0,0 +1,118 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from telebot import TeleBot, types
+
+# Получение экземпляра логгера
+logger = logging.getLogger(f'my_app.{__name__}')
+
+# Сообщение пользователю, если обработка нажатия кнопки завершилась ошибкой после подтверждения
+FAILURE_TEXT = 'Простите, не удалось обработать нажатие кнопки. Попробуйте еще раз.😔'
+
+
+class EarlyCallbackAck:
+    """
+    Подтверждает нажатия inline кнопок (answerCallbackQuery) сразу при получении обновления.
+
+    Обычно обработчик вызывает answer_callback_query() в конце, после запросов к БД и отправки сообщений,
+    и все это время пользователь видит индикатор загрузки на кнопке. EarlyCallbackAck отправляет подтверждение
+    в отдельном небольшом пуле потоков (ack_workers) до передачи обновления обработчикам, поэтому индикатор
+    пропадает через один запрос к Bot API независимо от нагрузки на БД. Обработчик затем выполняется как
+    обычно (в пуле потоков бота или в OrderedUpdateDispatcher), порядок обновлений не меняется.
+
+    Подтвержденное нажатие помечается атрибутом answered = True, чтобы обработчик не подтверждал его повторно.
+    Если обработчик завершился исключением, пользователю отправляется сообщение об ошибке.
+
+    Attributes:
+        stats (dict[str, float]): Количество подтверждений (acknowledged), ошибок подтверждения (failed),
+            ошибок обработчиков (handler_errors), среднее и максимальное время подтверждения в секундах.
+    """
+    def __init__(self, answer_callback_query: Callable[[str], object],
+                 send_message: Callable[[int, str], object], ack_workers: int = 2):
+        if ack_workers < 1:
+            raise ValueError('ack_workers должен быть больше нуля.')
+        self.stats: dict[str, float] = {'acknowledged': 0, 'failed': 0, 'handler_errors': 0,
+                                        'avg_ack_time': 0.0, 'max_ack_time': 0.0}
+        self._answer_callback_query = answer_callback_query
+        self._send_message = send_message
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=ack_workers, thread_name_prefix='callback-ack')
+
+    @classmethod
+    def install(cls, bot: TeleBot, ack_workers: int = 2) -> 'EarlyCallbackAck':
+        """
+        Подключает раннее подтверждение к боту: оборачивает process_new_updates и обработчики нажатий кнопок.
+        :param bot: TeleBot: Бот с зарегистрированными обработчиками.
+        :param ack_workers: int: Количество потоков для отправки подтверждений.
+        :return: EarlyCallbackAck: Подключенный объект.
+        """
+        ack = cls(bot.answer_callback_query, bot.send_message, ack_workers=ack_workers)
+        for handler in bot.callback_query_handlers:
+            handler['function'] = ack.report_failures(handler['function'])
+        process_new_updates = bot.process_new_updates
+
+        def process_with_ack(updates: list[types.Update]):
+            ack.acknowledge(updates)
+            process_new_updates(updates)
+        bot.process_new_updates = process_with_ack
+        logger.info('Нажатия inline кнопок подтверждаются сразу при получении.')
+        return ack
+
+    def acknowledge(self, updates: list[types.Update]):
+        """
+        Помечает нажатия кнопок как подтвержденные и отправляет подтверждения в фоновом пуле.
+        :param updates: list[types.Update]: Полученные обновления.
+        """
+        for update in updates:
+            call = update.callback_query
+            if call is not None:
+                call.answered = True
+                self._executor.submit(self._answer, call.id, time.monotonic())
+
+    def report_failures(self, function: Callable[[types.CallbackQuery], None]) -> Callable[[types.CallbackQuery], None]:
+        """
+        Оборачивает обработчик нажатия: при исключении пишет его в лог и сообщает пользователю об ошибке.
+        :param function: Callable: Обработчик нажатия кнопки.
+        :return: Callable: Обернутый обработчик.
+        """
+        def handler(call: types.CallbackQuery):
+            try:
+                function(call)
+            except Exception as e:
+                self._increment('handler_errors')
+                logger.error(f'Ошибка при обработке нажатия кнопки {call.data}: {e}', exc_info=True)
+                chat_id = call.message.chat.id if call.message is not None else call.from_user.id
+                try:
+                    self._send_message(chat_id, FAILURE_TEXT)
+                except Exception as send_error:
+                    logger.error(f'Не удалось сообщить пользователю ({chat_id}) об ошибке: {send_error}')
+        handler.__name__ = function.__name__
+        return handler
+
+    def stop(self):
+        """Дожидается отправки подтверждений и останавливает пул."""
+        self._executor.shutdown(wait=True)
+        logger.info(f'Раннее подтверждение нажатий остановлено: {self.stats}.')
+
+    def _answer(self, callback_query_id: str, received_at: float):
+        """Отправляет подтверждение нажатия и учитывает время от получения обновления."""
+        try:
+            self._answer_callback_query(callback_query_id)
+        except Exception as e:
+            self._increment('failed')
+            logger.warning(f'Не удалось подтвердить нажатие кнопки {callback_query_id}: {e}')
+            return
+        elapsed = time.monotonic() - received_at
+        with self._lock:
+            count = self.stats['acknowledged'] + 1
+            self.stats['acknowledged'] = count
+            self.stats['avg_ack_time'] += (elapsed - self.stats['avg_ack_time']) / count
+            self.stats['max_ack_time'] = max(self.stats['max_ack_time'], elapsed)
+
+    def _increment(self, name: str):
+        """Увеличивает счетчик stats[name]."""
+        with self._lock:
+            self.stats[name] += 1
@@ -0,0 +1,162 @@
+from typing import Any, Callable, NamedTuple
+
+from telebot import types
+
+# Ограничение Telegram на размер callback_data
+CALLBACK_DATA_MAX_BYTES = 64
+# Разделитель префикса и полей в callback_data
+SEPARATOR = ':'
+
+# Преобразование полей данных кнопки в строку и обратно по типу поля
+_ENCODERS: dict[type, Callable[[Any], str]] = {int: str, str: str, bool: lambda value: '1' if value else '0'}
+_DECODERS: dict[type, Callable[[str], Any]] = {int: int, str: str, bool: lambda value: value == '1'}
+# Допустимые значения поля в callback_data по типу поля
+_VALIDATORS: dict[type, Callable[[str], bool]] = {int: str.isdecimal, str: bool,
+                                                  bool: lambda value: value in ('0', '1')}
+
+
+class CallbackDataError(ValueError):
+    """
+    Ошибка разбора callback_data.
+
+    Attributes:
+        reason (str): Причина: 'oversized' (больше 64 байт), 'stale' (кнопка предыдущей версии формата),
+            'unknown' (неизвестный префикс), 'malformed' (неверные поля) или 'invalid' (недопустимые значения).
+        data (str): Полученная callback_data.
+    """
+    def __init__(self, reason: str, data: str):
+        super().__init__(f'Некорректные данные кнопки ({reason}): {data[:CALLBACK_DATA_MAX_BYTES]!r}')
+        self.reason: str = reason
+        self.data: str = data
+
+
+class _Route(NamedTuple):
+    """Зарегистрированный тип кнопки: префикс, тип данных, типы полей и обработчик."""
+    prefix: str
+    payload_type: type
+    field_types: tuple[type, ...]
+    handler: Callable[[types.CallbackQuery, Any], None]
+
+
+class CallbackRouter:
+    """
+    Маршрутизатор нажатий inline кнопок по компактной версионированной callback_data.
+
+    Данные кнопки описываются типом NamedTuple с полями int, str или bool и кодируются строкой
+    '<код><версия>:<поле>:<поле>' (например, 'q1:5:123' для оценки 5 сессии 123). Обработчик выбирается
+    поиском префикса в словаре, поэтому время выбора не зависит от количества типов кнопок. Данные разбираются
+    и проверяются один раз (включая метод validate() типа данных, если он есть), обработчик получает
+    готовый объект.
+
+    Данные больше 64 байт, с префиксом другой версии формата (кнопки старых сообщений) или с неверными
+    полями отклоняются исключением CallbackDataError. Для кнопок, отправленных до появления маршрутизатора,
+    можно зарегистрировать точные строки-псевдонимы (alias).
+
+    Attributes:
+        version (int): Версия формата callback_data.
+    """
+    def __init__(self, version: int = 1):
+        self.version: int = version
+        # Префикс '<код><версия>' -> тип кнопки
+        self._routes: dict[str, _Route] = {}
+        # Тип данных -> тип кнопки (для кодирования)
+        self._types: dict[type, _Route] = {}
+        # Коды зарегистрированных типов кнопок (для распознавания кнопок другой версии)
+        self._codes: set[str] = set()
+        # Точная callback_data старых кнопок -> (тип кнопки, данные)
+        self._aliases: dict[str, tuple[_Route, Any]] = {}
+
+    def route(self, code: str, payload_type: type) -> Callable:
+        """
+        Регистрирует обработчик кнопок с данными типа payload_type (декоратор).
+        :param code: str: Короткий буквенный код типа кнопки (например, 'q').
+        :param payload_type: type: Тип данных кнопки (NamedTuple с полями int, str или bool).
+        :return: Callable: Декоратор обработчика handler(call, data).
+        """
+        if not code.isalpha() or code in self._codes:
+            raise ValueError(f'Код кнопки должен состоять из букв и быть уникальным: {code!r}.')
+        fields = payload_type.__annotations__
+        unsupported = [name for name, field_type in fields.items() if field_type not in _DECODERS]
+        if unsupported:
+            raise TypeError(f'Неподдерживаемые типы полей {unsupported} в {payload_type.__name__}.')
+
+        def decorator(handler: Callable[[types.CallbackQuery, Any], None]) -> Callable[[types.CallbackQuery, Any], None]:
+            route = _Route(f'{code}{self.version}', payload_type, tuple(fields.values()), handler)
+            self._routes[route.prefix] = route
+            self._types[payload_type] = route
+            self._codes.add(code)
+            return handler
+        return decorator
+
+    def alias(self, data: str, payload: Any):
+        """
+        Связывает точную callback_data старой кнопки с данными зарегистрированного типа.
+        :param data: str: callback_data старой кнопки (например, '/sleep').
+        :param payload: Any: Данные, которые получит обработчик.
+        """
+        self._aliases[data] = (self._route_for(payload), payload)
+
+    def encode(self, payload: Any) -> str:
+        """
+        Кодирует данные кнопки в callback_data.
+        :param payload: Any: Данные зарегистрированного типа.
+        :return: str: callback_data.
+        """
+        route = self._route_for(payload)
+        values = [_ENCODERS[field_type](value) for field_type, value in zip(route.field_types, payload)]
+        if (any(SEPARATOR in value or not _VALIDATORS[field_type](value)
+                for field_type, value in zip(route.field_types, values)) or not self._is_valid(payload)):
+            raise ValueError(f'Недопустимые данные кнопки: {payload!r}.')
+        data = SEPARATOR.join([route.prefix, *values])
+        if len(data.encode()) > CALLBACK_DATA_MAX_BYTES:
+            raise ValueError(f'callback_data длиннее {CALLBACK_DATA_MAX_BYTES} байт: {data!r}.')
+        return data
+
+    def decode(self, data: str) -> tuple[Callable[[types.CallbackQuery, Any], None], Any]:
+        """
+        Разбирает и проверяет callback_data.
+        :param data: str: callback_data нажатой кнопки.
+        :return: tuple: Обработчик и данные кнопки.
+        :raises CallbackDataError: Если данные нельзя разобрать.
+        """
+        if data is None or len(data.encode()) > CALLBACK_DATA_MAX_BYTES:
+            raise CallbackDataError('oversized' if data else 'malformed', data or '')
+        alias = self._aliases.get(data)
+        if alias is not None:
+            return alias[0].handler, alias[1]
+        prefix, _, rest = data.partition(SEPARATOR)
+        route = self._routes.get(prefix)
+        if route is None:
+            code = prefix.rstrip('0123456789')
+            raise CallbackDataError('stale' if code in self._codes and code != prefix else 'unknown', data)
+        values = rest.split(SEPARATOR) if rest else []
+        if (len(values) != len(route.field_types)
+                or not all(_VALIDATORS[field_type](value) for field_type, value in zip(route.field_types, values))):
+            raise CallbackDataError('malformed', data)
+        payload = route.payload_type(*(_DECODERS[field_type](value)
+                                       for field_type, value in zip(route.field_types, values)))
+        if not self._is_valid(payload):
+            raise CallbackDataError('invalid', data)
+        return route.handler, payload
+
+    def dispatch(self, call: types.CallbackQuery):
+        """
+        Разбирает callback_data нажатой кнопки и вызывает ее обработчик.
+        :param call: types.CallbackQuery: Объект CallbackQuery, содержащий данные о нажатой inline - кнопке.
+        :raises CallbackDataError: Если данные кнопки нельзя разобрать.
+        """
+        handler, payload = self.decode(call.data)
+        handler(call, payload)
+
+    def _route_for(self, payload: Any) -> _Route:
+        """Возвращает зарегистрированный тип кнопки для данных."""
+        route = self._types.get(type(payload))
+        if route is None:
+            raise ValueError(f'Тип данных кнопки {type(payload).__name__} не зарегистрирован.')
+        return route
+
+    @staticmethod
+    def _is_valid(payload: Any) -> bool:
+        """Проверяет данные методом validate() их типа, если он есть."""
+        validate = getattr(payload, 'validate', None)
+        return validate() if validate is not None else True
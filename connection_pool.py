@@ -0,0 +1,254 @@
+import re
+import sqlite3
+import logging
+import threading
+import time
+
+# Получение экземпляра логгера
+logger = logging.getLogger(f'my_app.{__name__}')
+
+# Профиль настроек SQLite, применяемый к каждому соединению
+DEFAULT_PRAGMAS: dict[str, str | int] = {
+    'journal_mode': 'WAL',            # читатели не блокируют писателей и наоборот
+    'synchronous': 'NORMAL',          # в режиме WAL безопасно и без fsync на каждый commit
+    'busy_timeout': 5000,             # ждать снятия блокировки до 5 секунд вместо немедленной ошибки
+    'cache_size': -16000,             # кэш страниц 16 МБ (отрицательное значение - в килобайтах)
+    'mmap_size': 134217728,           # 128 МБ файла БД читаются через отображение в память
+    'temp_store': 'MEMORY',           # временные таблицы и индексы в памяти
+    'journal_size_limit': 67108864,   # после контрольной точки WAL-файл усекается до 64 МБ
+}
+
+# Допустимые значения PRAGMA: целое число или одно слово (NORMAL, WAL, MEMORY...)
+_PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+_PRAGMA_VALUE = re.compile(r'^(-?\d+|[A-Za-z_]+)$')
+
+
+def apply_pragmas(conn: sqlite3.Connection, pragmas: dict[str, str | int]):
+    """
+    Применяет профиль настроек PRAGMA к соединению.
+    :param conn: sqlite3.Connection: Соединение с базой данных.
+    :param pragmas: dict[str, str | int]: Имена и значения PRAGMA.
+    """
+    for name, value in pragmas.items():
+        if not _PRAGMA_NAME.match(name) or not _PRAGMA_VALUE.match(str(value)):
+            raise ValueError(f'Недопустимая настройка PRAGMA: {name}={value!r}')
+        conn.execute(f'PRAGMA {name} = {value}')
+
+
+class ConnectionPool:
+    """
+    Пул постоянных соединений SQLite: одно переиспользуемое соединение на каждый рабочий поток.
+
+    Вместо того чтобы открывать и закрывать файл базы данных на каждый запрос,
+    поток получает "свое" соединение, которое живет, пока жив поток (или до закрытия пула).
+    Соединения хранятся по ключу (ID потока, путь к БД), поэтому один пул может обслуживать
+    несколько файлов баз данных.
+
+    Особенности:
+    - Проверка работоспособности: не чаще чем раз в check_interval секунд выполняется 'SELECT 1',
+      сломанное соединение закрывается и открывается заново.
+    - Верхняя граница: не более max_connections постоянных соединений. Если лимит исчерпан,
+      сначала закрываются соединения завершившихся потоков, а если и это не помогло,
+      выдается временное соединение, которое будет закрыто при release().
+    - Корректное завершение: close_all() закрывает все соединения пула.
+
+    Attributes:
+        max_connections (int): Максимальное количество постоянных соединений.
+        check_interval (float): Интервал (в секундах) между проверками работоспособности соединения.
+    """
+    def __init__(self, max_connections: int = 32, check_interval: float = 30.0):
+        if max_connections < 1:
+            raise ValueError('max_connections должен быть больше нуля.')
+        self.max_connections: int = max_connections
+        self.check_interval: float = check_interval
+        self._lock = threading.Lock()
+        # (ID потока, путь к БД) -> соединение
+        self._connections: dict[tuple[int, str], sqlite3.Connection] = {}
+        # (ID потока, путь к БД) -> время последней проверки соединения этого ключа. Ключ, а не id(соединения):
+        # id закрытого соединения может достаться новому, и оно унаследовало бы чужое время проверки
+        self._last_checked: dict[tuple[int, str], float] = {}
+        # id временных соединений, выданных сверх лимита
+        self._overflow: set[int] = set()
+        self._closed: bool = False
+
+    def __len__(self) -> int:
+        """Возвращает количество постоянных соединений в пуле."""
+        with self._lock:
+            return len(self._connections)
+
+    def acquire(self, db_name: str, pragmas: dict[str, str | int] | None = None) -> sqlite3.Connection:
+        """
+        Выдает соединение текущего потока с указанной базой данных, создавая его при необходимости.
+        :param db_name: str: Путь к файлу базы данных SQLite.
+        :param pragmas: dict[str, str | int] | None: Профиль PRAGMA, применяемый к новому соединению.
+        :return: sqlite3.Connection: Соединение с базой данных.
+        """
+        if self._closed:
+            raise sqlite3.ProgrammingError('Пул соединений закрыт.')
+        key = (threading.get_ident(), db_name)
+        with self._lock:
+            conn = self._connections.get(key)
+        if conn is not None:
+            if self._is_healthy(key, conn):
+                return conn
+            self._discard(key, conn)
+
+        conn = self._connect(db_name)
+        if pragmas:
+            apply_pragmas(conn, pragmas)
+        with self._lock:
+            if len(self._connections) >= self.max_connections:
+                self._prune_dead_threads()
+            if len(self._connections) >= self.max_connections:
+                # Лимит исчерпан: соединение будет временным и закроется при release()
+                self._overflow.add(id(conn))
+                logger.warning(f'Достигнут лимит пула соединений ({self.max_connections}), '
+                               f'выдано временное соединение с {db_name}.')
+                return conn
+            self._connections[key] = conn
+            self._last_checked[key] = time.monotonic()
+        logger.debug(f'Создано постоянное соединение с {db_name} для потока {key[0]}.')
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        """
+        Возвращает соединение в пул.
+        Постоянное соединение остается открытым, временное (выданное сверх лимита) закрывается.
+        :param conn: sqlite3.Connection: Соединение, полученное через acquire().
+        """
+        with self._lock:
+            is_overflow = id(conn) in self._overflow
+            self._overflow.discard(id(conn))
+        if is_overflow:
+            conn.close()
+            return
+        # Незавершенная транзакция не должна "утечь" в следующий запрос потока
+        if conn.in_transaction:
+            conn.rollback()
+
+    def close_all(self, db_name: str | None = None):
+        """
+        Закрывает все постоянные соединения пула.
+        :param db_name: str | None: Если указан, закрываются только соединения с этой базой данных,
+                                    а пул продолжает работать.
+        """
+        with self._lock:
+            if db_name is None:
+                self._closed = True
+                keys = list(self._connections)
+            else:
+                keys = [key for key in self._connections if key[1] == db_name]
+            connections = [self._connections.pop(key) for key in keys]
+            for key in keys:
+                self._last_checked.pop(key, None)
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f'Ошибка при закрытии соединения пула: {e}')
+        logger.info(f'Пул соединений: закрыто {len(connections)} соединений.')
+
+    def _connect(self, db_name: str) -> sqlite3.Connection:
+        """Открывает новое соединение, которое можно закрыть из любого потока (при close_all)."""
+        return sqlite3.connect(db_name, check_same_thread=False)
+
+    def _is_healthy(self, key: tuple[int, str], conn: sqlite3.Connection) -> bool:
+        """Проверяет соединение запросом 'SELECT 1', если с последней проверки прошло больше check_interval."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_checked.get(key, 0.0) < self.check_interval:
+                return True
+        try:
+            conn.execute('SELECT 1').fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f'Соединение пула не прошло проверку и будет пересоздано: {e}')
+            return False
+        with self._lock:
+            # Время проверки относится только к соединению, которое все еще хранится под этим ключом
+            if self._connections.get(key) is conn:
+                self._last_checked[key] = now
+        return True
+
+    def _discard(self, key: tuple[int, str], conn: sqlite3.Connection):
+        """Удаляет сломанное соединение из пула и закрывает его."""
+        with self._lock:
+            if self._connections.get(key) is conn:
+                del self._connections[key]
+                self._last_checked.pop(key, None)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _prune_dead_threads(self):
+        """Закрывает соединения потоков, которые уже завершились. Вызывается под self._lock."""
+        alive = {thread.ident for thread in threading.enumerate()}
+        for key in [key for key in self._connections if key[0] not in alive]:
+            conn = self._connections.pop(key)
+            self._last_checked.pop(key, None)
+            conn.close()
+
+
+class WalCheckpointer:
+    """
+    Фоновый поток, периодически выполняющий пассивную контрольную точку WAL (PRAGMA wal_checkpoint(PASSIVE)).
+
+    Пассивная контрольная точка переносит страницы из WAL-файла в основной файл базы данных,
+    не дожидаясь читателей и не блокируя писателей. Благодаря этому WAL-файл не растет без ограничений,
+    а стоимость контрольной точки не ложится на запросы пользователей.
+
+    Attributes:
+        db_name (str): Путь к файлу базы данных SQLite.
+        interval (float): Интервал между контрольными точками в секундах.
+    """
+    def __init__(self, db_name: str, interval: float = 60.0):
+        self.db_name: str = db_name
+        self.interval: float = interval
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        """Запускает фоновый поток контрольных точек."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='wal-checkpointer', daemon=True)
+        self._thread.start()
+        logger.info(f'Фоновые контрольные точки WAL для {self.db_name} запущены (интервал {self.interval} с).')
+
+    def stop(self, timeout: float | None = 5.0):
+        """
+        Останавливает фоновый поток и выполняет последнюю контрольную точку.
+        :param timeout: float | None: Максимальное время ожидания завершения потока в секундах.
+        """
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self._thread = None
+        self.checkpoint()
+        logger.info(f'Фоновые контрольные точки WAL для {self.db_name} остановлены.')
+
+    def checkpoint(self) -> tuple[int, int, int] | None:
+        """
+        Выполняет одну пассивную контрольную точку.
+        :return: tuple[int, int, int] | None: Результат PRAGMA wal_checkpoint (busy, страниц в WAL,
+                                              перенесено страниц) или None при ошибке.
+        """
+        conn = None
+        try:
+            conn = sqlite3.connect(self.db_name)
+            result = conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+            logger.debug(f'Контрольная точка WAL для {self.db_name}: {result}.')
+            return result
+        except sqlite3.Error as e:
+            logger.error(f'Ошибка при выполнении контрольной точки WAL: {e}', exc_info=True)
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+    def _run(self):
+        """Цикл фонового потока: контрольная точка раз в interval секунд до остановки."""
+        while not self._stop_event.wait(self.interval):
+            self.checkpoint()
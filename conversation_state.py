@@ -0,0 +1,247 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Callable, NamedTuple
+
+from connection_pool import ConnectionPool, DEFAULT_PRAGMAS, apply_pragmas
+
+# Получение экземпляра логгера
+logger = logging.getLogger(f'my_app.{__name__}')
+
+
+class ConversationState(NamedTuple):
+    """
+    Ожидаемый шаг диалога в чате.
+
+    Attributes:
+        step (str): Имя шага (например, 'note' - ввод текста заметки).
+        data (dict[str, Any]): Данные шага (например, ID сессии сна), сохраняемые в JSON.
+        expires_at (float): Время (time.time()), после которого шаг считается брошенным.
+    """
+    step: str
+    data: dict[str, Any]
+    expires_at: float
+
+
+class ConversationStateStore:
+    """
+    Хранилище шагов диалога (например, ожидания текста заметки) в таблице SQLite conversation_state.
+
+    В отличие от register_next_step_handler, который держит замыкания в памяти процесса без ограничений,
+    состояние хранится в файле БД и переживает перезапуск бота. Поиск выполняется по первичному ключу (ID чата).
+    Таблицу создает миграция схемы БД (DatabaseManager), поэтому хранилище открывается на уже подготовленной БД.
+
+    Проверка "chat_id in store" (фильтр обработчика, вызываемый для каждого сообщения) обычно не обращается к БД:
+    ID чатов с ожидаемым шагом и сроки шагов держатся в памяти. Индекс загружается из таблицы при создании
+    хранилища, сразу обновляется методами set, pop и purge_expired этого экземпляра и перечитывается из таблицы
+    не реже раза в refresh_interval секунд. Поэтому таблицу могут разделять несколько процессов: шаг,
+    записанный или извлеченный другим процессом, становится виден здесь не позже чем через refresh_interval.
+
+    Размер ограничен: шаг старше ttl секунд считается брошенным и не возвращается (удаляется при следующей
+    записи), а при превышении max_entries вытесняются шаги, к которым дольше всего не обращались (LRU).
+    Время хранится по "настенным часам" (time.time), чтобы сроки совпадали у всех процессов.
+
+    Attributes:
+        db_name (str): Путь к файлу базы данных SQLite.
+        pool (ConnectionPool | None): Пул постоянных соединений или None для режима "соединение на запрос".
+        ttl (float): Время жизни шага в секундах.
+        max_entries (int): Максимальное количество хранимых шагов.
+        refresh_interval (float | None): Период перечитывания индекса из таблицы в секундах
+            или None, если таблицу изменяет только этот экземпляр.
+    """
+    def __init__(self, db_name: str = 'sleep_tracker.db', pool: ConnectionPool | None = None,
+                 ttl: float = 3600.0, max_entries: int = 10000, pragmas: dict[str, str | int] | None = None,
+                 clock: Callable[[], float] = time.time, refresh_interval: float | None = 1.0):
+        if max_entries < 1:
+            raise ValueError('max_entries должен быть больше нуля.')
+        if ttl <= 0:
+            raise ValueError('ttl должен быть больше нуля.')
+        if refresh_interval is not None and refresh_interval <= 0:
+            raise ValueError('refresh_interval должен быть больше нуля.')
+        self.db_name: str = db_name
+        self.pool: ConnectionPool | None = pool
+        self.ttl: float = ttl
+        self.max_entries: int = max_entries
+        self.refresh_interval: float | None = refresh_interval
+        # journal_mode устанавливает DatabaseManager, остальные настройки действуют только на соединение
+        self._pragmas = {name: value for name, value in (DEFAULT_PRAGMAS if pragmas is None else pragmas).items()
+                         if name != 'journal_mode'}
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Упорядочивает изменения таблицы и индекса: между записью в БД и обновлением индекса
+        # не может вклиниться другая запись или перечитывание индекса
+        self._write_lock = threading.Lock()
+        self._stats: dict[str, int] = {'hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0}
+        # ID чата -> срок шага: индекс для проверки "in" без обращения к БД
+        self._pending: dict[int, float] = {}
+        self._refreshed_at: float = 0.0
+        self._load_pending()
+
+    def __contains__(self, chat_id: int) -> bool:
+        """Проверяет по индексу в памяти, ожидается ли в чате шаг диалога (к БД - только для обновления индекса)."""
+        self._refresh_pending()
+        with self._lock:
+            expires_at = self._pending.get(chat_id)
+            if expires_at is None:
+                return False
+            if expires_at <= self._clock():
+                # Брошенный шаг: строку таблицы удалит следующая запись или purge_expired
+                del self._pending[chat_id]
+                return False
+            return True
+
+    def set(self, chat_id: int, step: str, data: dict[str, Any] | None = None):
+        """
+        Сохраняет шаг диалога для чата (заменяет предыдущий), удаляет брошенные шаги и вытесняет лишние.
+        :param chat_id: int: ID чата.
+        :param step: str: Имя шага.
+        :param data: dict[str, Any] | None: Данные шага (должны сериализоваться в JSON).
+        """
+        payload = json.dumps(data or {}, ensure_ascii=False)
+
+        def write(conn: sqlite3.Connection) -> tuple[int, int, float]:
+            now = self._clock()
+            with conn:
+                expired = conn.execute('DELETE FROM conversation_state WHERE expires_at <= ?', (now,)).rowcount
+                conn.execute('INSERT OR REPLACE INTO conversation_state (chat_id, step, data, expires_at, touched_at) '
+                             'VALUES (?, ?, ?, ?, ?)', (chat_id, step, payload, now + self.ttl, now))
+                # Шаги сверх max_entries, к которым дольше всего не обращались
+                evicted = conn.execute('DELETE FROM conversation_state WHERE chat_id IN '
+                                       '(SELECT chat_id FROM conversation_state ORDER BY touched_at DESC '
+                                       'LIMIT -1 OFFSET ?)', (self.max_entries,)).rowcount
+            return expired, evicted, now + self.ttl
+
+        with self._write_lock:
+            expired, evicted, expires_at = self._execute(write)
+            if evicted:
+                # Какие шаги вытеснены, знает только таблица: индекс перечитывается (редкий случай)
+                self._load_pending()
+            else:
+                with self._lock:
+                    self._pending[chat_id] = expires_at
+                    if expired:
+                        self._prune_pending()
+        self._count(expired=expired, evicted=evicted)
+        if evicted:
+            logger.warning(f'Вытеснено {evicted} шагов диалога: превышен лимит {self.max_entries}.')
+
+    def get(self, chat_id: int) -> ConversationState | None:
+        """
+        Возвращает ожидаемый шаг диалога чата и отмечает его как недавно использованный.
+        :param chat_id: int: ID чата.
+        :return: ConversationState | None: Шаг диалога или None, если его нет или он устарел.
+        """
+        def read(conn: sqlite3.Connection) -> ConversationState | None:
+            now = self._clock()
+            with conn:
+                row = conn.execute('SELECT step, data, expires_at FROM conversation_state '
+                                   'WHERE chat_id = ? AND expires_at > ?', (chat_id, now)).fetchone()
+                if row is not None:
+                    conn.execute('UPDATE conversation_state SET touched_at = ? WHERE chat_id = ?', (now, chat_id))
+            return None if row is None else ConversationState(row[0], json.loads(row[1]), row[2])
+
+        state = self._execute(read)
+        self._count(hits=state is not None, misses=state is None)
+        return state
+
+    def pop(self, chat_id: int) -> ConversationState | None:
+        """
+        Удаляет и возвращает шаг диалога чата (следующее сообщение обрабатывается этим шагом один раз).
+        :param chat_id: int: ID чата.
+        :return: ConversationState | None: Шаг диалога или None, если его нет или он устарел.
+        """
+        def take(conn: sqlite3.Connection) -> tuple | None:
+            with conn:
+                row = conn.execute('SELECT step, data, expires_at FROM conversation_state WHERE chat_id = ?',
+                                   (chat_id,)).fetchone()
+                if row is not None:
+                    conn.execute('DELETE FROM conversation_state WHERE chat_id = ?', (chat_id,))
+            return row
+
+        with self._write_lock:
+            row = self._execute(take)
+            with self._lock:
+                self._pending.pop(chat_id, None)
+        if row is None or row[2] <= self._clock():
+            self._count(misses=1, expired=row is not None)
+            return None
+        self._count(hits=1)
+        return ConversationState(row[0], json.loads(row[1]), row[2])
+
+    def purge_expired(self) -> int:
+        """
+        Удаляет брошенные шаги диалога.
+        :return: int: Количество удаленных шагов.
+        """
+        def purge(conn: sqlite3.Connection) -> int:
+            with conn:
+                return conn.execute('DELETE FROM conversation_state WHERE expires_at <= ?', (self._clock(),)).rowcount
+
+        with self._write_lock:
+            expired = self._execute(purge)
+            with self._lock:
+                self._prune_pending()
+        self._count(expired=expired)
+        return expired
+
+    def stats(self) -> dict[str, int]:
+        """
+        Возвращает счетчики работы хранилища.
+        :return: dict[str, int]: Количество хранимых шагов (size), попаданий, промахов,
+            удаленных брошенных (expired) и вытесненных (evicted) шагов.
+        """
+        size = self._execute(lambda conn: conn.execute('SELECT COUNT(*) FROM conversation_state').fetchone()[0])
+        with self._lock:
+            return {'size': size, **self._stats}
+
+    def _load_pending(self):
+        """Загружает из таблицы индекс чатов с ожидаемым шагом (вызывается под self._write_lock)."""
+        now = self._clock()
+        rows = self._execute(lambda conn: conn.execute(
+            'SELECT chat_id, expires_at FROM conversation_state WHERE expires_at > ?', (now,)).fetchall())
+        with self._lock:
+            self._pending = dict(rows)
+            self._refreshed_at = now
+
+    def _refresh_pending(self):
+        """Перечитывает индекс, если он старше refresh_interval (шаги могли изменить другие процессы)."""
+        if self.refresh_interval is None or self._clock() - self._refreshed_at < self.refresh_interval:
+            return
+        # Если таблицу сейчас изменяет другой поток, проверка использует текущий индекс и не ждет
+        if not self._write_lock.acquire(blocking=False):
+            return
+        try:
+            self._load_pending()
+        except sqlite3.Error as e:
+            logger.warning(f'Не удалось перечитать индекс шагов диалога: {e}')
+        finally:
+            self._write_lock.release()
+
+    def _prune_pending(self):
+        """Удаляет из индекса брошенные шаги (вызывается под self._lock)."""
+        now = self._clock()
+        for chat_id in [chat_id for chat_id, expires_at in self._pending.items() if expires_at <= now]:
+            del self._pending[chat_id]
+
+    def _execute(self, operation: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Выполняет операцию на соединении из пула или на новом соединении, которое затем закрывается."""
+        if self.pool is not None:
+            conn = self.pool.acquire(self.db_name, self._pragmas)
+            try:
+                return operation(conn)
+            finally:
+                self.pool.release(conn)
+        conn = sqlite3.connect(self.db_name)
+        try:
+            apply_pragmas(conn, self._pragmas)
+            return operation(conn)
+        finally:
+            conn.close()
+
+    def _count(self, **increments: int):
+        """Увеличивает счетчики stats."""
+        with self._lock:
+            for name, value in increments.items():
+                self._stats[name] += int(value)
@@ -1,14 +1,240 @@
 import sqlite3
 import logging
+import argparse
+from typing import Any, Callable, NamedTuple
 from datetime import datetime, timedelta
-# Импортируем функцию настройки логирования из файла с конфигурацией
-from my_logger_config import setup_logging
-# Вызов функции настройки логирования (ОДИН РАЗ) при запуске программы
-setup_logging()
+from connection_pool import ConnectionPool, WalCheckpointer, DEFAULT_PRAGMAS, apply_pragmas
+from write_behind import WriteBehindQueue
+from ttl_cache import TTLCache
+from session_index import HotSessionIndex, MISS
+from migrations import MigrationRegistry, run_in_batches
 
 # Получение экземпляра логгера
 logger = logging.getLogger(f'my_app.{__name__}')
 
+# Время хранится в БД целым числом микросекунд от начала эпохи по "настенным часам" (без часового пояса):
+# сравнения и расчет продолжительности сна становятся целочисленной арифметикой внутри SQLite,
+# а datetime восстанавливается без потерь (в том числе микросекунды).
+EPOCH = datetime(1970, 1, 1)
+MICROSECONDS_PER_SECOND = 1_000_000
+MICROSECONDS_PER_DAY = 86_400 * MICROSECONDS_PER_SECOND
+# Продолжительность сна в секундах по времени пробуждения (:wake_sec). Время начала, не преобразованное
+# в целое число (NULL или строка, которую не удалось перевести миграцией 4), дает NULL вместо ошибки
+DURATION_SQL = "CASE WHEN typeof(sleep_time) = 'integer' THEN :wake_sec - sleep_time / :us_per_sec END"
+# UPDATE ... RETURNING поддерживается начиная с SQLite 3.35
+SQLITE_SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+# Признак отсутствия записи в кэше (None - допустимое значение)
+_MISSING = object()
+
+
+def datetime_to_db(value: datetime) -> int:
+    """
+    Преобразует datetime в целое число микросекунд для хранения в БД.
+    :param value: datetime: Время (без часового пояса).
+    :return: int: Количество микросекунд от начала эпохи.
+    """
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def datetime_from_db(value: int) -> datetime:
+    """
+    Преобразует хранящееся в БД целое число микросекунд обратно в datetime.
+    :param value: int: Количество микросекунд от начала эпохи.
+    :return: datetime: Время (без часового пояса).
+    """
+    return EPOCH + timedelta(microseconds=value)
+
+
+# Миграции схемы БД. Номер последней примененной миграции хранится в PRAGMA user_version,
+# поэтому при запуске с актуальной БД никакие DDL-запросы не выполняются.
+# Миграции идемпотентны: базы данных, созданные до появления версий (user_version = 0), проходят их без ошибок.
+SCHEMA_MIGRATIONS = MigrationRegistry()
+
+
+@SCHEMA_MIGRATIONS.register(1, 'таблицы users, sleep_records и notes')
+def _migration_base_tables(conn: sqlite3.Connection, batch_size: int):
+    """Создает основные таблицы."""
+    with conn:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY UNIQUE,
+            name TEXT NOT NULL
+        );
+        ''')
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS sleep_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            sleep_time INTEGER,
+            wake_time INTEGER,
+            sleep_quality INTEGER,
+            duration_sec INTEGER,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        );
+        ''')
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS notes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            notes_text TEXT,
+            sleep_record_id INTEGER NOT NULL UNIQUE,
+            FOREIGN KEY (sleep_record_id) REFERENCES sleep_records(id)
+        );
+        ''')
+
+
+@SCHEMA_MIGRATIONS.register(2, 'колонка sleep_records.duration_sec')
+def _migration_duration_column(conn: sqlite3.Connection, batch_size: int):
+    """Добавляет продолжительность сна в базы, созданные до перехода на целочисленное время."""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(sleep_records)")]
+    if 'duration_sec' not in columns:
+        with conn:
+            conn.execute("ALTER TABLE sleep_records ADD COLUMN duration_sec INTEGER")
+
+
+@SCHEMA_MIGRATIONS.register(3, 'индексы поиска сессий сна')
+def _migration_session_indexes(conn: sqlite3.Connection, batch_size: int):
+    """Создает индексы под "горячие" запросы к sleep_records, чтобы поиск сессий не сканировал всю таблицу."""
+    with conn:
+        # Последняя незавершенная сессия пользователя (/sleep, /wake):
+        # частичный индекс содержит только открытые сессии, поэтому остается крошечным
+        conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sleep_records_unfinished
+        ON sleep_records (user_id, sleep_time)
+        WHERE wake_time IS NULL;
+        ''')
+        # Последняя завершенная сессия с оценкой/без оценки (/quality, /notes) и статистика (/statis)
+        conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sleep_records_user_wake
+        ON sleep_records (user_id, wake_time)
+        WHERE wake_time IS NOT NULL;
+        ''')
+
+
+@SCHEMA_MIGRATIONS.register(4, 'время сна в целых числах микросекунд')
+def _migration_integer_timestamps(conn: sqlite3.Connection, batch_size: int):
+    """
+    Переводит время начала сна и пробуждения из строк ISO-8601 в целые числа микросекунд
+    и заполняет продолжительность сна (duration_sec). Выбираются только еще не преобразованные записи,
+    поэтому прерванная миграция продолжится со следующего запуска.
+    """
+    sql_select = '''
+    SELECT id, sleep_time, wake_time
+    FROM sleep_records
+    WHERE id > ? AND (typeof(sleep_time) = 'text' OR typeof(wake_time) = 'text')
+    ORDER BY id
+    LIMIT ?
+    ;'''
+
+    def convert(cursor: sqlite3.Cursor, rows: list):
+        updates = []
+        for sleep_record_id, sleep_time, wake_time in rows:
+            try:
+                sleep_value = _iso_to_db(sleep_time)
+                wake_value = _iso_to_db(wake_time)
+            except ValueError as e:
+                logger.error(f'Не удалось преобразовать время сессии сна {sleep_record_id}: {e}')
+                continue
+            duration = None
+            if sleep_value is not None and wake_value is not None:
+                duration = wake_value // MICROSECONDS_PER_SECOND - sleep_value // MICROSECONDS_PER_SECOND
+            updates.append((sleep_value, wake_value, duration, sleep_record_id))
+        cursor.executemany("UPDATE sleep_records SET sleep_time = ?, wake_time = ?, duration_sec = ? WHERE id = ?",
+                           updates)
+
+    run_in_batches(conn, sql_select, convert, batch_size, 'Миграция времени в целые числа')
+
+
+@SCHEMA_MIGRATIONS.register(5, 'агрегированная статистика сна user_sleep_stats')
+def _migration_user_sleep_stats(conn: sqlite3.Connection, batch_size: int):
+    """
+    Создает таблицу статистики сна, обновляемую при каждом завершении сессии сна,
+    и заполняет ее по уже имеющимся записям (продолжительность уже посчитана миграцией 4).
+    """
+    table_existed = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_sleep_stats'").fetchone() is not None
+    with conn:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_sleep_stats (
+            user_id INTEGER PRIMARY KEY,
+            session_count INTEGER NOT NULL DEFAULT 0,
+            total_sec INTEGER NOT NULL DEFAULT 0,
+            min_sec INTEGER,
+            max_sec INTEGER,
+            sum_sq_sec INTEGER NOT NULL DEFAULT 0
+        );
+        ''')
+        if not table_existed:
+            conn.execute('''
+            INSERT INTO user_sleep_stats (user_id, session_count, total_sec, min_sec, max_sec, sum_sq_sec)
+            SELECT user_id, COUNT(*), SUM(duration_sec), MIN(duration_sec), MAX(duration_sec),
+                   SUM(duration_sec * duration_sec)
+            FROM sleep_records
+            WHERE wake_time IS NOT NULL AND duration_sec IS NOT NULL
+            GROUP BY user_id
+            ''')
+
+
+@SCHEMA_MIGRATIONS.register(6, 'таблица шагов диалога conversation_state')
+def _migration_conversation_state(conn: sqlite3.Connection, batch_size: int):
+    """
+    Создает таблицу шагов диалога (ConversationStateStore) и индексы для удаления брошенных
+    и вытеснения давно не использованных шагов. В базах, где таблицу уже создало хранилище, ничего не меняет.
+    """
+    with conn:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS conversation_state (
+            chat_id INTEGER PRIMARY KEY,
+            step TEXT NOT NULL,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            touched_at REAL NOT NULL
+        );
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_conversation_state_expires ON conversation_state (expires_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_conversation_state_touched ON conversation_state (touched_at)')
+
+
+@SCHEMA_MIGRATIONS.register(7, 'таблица служебных значений бота bot_state')
+def _migration_bot_state(conn: sqlite3.Connection, batch_size: int):
+    """
+    Создает таблицу служебных значений бота (смещение обновлений UpdateOffsetStore).
+    В базах, где таблицу уже создало хранилище, ничего не меняет.
+    """
+    with conn:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS bot_state (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        ''')
+
+
+def _iso_to_db(value: str | int | None) -> int | None:
+    """
+    Преобразует время в формате ISO-8601 в целое число микросекунд. Уже преобразованные значения не меняются.
+    :param value: str | int | None: Время из БД.
+    :return: int | None: Время в микросекундах от начала эпохи или None.
+    """
+    if isinstance(value, str):
+        return datetime_to_db(datetime.fromisoformat(value))
+    return value
+
+
+class UserSleepState(NamedTuple):
+    """
+    Снимок состояния сессий сна пользователя, прочитанный за одно обращение к БД.
+
+    Attributes:
+        open_session (tuple[int, datetime] | None): ID и время начала последней незавершенной сессии.
+        last_without_quality (tuple[int, datetime, datetime] | None): Последняя завершенная сессия без оценки.
+        last_with_quality (tuple[int, datetime, datetime] | None): Последняя завершенная сессия с оценкой.
+        note (str | None): Текст заметки к last_with_quality, если она есть.
+    """
+    open_session: tuple[int, datetime] | None = None
+    last_without_quality: tuple[int, datetime, datetime] | None = None
+    last_with_quality: tuple[int, datetime, datetime] | None = None
+    note: str | None = None
+
 
 class DatabaseManager:
     """
@@ -21,84 +247,169 @@ class DatabaseManager:
     Использует стандартную библиотеку Python `sqlite3`.
 
     Каждый метод этого класса устанавливает собственное соединение с базой данных,
-    используя контекстный менеджер (`with sqlite3.connect(...)`). Такой подход гарантирует, что соединение корректно
+    используя контекстный менеджер (`with conn:`). Такой подход гарантирует, что соединение корректно
     открывается и закрывается для каждой операции, что критически важно для многопоточных приложений
     (например, Telegram-ботов) при работе с SQLite.
     Это повышает надежность и предотвращает проблемы с блокировками или совместным использованием соединений
     между различными потоками.
 
+    Если передан пул соединений (`pool`), менеджер работает в режиме постоянных соединений:
+    каждый поток переиспользует свое соединение из пула, а транзакции по-прежнему управляются через `with conn:`.
+    Это убирает затраты на открытие файла и прогрев кэша страниц при каждом запросе.
+
+    К каждому соединению применяется профиль настроек PRAGMA (по умолчанию DEFAULT_PRAGMAS: режим WAL,
+    synchronous=NORMAL, busy_timeout и т.д.), чтобы долгие чтения не блокировали запись.
+    Режим журнала сохраняется в файле БД, поэтому устанавливается один раз при создании таблиц.
+    При указании checkpoint_interval фоновый поток выполняет пассивные контрольные точки WAL.
+
+    При указании write_behind_interval низкоприоритетные записи (add_user, update_sleep_quality, add_note)
+    выполняются фоновым потоком пачками (WriteBehindQueue), а методы чтения перед запросом дожидаются
+    записи затрагиваемых ими данных, поэтому пользователь всегда видит свои изменения.
+
+    Известные пары (ID пользователя, имя) хранятся в LRU-кэше user_cache: add_user не обращается к БД,
+    если имя не изменилось, а get_user_by_id отвечает из кэша.
+
+    Поиск последней незавершенной и последней завершенной сессии сна обслуживается индексом горячих сессий
+    (session_index) в памяти, который поддерживается методами записи этого менеджера. Поэтому изменять
+    sleep_records в обход DatabaseManager нельзя (или нужно вызвать session_index.invalidate()).
+
     Attributes:
         db_name (str): Путь к файлу базы данных SQLite (например, 'sleep_tracker.db').
+        pool (ConnectionPool | None): Пул постоянных соединений или None для режима "соединение на запрос".
+        pragmas (dict[str, str | int]): Профиль настроек PRAGMA.
+        user_cache (TTLCache): Кэш известных пользователей (ID -> имя).
+        session_index (HotSessionIndex): Индекс открытых и последних завершенных сессий сна.
+        day_start_offset (timedelta): Смещение начала суток сна от полуночи (фильтр по дате пробуждения).
     """
-    def __init__(self, db_name: str = 'sleep_tracker.db'):
+    # Количество записей, обрабатываемых в одной транзакции при миграциях данных
+    MIGRATION_BATCH_SIZE: int = 1000
+
+    def __init__(self, db_name: str = 'sleep_tracker.db', pool: ConnectionPool | None = None,
+                 pragmas: dict[str, str | int] | None = None, checkpoint_interval: float | None = None,
+                 write_behind_interval: float | None = None, write_behind_batch_size: int = 100,
+                 user_cache_size: int = 10000, user_cache_ttl: float | None = 3600.0,
+                 session_index_size: int = 10000, session_index_idle: float | None = 3600.0,
+                 day_start_offset: timedelta = timedelta(0)):
         self.db_name: str = db_name
+        self.pool: ConnectionPool | None = pool
+        self.day_start_offset: timedelta = day_start_offset
+        self.pragmas: dict[str, str | int] = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        # journal_mode хранится в самом файле БД, остальные настройки действуют только на соединение
+        self._connection_pragmas = {name: value for name, value in self.pragmas.items() if name != 'journal_mode'}
+        self._checkpointer: WalCheckpointer | None = None
+        self.user_cache: TTLCache = TTLCache(max_size=user_cache_size, ttl=user_cache_ttl)
+        self.session_index: HotSessionIndex = HotSessionIndex(max_users=session_index_size,
+                                                              idle_timeout=session_index_idle)
         self._create_tables()
+        if checkpoint_interval and str(self.pragmas.get('journal_mode', '')).upper() == 'WAL':
+            self._checkpointer = WalCheckpointer(self.db_name, checkpoint_interval)
+            self._checkpointer.start()
+        self._write_behind: WriteBehindQueue | None = None
+        if write_behind_interval is not None:
+            self._write_behind = WriteBehindQueue(self._get_connection, self._release_connection,
+                                                  flush_interval=write_behind_interval,
+                                                  batch_size=write_behind_batch_size)
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """
+        Возвращает соединение с базой данных: из пула, если он задан, иначе новое.
+        :return: sqlite3.Connection: Соединение с базой данных.
+        """
+        if self.pool is not None:
+            return self.pool.acquire(self.db_name, self._connection_pragmas)
+        conn = sqlite3.connect(self.db_name)
+        apply_pragmas(conn, self._connection_pragmas)
+        return conn
+
+    def _release_connection(self, conn: sqlite3.Connection):
+        """
+        Освобождает соединение: возвращает его в пул или закрывает.
+        :param conn: sqlite3.Connection: Соединение, полученное через _get_connection().
+        """
+        if self.pool is not None:
+            self.pool.release(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        """
+        Записывает накопленные отложенные изменения, останавливает фоновые контрольные точки WAL
+        и закрывает постоянные соединения этого менеджера (в режиме пула). Сам пул может использоваться дальше.
+        """
+        if self._write_behind is not None:
+            self._write_behind.stop()
+            self._write_behind = None
+        if self._checkpointer is not None:
+            self._checkpointer.stop()
+            self._checkpointer = None
+        if self.pool is not None:
+            self.pool.close_all(self.db_name)
 
     def _create_tables(self):
-        """Создает таблицы, если они не существуют."""
-        sql_users = '''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY UNIQUE,
-            name TEXT NOT NULL
-        );
-        '''
-        sql_sleep_records = '''
-        CREATE TABLE IF NOT EXISTS sleep_records (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            sleep_time DATETIME,
-            wake_time DATETIME,
-            sleep_quality INTEGER,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        );
-        '''
-        sql_notes = '''
-        CREATE TABLE IF NOT EXISTS notes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            notes_text TEXT,
-            sleep_record_id INTEGER NOT NULL UNIQUE,
-            FOREIGN KEY (sleep_record_id) REFERENCES sleep_records(id)
-        );
-        '''
+        """
+        Приводит схему БД к актуальной версии: применяет недостающие миграции (SCHEMA_MIGRATIONS).
+        Если версия схемы (PRAGMA user_version) актуальна, DDL-запросы не выполняются.
+        """
         conn = None
         try:
             # Открываем соединение внутри метода
-            conn = sqlite3.connect(self.db_name)
-            # with сделает commit и rollback при необходимости
-            with conn:
-                cursor = conn.cursor()
-                # Создает таблицу users
-                cursor.execute(sql_users)
-                # Создает таблицу sleep_records
-                cursor.execute(sql_sleep_records)
-                # Создает таблицу notes
-                cursor.execute(sql_notes)
-            # Изменения в БД сохранятся автоматически с помощью with
-            logger.info(f'Таблицы успешно созданы или уже существуют.')
+            conn = self._get_connection()
+            # Режим журнала (например, WAL) нельзя менять внутри транзакции, поэтому устанавливаем его до миграций
+            if 'journal_mode' in self.pragmas:
+                apply_pragmas(conn, {'journal_mode': self.pragmas['journal_mode']})
+            version = SCHEMA_MIGRATIONS.migrate(conn, self.MIGRATION_BATCH_SIZE)
+            logger.info(f'Таблицы успешно созданы или уже существуют (версия схемы {version}).')
         except sqlite3.Error as e:
             logger.error(f'Ошибка при создании таблиц: {e}', exc_info=True)
         finally:
             if conn:
-                conn.close()
+                self._release_connection(conn)
+
+    def _sync_pending_writes(self, key):
+        """
+        Дожидается записи отложенных изменений по ключу перед чтением (read-your-writes).
+        :param key: Hashable: Ключ данных, которые собираются прочитать.
+        """
+        write_behind = self._write_behind
+        if write_behind is not None:
+            write_behind.flush_key(key)
 
     def add_user(self, user_id: int, user_name: str):
         """
-        Добавляет нового пользователя, если его нет в базе данных.
+        Добавляет нового пользователя, если его нет в базе данных, или обновляет его имя, если оно изменилось.
+        Если пользователь с таким именем уже есть в кэше известных пользователей, обращения к БД не происходит.
         :param user_id: int: ID пользователя в телеграмме.
         :param user_name: str: Имя пользователя в телеграмме, если указано, иначе указывается "Пользователь".
         """
+        if self.user_cache.get(user_id, _MISSING) == user_name:
+            logger.debug(f'Пользователь {user_name} ({user_id}) уже известен, запись в БД не требуется.')
+            return
+        sql_upsert = """
+        INSERT INTO users (id, name) VALUES (?, ?)
+        ON CONFLICT(id) DO UPDATE SET name = excluded.name WHERE users.name IS NOT excluded.name
+        """
+        # Локальная ссылка: close() может обнулить очередь, пока обработчик еще работает
+        write_behind = self._write_behind
+        if write_behind is not None:
+            # Запись будет выполнена фоновым потоком в составе пачки
+            write_behind.submit(sql_upsert, (user_id, user_name), key=('users', user_id))
+            self.user_cache.set(user_id, user_name)
+            logger.info(f'Пользователь {user_name} ({user_id}) поставлен в очередь записи в БД {self.db_name}.')
+            return
         conn = None
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = self._get_connection()
             with conn:
                 cursor = conn.cursor()
-                cursor.execute("INSERT OR IGNORE INTO users (id, name) VALUES (?, ?)", (user_id, user_name))
+                cursor.execute(sql_upsert, (user_id, user_name))
+            self.user_cache.set(user_id, user_name)
             logger.info(f'Пользователь {user_name} ({user_id}) добавлен или уже существует в БД {self.db_name}.')
         except sqlite3.Error as e:
+            self.user_cache.pop(user_id)
             logger.error(f'Ошибка при добавлении пользователя в БД {self.db_name}: {e}', exc_info=True)
         finally:
             if conn:
-                conn.close()
+                self._release_connection(conn)
 
     def get_user_by_id(self, user_id: int) -> tuple[int, str] | None:
         """
@@ -106,20 +417,28 @@ class DatabaseManager:
         :param user_id: int: ID пользователя в телеграмме.
         :return: tuple[int, str] | None: Кортеж с данными пользователя (id и имя), если найден, иначе None.
         """
+        user_name = self.user_cache.get(user_id, _MISSING)
+        if user_name is not _MISSING:
+            logger.info(f'Пользователь с ID {user_id} найден.')
+            return user_id, user_name
+        self._sync_pending_writes(('users', user_id))
         conn = None
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = self._get_connection()
             with conn:
                 cursor = conn.cursor()
                 cursor.execute("SELECT id, name FROM users WHERE id = ?", (user_id,))
                 logger.info(f'Пользователь с ID {user_id} найден.')
-                return cursor.fetchone()
+                user = cursor.fetchone()
+            if user is not None:
+                self.user_cache.set(user_id, user[1])
+            return user
         except sqlite3.Error as e:
             logger.error(f'Ошибка при получении данных о пользователе: {e}', exc_info=True)
             return None
         finally:
             if conn:
-                conn.close()
+                self._release_connection(conn)
 
     def start_sleep_session(self, user_id: int, sleep_time: datetime) -> int | None:
         """
@@ -130,42 +449,182 @@ class DatabaseManager:
         """
         conn = None
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = self._get_connection()
             with conn:
                 cursor = conn.cursor()
                 # Добавляем время начала сна(преобразованное для SQLite) в таблицу с сессиями сна
+                sleep_value = datetime_to_db(sleep_time)
                 cursor.execute("INSERT INTO sleep_records (user_id, sleep_time) VALUES (?, ?)",
-                               (user_id, sleep_time.isoformat()))
-                logger.info(f'Начата новая сессия сна с ID {cursor.lastrowid}.')
-                # Возвращаем ID новой записи сна
-                return cursor.lastrowid
+                               (user_id, sleep_value))
+                sleep_record_id = cursor.lastrowid
+            self.session_index.session_started(user_id, sleep_record_id, sleep_value)
+            logger.info(f'Начата новая сессия сна с ID {sleep_record_id}.')
+            # Возвращаем ID новой записи сна
+            return sleep_record_id
         except sqlite3.Error as e:
             logger.error(f'Ошибка при начале сессии сна: {e}', exc_info=True)
             return None
         finally:
             if conn:
-                conn.close()
+                self._release_connection(conn)
 
     def end_sleep_session(self, sleep_record_id: int, wake_time: datetime):
         """
-        Завершает сессию сна, обновляя время пробуждения.
+        Завершает сессию сна, обновляя время пробуждения и продолжительность сна.
+        В той же транзакции обновляется агрегированная статистика сна пользователя (user_sleep_stats).
         :param sleep_record_id: int: ID сессии сна.
         :param wake_time: datetime: Время пробуждения.
         """
         conn = None
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = self._get_connection()
             with conn:
                 cursor = conn.cursor()
-                # Добавляем время пробуждение преобразованное для SQLite
-                cursor.execute("UPDATE sleep_records SET wake_time = ? WHERE id = ?",
-                               (wake_time.isoformat(), sleep_record_id))
+                wake_value = datetime_to_db(wake_time)
+                params = {'id': sleep_record_id, 'wake_time': wake_value,
+                          'wake_sec': wake_value // MICROSECONDS_PER_SECOND, 'us_per_sec': MICROSECONDS_PER_SECOND}
+                cursor.execute(f"SELECT user_id, wake_time, {DURATION_SQL} FROM sleep_records WHERE id = :id", params)
+                record = cursor.fetchone()
+                # Добавляем время пробуждения, преобразованное для SQLite, и продолжительность сна в секундах
+                cursor.execute(f"UPDATE sleep_records SET wake_time = :wake_time, duration_sec = {DURATION_SQL} "
+                               f"WHERE id = :id", params)
+                if record:
+                    user_id, previous_wake_time, duration = record
+                    if duration is None:
+                        logger.warning(f'У сессии сна {sleep_record_id} нет корректного времени начала, '
+                                       f'продолжительность не посчитана.')
+                    if previous_wake_time is not None:
+                        # Сессия уже была завершена: минимум и максимум нельзя "вычесть", пересчитываем заново
+                        self._rebuild_user_sleep_stats(cursor, user_id)
+                    elif duration is not None:
+                        self._add_to_user_sleep_stats(cursor, user_id, duration)
+            if record:
+                self.session_index.session_finished(record[0], sleep_record_id, wake_value)
             logger.info(f'Сессия сна {sleep_record_id} завершена.')
         except sqlite3.Error as e:
             logger.error(f'Ошибка при завершении сессии сна: {e}', exc_info=True)
         finally:
             if conn:
-                conn.close()
+                self._release_connection(conn)
+
+    def finish_latest_sleep_session(
+            self, user_id: int, wake_time: datetime
+    ) -> tuple[int, datetime, datetime] | tuple[None, None, None]:
+        """
+        Атомарно завершает последнюю незавершенную сессию сна пользователя.
+        Поиск и завершение сессии выполняются одним запросом UPDATE ... RETURNING в одной транзакции,
+        поэтому при повторном нажатии "Я проснулся" сессия не будет завершена дважды.
+        На SQLite старше 3.35 (без RETURNING) поиск и обновление выполняются в транзакции BEGIN IMMEDIATE.
+        :param user_id: int: ID пользователя в телеграмме.
+        :param wake_time: datetime: Время пробуждения.
+        :return: tuple[int, datetime, datetime] | tuple[None, None, None]: ID сессии, время начала сна и время
+                                                     пробуждения, если сессия завершена, иначе (None, None, None).
+        """
+        wake_value = datetime_to_db(wake_time)
+        conn = None
+        try:
+            conn = self._get_connection()
+            with conn:
+                cursor = conn.cursor()
+                params = {'wake_time': wake_value, 'wake_sec': wake_value // MICROSECONDS_PER_SECOND,
+                          'us_per_sec': MICROSECONDS_PER_SECOND, 'user_id': user_id}
+                if SQLITE_SUPPORTS_RETURNING:
+                    cursor.execute(f'''
+                    UPDATE sleep_records
+                    SET wake_time = :wake_time, duration_sec = {DURATION_SQL}
+                    WHERE id = (SELECT id FROM sleep_records
+                                WHERE user_id = :user_id AND wake_time IS NULL
+                                ORDER BY sleep_time DESC LIMIT 1)
+                    RETURNING id, sleep_time, duration_sec
+                    ''', params)
+                    # fetchall() доводит выполнение запроса до конца перед фиксацией транзакции
+                    record = next(iter(cursor.fetchall()), None)
+                else:
+                    # Блокировка записи берется сразу, чтобы между SELECT и UPDATE сессию не завершил другой поток
+                    cursor.execute('BEGIN IMMEDIATE')
+                    cursor.execute(f'''
+                    SELECT id, sleep_time, {DURATION_SQL} FROM sleep_records
+                    WHERE user_id = :user_id AND wake_time IS NULL
+                    ORDER BY sleep_time DESC LIMIT 1
+                    ''', params)
+                    record = cursor.fetchone()
+                    if record:
+                        cursor.execute("UPDATE sleep_records SET wake_time = ?, duration_sec = ? WHERE id = ?",
+                                       (wake_value, record[2], record[0]))
+                if record and record[2] is not None:
+                    self._add_to_user_sleep_stats(cursor, user_id, record[2])
+            if not record:
+                logger.info(f'У пользователя ({user_id}) нет незавершенной сессии сна.')
+                return None, None, None
+            sleep_record_id, sleep_time = record[0], datetime_from_db(record[1])
+            self.session_index.session_finished(user_id, sleep_record_id, wake_value)
+            logger.info(f'Сессия сна {sleep_record_id} завершена.')
+            return sleep_record_id, sleep_time, wake_time
+        except sqlite3.Error as e:
+            logger.error(f'Ошибка при завершении последней сессии сна: {e}', exc_info=True)
+            return None, None, None
+        finally:
+            if conn:
+                self._release_connection(conn)
+
+    @staticmethod
+    def _add_to_user_sleep_stats(cursor: sqlite3.Cursor, user_id: int, duration: int):
+        """
+        Добавляет продолжительность одной завершенной сессии сна в статистику пользователя.
+        Вызывается внутри транзакции, завершающей сессию сна.
+        :param cursor: sqlite3.Cursor: Курсор открытой транзакции.
+        :param user_id: int: ID пользователя в телеграмме.
+        :param duration: int: Продолжительность сна в секундах.
+        """
+        cursor.execute('''
+        INSERT INTO user_sleep_stats (user_id, session_count, total_sec, min_sec, max_sec, sum_sq_sec)
+        VALUES (:user_id, 1, :duration, :duration, :duration, :duration * :duration)
+        ON CONFLICT (user_id) DO UPDATE SET
+            session_count = session_count + 1,
+            total_sec = total_sec + excluded.total_sec,
+            min_sec = MIN(COALESCE(min_sec, excluded.min_sec), excluded.min_sec),
+            max_sec = MAX(COALESCE(max_sec, excluded.max_sec), excluded.max_sec),
+            sum_sq_sec = sum_sq_sec + excluded.sum_sq_sec
+        ''', {'user_id': user_id, 'duration': duration})
+
+    @staticmethod
+    def _rebuild_user_sleep_stats(cursor: sqlite3.Cursor, user_id: int | None = None):
+        """
+        Пересчитывает статистику сна по исходным записям sleep_records.
+        :param cursor: sqlite3.Cursor: Курсор открытой транзакции.
+        :param user_id: int | None: ID пользователя или None, чтобы пересчитать статистику всех пользователей.
+        """
+        user_filter = '' if user_id is None else 'AND user_id = :user_id'
+        cursor.execute(f"DELETE FROM user_sleep_stats WHERE 1 = 1 {user_filter}", {'user_id': user_id})
+        cursor.execute(f'''
+        INSERT INTO user_sleep_stats (user_id, session_count, total_sec, min_sec, max_sec, sum_sq_sec)
+        SELECT user_id, COUNT(*), SUM(duration_sec), MIN(duration_sec), MAX(duration_sec),
+               SUM(duration_sec * duration_sec)
+        FROM sleep_records
+        WHERE wake_time IS NOT NULL AND duration_sec IS NOT NULL {user_filter}
+        GROUP BY user_id
+        ''', {'user_id': user_id})
+
+    def rebuild_sleep_statistics(self, user_id: int | None = None) -> bool:
+        """
+        Пересчитывает агрегированную статистику сна (user_sleep_stats) по исходным записям.
+        Нужен после ручного редактирования sleep_records или для проверки согласованности.
+        :param user_id: int | None: ID пользователя или None, чтобы пересчитать статистику всех пользователей.
+        :return: bool: True, если пересчет выполнен успешно, иначе False.
+        """
+        conn = None
+        try:
+            conn = self._get_connection()
+            with conn:
+                self._rebuild_user_sleep_stats(conn.cursor(), user_id)
+            logger.info(f'Статистика сна пересчитана ({"все пользователи" if user_id is None else user_id}).')
+            return True
+        except sqlite3.Error as e:
+            logger.error(f'Ошибка при пересчете статистики сна: {e}', exc_info=True)
+            return False
+        finally:
+            if conn:
+                self._release_connection(conn)
 
     def update_sleep_quality(self, sleep_record_id: int, quality: int):
         """
@@ -173,19 +632,26 @@ class DatabaseManager:
         :param sleep_record_id: int: ID сессии сна.
         :param quality: int: Оценка качества сна.
         """
+        sql_update = "UPDATE sleep_records SET sleep_quality = ? WHERE id = ?"
+        write_behind = self._write_behind
+        if write_behind is not None:
+            write_behind.submit(sql_update, (quality, sleep_record_id), key='sleep_records')
+            self.session_index.quality_updated(sleep_record_id, quality)
+            logger.info(f'Оценка качества сна {quality} для сессии {sleep_record_id} поставлена в очередь записи.')
+            return
         conn = None
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = self._get_connection()
             with conn:
                 cursor = conn.cursor()
-                cursor.execute("UPDATE sleep_records SET sleep_quality = ? WHERE id = ?",
-                               (quality, sleep_record_id))
+                cursor.execute(sql_update, (quality, sleep_record_id))
+            self.session_index.quality_updated(sleep_record_id, quality)
             logger.info(f'Оценка качества сна для сессии {sleep_record_id} обновлена на {quality}.')
         except sqlite3.Error as e:
             logger.error(f'Ошибка при обновлении оценки качества сна: {e}', exc_info=True)
         finally:
             if conn:
-                conn.close()
+                self._release_connection(conn)
 
     def add_note(self, sleep_record_id: int, note_text: str):
         """
@@ -199,19 +665,126 @@ class DatabaseManager:
         if not note_text or not isinstance(note_text, str):
             logger.warning(f'Попытка записать пустую или нетекстовую заметку для сессии {sleep_record_id}')
             return False
+        sql_insert = "INSERT OR REPLACE INTO notes (sleep_record_id, notes_text) VALUES (?, ?)"
+        write_behind = self._write_behind
+        if write_behind is not None:
+            write_behind.submit(sql_insert, (sleep_record_id, note_text), key='notes')
+            logger.info(f'Заметка к сессии сна {sleep_record_id} поставлена в очередь записи.')
+            return
         conn = None
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = self._get_connection()
             with conn:
                 cursor = conn.cursor()
-                cursor.execute("INSERT OR REPLACE INTO notes (sleep_record_id, notes_text) VALUES (?, ?)",
-                               (sleep_record_id, note_text))
+                cursor.execute(sql_insert, (sleep_record_id, note_text))
             logger.info(f'Заметка к сессии сна {sleep_record_id} добавлена/обновлена.')
         except sqlite3.Error as e:
             logger.error(f'Ошибка при добавлении заметки к сессии сна: {e}', exc_info=True)
         finally:
             if conn:
-                conn.close()
+                self._release_connection(conn)
+
+    def warm_up(self, max_users: int | None = None) -> int:
+        """
+        Прогревает кэш известных пользователей и индекс горячих сессий при запуске бота.
+        Недавно активными считаются авторы последних созданных сессий сна: они выбираются обходом первичного
+        ключа sleep_records с конца, причем просматривается не больше строк, чем прогрев загрузил бы завершенных
+        сессий. Свободные места занимают остальные пользователи (сначала недавно зарегистрированные).
+        Сессии загружаются запросами по частичным индексам для каждого выбранного пользователя, поэтому время
+        прогрева зависит от max_users, а не от размера таблиц, и первые обращения после перезапуска не идут в БД.
+        :param max_users: int | None: Максимальное количество пользователей (по умолчанию - размер кэша и индекса).
+        :return: int: Количество загруженных пользователей.
+        """
+        limit = min(self.user_cache.max_size, self.session_index.max_users)
+        if max_users is not None:
+            limit = min(limit, max_users)
+        self._sync_pending_writes('sleep_records')
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+            SELECT users.id, users.name
+            FROM (SELECT user_id, MAX(id) AS last_id
+                  FROM (SELECT id, user_id FROM sleep_records ORDER BY id DESC LIMIT :scan_limit)
+                  GROUP BY user_id) AS activity
+            JOIN users ON users.id = activity.user_id
+            ORDER BY activity.last_id DESC
+            LIMIT :limit
+            """, {'scan_limit': limit * (self.session_index.recent_size + 1), 'limit': limit})
+            users = cursor.fetchall()
+            if len(users) < limit:
+                selected = {user_id for user_id, _ in users}
+                cursor.execute('SELECT id, name FROM users ORDER BY id DESC LIMIT ?', (limit,))
+                users += [row for row in cursor.fetchall() if row[0] not in selected][:limit - len(users)]
+            # Самые активные пользователи загружаются последними и становятся недавно использованными в LRU
+            for user_id, user_name in reversed(users):
+                self.user_cache.set(user_id, user_name)
+                self._load_hot_sessions(cursor, user_id)
+            logger.info(f'Кэш прогрет: загружено пользователей - {len(users)}.')
+            return len(users)
+        except sqlite3.Error as e:
+            logger.error(f'Ошибка при прогреве кэша: {e}', exc_info=True)
+            return 0
+        finally:
+            if conn:
+                self._release_connection(conn)
+
+    def _load_hot_sessions(self, cursor: sqlite3.Cursor, user_id: int):
+        """
+        Загружает в индекс горячих сессий все незавершенные и последние завершенные сессии пользователя.
+        Оба запроса используют частичные индексы sleep_records.
+        :param cursor: sqlite3.Cursor: Курсор открытого соединения.
+        :param user_id: int: ID пользователя в телеграмме.
+        """
+        version = self.session_index.begin_load()
+        cursor.execute("""
+        SELECT id, sleep_time, wake_time, sleep_quality
+        FROM sleep_records
+        WHERE user_id = ? AND wake_time IS NULL
+        """, (user_id,))
+        open_rows = cursor.fetchall()
+        # На одну запись больше размера буфера, чтобы знать, поместились ли в него все завершенные сессии
+        cursor.execute("""
+        SELECT id, sleep_time, wake_time, sleep_quality
+        FROM sleep_records
+        WHERE user_id = ? AND wake_time IS NOT NULL
+        ORDER BY wake_time DESC, id DESC
+        LIMIT ?
+        """, (user_id, self.session_index.recent_size + 1))
+        finished_rows = cursor.fetchall()
+        self.session_index.load(user_id, version, open_rows, finished_rows)
+
+    def _find_hot_session(self, user_id: int, lookup: Callable[[], Any], query: str, params: list | tuple) -> Any:
+        """
+        Ищет сессию сна в индексе горячих сессий. Если пользователь не загружен, загружает его состояние из БД;
+        если индекс все равно не может ответить, выполняет исходный запрос к БД.
+        Ошибки sqlite3.Error обрабатывает вызывающий метод.
+        :param user_id: int: ID пользователя в телеграмме.
+        :param lookup: Callable[[], Any]: Запрос к индексу, возвращающий результат или MISS.
+        :param query: str: SQL-запрос, возвращающий ту же строку, что и lookup.
+        :param params: list | tuple: Параметры SQL-запроса.
+        :return: Any: Строка результата (время в формате БД) или None.
+        """
+        result = lookup()
+        if result is not MISS:
+            return result
+        self._sync_pending_writes('sleep_records')
+        conn = None
+        try:
+            conn = self._get_connection()
+            with conn:
+                cursor = conn.cursor()
+                if user_id not in self.session_index:
+                    self._load_hot_sessions(cursor, user_id)
+                    result = lookup()
+                if result is MISS:
+                    cursor.execute(query, params)
+                    result = cursor.fetchone()
+            return result
+        finally:
+            if conn:
+                self._release_connection(conn)
 
     def get_latest_unfinished_sleep_session(self, user_id: int) -> tuple[int, datetime] | tuple[None, None]:
         """
@@ -220,7 +793,6 @@ class DatabaseManager:
         :return: tuple[int, datetime] | tuple[None, None]: ID и время начала последней незавершенной сессии сна,
                                                            если найдено, иначе (None, None).
         """
-        conn = None
         try:
             sql_select = '''
             SELECT id, sleep_time
@@ -229,23 +801,65 @@ class DatabaseManager:
             ORDER BY sleep_time
             DESC LIMIT 1
             ;'''
-            conn = sqlite3.connect(self.db_name)
-            with conn:
-                cursor = conn.cursor()
-                cursor.execute(sql_select, (user_id,))
-                result = cursor.fetchone()
+            result = self._find_hot_session(user_id, lambda: self.session_index.latest_unfinished(user_id),
+                                            sql_select, (user_id,))
             if result:
-                sleep_record_id, sleep_time = result
-                logger.info(f'Найдена незавершенная сессия сна для {user_id}: {result}.')
                 # sleep_time(преобразован в формат для Python)
-                return sleep_record_id, datetime.fromisoformat(sleep_time)
+                sleep_record_id, sleep_time = result[0], datetime_from_db(result[1])
+                logger.info(f'Найдена незавершенная сессия сна для {user_id}: '
+                            f'{(sleep_record_id, sleep_time.isoformat())}.')
+                return sleep_record_id, sleep_time
             return None, None
         except sqlite3.Error as e:
             logger.error(f'Ошибка при получении последней незавершенной сессии сна: {e}', exc_info=True)
             return None, None
-        finally:
-            if conn:
-                conn.close()
+
+    def sleep_day(self, moment: datetime) -> datetime.date:
+        """
+        Возвращает "сутки сна", к которым относится момент времени, с учетом смещения начала суток.
+        Например, при day_start_offset = 4 часа пробуждение в 03:00 относится к предыдущим суткам.
+        :param moment: datetime: Момент времени (например, текущее время).
+        :return: datetime.date: Дата суток сна.
+        """
+        return (moment - self.day_start_offset).date()
+
+    def _day_bounds(self, date: datetime.date) -> tuple[int, int]:
+        """
+        Возвращает границы суток сна в формате БД: [начало, начало + сутки).
+        Фильтр по диапазону wake_time выполняется поиском по индексу idx_sleep_records_user_wake
+        (user_id=? AND wake_time>? AND wake_time<?), без функций над колонкой.
+        :param date: datetime.date: Дата суток сна.
+        :return: tuple[int, int]: Нижняя (включительно) и верхняя (не включительно) граница wake_time.
+        """
+        day_start = datetime_to_db(datetime.combine(date, datetime.min.time()) + self.day_start_offset)
+        return day_start, day_start + MICROSECONDS_PER_DAY
+
+    def _find_latest_finished(self, user_id: int, date: datetime.date, with_quality: bool) -> tuple | None:
+        """
+        Ищет последнюю завершенную сессию сна с оценкой качества или без нее.
+        :param user_id: int: ID пользователя в телеграмме.
+        :param date: datetime.date | None: Дата для фильтрации сессий сна.
+        :param with_quality: bool: True - сессия с оценкой качества, False - без оценки.
+        :return: tuple | None: ID сессии, время начала сна и время пробуждения в формате БД, если найдено.
+        """
+        query = f"""
+        SELECT id, sleep_time, wake_time
+        FROM sleep_records
+        WHERE user_id = ? AND wake_time IS NOT NULL AND sleep_quality IS {'NOT NULL' if with_quality else 'NULL'}
+        """
+        params = [user_id]
+        wake_from = wake_to = None
+        # Если дата указана, добавляем в запрос сравнение этой даты с датой завершенной сессии сна
+        if date:
+            query += " AND wake_time >= ? AND wake_time < ?"
+            # добавляем в список параметров границы суток (с учетом начала суток), в формате для SQLite
+            wake_from, wake_to = self._day_bounds(date)
+            params.extend([wake_from, wake_to])
+        # добавляем в запрос сортировку полученных данных и лимит на 1 запись
+        query += " ORDER BY wake_time DESC LIMIT 1"
+        return self._find_hot_session(
+            user_id, lambda: self.session_index.latest_finished(user_id, with_quality, wake_from, wake_to),
+            query, params)
 
     def get_latest_finished_sleep_session_without_quality(
             self, user_id: int, date: datetime.date = None
@@ -258,38 +872,18 @@ class DatabaseManager:
         :return: tuple[int, datetime, datetime] | tuple[None, None, None]:
                                 ID сессии, время начала сна и время пробуждения, если найдено, иначе (None, None, None).
         """
-        conn = None
         try:
-            query = """
-            SELECT id, sleep_time, wake_time
-            FROM sleep_records
-            WHERE user_id = ? AND wake_time IS NOT NULL AND sleep_quality IS NULL
-            """
-            params = [user_id]
-            # Если дата указана, добавляем в запрос сравнение этой даты с датой завершенной сессии сна
-            if date:
-                query += " AND DATE(wake_time) = ?"
-                # добавляем в список параметров дату, преобразовав в формат для SQLite
-                params.append(date.isoformat())
-            # добавляем в запрос сортировку полученных данных и лимит на 1 запись
-            query += " ORDER BY wake_time DESC LIMIT 1"
-            conn = sqlite3.connect(self.db_name)
-            with conn:
-                cursor = conn.cursor()
-                cursor.execute(query, params)
-                result = cursor.fetchone()
+            result = self._find_latest_finished(user_id, date, with_quality=False)
             if result:
-                sleep_record_id, sleep_time, wake_time = result
-                logger.info(f'Найдена завершенная сессия без оценки качества сна для {user_id}: {result}.')
                 # sleep_time, wake_time (преобразованные в формат для Python)
-                return sleep_record_id, datetime.fromisoformat(sleep_time), datetime.fromisoformat(wake_time)
+                sleep_record_id, sleep_time, wake_time = result[0], datetime_from_db(result[1]), datetime_from_db(result[2])
+                logger.info(f'Найдена завершенная сессия без оценки качества сна для {user_id}: '
+                            f'{(sleep_record_id, sleep_time.isoformat(), wake_time.isoformat())}.')
+                return sleep_record_id, sleep_time, wake_time
             return None, None, None
         except sqlite3.Error as e:
             logger.error(f'Ошибка при получении завершенной сессии без оценки качества сна: {e}', exc_info=True)
             return None, None, None
-        finally:
-            if conn:
-                conn.close()
 
     def get_latest_finished_sleep_session_with_quality(
             self, user_id: int, date: datetime.date = None
@@ -301,38 +895,112 @@ class DatabaseManager:
         :param date: datetime.date | None: Дата для фильтрации сессий сна.
         :return: tuple[int, datetime, datetime] | None: ID сессии, время начала сна и время пробуждения, если найдено, иначе None.
         """
-        conn = None
         try:
-            query = """
-            SELECT id, sleep_time, wake_time
-            FROM sleep_records 
-            WHERE user_id = ? AND wake_time IS NOT NULL AND sleep_quality IS NOT NULL
-            """
-            params = [user_id]
-            # Если дата указана, добавляем в запрос сравнение этой даты с датой завершенной сессии сна
-            if date:
-                query += " AND DATE(wake_time) = ?"
-                # добавляем в список параметров дату, преобразовав в формат для SQLite
-                params.append(date.isoformat())
-            # добавляем в запрос сортировку полученных данных и лимит на 1 запись
-            query += " ORDER BY wake_time DESC LIMIT 1"
-            conn = sqlite3.connect(self.db_name)
-            with conn:
-                cursor = conn.cursor()
-                cursor.execute(query, params)
-                result = cursor.fetchone()
+            result = self._find_latest_finished(user_id, date, with_quality=True)
             if result:
-                sleep_record_id, sleep_time, wake_time = result
-                logger.info(f'Найдена завершенная сессия с оценкой качества сна {user_id}: {result}.')
                 # sleep_time, wake_time (преобразованные в формат для Python)
-                return sleep_record_id, datetime.fromisoformat(sleep_time), datetime.fromisoformat(wake_time)
+                sleep_record_id, sleep_time, wake_time = result[0], datetime_from_db(result[1]), datetime_from_db(result[2])
+                logger.info(f'Найдена завершенная сессия с оценкой качества сна {user_id}: '
+                            f'{(sleep_record_id, sleep_time.isoformat(), wake_time.isoformat())}.')
+                return sleep_record_id, sleep_time, wake_time
             return None
         except sqlite3.Error as e:
             logger.error(f'Ошибка при получении последней завершенной сессии с оценкой качества: {e}', exc_info=True)
             return None
+
+    def get_user_state(self, user_id: int, date: datetime.date = None) -> UserSleepState:
+        """
+        Возвращает состояние сессий сна пользователя: последнюю незавершенную сессию, последние завершенные
+        сессии с оценкой качества и без нее, а также заметку к сессии с оценкой.
+        Сессии берутся из индекса горячих сессий; если индекс не может ответить, все данные читаются
+        одним запросом (один согласованный снимок БД). Если нужна только заметка, выполняется один запрос к notes.
+        :param user_id: int: ID пользователя в телеграмме.
+        :param date: datetime.date | None: Дата для фильтрации завершенных сессий (по времени пробуждения).
+        :return: UserSleepState: Состояние пользователя; при ошибке - пустое состояние.
+        """
+        wake_from, wake_to = self._day_bounds(date) if date else (None, None)
+
+        def lookup() -> tuple:
+            return (self.session_index.latest_unfinished(user_id),
+                    self.session_index.latest_finished(user_id, False, wake_from, wake_to),
+                    self.session_index.latest_finished(user_id, True, wake_from, wake_to),
+                    _MISSING)
+
+        rows = lookup()
+        conn = None
+        try:
+            if MISS in rows or rows[2] is not None:
+                self._sync_pending_writes('sleep_records')
+                self._sync_pending_writes('notes')
+                conn = self._get_connection()
+                with conn:
+                    cursor = conn.cursor()
+                    if user_id not in self.session_index:
+                        self._load_hot_sessions(cursor, user_id)
+                        rows = lookup()
+                    if MISS in rows:
+                        rows = self._select_user_state(cursor, user_id, wake_from, wake_to)
+                    elif rows[2] is not None:
+                        cursor.execute("SELECT notes_text FROM notes WHERE sleep_record_id = ?", (rows[2][0],))
+                        note = cursor.fetchone()
+                        rows = (*rows[:3], note[0] if note else None)
+            open_session, without_quality, with_quality, note = rows
+            state = UserSleepState(
+                open_session=(open_session[0], datetime_from_db(open_session[1])) if open_session else None,
+                last_without_quality=(without_quality[0], datetime_from_db(without_quality[1]),
+                                      datetime_from_db(without_quality[2])) if without_quality else None,
+                last_with_quality=(with_quality[0], datetime_from_db(with_quality[1]),
+                                   datetime_from_db(with_quality[2])) if with_quality else None,
+                note=None if note is _MISSING else note)
+            logger.info(f'Получено состояние сессий сна пользователя {user_id}.')
+            return state
+        except sqlite3.Error as e:
+            logger.error(f'Ошибка при получении состояния сессий сна пользователя: {e}', exc_info=True)
+            return UserSleepState()
         finally:
             if conn:
-                conn.close()
+                self._release_connection(conn)
+
+    @staticmethod
+    def _select_user_state(cursor: sqlite3.Cursor, user_id: int,
+                           wake_from: int | None, wake_to: int | None) -> tuple:
+        """
+        Читает состояние сессий сна пользователя одним запросом.
+        Каждая часть запроса использует частичные индексы sleep_records.
+        :param cursor: sqlite3.Cursor: Курсор открытого соединения.
+        :param user_id: int: ID пользователя в телеграмме.
+        :param wake_from: int | None: Нижняя граница времени пробуждения (включительно).
+        :param wake_to: int | None: Верхняя граница времени пробуждения (не включительно).
+        :return: tuple: Незавершенная сессия, сессия без оценки, сессия с оценкой (время в формате БД) и заметка.
+        """
+        date_filter = '' if wake_from is None else 'AND wake_time >= :wake_from AND wake_time < :wake_to'
+        cursor.execute(f'''
+        WITH open_session AS (
+            SELECT id, sleep_time FROM sleep_records
+            WHERE user_id = :user_id AND wake_time IS NULL
+            ORDER BY sleep_time DESC LIMIT 1
+        ), without_quality AS (
+            SELECT id, sleep_time, wake_time FROM sleep_records
+            WHERE user_id = :user_id AND wake_time IS NOT NULL AND sleep_quality IS NULL {date_filter}
+            ORDER BY wake_time DESC LIMIT 1
+        ), with_quality AS (
+            SELECT id, sleep_time, wake_time FROM sleep_records
+            WHERE user_id = :user_id AND wake_time IS NOT NULL AND sleep_quality IS NOT NULL {date_filter}
+            ORDER BY wake_time DESC LIMIT 1
+        )
+        SELECT 'open', id, sleep_time, NULL, NULL FROM open_session
+        UNION ALL
+        SELECT 'without_quality', id, sleep_time, wake_time, NULL FROM without_quality
+        UNION ALL
+        SELECT 'with_quality', q.id, q.sleep_time, q.wake_time, n.notes_text
+        FROM with_quality AS q LEFT JOIN notes AS n ON n.sleep_record_id = q.id
+        ''', {'user_id': user_id, 'wake_from': wake_from, 'wake_to': wake_to})
+        found = {row[0]: row[1:] for row in cursor.fetchall()}
+        open_session = found['open'][:2] if 'open' in found else None
+        without_quality = found['without_quality'][:3] if 'without_quality' in found else None
+        with_quality = found['with_quality'][:3] if 'with_quality' in found else None
+        note = found['with_quality'][3] if with_quality else None
+        return open_session, without_quality, with_quality, note
 
     def get_note_by_sleep_record_id(self, sleep_record_id: int) -> str | None:
         """
@@ -340,9 +1008,10 @@ class DatabaseManager:
         :param sleep_record_id: int: ID сессии сна.
         :return: str | None: Текст заметки, если она существует, иначе None.
         """
+        self._sync_pending_writes('notes')
         conn = None
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = self._get_connection()
             with conn:
                 cursor = conn.cursor()
                 cursor.execute("SELECT notes_text FROM notes WHERE sleep_record_id = ?", (sleep_record_id,))
@@ -356,32 +1025,28 @@ class DatabaseManager:
             return None
         finally:
             if conn:
-                conn.close()
+                self._release_connection(conn)
 
     def get_sleep_statistic(self, user_id: int) -> tuple[int, int, float]:
         """
-        Рассчитывает статистику сна для пользователя.
+        Возвращает статистику сна для пользователя из агрегированной таблицы user_sleep_stats.
+        Стоимость не зависит от количества сессий сна пользователя.
         :param user_id: int: ID пользователя в телеграмме.
         :return: tuple[int, int, float] : Возвращает кортеж из: общего количества сессий сна,
                                     общего и среднего количества сна в секундах. Если завершенных сессий нет (0, 0, 0).
         """
         conn = None
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = self._get_connection()
             with conn:
                 cursor = conn.cursor()
-                cursor.execute(
-                    """SELECT
-                            COUNT(id),
-                            SUM(strftime('%s', wake_time) - strftime('%s', sleep_time))
-                            FROM sleep_records
-                            WHERE user_id = ? AND wake_time IS NOT NULL
-                        """,(user_id,))
-                total_session, total_sleep_duration_seconds = cursor.fetchone()
-
-            if total_session is None or total_session == 0:
+                cursor.execute("SELECT session_count, total_sec FROM user_sleep_stats WHERE user_id = ?", (user_id,))
+                result = cursor.fetchone()
+
+            if result is None or result[0] == 0:
                 return 0, 0, 0.0
 
+            total_session, total_sleep_duration_seconds = result
             average_sleep_duration_seconds = (total_sleep_duration_seconds / total_session) if total_session > 0 else 0.0
             logger.info(f'Статистики сна для пользователя ({user_id}) рассчитана.')
             return total_session, total_sleep_duration_seconds, average_sleep_duration_seconds
@@ -390,5 +1055,30 @@ class DatabaseManager:
             return 0, 0, 0.0
         finally:
             if conn:
-                conn.close()
+                self._release_connection(conn)
+
+
+def main(argv: list[str] | None = None):
+    """
+    Команды обслуживания базы данных из командной строки.
+    Например, пересчет статистики сна: python database_manager.py --rebuild-stats [--user-id ID]
+    :param argv: list[str] | None: Аргументы командной строки (по умолчанию sys.argv).
+    """
+    parser = argparse.ArgumentParser(description='Обслуживание базы данных Sleep bot.')
+    parser.add_argument('--db', default='sleep_tracker.db', help='Путь к файлу базы данных.')
+    parser.add_argument('--rebuild-stats', action='store_true',
+                        help='Пересчитать агрегированную статистику сна по исходным записям.')
+    parser.add_argument('--user-id', type=int, default=None,
+                        help='Пересчитать статистику только для указанного пользователя.')
+    args = parser.parse_args(argv)
+
+    manager = DatabaseManager(db_name=args.db)
+    if args.rebuild_stats:
+        manager.rebuild_sleep_statistics(args.user_id)
+
 
+if __name__ == '__main__':
+    # Настройка логирования при запуске из командной строки (при импорте модуля логирование не настраивается)
+    from my_logger_config import setup_logging
+    setup_logging()
+    main()
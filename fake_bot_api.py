@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+class _FakeBotApiHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов имитатора: отвечает на методы Bot API, которые использует бот."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        url = urlsplit(self.path)
+        # Путь запроса: /bot<токен>/<метод>
+        method = url.path.rsplit('/', 1)[-1]
+        params = dict(parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if body and self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+            params.update(parse_qsl(body.decode()))
+        api: FakeBotApi = self.server.api
+        if api.latency:
+            time.sleep(api.latency)
+        api.record(method, params)
+        payload = json.dumps({'ok': True, 'result': api.result_for(method, params)}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # Журнал каждого запроса не нужен
+        pass
+
+
+class FakeBotApi:
+    """
+    Локальный HTTP-сервер, имитирующий Telegram Bot API, для тестов и замеров производительности.
+
+    Отвечает на getMe, getUpdates (обновления, добавленные через add_update), sendMessage, editMessageText
+    и answerCallbackQuery, каждый ответ задерживается на latency секунд (имитация сети).
+    Полученные запросы сохраняются в requests.
+    Адрес для telebot.apihelper.API_URL и telebot.asyncio_helper.API_URL доступен через api_url.
+
+    Attributes:
+        latency (float): Задержка ответа в секундах.
+        requests (list[tuple[str, dict]]): Полученные запросы (метод, параметры).
+        updates (list[dict]): Обновления для getUpdates.
+    """
+    # Наибольшее время ожидания новых обновлений в getUpdates (long polling), чтобы polling быстро останавливался
+    LONG_POLLING_WAIT = 0.5
+
+    def __init__(self, latency: float = 0.0):
+        self.latency: float = latency
+        self.requests: list[tuple[str, dict]] = []
+        self.updates: list[dict] = []
+        self._condition = threading.Condition()
+        self._message_id = 0
+        self._server: ThreadingHTTPServer | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def api_url(self) -> str:
+        """Шаблон адреса метода Bot API (как telebot.apihelper.API_URL)."""
+        host, port = self._server.server_address
+        return f'http://{host}:{port}/bot{{0}}/{{1}}'
+
+    def start(self) -> 'FakeBotApi':
+        """Запускает сервер на свободном порту localhost в фоновом потоке."""
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _FakeBotApiHandler)
+        self._server.daemon_threads = True
+        self._server.api = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-bot-api', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Останавливает сервер."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def record(self, method: str, params: dict):
+        """Сохраняет полученный запрос и будит ожидающих в wait_for()."""
+        with self._condition:
+            self.requests.append((method, params))
+            self._condition.notify_all()
+
+    def add_update(self, update: dict):
+        """
+        Добавляет обновление, которое вернет getUpdates (с учетом параметра offset).
+        :param update: dict: Обновление в формате Bot API (с полем update_id).
+        """
+        with self._condition:
+            self.updates.append(update)
+            self._condition.notify_all()
+
+    def wait_for(self, count: int, timeout: float = 30.0, method: str | None = None) -> bool:
+        """
+        Ждет, пока сервер получит не меньше count запросов.
+        :param count: int: Ожидаемое количество запросов.
+        :param timeout: float: Максимальное время ожидания в секундах.
+        :param method: str | None: Учитывать только запросы этого метода Bot API (по умолчанию все).
+        :return: bool: True, если запросы получены.
+        """
+        def received() -> int:
+            if method is None:
+                return len(self.requests)
+            return sum(1 for requested, _ in self.requests if requested == method)
+        with self._condition:
+            return self._condition.wait_for(lambda: received() >= count, timeout)
+
+    def result_for(self, method: str, params: dict) -> object:
+        """Возвращает поле result ответа для метода Bot API."""
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'SleepBot', 'username': 'sleep_bot'}
+        if method == 'getUpdates':
+            offset = int(params.get('offset', 0))
+            timeout = min(float(params.get('timeout', 0)), self.LONG_POLLING_WAIT)
+            with self._condition:
+                # Как long polling Telegram: ждем новых обновлений не дольше timeout
+                self._condition.wait_for(lambda: any(update['update_id'] >= offset for update in self.updates), timeout)
+                return [update for update in self.updates if update['update_id'] >= offset]
+        if method in ('sendMessage', 'editMessageText'):
+            with self._condition:
+                self._message_id += 1
+                message_id = self._message_id
+            chat_id = int(params.get('chat_id', 0))
+            return {'message_id': message_id, 'date': int(time.time()), 'text': params.get('text', ''),
+                    'chat': {'id': chat_id, 'type': 'private'}}
+        return True
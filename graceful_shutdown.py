@@ -0,0 +1,151 @@
+import time
+import signal
+import logging
+import threading
+from typing import Any, Callable
+
+from telebot import TeleBot
+
+# Получение экземпляра логгера
+logger = logging.getLogger(f'my_app.{__name__}')
+
+
+class GracefulShutdown:
+    """
+    Плавная остановка бота по сигналу (SIGTERM, SIGINT) с общим ограничением времени.
+
+    По сигналу бот перестает принимать новые обновления (функции, зарегистрированные через on_stop,
+    например bot.stop_polling), после чего drain() по порядку выполняет шаги остановки: дождаться
+    обработчиков, которые уже выполняются или стоят в очереди, отправить исходящие сообщения, записать
+    отложенные изменения в БД и закрыть пулы соединений. Каждый шаг получает оставшееся до deadline время;
+    если время вышло, остальные шаги все равно выполняются с нулевым ожиданием, чтобы ресурсы были закрыты.
+
+    Незавершенные обработчики считаются с момента постановки в пул потоков telebot (track), поэтому
+    обновления, полученные последним запросом get_updates, тоже дорабатываются.
+
+    Attributes:
+        deadline (float): Общее время на остановку в секундах.
+        stop_requested (threading.Event): Устанавливается при получении сигнала или вызове request_stop().
+    """
+    def __init__(self, deadline: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        if deadline < 0:
+            raise ValueError('deadline не может быть отрицательным.')
+        self.deadline: float = deadline
+        self.stop_requested = threading.Event()
+        self._clock = clock
+        self._idle = threading.Condition()
+        self._in_flight: int = 0
+        self._on_stop: list[Callable[[], Any]] = []
+        self._steps: list[tuple[str, Callable[[float], Any]]] = []
+
+    @property
+    def in_flight(self) -> int:
+        """Количество обработчиков, которые выполняются или ждут в очереди."""
+        with self._idle:
+            return self._in_flight
+
+    def track(self, bot: TeleBot):
+        """
+        Учитывает незавершенные обработчики бота: оборачивает запуск задач telebot (_exec_task).
+        :param bot: TeleBot: Бот.
+        """
+        exec_task = bot._exec_task
+
+        def tracked_exec_task(task: Callable, *args, **kwargs):
+            self._add_in_flight(1)
+            started = threading.Event()
+
+            def run():
+                started.set()
+                try:
+                    task(*args, **kwargs)
+                finally:
+                    self._add_in_flight(-1)
+            try:
+                exec_task(run)
+            except BaseException:
+                # Задача не была запущена (если была, ее уже учел run)
+                if not started.is_set():
+                    self._add_in_flight(-1)
+                raise
+        bot._exec_task = tracked_exec_task
+
+    def on_stop(self, function: Callable[[], Any]):
+        """
+        Регистрирует функцию прекращения приема обновлений (вызывается в отдельном потоке при сигнале).
+        :param function: Callable[[], Any]: Функция (например, bot.stop_polling).
+        """
+        self._on_stop.append(function)
+
+    def add_step(self, name: str, step: Callable[[float], Any]):
+        """
+        Добавляет шаг остановки. Шаги выполняются в порядке добавления.
+        :param name: str: Название шага для журнала.
+        :param step: Callable[[float], Any]: Функция, получающая оставшееся время в секундах.
+        """
+        self._steps.append((name, step))
+
+    def install_signals(self, signals: tuple[int, ...] = (signal.SIGTERM, signal.SIGINT)):
+        """
+        Устанавливает обработчики сигналов (только из главного потока).
+        :param signals: tuple[int, ...]: Сигналы, запускающие остановку.
+        """
+        for signum in signals:
+            signal.signal(signum, self._handle_signal)
+
+    def request_stop(self):
+        """Прекращает прием обновлений: вызывает функции on_stop в фоновом потоке (не блокирует вызывающий)."""
+        if self.stop_requested.is_set():
+            return
+        self.stop_requested.set()
+        threading.Thread(target=self._run_on_stop, name='graceful-shutdown', daemon=True).start()
+
+    def wait_idle(self, timeout: float | None = None) -> bool:
+        """
+        Ждет завершения всех учтенных обработчиков.
+        :param timeout: float | None: Максимальное время ожидания в секундах.
+        :return: bool: True, если незавершенных обработчиков не осталось.
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._in_flight == 0, timeout)
+
+    def drain(self) -> dict[str, float]:
+        """
+        Выполняет шаги остановки с общим ограничением времени deadline.
+        :return: dict[str, float]: Длительность каждого шага в секундах.
+        """
+        started = self._clock()
+        durations: dict[str, float] = {}
+        for name, step in self._steps:
+            step_started = self._clock()
+            remaining = max(0.0, self.deadline - (step_started - started))
+            try:
+                step(remaining)
+            except Exception as e:
+                logger.error(f'Ошибка на шаге остановки "{name}": {e}', exc_info=True)
+            durations[name] = self._clock() - step_started
+        total = self._clock() - started
+        if total > self.deadline:
+            logger.warning(f'Остановка заняла {total:.2f} с, больше отведенных {self.deadline} с: {durations}.')
+        else:
+            logger.info(f'Бот остановлен за {total:.2f} с: {durations}.')
+        return durations
+
+    def _add_in_flight(self, delta: int):
+        """Изменяет количество незавершенных обработчиков и будит ожидающих wait_idle()."""
+        with self._idle:
+            self._in_flight += delta
+            self._idle.notify_all()
+
+    def _handle_signal(self, signum: int, frame: Any):
+        """Обработчик сигнала: начинает плавную остановку."""
+        logger.info(f'Получен сигнал {signal.Signals(signum).name}, прием новых обновлений прекращается.')
+        self.request_stop()
+
+    def _run_on_stop(self):
+        """Вызывает функции прекращения приема обновлений."""
+        for function in self._on_stop:
+            try:
+                function()
+            except Exception as e:
+                logger.error(f'Ошибка при прекращении приема обновлений: {e}', exc_info=True)
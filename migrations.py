@@ -0,0 +1,120 @@
+import sqlite3
+import logging
+from typing import Callable
+
+# Получение экземпляра логгера
+logger = logging.getLogger(f'my_app.{__name__}')
+
+# Функция миграции: получает соединение и размер пачки для долгих преобразований данных
+MigrationFunc = Callable[[sqlite3.Connection, int], None]
+
+
+def get_user_version(conn: sqlite3.Connection) -> int:
+    """
+    Возвращает версию схемы БД, записанную в PRAGMA user_version.
+    :param conn: sqlite3.Connection: Соединение с базой данных.
+    :return: int: Версия схемы (0 для новой или не версионированной БД).
+    """
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def set_user_version(conn: sqlite3.Connection, version: int):
+    """
+    Записывает версию схемы БД в PRAGMA user_version (в текущей транзакции).
+    :param conn: sqlite3.Connection: Соединение с базой данных.
+    :param version: int: Версия схемы.
+    """
+    # PRAGMA не поддерживает параметры запроса, поэтому значение проверяется явно
+    conn.execute(f'PRAGMA user_version = {int(version)}')
+
+
+def run_in_batches(conn: sqlite3.Connection, sql_select: str, process_batch: Callable[[sqlite3.Cursor, list], None],
+                   batch_size: int, description: str) -> int:
+    """
+    Выполняет долгое преобразование данных пачками, каждая пачка - отдельная короткая транзакция,
+    чтобы не держать блокировку записи. Строки перебираются по возрастанию ID (первая колонка выборки).
+    Если запрос выбирает только еще не обработанные строки, прерванное преобразование продолжится
+    с места остановки при следующем запуске.
+    :param conn: sqlite3.Connection: Соединение с базой данных.
+    :param sql_select: str: Запрос с параметрами (последний обработанный ID, размер пачки).
+    :param process_batch: Callable[[sqlite3.Cursor, list], None]: Обработка пачки строк внутри транзакции.
+    :param batch_size: int: Количество строк в одной пачке.
+    :param description: str: Описание преобразования для журнала.
+    :return: int: Количество обработанных строк.
+    """
+    last_id = 0
+    processed = 0
+    while True:
+        rows = conn.execute(sql_select, (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        with conn:
+            process_batch(conn.cursor(), rows)
+        last_id = rows[-1][0]
+        processed += len(rows)
+        logger.info(f'{description}: обработано {processed} записей (до ID {last_id}).')
+    return processed
+
+
+class MigrationRegistry:
+    """
+    Упорядоченный реестр миграций схемы БД, основанный на PRAGMA user_version.
+
+    Каждая миграция имеет номер версии. При запуске migrate() выполняются только миграции с номером больше
+    текущего user_version, по возрастанию; после каждой миграции user_version увеличивается. Если БД уже
+    актуальна, никакие DDL-запросы не выполняются - только чтение user_version.
+
+    Миграция сама управляет транзакциями: изменение схемы выполняется в одной транзакции, а долгие
+    преобразования данных - пачками через run_in_batches(). Миграции должны быть идемпотентными
+    (IF NOT EXISTS, обработка только еще не преобразованных строк), чтобы прерванный запуск можно было повторить.
+    """
+    def __init__(self):
+        self._migrations: dict[int, tuple[str, MigrationFunc]] = {}
+
+    @property
+    def latest_version(self) -> int:
+        """Номер последней зарегистрированной миграции."""
+        return max(self._migrations, default=0)
+
+    def register(self, version: int, description: str) -> Callable[[MigrationFunc], MigrationFunc]:
+        """
+        Декоратор, регистрирующий функцию миграции под указанным номером версии.
+        :param version: int: Номер версии схемы после применения миграции.
+        :param description: str: Описание миграции для журнала.
+        :return: Callable: Декоратор.
+        """
+        if version < 1 or version in self._migrations:
+            raise ValueError(f'Недопустимый или повторяющийся номер миграции: {version}')
+
+        def decorator(func: MigrationFunc) -> MigrationFunc:
+            self._migrations[version] = (description, func)
+            return func
+        return decorator
+
+    def pending(self, current_version: int) -> list[tuple[int, str, MigrationFunc]]:
+        """
+        Возвращает миграции, которые нужно применить к БД указанной версии.
+        :param current_version: int: Текущая версия схемы.
+        :return: list[tuple[int, str, MigrationFunc]]: Номер, описание и функция каждой миграции по порядку.
+        """
+        return [(version, *self._migrations[version]) for version in sorted(self._migrations)
+                if version > current_version]
+
+    def migrate(self, conn: sqlite3.Connection, batch_size: int = 1000) -> int:
+        """
+        Применяет к БД все недостающие миграции.
+        :param conn: sqlite3.Connection: Соединение с базой данных.
+        :param batch_size: int: Размер пачки для долгих преобразований данных.
+        :return: int: Версия схемы после миграции.
+        """
+        current_version = get_user_version(conn)
+        if current_version > self.latest_version:
+            logger.warning(f'Версия схемы БД ({current_version}) новее известной приложению ({self.latest_version}).')
+            return current_version
+        for version, description, func in self.pending(current_version):
+            logger.info(f'Применяется миграция {version}: {description}.')
+            func(conn, batch_size)
+            with conn:
+                set_user_version(conn, version)
+            current_version = version
+        return current_version
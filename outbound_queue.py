@@ -0,0 +1,319 @@
+import time
+import heapq
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+from telebot import TeleBot, apihelper, types
+
+# Получение экземпляра логгера
+logger = logging.getLogger(f'my_app.{__name__}')
+
+# Полосы приоритета: ответы пользователю отправляются раньше напоминаний, напоминания - раньше рассылок
+PRIORITY_INTERACTIVE = 0
+PRIORITY_REMINDER = 1
+PRIORITY_BROADCAST = 2
+LANE_NAMES = ('interactive', 'reminder', 'broadcast')
+# Количество хранимых лимитов чатов, после которого удаляются лимиты неактивных чатов
+MAX_IDLE_CHAT_LIMITS = 10000
+
+
+class _OutboundMessage:
+    """Вызов Bot API, ожидающий отправки."""
+    __slots__ = ('function', 'args', 'kwargs', 'chat_id', 'priority', 'future', 'enqueued_at', 'attempts')
+
+    def __init__(self, function: Callable, args: tuple, kwargs: dict, chat_id: int, priority: int):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.chat_id = chat_id
+        self.priority = priority
+        self.future: Future = Future()
+        self.enqueued_at: float = time.monotonic()
+        self.attempts: int = 0
+
+
+class OutboundQueue:
+    """
+    Очередь исходящих сообщений с ограничением частоты запросов к Telegram.
+
+    Сообщения складываются в очереди своих чатов и отправляются потоками пула (senders) с соблюдением:
+    - общего лимита global_rate сообщений в секунду (token bucket с запасом global_burst);
+    - лимита per_chat_rate сообщений в секунду для каждого чата (с запасом per_chat_burst);
+    - порядка сообщений внутри чата (у чата не больше одного сообщения в отправке);
+    - приоритета полос: interactive раньше reminder, reminder раньше broadcast.
+
+    Ответ 429 (Too Many Requests) откладывает отправку в чат на retry_after секунд, указанные Telegram,
+    сообщение возвращается в начало очереди чата. Ошибки сети и ответы 5xx повторяются с экспоненциальной
+    задержкой (не больше max_retries раз), остальные ошибки Bot API не повторяются.
+
+    Количество ожидающих сообщений ограничено max_pending: при переполнении submit() ждет. Лимиты чатов,
+    у которых нет сообщений и запас восстановлен, удаляются, поэтому память не растет с количеством чатов.
+
+    Attributes:
+        global_rate (float): Общий лимит сообщений в секунду.
+        per_chat_rate (float): Лимит сообщений в секунду для одного чата.
+        max_pending (int): Максимальное количество ожидающих отправки сообщений.
+        max_retries (int): Максимальное количество повторов при ошибке сети или 5xx.
+    """
+    def __init__(self, global_rate: float = 30.0, global_burst: int = 30, per_chat_rate: float = 1.0,
+                 per_chat_burst: int = 3, max_pending: int = 10000, senders: int = 4, max_retries: int = 3,
+                 retry_backoff: float = 0.5):
+        if global_rate <= 0 or per_chat_rate <= 0 or min(global_burst, per_chat_burst, max_pending, senders) < 1:
+            raise ValueError('Лимиты очереди исходящих сообщений должны быть больше нуля.')
+        self.global_rate: float = global_rate
+        self.per_chat_rate: float = per_chat_rate
+        self.max_pending: int = max_pending
+        self.max_retries: int = max_retries
+        self._retry_backoff = retry_backoff
+        # Алгоритм GCRA: лимит хранится одним числом - временем, когда запас будет полностью восстановлен
+        self._global_interval = 1.0 / global_rate
+        self._global_tolerance = self._global_interval * (global_burst - 1)
+        self._global_tat: float = 0.0
+        self._chat_interval = 1.0 / per_chat_rate
+        self._chat_tolerance = self._chat_interval * (per_chat_burst - 1)
+        self._chat_tat: dict[int, float] = {}
+        self._condition = threading.Condition()
+        # Ожидающие сообщения каждого чата
+        self._chats: dict[int, deque[_OutboundMessage]] = {}
+        # Чаты, готовые к отправке, по полосам приоритета (полоса определяется первым сообщением чата)
+        self._lanes: list[deque[int]] = [deque() for _ in LANE_NAMES]
+        # Чаты, отложенные лимитом или ответом 429: (время, когда можно отправлять, порядковый номер, ID чата)
+        self._delayed: list[tuple[float, int, int]] = []
+        self._delayed_seq: int = 0
+        # Чаты, ожидающие в _lanes или _delayed, и чаты с сообщением в отправке
+        self._scheduled: set[int] = set()
+        self._in_flight: set[int] = set()
+        self._pending: int = 0
+        self._stopping: bool = False
+        self._counters: dict[str, int] = {'sent': 0, 'retried': 0, 'rate_limited': 0, 'failed': 0}
+        # Время ожидания в очереди по полосам: [количество, сумма, максимум]
+        self._latency: list[list[float]] = [[0, 0.0, 0.0] for _ in LANE_NAMES]
+        self._executor = ThreadPoolExecutor(max_workers=senders, thread_name_prefix='outbound-sender')
+        self._thread = threading.Thread(target=self._run, name='outbound-scheduler', daemon=True)
+        self._thread.start()
+
+    def submit(self, function: Callable, chat_id: int, *args, priority: int = PRIORITY_INTERACTIVE,
+               queue_timeout: float | None = None, **kwargs) -> Future:
+        """
+        Ставит вызов Bot API в очередь чата.
+        :param function: Callable: Метод бота (например, bot.send_message).
+        :param chat_id: int: ID чата, к лимиту которого относится вызов.
+        :param args: Позиционные аргументы вызова.
+        :param priority: int: Полоса приоритета (PRIORITY_INTERACTIVE, PRIORITY_REMINDER, PRIORITY_BROADCAST).
+        :param queue_timeout: float | None: Максимальное время ожидания места в очереди в секундах
+            (не путать с параметром timeout методов Bot API, который передается вызову в kwargs).
+        :param kwargs: Именованные аргументы вызова.
+        :return: Future: Результат вызова Bot API.
+        """
+        if priority not in range(len(LANE_NAMES)):
+            raise ValueError(f'Неизвестная полоса приоритета: {priority}.')
+        message = _OutboundMessage(function, args, kwargs, chat_id, priority)
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._stopping or self._pending < self.max_pending, queue_timeout):
+                raise TimeoutError('Очередь исходящих сообщений переполнена.')
+            if self._stopping:
+                raise RuntimeError('Очередь исходящих сообщений остановлена.')
+            self._chats.setdefault(chat_id, deque()).append(message)
+            self._pending += 1
+            if chat_id not in self._scheduled and chat_id not in self._in_flight:
+                self._schedule(chat_id)
+            self._condition.notify_all()
+        return message.future
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Возвращает метрики очереди.
+        :return: dict[str, Any]: Количество ожидающих сообщений (pending), отправленных (sent), повторов (retried),
+            ответов 429 (rate_limited), неотправленных (failed) и время ожидания в очереди по полосам
+            (latency: количество, среднее и максимальное время в секундах).
+        """
+        with self._condition:
+            latency = {name: {'count': int(count), 'avg': total / count if count else 0.0, 'max': peak}
+                       for name, (count, total, peak) in zip(LANE_NAMES, self._latency)}
+            return {'pending': self._pending, **self._counters, 'latency': latency}
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Ждет отправки всех сообщений, поставленных в очередь.
+        :param timeout: float | None: Максимальное время ожидания в секундах.
+        :return: bool: True, если очередь пуста.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._pending == 0, timeout)
+
+    def stop(self, timeout: float | None = 10.0):
+        """
+        Прекращает прием сообщений, ждет отправки уже поставленных (не дольше timeout) и останавливает потоки.
+        :param timeout: float | None: Максимальное время ожидания в секундах.
+        """
+        self.flush(timeout)
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=True)
+        with self._condition:
+            # Сообщения, не отправленные за отведенное время, отменяются
+            for chat in self._chats.values():
+                for message in chat:
+                    message.future.cancel()
+            self._chats.clear()
+            self._pending = 0
+        logger.info(f'Очередь исходящих сообщений остановлена: {self.stats()}.')
+
+    def _schedule(self, chat_id: int, not_before: float = 0.0):
+        """Ставит чат в полосу приоритета его первого сообщения или откладывает до not_before. Вызывается под lock."""
+        self._scheduled.add(chat_id)
+        if not_before > time.monotonic():
+            self._delayed_seq += 1
+            heapq.heappush(self._delayed, (not_before, self._delayed_seq, chat_id))
+        else:
+            self._lanes[self._chats[chat_id][0].priority].append(chat_id)
+
+    def _next_ready(self, now: float) -> tuple[_OutboundMessage | None, float | None]:
+        """
+        Выбирает следующее сообщение с учетом приоритета и лимитов. Вызывается под lock.
+        :return: tuple: Сообщение (или None) и время ожидания до следующей проверки (None - ждать события).
+        """
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, chat_id = heapq.heappop(self._delayed)
+            self._lanes[self._chats[chat_id][0].priority].append(chat_id)
+        wait = self._delayed[0][0] - now if self._delayed else None
+        if not any(self._lanes):
+            return None, wait
+        global_wait = self._global_tat - self._global_tolerance - now
+        if global_wait > 0:
+            return None, global_wait if wait is None else min(wait, global_wait)
+        lane = next(lane for lane in self._lanes if lane)
+        chat_id = lane.popleft()
+        chat_tat = self._chat_tat.get(chat_id, 0.0)
+        chat_wait = chat_tat - self._chat_tolerance - now
+        if chat_wait > 0:
+            # Лимит чата исчерпан: чат ждет, не задерживая остальных
+            self._scheduled.discard(chat_id)
+            self._schedule(chat_id, now + chat_wait)
+            return None, 0.0
+        self._global_tat = max(self._global_tat, now) + self._global_interval
+        self._chat_tat[chat_id] = max(chat_tat, now) + self._chat_interval
+        self._scheduled.discard(chat_id)
+        self._in_flight.add(chat_id)
+        message = self._chats[chat_id].popleft()
+        count_total_peak = self._latency[message.priority]
+        latency = now - message.enqueued_at
+        count_total_peak[0] += 1
+        count_total_peak[1] += latency
+        count_total_peak[2] = max(count_total_peak[2], latency)
+        return message, 0.0
+
+    def _run(self):
+        """Цикл планировщика: передает готовые сообщения потокам отправки."""
+        while True:
+            with self._condition:
+                if self._stopping:
+                    return
+                message, wait = self._next_ready(time.monotonic())
+                if message is None:
+                    if wait != 0.0:
+                        self._condition.wait(wait)
+                    continue
+            self._executor.submit(self._send, message)
+
+    def _send(self, message: _OutboundMessage):
+        """Выполняет вызов Bot API и обрабатывает результат (успех, 429, повтор или отказ)."""
+        message.attempts += 1
+        retry_at = None
+        try:
+            result = message.function(*message.args, **message.kwargs)
+        except apihelper.ApiTelegramException as e:
+            if e.error_code == 429:
+                retry_after = (e.result_json.get('parameters') or {}).get('retry_after', 1)
+                logger.warning(f'Telegram ограничил отправку в чат {message.chat_id}, повтор через {retry_after} с.')
+                retry_at = time.monotonic() + retry_after
+                # Ответ 429 не расходует попытки: Telegram сам указал, когда повторить
+                message.attempts -= 1
+                self._count('rate_limited')
+            elif e.error_code >= 500 and message.attempts <= self.max_retries:
+                retry_at = self._backoff(message)
+            else:
+                self._fail(message, e)
+        except Exception as e:
+            if message.attempts <= self.max_retries:
+                retry_at = self._backoff(message)
+            else:
+                self._fail(message, e)
+        else:
+            message.future.set_result(result)
+            self._count('sent')
+        with self._condition:
+            chat_id = message.chat_id
+            self._in_flight.discard(chat_id)
+            if retry_at is not None:
+                self._chats[chat_id].appendleft(message)
+            else:
+                self._pending -= 1
+            if self._chats[chat_id]:
+                self._schedule(chat_id, retry_at or 0.0)
+            else:
+                del self._chats[chat_id]
+                self._prune_chat_limits()
+            self._condition.notify_all()
+
+    def _backoff(self, message: _OutboundMessage) -> float:
+        """Возвращает время повтора после ошибки сети или 5xx (экспоненциальная задержка)."""
+        self._count('retried')
+        return time.monotonic() + self._retry_backoff * 2 ** (message.attempts - 1)
+
+    def _fail(self, message: _OutboundMessage, error: Exception):
+        """Завершает сообщение ошибкой без повтора."""
+        self._count('failed')
+        # Обработчик не ждет результата, поэтому ошибка (например, пользователь заблокировал бота) видна только в журнале
+        method = getattr(message.function, '__name__', repr(message.function))
+        logger.error(f'Не удалось выполнить {method} для чата {message.chat_id}: {error!r}')
+        message.future.set_exception(error)
+
+    def _count(self, name: str):
+        """Увеличивает счетчик метрик."""
+        with self._condition:
+            self._counters[name] += 1
+
+    def _prune_chat_limits(self):
+        """Удаляет лимиты чатов без сообщений, запас которых полностью восстановлен. Вызывается под lock."""
+        if len(self._chat_tat) <= MAX_IDLE_CHAT_LIMITS:
+            return
+        now = time.monotonic()
+        for chat_id in [chat_id for chat_id, tat in self._chat_tat.items() if tat <= now and chat_id not in self._chats]:
+            del self._chat_tat[chat_id]
+
+
+class RateLimitedBot:
+    """
+    Обертка над TeleBot для обработчиков: send_message, reply_to и edit_message_text ставятся в OutboundQueue
+    (полоса interactive) и не блокируют поток обработчика, остальные атрибуты и методы берутся у бота.
+    Ошибка отправки не поднимается в обработчике: она записывается в журнал с методом и ID чата
+    и доступна через возвращенный Future.
+
+    Attributes:
+        bot (TeleBot): Бот, выполняющий запросы к Bot API.
+        outbound (OutboundQueue): Очередь исходящих сообщений.
+    """
+    def __init__(self, bot: TeleBot, outbound: OutboundQueue):
+        self.bot: TeleBot = bot
+        self.outbound: OutboundQueue = outbound
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.bot, name)
+
+    def send_message(self, chat_id: int, text: str, *args, **kwargs) -> Future:
+        """Ставит bot.send_message в очередь чата chat_id."""
+        return self.outbound.submit(self.bot.send_message, chat_id, chat_id, text, *args, **kwargs)
+
+    def reply_to(self, message: types.Message, text: str, **kwargs) -> Future:
+        """Ставит bot.reply_to в очередь чата сообщения."""
+        return self.outbound.submit(self.bot.reply_to, message.chat.id, message, text, **kwargs)
+
+    def edit_message_text(self, text: str, chat_id: int, *args, **kwargs) -> Future:
+        """Ставит bot.edit_message_text в очередь чата chat_id."""
+        return self.outbound.submit(self.bot.edit_message_text, chat_id, text, chat_id, *args, **kwargs)
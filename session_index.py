@@ -0,0 +1,291 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Iterable
+
+# Признак того, что ответа в индексе нет и нужно обратиться к БД
+MISS = object()
+
+
+class _CachedSession:
+    """Сессия сна в индексе. Время хранится в формате БД (микросекунды от эпохи)."""
+    __slots__ = ('id', 'sleep_time', 'wake_time', 'quality')
+
+    def __init__(self, session_id: int, sleep_time: int, wake_time: int | None = None, quality: int | None = None):
+        self.id: int = session_id
+        self.sleep_time: int = sleep_time
+        self.wake_time: int | None = wake_time
+        self.quality: int | None = quality
+
+
+class _UserSessions:
+    """
+    Состояние сессий одного пользователя: все незавершенные сессии и кольцевой буфер последних завершенных
+    (упорядочен по времени пробуждения, от новых к старым).
+    """
+    __slots__ = ('open', 'recent', 'complete', 'last_access')
+
+    def __init__(self, recent_size: int):
+        self.open: dict[int, _CachedSession] = {}
+        self.recent: deque[_CachedSession] = deque(maxlen=recent_size)
+        # True, если в буфере все завершенные сессии пользователя (буфер ни разу не переполнялся)
+        self.complete: bool = True
+        self.last_access: float = 0.0
+
+
+class HotSessionIndex:
+    """
+    Индекс "горячих" сессий сна в памяти: для каждого активного пользователя хранятся открытые сессии
+    и кольцевой буфер из recent_size последних завершенных сессий.
+
+    Обработчики /wake, /quality, /notes и кнопок оценки ищут последнюю незавершенную сессию или последнюю
+    завершенную сессию за сегодня. Индекс отвечает на эти запросы без обращения к БД. Состояние пользователя
+    загружается из БД при первом обращении и дальше поддерживается методами записи DatabaseManager
+    (session_started, session_finished, quality_updated). Если изменение нельзя точно отразить в индексе,
+    состояние пользователя сбрасывается и будет загружено заново.
+
+    Память ограничена: хранится не более max_users пользователей (вытесняются давно не обращавшиеся),
+    а пользователи без обращений дольше idle_timeout секунд удаляются.
+
+    Attributes:
+        max_users (int): Максимальное количество пользователей в индексе.
+        idle_timeout (float | None): Время (в секундах) без обращений, после которого пользователь удаляется.
+        recent_size (int): Размер кольцевого буфера завершенных сессий.
+        hits (int): Количество запросов, на которые индекс ответил без БД.
+        misses (int): Количество запросов, потребовавших обращения к БД.
+        evictions (int): Количество пользователей, удаленных из-за переполнения или простоя.
+    """
+    def __init__(self, max_users: int = 10000, idle_timeout: float | None = 3600.0, recent_size: int = 8,
+                 clock: Callable[[], float] = time.monotonic):
+        if max_users < 1 or recent_size < 1:
+            raise ValueError('max_users и recent_size должны быть больше нуля.')
+        self.max_users: int = max_users
+        self.idle_timeout: float | None = idle_timeout
+        self.recent_size: int = recent_size
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+        # ID пользователя -> состояние; порядок - от давно использованных к недавним
+        self._users: OrderedDict[int, _UserSessions] = OrderedDict()
+        # ID сессии -> ID пользователя (для сессий, которые есть в индексе)
+        self._session_users: dict[int, int] = {}
+        # Счетчик изменений: загрузка, начатая до изменения, не сохраняется (данные могли устареть)
+        self._version: int = 0
+
+    def __len__(self) -> int:
+        """Возвращает количество пользователей в индексе."""
+        with self._lock:
+            return len(self._users)
+
+    def __contains__(self, user_id: int) -> bool:
+        """Проверяет, загружено ли состояние пользователя."""
+        with self._lock:
+            return user_id in self._users
+
+    def stats(self) -> dict[str, int]:
+        """
+        Возвращает счетчики работы индекса.
+        :return: dict[str, int]: Количество пользователей, попаданий, промахов и вытеснений.
+        """
+        with self._lock:
+            return {'size': len(self._users), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def begin_load(self) -> int:
+        """
+        Возвращает метку версии, которую нужно передать в load() после чтения данных из БД.
+        :return: int: Метка версии.
+        """
+        with self._lock:
+            return self._version
+
+    def load(self, user_id: int, version: int, open_rows: Iterable[tuple], finished_rows: Iterable[tuple]) -> bool:
+        """
+        Сохраняет состояние пользователя, прочитанное из БД.
+        :param user_id: int: ID пользователя в телеграмме.
+        :param version: int: Метка, полученная от begin_load() до чтения из БД.
+        :param open_rows: Iterable[tuple]: Все незавершенные сессии (id, sleep_time, wake_time, sleep_quality).
+        :param finished_rows: Iterable[tuple]: Не более recent_size + 1 последних завершенных сессий
+                                               в порядке убывания времени пробуждения.
+        :return: bool: True, если состояние сохранено, False, если за время чтения данные изменились.
+        """
+        state = _UserSessions(self.recent_size)
+        for row in open_rows:
+            state.open[row[0]] = _CachedSession(*row)
+        finished_rows = list(finished_rows)
+        state.complete = len(finished_rows) <= self.recent_size
+        state.recent.extend(_CachedSession(*row) for row in finished_rows[:self.recent_size])
+        with self._lock:
+            if version != self._version:
+                return False
+            self._drop(user_id)
+            state.last_access = self._clock()
+            self._users[user_id] = state
+            for session in (*state.open.values(), *state.recent):
+                self._session_users[session.id] = user_id
+            self._evict_overflow()
+        return True
+
+    def latest_unfinished(self, user_id: int) -> tuple[int, int] | None:
+        """
+        Возвращает последнюю (по времени начала) незавершенную сессию пользователя.
+        :param user_id: int: ID пользователя в телеграмме.
+        :return: tuple[int, int] | None: ID сессии и время начала, None, если открытых сессий нет,
+                                         или MISS, если пользователь не загружен.
+        """
+        with self._lock:
+            state = self._touch(user_id)
+            if state is None:
+                return MISS
+            self.hits += 1
+            if not state.open:
+                return None
+            session = max(state.open.values(), key=lambda item: (item.sleep_time, item.id))
+            return session.id, session.sleep_time
+
+    def latest_finished(self, user_id: int, with_quality: bool,
+                        wake_from: int | None = None, wake_to: int | None = None) -> tuple[int, int, int] | None:
+        """
+        Возвращает последнюю завершенную сессию с оценкой качества или без нее.
+        :param user_id: int: ID пользователя в телеграмме.
+        :param with_quality: bool: True - искать сессию с оценкой качества, False - без оценки.
+        :param wake_from: int | None: Нижняя граница времени пробуждения (включительно).
+        :param wake_to: int | None: Верхняя граница времени пробуждения (не включительно).
+        :return: tuple[int, int, int] | None: ID сессии, время начала и время пробуждения, None, если сессии нет,
+                                              или MISS, если ответ может знать только БД.
+        """
+        with self._lock:
+            state = self._touch(user_id)
+            if state is None:
+                return MISS
+            for session in state.recent:
+                if wake_to is not None and session.wake_time >= wake_to:
+                    continue
+                if wake_from is not None and session.wake_time < wake_from:
+                    # Дальше в буфере (и за его пределами) сессии только старше
+                    break
+                if (session.quality is not None) == with_quality:
+                    self.hits += 1
+                    return session.id, session.sleep_time, session.wake_time
+            # Сессии за пределами буфера завершены не позже самой старой сессии в буфере
+            outside_too_old = (wake_from is not None and state.recent
+                               and state.recent[-1].wake_time < wake_from)
+            if state.complete or outside_too_old:
+                self.hits += 1
+                return None
+            self.misses += 1
+            return MISS
+
+    def session_started(self, user_id: int, session_id: int, sleep_time: int):
+        """
+        Отражает в индексе начало новой сессии сна.
+        :param user_id: int: ID пользователя в телеграмме.
+        :param session_id: int: ID новой сессии.
+        :param sleep_time: int: Время начала сна в формате БД.
+        """
+        with self._lock:
+            self._version += 1
+            state = self._users.get(user_id)
+            if state is not None:
+                state.open[session_id] = _CachedSession(session_id, sleep_time)
+                self._session_users[session_id] = user_id
+
+    def session_finished(self, user_id: int, session_id: int, wake_time: int):
+        """
+        Отражает в индексе завершение сессии сна: сессия переносится из открытых в буфер завершенных.
+        :param user_id: int: ID пользователя в телеграмме.
+        :param session_id: int: ID сессии.
+        :param wake_time: int: Время пробуждения в формате БД.
+        """
+        with self._lock:
+            self._version += 1
+            state = self._users.get(user_id)
+            if state is None:
+                return
+            session = state.open.pop(session_id, None)
+            if session is None:
+                # Повторное завершение или сессия, неизвестная индексу: проще загрузить состояние заново
+                self._drop(user_id)
+                return
+            session.wake_time = wake_time
+            if state.recent and wake_time < state.recent[0].wake_time:
+                # Сессия завершилась раньше уже известных: вставляем с сохранением порядка
+                ordered = sorted((*state.recent, session), key=lambda item: (item.wake_time, item.id), reverse=True)
+                state.recent.clear()
+                state.recent.extend(ordered[:self.recent_size])
+                dropped = ordered[self.recent_size:]
+            else:
+                dropped = [state.recent[-1]] if len(state.recent) == self.recent_size else []
+                state.recent.appendleft(session)
+            for item in dropped:
+                self._session_users.pop(item.id, None)
+                state.complete = False
+
+    def quality_updated(self, session_id: int, quality: int):
+        """
+        Отражает в индексе оценку качества сессии сна.
+        :param session_id: int: ID сессии.
+        :param quality: int: Оценка качества сна.
+        """
+        with self._lock:
+            self._version += 1
+            user_id = self._session_users.get(session_id)
+            state = self._users.get(user_id) if user_id is not None else None
+            if state is None:
+                return
+            session = state.open.get(session_id)
+            if session is None:
+                session = next((item for item in state.recent if item.id == session_id), None)
+            if session is not None:
+                session.quality = quality
+
+    def invalidate(self, user_id: int | None = None):
+        """
+        Удаляет состояние пользователя (или всех пользователей), чтобы оно было загружено из БД заново.
+        :param user_id: int | None: ID пользователя или None, чтобы очистить индекс полностью.
+        """
+        with self._lock:
+            self._version += 1
+            if user_id is None:
+                self._users.clear()
+                self._session_users.clear()
+            else:
+                self._drop(user_id)
+
+    def _touch(self, user_id: int) -> _UserSessions | None:
+        """Возвращает состояние пользователя и отмечает обращение. Вызывается под self._lock."""
+        self._evict_idle()
+        state = self._users.get(user_id)
+        if state is None:
+            self.misses += 1
+            return None
+        state.last_access = self._clock()
+        self._users.move_to_end(user_id)
+        return state
+
+    def _drop(self, user_id: int):
+        """Удаляет состояние пользователя вместе с обратными ссылками сессий. Вызывается под self._lock."""
+        state = self._users.pop(user_id, None)
+        if state is not None:
+            for session in (*state.open.values(), *state.recent):
+                self._session_users.pop(session.id, None)
+
+    def _evict_overflow(self):
+        """Вытесняет давно не обращавшихся пользователей сверх max_users. Вызывается под self._lock."""
+        while len(self._users) > self.max_users:
+            self._drop(next(iter(self._users)))
+            self.evictions += 1
+
+    def _evict_idle(self):
+        """Удаляет пользователей без обращений дольше idle_timeout. Вызывается под self._lock."""
+        if self.idle_timeout is None:
+            return
+        deadline = self._clock() - self.idle_timeout
+        # Пользователи упорядочены по времени последнего обращения, проверяем только самых "старых"
+        while self._users:
+            user_id, state = next(iter(self._users.items()))
+            if state.last_access > deadline:
+                break
+            self._drop(user_id)
+            self.evictions += 1
@@ -1,28 +1,148 @@
 import os
 import telebot
 import logging
-from telebot import types
+import threading
+from telebot import types, util
+from typing import Callable, NamedTuple
 from datetime import datetime
-# Импортируем DatabaseManager, в нем вся логика работы с БД
-from database_manager import DatabaseManager
-# Импортируем функцию настройки логирования из файла с конфигурацией
-from my_logger_config import setup_logging
-# Вызов функции настройки логирования (ОДИН РАЗ) при запуске программы
-setup_logging()
+# Экземпляр бота (BotApp): свой менеджер БД (DatabaseManager), хранилище шагов диалога и настройки
+from bot_app import AppAttribute, BotApp, BotSettings, HandlerSpec, close_shared_pools, create_apps, settings_from_env
+from callback_router import CallbackDataError, CallbackRouter
 
 # Получение экземпляра логгера
 logger = logging.getLogger(f'my_app.{__name__}')
 
-# --- Инициализация бота и базы данных ---
-# Токен в переменной окружения
-MY_TOKEN_BOT = os.getenv("API_TOKEN")
-bot = telebot.TeleBot(MY_TOKEN_BOT)
-# Инициализируем менеджер базы данных
-db = DatabaseManager()
+# --- Бот и база данных ---
+# Обработчики обращаются к bot, db и conversations экземпляра бота, получившего обновление.
+# Экземпляры создаются фабрикой create_app() (или create_apps() для нескольких ботов) при запуске,
+# а не при импорте модуля: импорт не открывает БД, не настраивает логирование и не создает бота
+bot = AppAttribute('bot')
+db = AppAttribute('db')
+conversations = AppAttribute('conversations')
+# Шаг диалога: ожидание текста заметки к сессии сна
+NOTE_STEP = 'note'
+# Режим работы: 'threaded' - синхронный TeleBot (по умолчанию), 'async' - те же обработчики на AsyncTeleBot
+BOT_RUNTIME = os.getenv('BOT_RUNTIME', 'threaded')
+# Способ получения обновлений: 'polling' (по умолчанию) или 'webhook' - встроенный HTTP-сервер
+BOT_UPDATE_MODE = os.getenv('BOT_UPDATE_MODE', 'polling')
+# Если задано BOT_ORDERED_WORKERS, обновления обрабатываются этим количеством очередей с сохранением порядка для чата
+BOT_ORDERED_WORKERS = os.getenv('BOT_ORDERED_WORKERS')
+# Если задано BOT_OUTBOUND_RATE (сообщений в секунду), исходящие сообщения отправляются через очередь с лимитами Telegram
+BOT_OUTBOUND_RATE = os.getenv('BOT_OUTBOUND_RATE')
+# BOT_EARLY_CALLBACK_ACK=1 - нажатия inline кнопок подтверждаются сразу при получении, до запросов к БД
+BOT_EARLY_CALLBACK_ACK = os.getenv('BOT_EARLY_CALLBACK_ACK') == '1'
+# Время (в секундах) на плавную остановку по SIGTERM/SIGINT: дообработка обновлений, отправка сообщений, запись в БД
+BOT_SHUTDOWN_TIMEOUT = float(os.getenv('BOT_SHUTDOWN_TIMEOUT', '30'))
+
+
+# --- Регистрация обработчиков ---
+# Обработчики объявляются при импорте, а подключаются к боту фабрикой create_app() в порядке объявления
+MESSAGE_HANDLERS: list[HandlerSpec] = []
+CALLBACK_QUERY_HANDLERS: list[HandlerSpec] = []
+
+
+def message_handler(**filters) -> Callable:
+    """
+    Декоратор: запоминает обработчик сообщений и его фильтры для подключения к боту в create_app().
+    :param filters: Фильтры telebot, как у bot.message_handler (commands, func, content_types и т.д.).
+    :return: Callable: Декоратор, возвращающий обработчик без изменений.
+    """
+    # Как и bot.message_handler, по умолчанию обрабатываются только текстовые сообщения
+    filters.setdefault('content_types', ['text'])
+
+    def decorator(handler: Callable) -> Callable:
+        MESSAGE_HANDLERS.append((handler, filters))
+        return handler
+    return decorator
+
+
+def callback_query_handler(**filters) -> Callable:
+    """
+    Декоратор: запоминает обработчик нажатий inline кнопок для подключения к боту в create_app().
+    :param filters: Фильтры telebot, как у bot.callback_query_handler (func).
+    :return: Callable: Декоратор, возвращающий обработчик без изменений.
+    """
+    def decorator(handler: Callable) -> Callable:
+        CALLBACK_QUERY_HANDLERS.append((handler, filters))
+        return handler
+    return decorator
+
+
+# --- Данные inline кнопок ---
+# Маршрутизатор нажатий: callback_data кодируется как '<код><версия>:<поля>' и разбирается один раз
+callback_router = CallbackRouter()
+
+
+class MenuCallback(NamedTuple):
+    """ Кнопка основной команды (sleep, wake, quality, notes, recom, statis). """
+    command: str
+
+    def validate(self) -> bool:
+        return self.command in MENU_COMMANDS
+
+
+class QualityCallback(NamedTuple):
+    """ Кнопка оценки качества сна: оценка от 1 до 5 и ID сессии сна. """
+    quality: int
+    sleep_record_id: int
+
+    def validate(self) -> bool:
+        return 1 <= self.quality <= 5
+
+
+class NoteUpdateCallback(NamedTuple):
+    """ Кнопка согласия (update=True) или отказа в обновлении заметки к сессии сна. """
+    update: bool
+    sleep_record_id: int
+
+
+def menu_data(command: str) -> str:
+    """
+    Возвращает callback_data кнопки основной команды.
+    :param command: str: Команда без '/' (например, 'sleep').
+    :return: str: callback_data.
+    """
+    return callback_router.encode(MenuCallback(command))
 
 
 # --- Обработчики команд ---
-@bot.message_handler(commands=['start'])
+@message_handler(func=lambda message: message.chat.id in conversations, content_types=util.content_type_media)
+def handle_conversation_step(message: types.Message):
+    """
+    Передает сообщение ожидаемому шагу диалога чата (регистрируется первым, раньше обработчиков команд).
+    Шаг извлекается из хранилища conversations, поэтому ввод заметки продолжается и после перезапуска бота.
+    :param message: types.Message: Объект сообщения.
+    """
+    state = conversations.pop(message.chat.id)
+    if state is None:
+        # Шаг устарел после проверки фильтра или уже обработан другим потоком
+        dispatch_without_step(message)
+    elif state.step == NOTE_STEP:
+        process_notes_step(message, state.data['sleep_record_id'])
+    else:
+        logger.warning(f'Неизвестный шаг диалога {state.step!r} в чате {message.chat.id}.')
+
+
+def dispatch_without_step(message: types.Message):
+    """
+    Передает сообщение первому подходящему обработчику после handle_conversation_step,
+    как если бы шага диалога не было (фильтры проверяются так же, как в telebot).
+    :param message: types.Message: Объект сообщения.
+    """
+    for handler, filters in MESSAGE_HANDLERS:
+        if handler is handle_conversation_step or message.content_type not in filters['content_types']:
+            continue
+        commands = filters.get('commands')
+        if commands is not None and (message.content_type != 'text'
+                                     or util.extract_command(message.text) not in commands):
+            continue
+        if filters.get('func') is not None and not filters['func'](message):
+            continue
+        handler(message)
+        return
+
+
+@message_handler(commands=['start'])
 def send_welcome(message: types.Message):
     """
     Обрабатывает команду start.
@@ -41,12 +161,12 @@ def send_welcome(message: types.Message):
     # создаем inline клавиатуру
     markup = types.InlineKeyboardMarkup()
     # создаем кнопки с callback_data - командами
-    sleep_button = types.InlineKeyboardButton("Сладких снов 😴", callback_data='/sleep')
-    wake_button = types.InlineKeyboardButton("Я проснулся ☀", callback_data='/wake')
-    quality_button = types.InlineKeyboardButton("Качество сна 💫", callback_data='/quality')
-    notes_button = types.InlineKeyboardButton("Заметки 📝", callback_data='/notes')
-    recom_button = types.InlineKeyboardButton("Общие рекомендации 🧘🏼‍♀️", callback_data='/recom')
-    statis_inl_button = types.InlineKeyboardButton("Статистика сна 📊💤", callback_data='/statis')
+    sleep_button = types.InlineKeyboardButton("Сладких снов 😴", callback_data=menu_data('sleep'))
+    wake_button = types.InlineKeyboardButton("Я проснулся ☀", callback_data=menu_data('wake'))
+    quality_button = types.InlineKeyboardButton("Качество сна 💫", callback_data=menu_data('quality'))
+    notes_button = types.InlineKeyboardButton("Заметки 📝", callback_data=menu_data('notes'))
+    recom_button = types.InlineKeyboardButton("Общие рекомендации 🧘🏼‍♀️", callback_data=menu_data('recom'))
+    statis_inl_button = types.InlineKeyboardButton("Статистика сна 📊💤", callback_data=menu_data('statis'))
     # Добавляем кнопки на клавиатуру
     markup.add(sleep_button, wake_button)
     markup.add(quality_button, notes_button)
@@ -86,7 +206,7 @@ def send_welcome(message: types.Message):
     logger.debug('Отправка дополнительного сообщения с командами, которые всегда доступны.')
 
 
-@bot.message_handler(commands=['help'])
+@message_handler(commands=['help'])
 def handle_help(message: types.Message):
     """
     Обрабатывает команду help.
@@ -98,12 +218,12 @@ def handle_help(message: types.Message):
     # создаем inline клавиатуру
     markup = types.InlineKeyboardMarkup()
     # создаем кнопки с callback_data - командами
-    sleep_button = types.InlineKeyboardButton("Сладких снов 😴", callback_data='/sleep')
-    wake_button = types.InlineKeyboardButton("Я проснулся ☀", callback_data='/wake')
-    quality_button = types.InlineKeyboardButton("Качество сна 💫", callback_data='/quality')
-    notes_button = types.InlineKeyboardButton("Заметки 📝", callback_data='/notes')
-    recom_button = types.InlineKeyboardButton("Общие рекомендации 🧘🏼‍♀️", callback_data='/recom')
-    statis_inl_button = types.InlineKeyboardButton("Статистика сна 📊💤", callback_data='/statis')
+    sleep_button = types.InlineKeyboardButton("Сладких снов 😴", callback_data=menu_data('sleep'))
+    wake_button = types.InlineKeyboardButton("Я проснулся ☀", callback_data=menu_data('wake'))
+    quality_button = types.InlineKeyboardButton("Качество сна 💫", callback_data=menu_data('quality'))
+    notes_button = types.InlineKeyboardButton("Заметки 📝", callback_data=menu_data('notes'))
+    recom_button = types.InlineKeyboardButton("Общие рекомендации 🧘🏼‍♀️", callback_data=menu_data('recom'))
+    statis_inl_button = types.InlineKeyboardButton("Статистика сна 📊💤", callback_data=menu_data('statis'))
     # добавляем кнопки на клавиатуру
     markup.add(sleep_button, wake_button)
     markup.add(quality_button, notes_button)
@@ -125,7 +245,7 @@ def handle_help(message: types.Message):
     logger.debug('Отправка сообщения со списком доступных команд.')
 
 
-@bot.message_handler(commands=['recom'])
+@message_handler(commands=['recom'])
 def handle_recom(message: types.Message):
     """
     Обрабатывает команду recom. Отправляем пользователю сообщение с общими рекомендациями.
@@ -185,7 +305,7 @@ def calculate_sleep_statistics(user_id: int) -> str:
         return f"Простите, произошла ошибка {e}. Попробуйте еще раз.😔"
 
 
-@bot.message_handler(commands=['statis'])
+@message_handler(commands=['statis'])
 def handle_statistics(message: types.Message):
     """
     Обрабатывает команду statis.
@@ -199,7 +319,7 @@ def handle_statistics(message: types.Message):
     bot.send_message(user_id, statistics)
 
 
-@bot.message_handler(commands=['sleep'])
+@message_handler(commands=['sleep'])
 def handle_sleep(message: types.Message):
     """
     Обрабатывает команду sleep.
@@ -219,7 +339,7 @@ def handle_sleep(message: types.Message):
         sleep_record_id, sleep_start_time = db.get_latest_unfinished_sleep_session(user_id)
         if sleep_record_id:
             markup = types.InlineKeyboardMarkup()
-            wake_button = types.InlineKeyboardButton("Я проснулся ☀", callback_data='/wake')
+            wake_button = types.InlineKeyboardButton("Я проснулся ☀", callback_data=menu_data('wake'))
             markup.add(wake_button)
             bot.send_message(user_id, "У Вас уже есть активная сессия сна😴\n"
                                       "Сначала завершите ее отметив свое пробуждение.😊", reply_markup=markup)
@@ -232,7 +352,7 @@ def handle_sleep(message: types.Message):
         new_sleep_record_id = db.start_sleep_session(user_id, current_time)
         if new_sleep_record_id:
             markup = types.InlineKeyboardMarkup()
-            wake_button = types.InlineKeyboardButton("Я проснулся ☀", callback_data='/wake')
+            wake_button = types.InlineKeyboardButton("Я проснулся ☀", callback_data=menu_data('wake'))
             markup.add(wake_button)
             bot.send_message(user_id, "Отмечено время начала сна.\nСладких снов!✨\nНе забудьте отметить свое пробуждение!")
             logger.debug('Отмечено время начала сна.')
@@ -247,12 +367,12 @@ def handle_sleep(message: types.Message):
         logger.error(f'Ошибка при выполнении функции-обработчика команды /sleep: {e}', exc_info=True)
 
 
-@bot.message_handler(commands=['wake'])
+@message_handler(commands=['wake'])
 def handle_wake(message: types.Message):
     """
     Обработчик команды wake.
-    Ищет последнюю незавершенную сессию сна, информирует, если нет такой и необходимо отметить начало сна.
-    Если сессия найдена, завершает ее и рассчитывает продолжительность сна за эту сессию.
+    Атомарно завершает последнюю незавершенную сессию сна (один запрос к БД) и рассчитывает продолжительность сна.
+    Если незавершенной сессии нет, информирует, что необходимо отметить начало сна.
     Отправляет пользователю информативное сообщение с продолжительностью сна и предложением оценить его качество.
     :param message: types.Message: Объект сообщения.
     """
@@ -261,20 +381,16 @@ def handle_wake(message: types.Message):
     user_name = message.from_user.first_name if message.from_user.first_name else 'Пользователь'
     db.add_user(user_id, user_name)
     try:
-        # Ищем последнюю незавершенную сессию сна
-        sleep_record_id, sleep_start_time = db.get_latest_unfinished_sleep_session(user_id)
+        # Находим и завершаем последнюю незавершенную сессию сна одним запросом
+        sleep_record_id, sleep_start_time, sleep_end_time = db.finish_latest_sleep_session(user_id, datetime.now())
         if sleep_record_id:
-            sleep_end_time = datetime.now()
-            # Завершаем найденную сессию сна
-            db.end_sleep_session(sleep_record_id, sleep_end_time)
-
             # Рассчитываем продолжительность сна за эту сессию
             duration = sleep_end_time - sleep_start_time
             duration_hours = int(duration.total_seconds() // 3600)
             duration_minutes = int((duration.total_seconds() % 3600) // 60)
 
             markup_q = types.InlineKeyboardMarkup()
-            quality_button = types.InlineKeyboardButton("Качество сна 💫", callback_data='/quality')
+            quality_button = types.InlineKeyboardButton("Качество сна 💫", callback_data=menu_data('quality'))
             markup_q.add(quality_button)
             bot.send_message(user_id,
                              f"Надеюсь Вы выспались!☀ Вы спали, примерно, {duration_hours} часов {duration_minutes} минут.\n"
@@ -284,7 +400,7 @@ def handle_wake(message: types.Message):
             logger.debug('Отправка кнопки для оценки качества сна.')
         else:
             markup_s = types.InlineKeyboardMarkup()
-            sleep_button = types.InlineKeyboardButton("Сладких снов 😴", callback_data='/sleep')
+            sleep_button = types.InlineKeyboardButton("Сладких снов 😴", callback_data=menu_data('sleep'))
             markup_s.add(sleep_button)
             bot.send_message(user_id, "Сначала отметьте, когда легли спать.😊", reply_markup=markup_s)
             logger.debug('Отправка сообщения, с кнопкой, о необходимо отметить начало сна.')
@@ -295,7 +411,7 @@ def handle_wake(message: types.Message):
         logger.error(f'Ошибка при выполнении функции-обработчика команды /wake: {e}', exc_info=True)
 
 
-@bot.message_handler(commands=['quality'])
+@message_handler(commands=['quality'])
 def handle_quality(message: types.Message):
     """
     Обработчик команды quality.
@@ -310,13 +426,14 @@ def handle_quality(message: types.Message):
     db.add_user(user_id, user_name)
     try:
         # Ищем последнюю завершенную сессию сегодня без оценки качества сна
-        today = datetime.now().date()
-        sleep_record_id, _, _ = db.get_latest_finished_sleep_session_without_quality(user_id, date=today)
-        if sleep_record_id:
+        today = db.sleep_day(datetime.now())
+        state = db.get_user_state(user_id, date=today)
+        if state.last_without_quality:
+            sleep_record_id = state.last_without_quality[0]
             # Создаем клавиатуру и кнопки с оценками от 1 до 5
             keyboard = types.InlineKeyboardMarkup()
             for i in range(1, 6):
-                button = types.InlineKeyboardButton(str(i), callback_data=f'quality_{i}_{sleep_record_id}')
+                button = types.InlineKeyboardButton(str(i), callback_data=callback_router.encode(QualityCallback(i, sleep_record_id)))
                 keyboard.add(button)
             bot.send_message(user_id, """Оцените, пожалуйста, качество Вашего сна сегодня!
 
@@ -335,7 +452,7 @@ def handle_quality(message: types.Message):
             logger.debug('Отправка сообщения с кнопками для оценки качества сна.')
         else:
             markup = types.InlineKeyboardMarkup()
-            wake_button = types.InlineKeyboardButton("Я проснулся ☀", callback_data='/wake')
+            wake_button = types.InlineKeyboardButton("Я проснулся ☀", callback_data=menu_data('wake'))
             markup.add(wake_button)
             bot.send_message(user_id, "Сначала отметьте свое пробуждение,"
                                       " или Вы уже оценили свой последний сон.😊", reply_markup=markup)
@@ -347,28 +464,32 @@ def handle_quality(message: types.Message):
         logger.error(f'Ошибка при выполнении функции-обработчика команды /quality: {e}', exc_info=True)
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("quality_"))
-def handle_quality_callback(call: types.CallbackQuery):
+def answer_callback(call: types.CallbackQuery):
+    """
+    Подтверждает нажатие inline кнопки, если оно еще не подтверждено при получении (BOT_EARLY_CALLBACK_ACK).
+    :param call: types.CallbackQuery: Объект CallbackQuery, содержащий данные о нажатой inline - кнопке.
+    """
+    if getattr(call, 'answered', False) is not True:
+        bot.answer_callback_query(call.id)
+
+
+@callback_router.route('q', QualityCallback)
+def handle_quality_callback(call: types.CallbackQuery, data: QualityCallback):
     """
     Обрабатывает нажатие на кнопки оценки качества сна.
-    Извлекает из callback_data необходимые данные (оценка, ID сессии), предварительно разделив на части.
     Добавляет оценку качества сна, для найденной ранее сессии, в базу данных.
     :param call: types.CallbackQuery: Объект CallbackQuery, содержащий данные о нажатой inline - кнопке.
+    :param data: QualityCallback: Разобранные данные кнопки (оценка, ID сессии).
     """
     logger.info('Обработка нажатия на кнопки оценки качества сна.')
     user_id = call.from_user.id
+    quality = data.quality
     try:
-        parts = call.data.split('_')
-        # Оценка качества сна
-        quality = int(parts[1])
-        # ID сессии сна, которой поставили оценку
-        sleep_record_id = int(parts[2])
-
         # Добавляем оценку в базу данных
-        db.update_sleep_quality(sleep_record_id, quality)
+        db.update_sleep_quality(data.sleep_record_id, quality)
 
         markup = types.InlineKeyboardMarkup()
-        notes_button = types.InlineKeyboardButton("Заметки 📝", callback_data='/notes')
+        notes_button = types.InlineKeyboardButton("Заметки 📝", callback_data=menu_data('notes'))
         markup.add(notes_button)
         # изменяем сообщение, с кнопками для оценки качества сна,
         # после нажатия пользователем на какую-то из предложенных кнопок, на сообщение указанное ниже
@@ -381,11 +502,8 @@ def handle_quality_callback(call: types.CallbackQuery):
         bot.send_message(call.message.chat.id, f"Простите, произошла ошибка {e}. Попробуйте еще раз.😔")
         logger.error(f'Ошибка при выполнении обработки нажатия на кнопки оценки качества сна: {e}', exc_info=True)
 
-    # подтверждение того, что запрос был получен и обработан
-    bot.answer_callback_query(call.id)
-
 
-@bot.message_handler(commands=['notes'])
+@message_handler(commands=['notes'])
 def handle_notes(message: types.Message):
     """
     Обработчик команды notes. Позволяет добавлять или обновлять заметки к сессиям сна.
@@ -399,18 +517,18 @@ def handle_notes(message: types.Message):
     db.add_user(user_id, user_name)
 
     try:
-        today = datetime.now().date()
-        # Ищем сессию с оценкой качества сна
-        sleep_record_data = db.get_latest_finished_sleep_session_with_quality(user_id, date=today)
-        if sleep_record_data:
-            sleep_record_id, _, _ = sleep_record_data
+        today = db.sleep_day(datetime.now())
+        # Ищем сессию с оценкой качества сна и заметку к ней за одно обращение к БД
+        state = db.get_user_state(user_id, date=today)
+        if state.last_with_quality:
+            sleep_record_id, _, _ = state.last_with_quality
 
             # Проверяем наличие заметки к найденной сессии сна
-            existing_note = db.get_note_by_sleep_record_id(sleep_record_id)
+            existing_note = state.note
             if existing_note:
                 markup_n = types.InlineKeyboardMarkup()
-                button_yes = types.InlineKeyboardButton('Да, обнови', callback_data=f'update_yes_{sleep_record_id}')
-                button_no = types.InlineKeyboardButton('Нет', callback_data=f'update_no_{sleep_record_id}')
+                button_yes = types.InlineKeyboardButton('Да, обнови', callback_data=callback_router.encode(NoteUpdateCallback(True, sleep_record_id)))
+                button_no = types.InlineKeyboardButton('Нет', callback_data=callback_router.encode(NoteUpdateCallback(False, sleep_record_id)))
                 markup_n.add(button_yes, button_no)
                 bot.send_message(user_id, f'У вас уже есть заметка к последней оцененной сессии сна: "{existing_note}".'
                                           f'Хотите обновить текущую заметку?', reply_markup=markup_n)
@@ -423,11 +541,11 @@ def handle_notes(message: types.Message):
                 logger.debug('Отправка сообщения с просьбой написать комментарий к оценке качества сна.')
                 logger.info(f'У пользователя ({user_id}) заметки к последней оцененной сессии сна не найдено.')
                 # задаем следующий шаг бота, а именно,
-                # вызываем функцию записи комментария пользователя к оценке качества сна и передаем sleep_record_id
-                bot.register_next_step_handler(message, process_notes_step, sleep_record_id)
+                # следующее сообщение пользователя передается функции записи комментария вместе с sleep_record_id
+                conversations.set(user_id, NOTE_STEP, {'sleep_record_id': sleep_record_id})
         else:
             markup = types.InlineKeyboardMarkup()
-            quality_button = types.InlineKeyboardButton("Качество сна 💫", callback_data='/quality')
+            quality_button = types.InlineKeyboardButton("Качество сна 💫", callback_data=menu_data('quality'))
             markup.add(quality_button)
             bot.send_message(user_id, "У Вас нет завершенной сессии сна с оценкой качества, "
                                       "к которой можно добавить заметку. "
@@ -440,26 +558,25 @@ def handle_notes(message: types.Message):
         logger.error(f'Ошибка при выполнении функции-обработчика команды /notes: {e}', exc_info=True)
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("update_"))
-def handle_notes_update_callback(call: types.CallbackQuery):
+@callback_router.route('n', NoteUpdateCallback)
+def handle_notes_update_callback(call: types.CallbackQuery, data: NoteUpdateCallback):
     """
     Обрабатывает нажатие на кнопки согласия или отказа в обновлении текущей заметки к оценке качества сна.
     :param call: types.CallbackQuery: Объект CallbackQuery, содержащий данные о нажатой inline - кнопке.
+    :param data: NoteUpdateCallback: Разобранные данные кнопки (согласие, ID сессии).
     """
     logger.info('Обработка нажатия на кнопки согласия или отказа в обновлении текущей заметки к оценке качества сна.')
     user_id = call.from_user.id
+    sleep_record_id = data.sleep_record_id
     try:
-        parts = call.data.split('_')
-        yes_no = parts[1]
-        sleep_record_id = int(parts[2])
-        if yes_no == 'yes':
+        if data.update:
             bot.edit_message_text(chat_id=user_id, message_id=call.message.message_id,
                                   text='Пожалуйста, напишите новый комментарий текстом, чтобы обновить ее. '
                                        '\nДля отмены напишите /cancel или /stop, просто "Отмена" тоже подойдет.😊')
             logger.debug('Отправка сообщения с просьбой написать новый комментарий к оценке качества сна.')
             logger.info('Пользователь подтвердил обновление заметки.')
-            bot.register_next_step_handler(call.message, process_notes_step, sleep_record_id)
-        elif yes_no == 'no':
+            conversations.set(call.message.chat.id, NOTE_STEP, {'sleep_record_id': sleep_record_id})
+        else:
             bot.edit_message_text(chat_id=user_id, message_id=call.message.message_id,
                                   text='Хорошо, Ваша заметка останется без изменений.😊')
             logger.debug('Отправка сообщения с подтверждением отмены обновления заметки.')
@@ -468,9 +585,6 @@ def handle_notes_update_callback(call: types.CallbackQuery):
         bot.send_message(user_id, f"Простите, произошла ошибка {e}. Попробуйте еще раз.😔")
         logger.error(f'Ошибка при выполнении обработки нажатия на кнопки согласия или отказа в обновлении заметки: {e}', exc_info=True)
 
-    # подтверждение того, что запрос был получен и обработан
-    bot.answer_callback_query(call.id)
-
 
 def process_notes_step(message: types.Message, sleep_record_id: int):
     """
@@ -490,8 +604,8 @@ def process_notes_step(message: types.Message, sleep_record_id: int):
                                   'Стикеры, фото или файлы я пока не умею сохранять в заметки.\n'
                                   'Для отмены напишите /cancel или /stop, просто "Отмена" тоже подойдет.😊')
 
-        # Снова вызываем этот же шаг, чтобы бот продолжил ждать текст
-        bot.register_next_step_handler(message, process_notes_step, sleep_record_id)
+        # Снова сохраняем этот же шаг, чтобы бот продолжил ждать текст
+        conversations.set(user_id, NOTE_STEP, {'sleep_record_id': sleep_record_id})
         # Выходим из функции, чтобы код ниже не выполнился
         return
 
@@ -524,43 +638,56 @@ def process_notes_step(message: types.Message, sleep_record_id: int):
         logger.error(f'Ошибка при выполнении записи/обновления заметки: {e}', exc_info=True)
 
 
-@bot.callback_query_handler(func=lambda call: True)
-def handle_callback(call: types.CallbackQuery):
+@callback_router.route('m', MenuCallback)
+def handle_menu_callback(call: types.CallbackQuery, data: MenuCallback):
     """
-    Обрабатывает нажатия на inline кнопки.
-    Каждой кнопке соответствует определенная команда, для этой команды вызывается ее функция-обработчик.
+    Обрабатывает нажатия на inline кнопки основных команд (sleep, wake, quality, notes, recom, statis).
+    Для команды кнопки вызывается ее функция-обработчик.
     :param call: types.CallbackQuery: Объект CallbackQuery, содержащий данные о нажатой inline - кнопке.
+    :param data: MenuCallback: Разобранные данные кнопки (команда).
     """
-    logger.info('Выполнение обработки нажатия на inline кнопки основных команд '
-                '(sleep, wake, quality, notes, recom, statis).')
-    try:
-        if call.data == '/sleep':
-            handle_sleep(call.message)
+    logger.info(f'Выполнение обработки нажатия на inline кнопку команды {data.command}.')
+    MENU_COMMANDS[data.command](call.message)
 
-        elif call.data == '/wake':
-            handle_wake(call.message)
 
-        elif call.data == '/quality':
-            handle_quality(call.message)
+# Команда кнопки -> функция-обработчик команды
+MENU_COMMANDS = {
+    'sleep': handle_sleep,
+    'wake': handle_wake,
+    'quality': handle_quality,
+    'notes': handle_notes,
+    'recom': handle_recom,
+    'statis': handle_statistics,
+}
+# Кнопки сообщений, отправленных до перехода на компактный формат callback_data
+for command in MENU_COMMANDS:
+    callback_router.alias(f'/{command}', MenuCallback(command))
 
-        elif call.data == '/notes':
-            handle_notes(call.message)
 
-        elif call.data == '/recom':
-            handle_recom(call.message)
+@callback_query_handler(func=lambda call: True)
+def handle_callback(call: types.CallbackQuery):
+    """
+    Обрабатывает нажатия на inline кнопки.
+    callback_data разбирается маршрутизатором callback_router, который вызывает обработчик типа кнопки.
+    Устаревшие и некорректные кнопки отклоняются с просьбой открыть меню заново.
+    :param call: types.CallbackQuery: Объект CallbackQuery, содержащий данные о нажатой inline - кнопке.
+    """
+    try:
+        callback_router.dispatch(call)
 
-        elif call.data == '/statis':
-            handle_statistics(call.message)
+    except CallbackDataError as e:
+        logger.warning(f'Отклонено нажатие на inline кнопку: {e}')
+        bot.send_message(call.message.chat.id, "Эта кнопка устарела. Нажмите /start, чтобы открыть меню заново.")
 
     except Exception as e:
         bot.send_message(call.message.chat.id, f"Простите, произошла ошибка {e}. Попробуйте еще раз.😔")
-        logger.error(f'Ошибка при выполнении обработки нажатия на inline кнопки основных команд: {e}', exc_info=True)
+        logger.error(f'Ошибка при выполнении обработки нажатия на inline кнопку: {e}', exc_info=True)
 
     # подтверждение того, что запрос был получен и обработан
-    bot.answer_callback_query(call.id)
+    answer_callback(call)
 
 
-@bot.message_handler(func=lambda message: True)
+@message_handler(func=lambda message: True)
 def all_other_message(message: types.Message):
     """
     Обрабатывает все иные сообщения от пользователя.
@@ -573,19 +700,195 @@ def all_other_message(message: types.Message):
     logger.info(f'Пользователь ({user_id}) отправил боту необрабатываемое сообщение.')
 
 
+def create_app(settings: BotSettings | None = None, **shared) -> BotApp:
+    """
+    Фабрика приложения: создает экземпляр бота с обработчиками модуля, своим менеджером базы данных
+    и хранилищем шагов диалога. Импорт модуля ничего из этого не создает.
+    :param settings: BotSettings | None: Настройки экземпляра (по умолчанию из переменных окружения).
+    :param shared: Общие пулы экземпляров: executor (ThreadPoolExecutor) и connection_pool (ConnectionPool).
+    :return: BotApp: Экземпляр бота.
+    """
+    return BotApp.create(settings or BotSettings.from_env(), MESSAGE_HANDLERS, CALLBACK_QUERY_HANDLERS, **shared)
+
+
+def create_all_apps(settings: list[BotSettings] | None = None) -> list[BotApp]:
+    """
+    Создает все экземпляры бота процесса с общими пулами потоков обработчиков и соединений SQLite.
+    :param settings: list[BotSettings] | None: Настройки экземпляров (по умолчанию из переменных окружения:
+        единственный бот или по одному на каждое имя из BOT_TENANTS).
+    :return: list[BotApp]: Экземпляры бота.
+    """
+    return create_apps(settings or settings_from_env(), MESSAGE_HANDLERS, CALLBACK_QUERY_HANDLERS)
+
+
+def run_async_bot(app: BotApp):
+    """
+    Запускает обработчики бота на AsyncTeleBot (BOT_RUNTIME=async).
+    Бот экземпляра заменяется мостом AsyncBotBridge: обработчики выполняются в ограниченном пуле потоков,
+    а запросы к Bot API - асинхронно через общую HTTP-сессию.
+    Ограничения задаются переменными окружения BOT_MAX_CONCURRENCY и BOT_HANDLER_THREADS.
+    :param app: BotApp: Экземпляр бота.
+    """
+    import asyncio
+    # Асинхронный клиент требует aiohttp, поэтому импортируется только в этом режиме
+    from telebot.async_telebot import AsyncTeleBot
+    from async_runtime import AsyncBotBridge
+
+    bridge = AsyncBotBridge(AsyncTeleBot(app.settings.token),
+                            max_concurrency=int(os.getenv('BOT_MAX_CONCURRENCY', '64')),
+                            max_workers=int(os.getenv('BOT_HANDLER_THREADS', '8')))
+    bridge.register_handlers(app.bot)
+    app.bot = bridge
+    asyncio.run(bridge.polling())
+
+
+def run_webhook_bot(app: BotApp, shutdown=None):
+    """
+    Принимает обновления через встроенный webhook-сервер (BOT_UPDATE_MODE=webhook) вместо long polling.
+    Если задан WEBHOOK_URL (публичный адрес за обратным прокси), адрес и секретный токен регистрируются в Telegram.
+    Публичный адрес без проверки запросов не регистрируется: если WEBHOOK_SECRET не задан, секретный токен
+    генерируется при запуске.
+    Параметры сервера задаются переменными окружения WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH,
+    WEBHOOK_SECRET, WEBHOOK_QUEUE_SIZE и WEBHOOK_WORKERS.
+    :param app: BotApp: Экземпляр бота.
+    :param shutdown: GracefulShutdown | None: Плавная остановка, которая по сигналу останавливает сервер.
+    """
+    import secrets
+    from webhook_server import WebhookServer
+
+    secret_token = os.getenv('WEBHOOK_SECRET')
+    webhook_url = os.getenv('WEBHOOK_URL')
+    if webhook_url and not secret_token:
+        # Иначе любой, кто знает адрес, может отправить боту поддельные обновления
+        secret_token = secrets.token_urlsafe(32)
+        logger.info('WEBHOOK_SECRET не задан: для webhook сгенерирован секретный токен.')
+    server = WebhookServer(app.bot.process_new_updates, secret_token=secret_token,
+                           host=os.getenv('WEBHOOK_HOST', '127.0.0.1'),
+                           port=int(os.getenv('WEBHOOK_PORT', '8443')),
+                           path=os.getenv('WEBHOOK_PATH', '/webhook'),
+                           max_queue_size=int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000')),
+                           workers=int(os.getenv('WEBHOOK_WORKERS', '1')))
+    if webhook_url:
+        app.bot.set_webhook(url=webhook_url, secret_token=secret_token)
+        logger.info(f'Webhook зарегистрирован в Telegram: {webhook_url}.')
+    if shutdown is not None:
+        # Сервер перестает принимать запросы и дообрабатывает свою очередь
+        shutdown.on_stop(server.stop)
+    server.serve_forever()
+
+
+def run_polling(apps: list[BotApp]):
+    """
+    Получает обновления всех экземпляров бота через long polling: каждый экземпляр в своем потоке,
+    главный поток ждет их завершения (и обрабатывает сигналы).
+    :param apps: list[BotApp]: Экземпляры бота.
+    """
+    if len(apps) == 1:
+        apps[0].bot.polling(non_stop=True, interval=0)
+        return
+    threads = [threading.Thread(target=app.bot.polling, kwargs={'non_stop': True, 'interval': 0},
+                                name=f'polling-{app.settings.name}') for app in apps]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
 def main():
-    """ Основная функция запуска Telegram-бота. """
+    """ Основная функция запуска Telegram-бота (одного или нескольких экземпляров в одном процессе). """
+    dispatchers = []
+    outbound_queues = []
+    callback_acks = []
+    update_filters = []
+    api_session = None
+    shutdown = None
+    # Настройка логирования (ОДИН РАЗ) при запуске программы
+    from my_logger_config import setup_logging
+    setup_logging()
+    apps = create_all_apps()
     try:
-        logger.info('Telegram-бот запущен и готов к работе.')
-        bot.polling(non_stop=True, interval=0)
+        logger.info(f'Telegram-бот запущен и готов к работе (экземпляров: {len(apps)}, режим {BOT_RUNTIME}, '
+                    f'обновления: {BOT_UPDATE_MODE}).')
+        if len(apps) > 1 and (BOT_RUNTIME == 'async' or BOT_UPDATE_MODE == 'webhook'):
+            raise ValueError('Несколько экземпляров бота в одном процессе поддерживаются только в режиме polling.')
+        for app in apps:
+            if app.settings.warm_start_users:
+                # Первые обращения пользователей после перезапуска не идут в БД
+                app.db.warm_up(max_users=app.settings.warm_start_users)
+        if BOT_RUNTIME != 'async':
+            from graceful_shutdown import GracefulShutdown
+            from bot_api_session import BotApiSession
+            # По SIGTERM/SIGINT прием обновлений прекращается, а начатая работа завершается за BOT_SHUTDOWN_TIMEOUT
+            shutdown = GracefulShutdown(deadline=BOT_SHUTDOWN_TIMEOUT)
+            for app in apps:
+                shutdown.track(app.bot)
+                shutdown.on_stop(app.bot.stop_polling)
+            shutdown.install_signals()
+            # Все потоки обращаются к Bot API через общий пул постоянных соединений
+            api_session = BotApiSession(pool_size=int(os.getenv('BOT_API_POOL_SIZE', '32')),
+                                        connect_timeout=float(os.getenv('BOT_API_CONNECT_TIMEOUT', '5')),
+                                        read_timeout=float(os.getenv('BOT_API_READ_TIMEOUT', '30')),
+                                        http2=os.getenv('BOT_API_HTTP2') == '1').install()
+            for app in apps:
+                if BOT_ORDERED_WORKERS:
+                    from update_dispatcher import OrderedUpdateDispatcher
+                    dispatchers.append((app, OrderedUpdateDispatcher.install(app.bot, workers=int(BOT_ORDERED_WORKERS))))
+                if BOT_EARLY_CALLBACK_ACK:
+                    from callback_ack import EarlyCallbackAck
+                    callback_acks.append((app, EarlyCallbackAck.install(app.bot)))
+                if app.settings.update_dedup_window:
+                    from update_offset import DurableUpdateFilter, UpdateOffsetStore
+                    # Подключается последним: повторные доставки отбрасываются до остальных оберток и обработчиков
+                    update_filters.append(DurableUpdateFilter.install(
+                        app.bot, UpdateOffsetStore(app.db.db_name, pool=app.db.pool),
+                        window=app.settings.update_dedup_window))
+                if BOT_OUTBOUND_RATE:
+                    from outbound_queue import OutboundQueue, RateLimitedBot
+                    outbound = OutboundQueue(global_rate=float(BOT_OUTBOUND_RATE),
+                                             per_chat_rate=float(os.getenv('BOT_CHAT_RATE', '1')))
+                    outbound_queues.append((app, outbound))
+                    # Обработчики ставят сообщения в очередь и не ждут ответа Telegram
+                    app.bot = RateLimitedBot(app.bot, outbound)
+        if BOT_RUNTIME == 'async':
+            run_async_bot(apps[0])
+        elif BOT_UPDATE_MODE == 'webhook':
+            run_webhook_bot(apps[0], shutdown)
+        else:
+            run_polling(apps)
     except Exception as e:
         logger.critical(f'Критическая ошибка: {e}', exc_info=True)
+    finally:
+        for update_filter in update_filters:
+            logger.info(f'Статистика получения обновлений: {update_filter.stats}')
+        if shutdown is None:
+            # Останавливаем контрольные точки WAL и закрываем постоянные соединения с БД
+            for app in apps:
+                app.close()
+            close_shared_pools(apps)
+        else:
+            def step_name(name: str, app: BotApp) -> str:
+                # Шаги нескольких экземпляров различаются именем экземпляра
+                return f'{name} {app.settings.name}' if app.settings.name else name
+
+            for app, dispatcher in dispatchers:
+                # Дообрабатываем обновления, уже поставленные в очереди
+                shutdown.add_step(step_name('очереди обновлений', app), dispatcher.stop)
+            # Дожидаемся обработчиков, уже запущенных в пуле потоков бота
+            shutdown.add_step('обработчики', shutdown.wait_idle)
+            for app, callback_ack in callback_acks:
+                shutdown.add_step(step_name('подтверждения нажатий', app), lambda timeout, ack=callback_ack: ack.stop())
+            for app, outbound in outbound_queues:
+                # Отправляем сообщения, уже поставленные в очередь
+                shutdown.add_step(step_name('исходящие сообщения', app), outbound.stop)
+            if api_session is not None:
+                logger.info(f'Статистика запросов к Bot API: {api_session.stats()}')
+                shutdown.add_step('соединения с Bot API', lambda timeout: api_session.close())
+            # Записываем отложенные изменения, останавливаем контрольные точки WAL и закрываем соединения с БД
+            for app in apps:
+                shutdown.add_step(step_name('база данных', app), lambda timeout, app=app: app.close())
+            shutdown.add_step('общие пулы', lambda timeout: close_shared_pools(apps))
+            shutdown.drain()
 
 
 if __name__ == '__main__':
     main()
-
-
-
-
-
@@ -0,0 +1,198 @@
+import asyncio
+import threading
+import pytest
+from datetime import datetime
+from unittest import mock
+
+from async_database_manager import AsyncDatabaseManager
+from database_manager import DatabaseManager
+
+
+@pytest.fixture
+def db_file(tmp_path) -> str:
+    """
+    Предоставляет путь к временному файлу базы данных.
+    :param tmp_path: Встроенная фикстура pytest для создания временных путей.
+    :return: str: Путь к файлу базы данных.
+    """
+    return str(tmp_path/'test_async_db_manager.db')
+
+
+def make_blocking_manager() -> tuple[mock.MagicMock, threading.Event, threading.Event]:
+    """
+    Создает подмену DatabaseManager, у которой get_sleep_statistic ждет разрешения на завершение.
+    :return: tuple: Подмена менеджера, событие "запрос начал выполняться" и событие "запрос можно завершить".
+    """
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_statistic(user_id: int) -> tuple[int, int, float]:
+        started.set()
+        release.wait(5)
+        return 1, 60, 60.0
+
+    manager = mock.MagicMock(spec=DatabaseManager)
+    manager.get_sleep_statistic.side_effect = slow_statistic
+    return manager, started, release
+
+
+def test_methods_mirror_database_manager(db_file: str):
+    """
+    Тестирует, что методы асинхронного фасада работают с БД так же, как методы DatabaseManager.
+    :param db_file: str: Путь к временному файлу базы данных.
+    """
+    async def scenario():
+        async with AsyncDatabaseManager(db_name=db_file, max_workers=2) as db:
+            await db.add_user(1, 'Test')
+            session_id = await db.start_sleep_session(1, datetime(2025, 12, 12, 23, 0, 0))
+            finished = await db.finish_latest_sleep_session(1, datetime(2025, 12, 13, 7, 0, 0))
+            await db.update_sleep_quality(session_id, 5)
+            await db.add_note(session_id, 'Хорошо')
+            state = await db.get_user_state(1, db.sleep_day(datetime(2025, 12, 13, 7, 0, 0)))
+            return session_id, finished, state, await db.get_user_by_id(1), await db.get_sleep_statistic(1)
+
+    session_id, finished, state, user, statistic = asyncio.run(scenario())
+
+    assert finished[0] == session_id
+    assert state.last_with_quality[0] == session_id
+    assert state.note == 'Хорошо'
+    assert user == (1, 'Test')
+    assert statistic == (1, 8 * 3600, 8 * 3600.0)
+
+
+def test_queries_run_outside_event_loop_thread(db_file: str):
+    """
+    Тестирует, что запросы выполняются в потоках пула, а не в потоке цикла событий.
+    :param db_file: str: Путь к временному файлу базы данных.
+    """
+    manager = mock.MagicMock(spec=DatabaseManager)
+    manager.get_sleep_statistic.side_effect = lambda user_id: threading.current_thread().name
+
+    async def scenario():
+        async with AsyncDatabaseManager(manager) as db:
+            return await db.get_sleep_statistic(1)
+
+    assert asyncio.run(scenario()).startswith('async-db')
+
+
+def test_full_queue_rejects_after_timeout():
+    """
+    Тестирует ограничение нагрузки: при заполненной очереди запрос ждет submit_timeout и отклоняется.
+    """
+    manager, started, release = make_blocking_manager()
+
+    async def scenario():
+        db = AsyncDatabaseManager(manager, max_workers=1, max_pending=2, submit_timeout=0.1)
+        first = asyncio.create_task(db.get_sleep_statistic(1))
+        second = asyncio.create_task(db.get_sleep_statistic(2))
+        await asyncio.sleep(0)
+        with pytest.raises(TimeoutError):
+            await db.get_sleep_statistic(3)
+        stats = db.stats()
+        release.set()
+        await asyncio.gather(first, second)
+        await db.close()
+        return stats, db.stats()
+
+    stats_when_full, stats_after = asyncio.run(scenario())
+
+    assert stats_when_full == {'pending': 2, 'max_pending': 2, 'rejected': 1}
+    assert stats_after['pending'] == 0
+    assert manager.get_sleep_statistic.call_count == 2
+
+
+
+def test_rejected_and_cancelled_requests_do_not_shrink_queue():
+    """
+    Тестирует, что отклоненные по времени и отмененные во время ожидания запросы не занимают места в очереди:
+    после их завершения очередь снова вмещает max_pending запросов.
+    """
+    manager, started, release = make_blocking_manager()
+
+    async def scenario():
+        db = AsyncDatabaseManager(manager, max_workers=1, max_pending=1, submit_timeout=0.05)
+        first = asyncio.create_task(db.get_sleep_statistic(1))
+        await asyncio.sleep(0)
+        for user_id in range(2, 5):
+            with pytest.raises(TimeoutError):
+                await db.get_sleep_statistic(user_id)
+        cancelled = asyncio.create_task(db.get_sleep_statistic(5))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        # Место освобождается сразу после отмены ожидающего запроса
+        release.set()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        await first
+        await asyncio.sleep(0.01)
+        free_slots = db._slots._value
+        await db.close()
+        return free_slots
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_cancel_does_not_interrupt_running_query():
+    """
+    Тестирует, что отмена корутины не прерывает начатый запрос: он выполняется до конца,
+    а место в очереди освобождается только после его завершения.
+    """
+    manager, started, release = make_blocking_manager()
+
+    async def scenario():
+        db = AsyncDatabaseManager(manager, max_workers=1, max_pending=1)
+        task = asyncio.create_task(db.get_sleep_statistic(1))
+        await asyncio.to_thread(started.wait, 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        pending_after_cancel = db.pending
+        release.set()
+        await db.close()
+        return pending_after_cancel, db.pending
+
+    pending_after_cancel, pending_after_close = asyncio.run(scenario())
+
+    assert pending_after_cancel == 1
+    assert pending_after_close == 0
+    manager.get_sleep_statistic.assert_called_once_with(1)
+
+
+def test_cancel_skips_query_that_has_not_started():
+    """
+    Тестирует, что запрос, отмененный до начала выполнения (все потоки заняты), не выполняется.
+    """
+    manager, started, release = make_blocking_manager()
+
+    async def scenario():
+        db = AsyncDatabaseManager(manager, max_workers=1)
+        first = asyncio.create_task(db.get_sleep_statistic(1))
+        await asyncio.to_thread(started.wait, 5)
+        queued = asyncio.create_task(db.get_sleep_statistic(2))
+        await asyncio.sleep(0)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        release.set()
+        await first
+        await db.close()
+        return db.pending
+
+    assert asyncio.run(scenario()) == 0
+    manager.get_sleep_statistic.assert_called_once_with(1)
+
+
+def test_close_closes_own_manager_and_rejects_new_queries():
+    """
+    Тестирует, что close() закрывает только собственный менеджер, а после закрытия запросы не принимаются.
+    """
+    external = mock.MagicMock(spec=DatabaseManager)
+
+    async def scenario():
+        db = AsyncDatabaseManager(external)
+        await db.close()
+        with pytest.raises(RuntimeError):
+            await db.get_sleep_statistic(1)
+
+    asyncio.run(scenario())
+
+    external.close.assert_not_called()
@@ -0,0 +1,168 @@
+import time
+import asyncio
+import threading
+import pytest
+from unittest import mock
+
+import telebot
+from telebot import asyncio_helper, types
+from telebot.async_telebot import AsyncTeleBot
+
+from async_runtime import AsyncBotBridge
+from fake_bot_api import FakeBotApi
+
+TOKEN = '123456:TEST'
+
+
+def make_message(chat_id: int, text: str, message_id: int = 1) -> types.Message:
+    """
+    Создает сообщение пользователя для обработки ботом.
+    :param chat_id: int: ID чата.
+    :param text: str: Текст сообщения.
+    :param message_id: int: ID сообщения.
+    :return: types.Message: Сообщение.
+    """
+    entities = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}] if text.startswith('/') else []
+    return types.Message.de_json({'message_id': message_id, 'date': int(time.time()), 'text': text,
+                                  'chat': {'id': chat_id, 'type': 'private'},
+                                  'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Test'},
+                                  'entities': entities})
+
+
+@pytest.fixture
+def fake_api():
+    """
+    Запускает локальный имитатор Bot API и направляет на него запросы AsyncTeleBot.
+    :yield: FakeBotApi: Запущенный имитатор.
+    """
+    api = FakeBotApi().start()
+    with mock.patch.object(asyncio_helper, 'API_URL', api.api_url):
+        yield api
+    api.stop()
+
+
+def test_constructor_rejects_non_positive_limits():
+    """ Тестирует, что нулевые ограничения параллелизма отклоняются. """
+    with pytest.raises(ValueError):
+        AsyncBotBridge(AsyncTeleBot(TOKEN), max_concurrency=0)
+    with pytest.raises(ValueError):
+        AsyncBotBridge(AsyncTeleBot(TOKEN), max_workers=0)
+
+
+def test_api_call_outside_handler_raises():
+    """ Тестирует, что метод Bot API нельзя вызвать вне обработчика, а неизвестный атрибут отсутствует. """
+    bridge = AsyncBotBridge(AsyncTeleBot(TOKEN))
+
+    with pytest.raises(RuntimeError):
+        bridge.send_message(1, 'text')
+    with pytest.raises(AttributeError):
+        bridge.no_such_method
+
+
+def test_recorded_calls_are_sent_in_order(fake_api: FakeBotApi):
+    """
+    Тестирует, что вызовы Bot API обработчика выполняются после него через AsyncTeleBot в исходном порядке.
+    :param fake_api: FakeBotApi: Имитатор Bot API.
+    """
+    sync_bot = telebot.TeleBot(TOKEN)
+    bridge = AsyncBotBridge(AsyncTeleBot(TOKEN), max_workers=2)
+
+    @sync_bot.message_handler(commands=['sleep'])
+    def handle_sleep(message: types.Message):
+        bridge.send_message(message.chat.id, 'Первое')
+        bridge.send_message(message.chat.id, 'Второе')
+
+    bridge.register_handlers(sync_bot)
+
+    async def run():
+        await bridge.async_bot.process_new_messages([make_message(7, '/sleep')])
+        await bridge.async_bot.close_session()
+
+    asyncio.run(run())
+
+    assert [(method, params['text']) for method, params in fake_api.requests] == [
+        ('sendMessage', 'Первое'), ('sendMessage', 'Второе')]
+    assert bridge.failed_calls == 0
+
+
+def test_handler_error_does_not_stop_processing(fake_api: FakeBotApi):
+    """
+    Тестирует, что ошибка в одном обработчике не мешает обработке остальных обновлений.
+    :param fake_api: FakeBotApi: Имитатор Bot API.
+    """
+    sync_bot = telebot.TeleBot(TOKEN)
+    bridge = AsyncBotBridge(AsyncTeleBot(TOKEN))
+
+    @sync_bot.message_handler(commands=['wake'])
+    def handle_wake(message: types.Message):
+        if message.chat.id == 1:
+            raise RuntimeError('сбой обработчика')
+        bridge.send_message(message.chat.id, 'Доброе утро')
+
+    bridge.register_handlers(sync_bot)
+
+    async def run():
+        await bridge.async_bot.process_new_messages([make_message(1, '/wake'), make_message(2, '/wake', 2)])
+        await bridge.async_bot.close_session()
+
+    asyncio.run(run())
+
+    assert [params['chat_id'] for _, params in fake_api.requests] == ['2']
+
+
+def test_next_step_handler_receives_next_message():
+    """ Тестирует, что register_next_step_handler передает следующее сообщение чата зарегистрированной функции. """
+    sync_bot = telebot.TeleBot(TOKEN)
+    bridge = AsyncBotBridge(AsyncTeleBot(TOKEN))
+    received = []
+
+    def process_notes_step(message: types.Message, session_id: int):
+        received.append(('step', message.text, session_id))
+
+    @sync_bot.message_handler(func=lambda message: True)
+    def all_other_message(message: types.Message):
+        received.append(('other', message.text))
+
+    @sync_bot.message_handler(commands=['notes'])
+    def handle_notes(message: types.Message):
+        bridge.register_next_step_handler(message, process_notes_step, 42)
+
+    # Обработчик /notes должен проверяться раньше обработчика всех сообщений
+    sync_bot.message_handlers.reverse()
+    bridge.register_handlers(sync_bot)
+
+    async def run():
+        for i, text in enumerate(['/notes', 'Спал хорошо', 'Еще текст']):
+            await bridge.async_bot.process_new_messages([make_message(5, text, i)])
+
+    asyncio.run(run())
+
+    assert received == [('step', 'Спал хорошо', 42), ('other', 'Еще текст')]
+
+
+def test_concurrency_is_bounded():
+    """ Тестирует, что одновременно обрабатывается не больше max_concurrency обновлений. """
+    sync_bot = telebot.TeleBot(TOKEN)
+    bridge = AsyncBotBridge(AsyncTeleBot(TOKEN), max_concurrency=2, max_workers=8)
+    lock = threading.Lock()
+    active = 0
+    peak = 0
+
+    @sync_bot.message_handler(commands=['sleep'])
+    def handle_sleep(message: types.Message):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.05)
+        with lock:
+            active -= 1
+
+    bridge.register_handlers(sync_bot)
+
+    async def run():
+        await bridge.async_bot.process_new_messages([make_message(i, '/sleep', i) for i in range(6)])
+
+    asyncio.run(run())
+
+    assert peak == 2
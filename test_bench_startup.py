@@ -0,0 +1,29 @@
+import os
+
+from bench_startup import FIRST_UPDATE_BUDGET, IMPORT_TIME_BUDGET, measure_first_update, measure_import
+
+
+def test_import_is_fast_and_side_effect_free(tmp_path):
+    """
+    Тестирует, что импорт sleep_bot укладывается в бюджет, не создает БД и журналов
+    и не загружает модули, нужные только при запуске (yaml для логирования, asyncio для режима async).
+    :param tmp_path: Встроенная фикстура pytest для создания временных путей.
+    """
+    times = measure_import('sleep_bot', workdir=str(tmp_path))
+
+    assert times['sleep_bot'] < IMPORT_TIME_BUDGET
+    assert 'yaml' not in times
+    assert 'asyncio' not in times
+    assert os.listdir(tmp_path) == []
+
+
+def test_first_update_within_budget(tmp_path):
+    """
+    Тестирует, что запущенный бот отвечает на первое обновление в пределах бюджета.
+    :param tmp_path: Встроенная фикстура pytest для создания временных путей.
+    """
+    elapsed = measure_first_update(workdir=str(tmp_path))
+
+    assert elapsed < FIRST_UPDATE_BUDGET
+    # Бот создал БД в рабочем каталоге только при запуске
+    assert (tmp_path/'sleep_tracker.db').exists()
@@ -0,0 +1,80 @@
+import pytest
+from unittest import mock
+
+from telebot import apihelper
+
+from bot_api_session import BotApiSession
+from fake_bot_api import FakeBotApi
+
+TOKEN = '123456:TEST'
+
+
+@pytest.fixture
+def fake_api():
+    """
+    Запускает локальный имитатор Bot API и направляет на него запросы telebot.
+    Настройки apihelper восстанавливаются после теста.
+    :yield: FakeBotApi: Запущенный имитатор.
+    """
+    api = FakeBotApi().start()
+    with mock.patch.multiple(apihelper, API_URL=api.api_url, session=None, SESSION_TIME_TO_LIVE=600,
+                             CONNECT_TIMEOUT=15, READ_TIMEOUT=30, CUSTOM_REQUEST_SENDER=None):
+        yield api
+    # Закрытая сессия теста не должна остаться сессией потока
+    apihelper._get_req_session(reset=True)
+    api.stop()
+
+
+def test_install_configures_apihelper(fake_api: FakeBotApi):
+    """
+    Тестирует, что сессия и таймауты подключаются к telebot.apihelper.
+    :param fake_api: FakeBotApi: Имитатор Bot API.
+    """
+    session = BotApiSession(pool_size=4, connect_timeout=2, read_timeout=7).install()
+
+    assert apihelper.session is session.session
+    assert apihelper.SESSION_TIME_TO_LIVE is None
+    assert apihelper.CONNECT_TIMEOUT == 2
+    assert apihelper.READ_TIMEOUT == 7
+    assert apihelper._get_req_session() is session.session
+    session.close()
+
+
+def test_connections_are_reused(fake_api: FakeBotApi):
+    """
+    Тестирует, что последовательные вызовы Bot API используют одно соединение и учитываются по методам.
+    :param fake_api: FakeBotApi: Имитатор Bot API.
+    """
+    session = BotApiSession(pool_size=4).install()
+    for i in range(5):
+        apihelper.send_message(TOKEN, 1, f'Сообщение {i}')
+    apihelper.answer_callback_query(TOKEN, '42')
+    stats = session.stats()
+    session.close()
+
+    assert stats['requests'] == 6
+    assert stats['connections_opened'] == 1
+    assert stats['methods']['sendMessage']['count'] == 5
+    assert stats['methods']['answerCallbackQuery']['count'] == 1
+    assert stats['methods']['sendMessage']['max'] >= stats['methods']['sendMessage']['avg'] > 0
+
+
+def test_http2_falls_back_without_httpx(fake_api: FakeBotApi):
+    """
+    Тестирует, что без httpx запросы выполняются по HTTP/1.1.
+    :param fake_api: FakeBotApi: Имитатор Bot API.
+    """
+    with mock.patch.dict('sys.modules', {'httpx': None}):
+        session = BotApiSession(http2=True).install()
+
+    assert session.http2 is False
+    assert apihelper.CUSTOM_REQUEST_SENDER is None
+    apihelper.get_me(TOKEN)
+    assert session.stats()['methods']['getMe']['count'] == 1
+    session.close()
+
+
+def test_constructor_rejects_empty_pool():
+    """ Тестирует, что пул без соединений отклоняется. """
+    with pytest.raises(ValueError):
+        BotApiSession(pool_size=0)
@@ -0,0 +1,129 @@
+import threading
+import pytest
+from unittest.mock import MagicMock
+
+from telebot import types
+
+import sleep_bot
+from bot_app import AppAttribute, BotApp, BotSettings, close_shared_pools, current_app, settings_from_env
+
+
+def make_update(update_id: int, chat_id: int, text: str = '/sleep') -> types.Update:
+    """
+    Создает обновление с командой.
+    :param update_id: int: ID обновления.
+    :param chat_id: int: ID чата.
+    :param text: str: Текст команды.
+    :return: types.Update: Обновление.
+    """
+    return types.Update.de_json({'update_id': update_id,
+                                 'message': {'message_id': update_id, 'date': 0, 'text': text,
+                                             'chat': {'id': chat_id, 'type': 'private'},
+                                             'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Test'},
+                                             'entities': [{'type': 'bot_command', 'offset': 0,
+                                                           'length': len(text)}]}})
+
+
+def test_settings_from_env(monkeypatch):
+    """ Тестирует чтение настроек экземпляров: свои токен и БД, переменные с префиксом важнее общих. """
+    monkeypatch.setenv('BOT_TENANTS', 'alpha, beta')
+    monkeypatch.setenv('ALPHA_API_TOKEN', '1:ALPHA')
+    monkeypatch.setenv('BETA_API_TOKEN', '2:BETA')
+    monkeypatch.setenv('BETA_DB_NAME', 'beta.db')
+    monkeypatch.setenv('API_TOKEN', '3:DEFAULT')
+    monkeypatch.setenv('CONVERSATION_TTL', '60')
+    monkeypatch.setenv('BETA_CONVERSATION_TTL', '5')
+    monkeypatch.setenv('DB_WRITE_BEHIND_INTERVAL', '')
+
+    alpha, beta = settings_from_env()
+
+    assert (alpha.name, alpha.token, alpha.db_name) == ('alpha', '1:ALPHA', 'alpha_sleep_tracker.db')
+    assert alpha.conversation_ttl == 60
+    assert (beta.name, beta.token, beta.db_name, beta.conversation_ttl) == ('beta', '2:BETA', 'beta.db', 5)
+    assert alpha.write_behind_interval is None
+    assert alpha.update_dedup_window == BotSettings().update_dedup_window
+
+    monkeypatch.delenv('BOT_TENANTS')
+    assert settings_from_env() == [BotSettings(token='3:DEFAULT', conversation_ttl=60)]
+
+
+def test_app_attribute_follows_current_app():
+    """ Тестирует, что глобальные имена обработчиков указывают на объекты экземпляра, вызвавшего обработчик. """
+    bot = AppAttribute('bot')
+    conversations = AppAttribute('conversations')
+    first = BotApp(BotSettings('first'), MagicMock(), MagicMock(), {1})
+    second = BotApp(BotSettings('second'), MagicMock(), MagicMock(), {2})
+
+    def handler(chat_id: int):
+        bot.send_message(chat_id, current_app().settings.name)
+        return chat_id in conversations
+
+    assert first.bind(handler)(1) is True
+    assert second.bind(handler)(1) is False
+    first.bot.send_message.assert_called_once_with(1, 'first')
+    second.bot.send_message.assert_called_once_with(1, 'second')
+    with pytest.raises(RuntimeError):
+        bot.send_message(1, 'вне обработчика')
+
+
+def test_instances_share_pools_and_keep_data_separate(tmp_path):
+    """
+    Тестирует два экземпляра бота в одном процессе: общие пулы потоков и соединений,
+    но свои боты и базы данных.
+    :param tmp_path: Встроенная фикстура pytest для создания временных путей.
+    """
+    apps = sleep_bot.create_all_apps([BotSettings('alpha', '1:ALPHA', db_name=str(tmp_path/'alpha.db')),
+                                      BotSettings('beta', '2:BETA', db_name=str(tmp_path/'beta.db'))])
+    alpha, beta = apps
+    telebots = [app.bot for app in apps]
+    try:
+        # У каждого бота свой пул задач поверх общих потоков
+        assert alpha.bot.worker_pool is not beta.bot.worker_pool
+        assert alpha.bot.worker_pool.executor is beta.bot.worker_pool.executor
+        assert alpha.db.pool is beta.db.pool
+        replied = threading.Event()
+        for app in apps:
+            # Ответы обработчиков проверяются по вызовам фейкового бота экземпляра
+            app.bot = MagicMock()
+        alpha.bot.send_message.side_effect = lambda *args, **kwargs: replied.set()
+
+        telebots[0].process_new_updates([make_update(1, chat_id=7)])
+
+        assert replied.wait(5)
+        assert alpha.db.get_latest_unfinished_sleep_session(7)[0] is not None
+        assert beta.db.get_latest_unfinished_sleep_session(7)[0] is None
+        beta.bot.send_message.assert_not_called()
+    finally:
+        for app in apps:
+            app.close()
+        close_shared_pools(apps)
+        assert len(alpha.db.pool) == 0
+
+
+def test_handler_errors_stay_with_their_instance(tmp_path):
+    """
+    Тестирует, что ошибка обработчика одного экземпляра поднимается только в его polling
+    и что остановка одного бота не закрывает общий пул потоков для другого.
+    :param tmp_path: Встроенная фикстура pytest для создания временных путей.
+    """
+    apps = sleep_bot.create_all_apps([BotSettings('alpha', '1:ALPHA', db_name=str(tmp_path/'alpha.db')),
+                                      BotSettings('beta', '2:BETA', db_name=str(tmp_path/'beta.db'))])
+    alpha, beta = (app.bot.worker_pool for app in apps)
+    try:
+        def fail():
+            raise ValueError('ошибка alpha')
+
+        alpha.put(fail)
+        assert alpha.exception_event.wait(5)
+        assert not beta.exception_event.is_set()
+        with pytest.raises(ValueError):
+            alpha.raise_exceptions()
+
+        apps[0].bot.stop_bot()
+        done = threading.Event()
+        beta.put(done.set)
+        assert done.wait(5)
+    finally:
+        for app in apps:
+            app.close()
+        close_shared_pools(apps)
@@ -0,0 +1,121 @@
+import threading
+import pytest
+from unittest import mock
+
+import telebot
+from telebot import types
+
+from callback_ack import FAILURE_TEXT, EarlyCallbackAck
+
+
+def make_callback_update(update_id: int, chat_id: int, data: str) -> types.Update:
+    """
+    Создает обновление с нажатием inline кнопки.
+    :param update_id: int: ID обновления.
+    :param chat_id: int: ID чата.
+    :param data: str: callback_data кнопки.
+    :return: types.Update: Обновление.
+    """
+    user = {'id': chat_id, 'is_bot': False, 'first_name': 'Test'}
+    return types.Update.de_json({'update_id': update_id,
+                                 'callback_query': {'id': f'call-{update_id}', 'from': user, 'chat_instance': '1',
+                                                    'data': data,
+                                                    'message': {'message_id': 1, 'date': 0, 'text': 'Кнопки',
+                                                                'chat': {'id': chat_id, 'type': 'private'}}}})
+
+
+@pytest.fixture
+def bot() -> telebot.TeleBot:
+    """
+    Предоставляет бота без пула потоков с подмененными методами Bot API.
+    :return: telebot.TeleBot: Бот.
+    """
+    sync_bot = telebot.TeleBot('123456:TEST', threaded=False)
+    sync_bot.answer_callback_query = mock.MagicMock()
+    sync_bot.send_message = mock.MagicMock()
+    return sync_bot
+
+
+def test_ack_is_sent_before_handler_finishes(bot: telebot.TeleBot):
+    """
+    Тестирует, что подтверждение отправляется, пока обработчик еще работает, и помечает нажатие.
+    :param bot: telebot.TeleBot: Бот.
+    """
+    acked = threading.Event()
+    bot.answer_callback_query.side_effect = lambda call_id: acked.set()
+    seen = []
+
+    @bot.callback_query_handler(func=lambda call: True)
+    def handle_callback(call: types.CallbackQuery):
+        # Обработчик ждет подтверждения: без раннего подтверждения тест не дождался бы его
+        seen.append((call.answered, acked.wait(5)))
+
+    ack = EarlyCallbackAck.install(bot)
+    bot.process_new_updates([make_callback_update(1, 10, '/sleep')])
+    ack.stop()
+
+    assert seen == [(True, True)]
+    bot.answer_callback_query.assert_called_once_with('call-1')
+    assert ack.stats['acknowledged'] == 1
+    assert ack.stats['max_ack_time'] >= ack.stats['avg_ack_time'] > 0
+
+
+def test_messages_are_not_acknowledged(bot: telebot.TeleBot):
+    """
+    Тестирует, что обновления без нажатия кнопки проходят без подтверждения.
+    :param bot: telebot.TeleBot: Бот.
+    """
+    received = []
+
+    @bot.message_handler(func=lambda message: True)
+    def all_other_message(message: types.Message):
+        received.append(message.text)
+
+    ack = EarlyCallbackAck.install(bot)
+    bot.process_new_updates([types.Update.de_json({
+        'update_id': 1, 'message': {'message_id': 1, 'date': 0, 'text': 'Привет',
+                                    'chat': {'id': 1, 'type': 'private'},
+                                    'from': {'id': 1, 'is_bot': False, 'first_name': 'Test'}}})])
+    ack.stop()
+
+    assert received == ['Привет']
+    bot.answer_callback_query.assert_not_called()
+
+
+def test_handler_failure_is_reported(bot: telebot.TeleBot):
+    """
+    Тестирует, что ошибка обработчика после подтверждения сообщается пользователю.
+    :param bot: telebot.TeleBot: Бот.
+    """
+    @bot.callback_query_handler(func=lambda call: True)
+    def handle_quality_callback(call: types.CallbackQuery):
+        raise RuntimeError('DB Error')
+
+    ack = EarlyCallbackAck.install(bot)
+    bot.process_new_updates([make_callback_update(1, 10, 'quality_5_1')])
+    ack.stop()
+
+    bot.send_message.assert_called_once_with(10, FAILURE_TEXT)
+    assert ack.stats['handler_errors'] == 1
+    assert bot.callback_query_handlers[0]['function'].__name__ == 'handle_quality_callback'
+
+
+def test_ack_failure_is_counted(bot: telebot.TeleBot):
+    """
+    Тестирует, что ошибка подтверждения не мешает обработке нажатия.
+    :param bot: telebot.TeleBot: Бот.
+    """
+    bot.answer_callback_query.side_effect = RuntimeError('network')
+    handled = []
+
+    @bot.callback_query_handler(func=lambda call: True)
+    def handle_callback(call: types.CallbackQuery):
+        handled.append(call.data)
+
+    ack = EarlyCallbackAck.install(bot)
+    bot.process_new_updates([make_callback_update(1, 10, '/wake')])
+    ack.stop()
+
+    assert handled == ['/wake']
+    assert ack.stats['failed'] == 1
+    assert ack.stats['acknowledged'] == 0
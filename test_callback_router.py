@@ -0,0 +1,109 @@
+import pytest
+from typing import NamedTuple
+from unittest.mock import MagicMock
+
+from callback_router import CALLBACK_DATA_MAX_BYTES, CallbackDataError, CallbackRouter
+
+
+class Rating(NamedTuple):
+    """ Данные тестовой кнопки оценки. """
+    value: int
+    record_id: int
+    confirmed: bool
+
+    def validate(self) -> bool:
+        return 1 <= self.value <= 5
+
+
+class Command(NamedTuple):
+    """ Данные тестовой кнопки команды. """
+    name: str
+
+
+@pytest.fixture
+def router() -> CallbackRouter:
+    """
+    Предоставляет маршрутизатор с двумя типами кнопок и обработчиками-моками.
+    :return: CallbackRouter: Маршрутизатор.
+    """
+    callback_router = CallbackRouter()
+    callback_router.route('r', Rating)(MagicMock(name='rating'))
+    callback_router.route('c', Command)(MagicMock(name='command'))
+    callback_router.alias('/start', Command('start'))
+    return callback_router
+
+
+def test_encode_decode_round_trip(router: CallbackRouter):
+    """
+    Тестирует компактное кодирование данных кнопки и их разбор в тот же объект.
+    :param router: CallbackRouter: Маршрутизатор.
+    """
+    data = router.encode(Rating(5, 123, True))
+
+    assert data == 'r1:5:123:1'
+    handler, payload = router.decode(data)
+    assert payload == Rating(5, 123, True)
+    assert handler is router._routes['r1'].handler
+
+
+def test_dispatch_calls_handler(router: CallbackRouter):
+    """
+    Тестирует, что dispatch вызывает обработчик с нажатием и разобранными данными, в том числе для псевдонима.
+    :param router: CallbackRouter: Маршрутизатор.
+    """
+    call = MagicMock()
+    call.data = '/start'
+
+    router.dispatch(call)
+
+    router._routes['c1'].handler.assert_called_once_with(call, Command('start'))
+
+
+@pytest.mark.parametrize('data, reason', [
+    ('r0:5:123:1', 'stale'),
+    ('x1:5', 'unknown'),
+    ('r1:5:123', 'malformed'),
+    ('r1:-5:123:1', 'malformed'),
+    ('r1:5:123:yes', 'malformed'),
+    ('r1:7:123:1', 'invalid'),
+    ('r1:' + '9' * CALLBACK_DATA_MAX_BYTES, 'oversized'),
+])
+def test_decode_rejects_bad_data(router: CallbackRouter, data: str, reason: str):
+    """
+    Тестирует причины отклонения некорректной callback_data.
+    :param router: CallbackRouter: Маршрутизатор.
+    :param data: str: callback_data.
+    :param reason: str: Ожидаемая причина.
+    """
+    with pytest.raises(CallbackDataError) as error:
+        router.decode(data)
+
+    assert error.value.reason == reason
+    assert error.value.data == data
+
+
+def test_encode_rejects_invalid_payload(router: CallbackRouter):
+    """
+    Тестирует, что нельзя создать кнопку с недопустимыми, неразбираемыми или слишком длинными данными.
+    :param router: CallbackRouter: Маршрутизатор.
+    """
+    with pytest.raises(ValueError):
+        router.encode(Rating(9, 1, False))
+    with pytest.raises(ValueError):
+        router.encode(Command('a:b'))
+    with pytest.raises(ValueError):
+        router.encode(Command('x' * CALLBACK_DATA_MAX_BYTES))
+
+
+def test_route_rejects_duplicate_code_and_unsupported_fields(router: CallbackRouter):
+    """
+    Тестирует проверки при регистрации типа кнопки.
+    :param router: CallbackRouter: Маршрутизатор.
+    """
+    class Price(NamedTuple):
+        amount: float
+
+    with pytest.raises(ValueError):
+        router.route('r', Command)
+    with pytest.raises(TypeError):
+        router.route('p', Price)
@@ -0,0 +1,258 @@
+import sqlite3
+import threading
+import pytest
+from unittest import mock
+
+from connection_pool import ConnectionPool, WalCheckpointer, apply_pragmas
+
+
+@pytest.fixture
+def db_file(tmp_path) -> str:
+    """
+    Предоставляет путь к временному файлу базы данных.
+    :param tmp_path: Встроенная фикстура pytest для создания временных путей.
+    :return: str: Путь к файлу базы данных.
+    """
+    return str(tmp_path/'test_pool.db')
+
+
+def test_acquire_reuses_connection_in_same_thread(db_file: str):
+    """
+    Тестирует, что один и тот же поток получает одно и то же соединение при повторных вызовах acquire().
+    :param db_file: str: Путь к временному файлу базы данных.
+    """
+    pool = ConnectionPool()
+    conn_1 = pool.acquire(db_file)
+    pool.release(conn_1)
+    conn_2 = pool.acquire(db_file)
+
+    assert conn_1 is conn_2
+    assert len(pool) == 1
+    pool.close_all()
+
+
+def test_acquire_gives_each_thread_own_connection(db_file: str):
+    """
+    Тестирует, что разные потоки получают разные соединения.
+    :param db_file: str: Путь к временному файлу базы данных.
+    """
+    pool = ConnectionPool()
+    main_conn = pool.acquire(db_file)
+    other = {}
+
+    def worker():
+        other['conn'] = pool.acquire(db_file)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+
+    assert other['conn'] is not main_conn
+    assert len(pool) == 2
+    pool.close_all()
+
+
+def test_overflow_connection_is_closed_on_release(db_file: str):
+    """
+    Тестирует верхнюю границу пула: при исчерпании лимита выдается временное соединение,
+    которое закрывается при release().
+    :param db_file: str: Путь к временному файлу базы данных.
+    """
+    pool = ConnectionPool(max_connections=1)
+    pool.acquire(db_file)
+    # Второй файл БД в том же потоке требует второго соединения, лимит уже исчерпан
+    overflow_conn = pool.acquire(db_file + '-second')
+    assert len(pool) == 1
+
+    pool.release(overflow_conn)
+    with pytest.raises(sqlite3.ProgrammingError):
+        overflow_conn.execute('SELECT 1')
+    pool.close_all()
+
+
+def test_dead_thread_connections_are_pruned(db_file: str):
+    """
+    Тестирует, что соединения завершившихся потоков освобождают место в пуле.
+    :param db_file: str: Путь к временному файлу базы данных.
+    """
+    pool = ConnectionPool(max_connections=1)
+    thread = threading.Thread(target=pool.acquire, args=(db_file,))
+    thread.start()
+    thread.join()
+
+    conn = pool.acquire(db_file)
+    pool.release(conn)
+
+    assert len(pool) == 1
+    # Соединение постоянное, release() его не закрыл
+    assert conn.execute('SELECT 1').fetchone() == (1,)
+    pool.close_all()
+
+
+def test_unhealthy_connection_is_replaced(db_file: str):
+    """
+    Тестирует, что соединение, не прошедшее проверку работоспособности, пересоздается.
+    :param db_file: str: Путь к временному файлу базы данных.
+    """
+    pool = ConnectionPool(check_interval=0)
+    broken_conn = pool.acquire(db_file)
+    broken_conn.close()
+
+    new_conn = pool.acquire(db_file)
+
+    assert new_conn is not broken_conn
+    assert new_conn.execute('SELECT 1').fetchone() == (1,)
+    pool.close_all()
+
+
+
+def test_health_check_time_does_not_outlive_connection(db_file: str):
+    """
+    Тестирует, что время последней проверки хранится для ключа пула и удаляется вместе с соединением:
+    новое соединение (даже с тем же id объекта) не наследует время проверки закрытого.
+    :param db_file: str: Путь к временному файлу базы данных.
+    """
+    pool = ConnectionPool(check_interval=60)
+    pool.acquire(db_file)
+    pool.acquire(db_file + '-second')
+
+    pool.close_all(db_file)
+
+    assert list(pool._last_checked) == [(threading.get_ident(), db_file + '-second')]
+    pool.close_all()
+    assert pool._last_checked == {}
+
+def test_release_rolls_back_open_transaction(db_file: str):
+    """
+    Тестирует, что незавершенная транзакция откатывается при возврате соединения в пул.
+    :param db_file: str: Путь к временному файлу базы данных.
+    """
+    pool = ConnectionPool()
+    conn = pool.acquire(db_file)
+    conn.execute('CREATE TABLE t (x INTEGER)')
+    conn.commit()
+    conn.execute('INSERT INTO t VALUES (1)')
+    assert conn.in_transaction
+
+    pool.release(conn)
+
+    assert not conn.in_transaction
+    assert conn.execute('SELECT COUNT(*) FROM t').fetchone() == (0,)
+    pool.close_all()
+
+
+def test_close_all_for_one_database(db_file: str):
+    """
+    Тестирует закрытие соединений только для одной базы данных: пул продолжает работать.
+    :param db_file: str: Путь к временному файлу базы данных.
+    """
+    pool = ConnectionPool()
+    conn = pool.acquire(db_file)
+    pool.acquire(db_file + '-second')
+
+    pool.close_all(db_file)
+
+    assert len(pool) == 1
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute('SELECT 1')
+    assert pool.acquire(db_file) is not conn
+    pool.close_all()
+
+
+def test_acquire_after_close_all_raises(db_file: str):
+    """
+    Тестирует, что после полного закрытия пул не выдает соединения.
+    :param db_file: str: Путь к временному файлу базы данных.
+    """
+    pool = ConnectionPool()
+    pool.acquire(db_file)
+    pool.close_all()
+
+    assert len(pool) == 0
+    with pytest.raises(sqlite3.ProgrammingError):
+        pool.acquire(db_file)
+
+
+def test_connection_is_opened_once_per_thread(db_file: str):
+    """
+    Тестирует, что при многократных запросах соединение открывается только один раз.
+    :param db_file: str: Путь к временному файлу базы данных.
+    """
+    pool = ConnectionPool()
+    with mock.patch('connection_pool.sqlite3.connect', wraps=sqlite3.connect) as spy_connect:
+        for _ in range(10):
+            pool.release(pool.acquire(db_file))
+
+    assert spy_connect.call_count == 1
+    pool.close_all()
+
+
+# -- Тесты профиля PRAGMA и контрольных точек WAL --
+def test_pool_applies_pragmas_to_new_connection(db_file: str):
+    """
+    Тестирует, что пул применяет профиль PRAGMA к создаваемому соединению.
+    :param db_file: str: Путь к временному файлу базы данных.
+    """
+    pool = ConnectionPool()
+    conn = pool.acquire(db_file, {'busy_timeout': 1234, 'temp_store': 'MEMORY'})
+
+    assert conn.execute('PRAGMA busy_timeout').fetchone() == (1234,)
+    # 2 - MEMORY
+    assert conn.execute('PRAGMA temp_store').fetchone() == (2,)
+    pool.close_all()
+
+
+@pytest.mark.parametrize('name, value', [
+    ('busy_timeout; DROP TABLE users', 1),
+    ('synchronous', 'NORMAL; DROP TABLE users'),
+    ('cache_size', '1.5'),
+])
+def test_apply_pragmas_rejects_invalid_settings(db_file: str, name: str, value: str | int):
+    """
+    Тестирует, что недопустимые имена и значения PRAGMA отклоняются до выполнения запроса.
+    :param db_file: str: Путь к временному файлу базы данных.
+    :param name: str: Имя PRAGMA.
+    :param value: str | int: Значение PRAGMA.
+    """
+    conn = sqlite3.connect(db_file)
+    with pytest.raises(ValueError):
+        apply_pragmas(conn, {name: value})
+    conn.close()
+
+
+def test_wal_checkpointer_checkpoint(db_file: str):
+    """
+    Тестирует выполнение пассивной контрольной точки WAL: страницы из WAL переносятся в файл БД.
+    :param db_file: str: Путь к временному файлу базы данных.
+    """
+    conn = sqlite3.connect(db_file)
+    apply_pragmas(conn, {'journal_mode': 'WAL'})
+    with conn:
+        conn.execute('CREATE TABLE t (x INTEGER)')
+        conn.executemany('INSERT INTO t VALUES (?)', [(i,) for i in range(100)])
+
+    busy, log_pages, checkpointed_pages = WalCheckpointer(db_file).checkpoint()
+    conn.close()
+
+    assert busy == 0
+    assert log_pages > 0
+    assert checkpointed_pages == log_pages
+
+
+def test_wal_checkpointer_start_stop(db_file: str):
+    """
+    Тестирует запуск и остановку фонового потока контрольных точек.
+    :param db_file: str: Путь к временному файлу базы данных.
+    """
+    checkpointer = WalCheckpointer(db_file, interval=0.01)
+    with mock.patch.object(checkpointer, 'checkpoint') as mock_checkpoint:
+        checkpointer.start()
+        # Ждем, пока поток выполнит хотя бы одну контрольную точку
+        for _ in range(100):
+            if mock_checkpoint.call_count:
+                break
+            threading.Event().wait(0.01)
+        checkpointer.stop()
+
+    assert mock_checkpoint.call_count >= 2
+    assert checkpointer._thread is None
@@ -0,0 +1,188 @@
+import pytest
+
+from connection_pool import ConnectionPool
+from conversation_state import ConversationState, ConversationStateStore
+from database_manager import DatabaseManager
+
+
+class FakeClock:
+    """ Управляемые часы для проверки времени жизни шагов. """
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    """
+    Предоставляет управляемые часы.
+    :return: FakeClock: Часы.
+    """
+    return FakeClock()
+
+
+@pytest.fixture
+def db_name(tmp_path) -> str:
+    """
+    Предоставляет временный файл БД, схему которого (в том числе таблицу conversation_state) создал DatabaseManager.
+    :param tmp_path: Встроенная фикстура pytest для создания временных путей.
+    :return: str: Путь к файлу БД.
+    """
+    db_file = str(tmp_path/'state.db')
+    DatabaseManager(db_name=db_file).close()
+    return db_file
+
+
+@pytest.fixture
+def store(db_name: str, clock: FakeClock) -> ConversationStateStore:
+    """
+    Предоставляет хранилище шагов диалога во временном файле.
+    :param db_name: str: Путь к файлу БД.
+    :param clock: FakeClock: Часы.
+    :return: ConversationStateStore: Хранилище.
+    """
+    return ConversationStateStore(db_name, ttl=60, max_entries=3, clock=clock)
+
+
+def test_set_get_pop(store: ConversationStateStore, clock: FakeClock):
+    """
+    Тестирует сохранение, чтение и однократное извлечение шага диалога.
+    :param store: ConversationStateStore: Хранилище.
+    :param clock: FakeClock: Часы.
+    """
+    store.set(1, 'note', {'sleep_record_id': 42})
+
+    assert 1 in store
+    assert store.get(1) == ConversationState('note', {'sleep_record_id': 42}, clock.now + 60)
+    assert store.pop(1).data == {'sleep_record_id': 42}
+    assert store.pop(1) is None
+    assert 1 not in store
+    assert store.stats() == {'size': 0, 'hits': 2, 'misses': 1, 'expired': 0, 'evicted': 0}
+
+
+def test_state_survives_restart(db_name: str, clock: FakeClock):
+    """
+    Тестирует, что шаг диалога доступен новому экземпляру хранилища (перезапуск бота).
+    :param db_name: str: Путь к файлу БД.
+    :param clock: FakeClock: Часы.
+    """
+    ConversationStateStore(db_name, clock=clock).set(7, 'note', {'sleep_record_id': 1})
+
+    restarted = ConversationStateStore(db_name, clock=clock)
+
+    assert restarted.pop(7).step == 'note'
+
+
+def test_expired_state_is_ignored_and_purged(store: ConversationStateStore, clock: FakeClock):
+    """
+    Тестирует, что брошенный шаг не возвращается и удаляется.
+    :param store: ConversationStateStore: Хранилище.
+    :param clock: FakeClock: Часы.
+    """
+    store.set(1, 'note')
+    store.set(2, 'note')
+    clock.now += 60
+
+    assert 1 not in store
+    assert store.get(1) is None
+    assert store.pop(1) is None
+    assert store.purge_expired() == 1
+    assert store.stats()['size'] == 0
+
+
+def test_least_recently_used_is_evicted(store: ConversationStateStore, clock: FakeClock):
+    """
+    Тестирует, что при превышении лимита вытесняется шаг, к которому дольше всего не обращались.
+    :param store: ConversationStateStore: Хранилище.
+    :param clock: FakeClock: Часы.
+    """
+    for chat_id in (1, 2, 3):
+        store.set(chat_id, 'note')
+        clock.now += 1
+    # Обращение к шагу 1 делает его недавно использованным, дольше всего не использовался шаг 2
+    store.get(1)
+    clock.now += 1
+    store.set(4, 'note')
+
+    assert [chat_id in store for chat_id in (1, 2, 3, 4)] == [True, False, True, True]
+    assert store.stats()['evicted'] == 1
+
+
+def test_store_with_connection_pool(db_name: str):
+    """
+    Тестирует работу хранилища через пул постоянных соединений.
+    :param db_name: str: Путь к файлу БД.
+    """
+    pool = ConnectionPool(max_connections=2)
+    store = ConversationStateStore(db_name, pool=pool)
+    store.set(5, 'note', {'text': 'Заметка'})
+
+    assert store.get(5).data == {'text': 'Заметка'}
+    assert len(pool) == 1
+    pool.close_all()
+
+
+def test_constructor_rejects_invalid_limits(db_name: str):
+    """
+    Тестирует проверку лимитов хранилища.
+    :param db_name: str: Путь к файлу БД.
+    """
+    with pytest.raises(ValueError):
+        ConversationStateStore(db_name, max_entries=0)
+    with pytest.raises(ValueError):
+        ConversationStateStore(db_name, ttl=0)
+    with pytest.raises(ValueError):
+        ConversationStateStore(db_name, refresh_interval=0)
+
+
+def test_membership_check_does_not_query_database(db_name: str, clock: FakeClock):
+    """
+    Тестирует, что проверка "in" (фильтр каждого сообщения) использует индекс в памяти:
+    он загружается из таблицы при создании хранилища и следует за set, pop и сроком шага.
+    :param db_name: str: Путь к файлу БД.
+    :param clock: FakeClock: Часы.
+    """
+    ConversationStateStore(db_name, ttl=60, clock=clock).set(1, 'note')
+    store = ConversationStateStore(db_name, ttl=60, clock=clock, refresh_interval=120)
+    store._execute = None  # любое обращение к БД завершится ошибкой
+
+    assert 1 in store
+    assert 2 not in store
+    clock.now += 60
+    assert 1 not in store
+
+
+def test_membership_follows_set_pop_and_eviction(store: ConversationStateStore, clock: FakeClock):
+    """
+    Тестирует согласованность индекса в памяти с таблицей при записи, извлечении и вытеснении шагов.
+    :param store: ConversationStateStore: Хранилище.
+    :param clock: FakeClock: Часы.
+    """
+    for chat_id in (1, 2, 3, 4):
+        store.set(chat_id, 'note')
+        clock.now += 1
+    store.pop(4)
+
+    assert [chat_id in store for chat_id in (1, 2, 3, 4)] == [False, True, True, False]
+
+
+def test_membership_sees_steps_of_other_process(db_name: str, clock: FakeClock):
+    """
+    Тестирует, что шаги, записанные и извлеченные другим экземпляром (процессом) с той же таблицей,
+    становятся видны проверке "in" после перечитывания индекса.
+    :param db_name: str: Путь к файлу БД.
+    :param clock: FakeClock: Часы.
+    """
+    writer = ConversationStateStore(db_name, ttl=60, clock=clock)
+    reader = ConversationStateStore(db_name, ttl=60, clock=clock, refresh_interval=5)
+    writer.set(1, 'note')
+
+    assert 1 not in reader
+    clock.now += 5
+    assert 1 in reader
+    writer.pop(1)
+    clock.now += 5
+    assert 1 not in reader
+
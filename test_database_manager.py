@@ -1,13 +1,16 @@
 import pytest
 import sqlite3
 import logging
-from datetime import datetime, date
+import threading
+from datetime import datetime, date, timedelta
 from typing import Any
 from unittest import mock
 from pytest_mock import MockFixture
 
 # Импортируем DatabaseManager
-from database_manager import DatabaseManager
+import database_manager
+from database_manager import DatabaseManager, SCHEMA_MIGRATIONS, datetime_to_db, datetime_from_db
+from connection_pool import ConnectionPool, DEFAULT_PRAGMAS
 
 
 @pytest.fixture
@@ -163,7 +166,7 @@ def test_start_sleep_session_successfully(db_manager: DatabaseManager, caplog: p
     # Проверка корректности возвращаемых значений
     assert retrieved_session_id == session_id
     assert retrieved_user_id == user_id
-    assert retrieved_sleep_time == sleep_time.isoformat()
+    assert retrieved_sleep_time == datetime_to_db(sleep_time)
     assert retrieved_wake_time is None
     assert retrieved_sleep_quality is None
 
@@ -201,8 +204,8 @@ def test_end_sleep_session_successfully(db_manager: DatabaseManager, caplog: pyt
 
     # Проверка корректности возвращаемых значений
     assert retrieved_session_id == session_id
-    assert retrieved_sleep_time == sleep_time.isoformat()
-    assert retrieved_wake_time == wake_time.isoformat()
+    assert retrieved_sleep_time == datetime_to_db(sleep_time)
+    assert retrieved_wake_time == datetime_to_db(wake_time)
     assert retrieved_sleep_quality is None
 
 
@@ -242,8 +245,8 @@ def test_update_sleep_quality_successfully(db_manager: DatabaseManager, caplog:
 
     # Проверка корректности возвращаемых значений
     assert retrieved_session_id == session_id
-    assert retrieved_sleep_time == sleep_time.isoformat()
-    assert retrieved_wake_time == wake_time.isoformat()
+    assert retrieved_sleep_time == datetime_to_db(sleep_time)
+    assert retrieved_wake_time == datetime_to_db(wake_time)
     assert retrieved_sleep_quality == quality
 
 
@@ -451,18 +454,10 @@ def test_get_sleep_statistic_successfully(db_manager: DatabaseManager, caplog: p
     wake_time = datetime.now()
     db_manager.end_sleep_session(session_id, wake_time)
 
-    with sqlite3.connect(db_manager.db_name) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-                """SELECT
-                   COUNT(id),
-                   SUM(strftime('%s', wake_time) - strftime('%s', sleep_time))
-                   FROM sleep_records
-                   WHERE user_id = ? AND wake_time IS NOT NULL
-                   """, (user_id,))
-        retrieved_total_s, retrieved_total_d = cursor.fetchone()
-    conn.close()
-    retrieved_avg_d = (retrieved_total_d / retrieved_total_s) if retrieved_total_s > 0 else 0.0
+    # Ожидаемые значения: продолжительность считается в целых секундах
+    retrieved_total_s = 1
+    retrieved_total_d = int((wake_time.replace(microsecond=0) - sleep_time).total_seconds())
+    retrieved_avg_d = retrieved_total_d / retrieved_total_s
 
     total_s, total_d, avg_d = db_manager.get_sleep_statistic(user_id)
 
@@ -719,6 +714,7 @@ def test_get_sleep_statistic_error_handling(db_manager: DatabaseManager, caplog:
         ('add_user', (1, 'Sonya')),
         ('start_sleep_session', (1, datetime.now())),
         ('end_sleep_session', (1, datetime.now())),
+        ('finish_latest_sleep_session', (1, datetime.now())),
         ('update_sleep_quality', (1, 5)),
         ('add_note', (1, 'Note text'))
     ])
@@ -770,3 +766,963 @@ def test_all_methods_for_rollback(
 
     assert not mock_conn.commit.called, f'Метод {method_name} ошибочно сделал commit!'
 
+# -- Тесты режима пула постоянных соединений --
+@pytest.fixture
+def pooled_db_manager(tmp_path) -> DatabaseManager:
+    """
+    Предоставляет экземпляр DatabaseManager, работающий через пул постоянных соединений.
+    :param tmp_path: Встроенная фикстура pytest для создания временных путей.
+    :yield: DatabaseManager: Экземпляр менеджера с пулом соединений.
+    """
+    db_file = str(tmp_path/'test_db_manager_pooled.db')
+    manager = DatabaseManager(db_name=db_file, pool=ConnectionPool())
+    yield manager
+    manager.pool.close_all()
+
+
+def test_pooled_mode_reuses_connection(pooled_db_manager: DatabaseManager, mocker: MockFixture):
+    """
+    Тестирует, что в режиме пула методы не открывают новое соединение на каждый вызов.
+    :param pooled_db_manager: DatabaseManager: Менеджер базы данных с пулом соединений.
+    :param mocker: MockFixture: Фикстура pytest_mock для подмены объектов.
+    """
+    spy_connect = mocker.spy(sqlite3, 'connect')
+
+    pooled_db_manager.add_user(1, 'TestUser')
+    session_id = pooled_db_manager.start_sleep_session(1, datetime(2025, 12, 12, 23, 0, 0))
+    pooled_db_manager.end_sleep_session(session_id, datetime(2025, 12, 13, 7, 0, 0))
+
+    assert spy_connect.call_count == 0
+    assert pooled_db_manager.get_user_by_id(1) == (1, 'TestUser')
+    assert pooled_db_manager.get_sleep_statistic(1) == (1, 8 * 3600, 8 * 3600.0)
+
+
+def test_pooled_mode_rollback_keeps_connection_usable(
+        pooled_db_manager: DatabaseManager, caplog: pytest.LogCaptureFixture):
+    """
+    Тестирует, что ошибка запроса в режиме пула откатывает транзакцию и не ломает соединение потока.
+    :param pooled_db_manager: DatabaseManager: Менеджер базы данных с пулом соединений.
+    :param caplog: pytest.LogCaptureFixture: Фикстура pytest для перехвата сообщений логгера.
+    """
+    # Нарушение NOT NULL для ID сессии сна
+    pooled_db_manager.add_note(None, 'Хорошо')
+    assert 'Ошибка при добавлении заметки к сессии сна' in caplog.text
+
+    pooled_db_manager.add_note(1, 'Хорошо')
+    assert pooled_db_manager.get_note_by_sleep_record_id(1) == 'Хорошо'
+
+
+def test_close_releases_pooled_connections(pooled_db_manager: DatabaseManager):
+    """
+    Тестирует, что close() закрывает постоянные соединения менеджера.
+    :param pooled_db_manager: DatabaseManager: Менеджер базы данных с пулом соединений.
+    """
+    pooled_db_manager.add_user(1, 'TestUser')
+    assert len(pooled_db_manager.pool) == 1
+
+    pooled_db_manager.close()
+
+    assert len(pooled_db_manager.pool) == 0
+    # Пул продолжает работать, соединение будет открыто заново
+    assert pooled_db_manager.get_user_by_id(1) == (1, 'TestUser')
+
+
+# -- Тесты профиля PRAGMA --
+def test_database_uses_wal_journal_mode(db_manager: DatabaseManager):
+    """
+    Тестирует, что база данных переводится в режим журнала WAL при создании таблиц.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    """
+    with sqlite3.connect(db_manager.db_name) as conn:
+        journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+    conn.close()
+
+    assert journal_mode == 'wal'
+
+
+def test_connection_pragmas_applied(db_manager: DatabaseManager):
+    """
+    Тестирует, что к каждому соединению менеджера применяется профиль PRAGMA.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    """
+    conn = db_manager._get_connection()
+    try:
+        assert conn.execute('PRAGMA synchronous').fetchone() == (1,)  # 1 - NORMAL
+        assert conn.execute('PRAGMA busy_timeout').fetchone() == (DEFAULT_PRAGMAS['busy_timeout'],)
+        assert conn.execute('PRAGMA cache_size').fetchone() == (DEFAULT_PRAGMAS['cache_size'],)
+    finally:
+        db_manager._release_connection(conn)
+
+
+def test_custom_pragmas_without_wal(tmp_path):
+    """
+    Тестирует, что профиль PRAGMA можно переопределить, например, оставить журнал отката.
+    :param tmp_path: Встроенная фикстура pytest для создания временных путей.
+    """
+    manager = DatabaseManager(db_name=str(tmp_path/'test_rollback_journal.db'),
+                              pragmas={'journal_mode': 'DELETE', 'busy_timeout': 100},
+                              checkpoint_interval=1)
+    conn = manager._get_connection()
+    try:
+        assert conn.execute('PRAGMA journal_mode').fetchone() == ('delete',)
+        assert conn.execute('PRAGMA busy_timeout').fetchone() == (100,)
+    finally:
+        manager._release_connection(conn)
+    # Без WAL фоновые контрольные точки не запускаются
+    assert manager._checkpointer is None
+
+
+def test_checkpointer_started_and_stopped(tmp_path):
+    """
+    Тестирует, что при указании checkpoint_interval запускаются фоновые контрольные точки, а close() их останавливает.
+    :param tmp_path: Встроенная фикстура pytest для создания временных путей.
+    """
+    manager = DatabaseManager(db_name=str(tmp_path/'test_checkpointer.db'), checkpoint_interval=60)
+    assert manager._checkpointer is not None
+    assert manager._checkpointer._thread.is_alive()
+
+    manager.close()
+
+    assert manager._checkpointer is None
+
+
+# -- Тесты индексов --
+def query_plan(db_name: str, query: str, params: tuple) -> str:
+    """
+    Возвращает план выполнения запроса (EXPLAIN QUERY PLAN) одной строкой.
+    :param db_name: str: Путь к файлу базы данных.
+    :param query: str: SQL-запрос.
+    :param params: tuple: Параметры запроса.
+    :return: str: Описание шагов плана, разделенные ';'.
+    """
+    with sqlite3.connect(db_name) as conn:
+        rows = conn.execute(f'EXPLAIN QUERY PLAN {query}', params).fetchall()
+    conn.close()
+    return '; '.join(row[-1] for row in rows)
+
+
+@pytest.mark.parametrize('query, expected_index', [
+    ('SELECT id, sleep_time FROM sleep_records WHERE user_id = ? AND wake_time IS NULL '
+     'ORDER BY sleep_time DESC LIMIT 1', 'idx_sleep_records_unfinished'),
+    ('SELECT id, sleep_time, wake_time FROM sleep_records '
+     'WHERE user_id = ? AND wake_time IS NOT NULL AND sleep_quality IS NULL '
+     'ORDER BY wake_time DESC LIMIT 1', 'idx_sleep_records_user_wake'),
+    ('SELECT id, sleep_time, wake_time FROM sleep_records '
+     'WHERE user_id = ? AND wake_time IS NOT NULL AND sleep_quality IS NOT NULL '
+     'ORDER BY wake_time DESC LIMIT 1', 'idx_sleep_records_user_wake'),
+    ('SELECT id, sleep_time, wake_time FROM sleep_records '
+     'WHERE user_id = ? AND wake_time IS NOT NULL AND sleep_quality IS NULL AND wake_time >= 0 AND wake_time < 1 '
+     'ORDER BY wake_time DESC LIMIT 1', 'idx_sleep_records_user_wake'),
+    # Загрузка состояния пользователя в индекс горячих сессий
+    ('SELECT id, sleep_time, wake_time, sleep_quality FROM sleep_records WHERE user_id = ? AND wake_time IS NULL',
+     'idx_sleep_records_unfinished'),
+    ('SELECT id, sleep_time, wake_time, sleep_quality FROM sleep_records '
+     'WHERE user_id = ? AND wake_time IS NOT NULL ORDER BY wake_time DESC, id DESC LIMIT 9',
+     'idx_sleep_records_user_wake'),
+])
+def test_hot_queries_use_indexes(db_manager: DatabaseManager, query: str, expected_index: str):
+    """
+    Тестирует, что "горячие" запросы поиска сессий используют индексы, а не полное сканирование таблицы.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    :param query: str: Проверяемый запрос.
+    :param expected_index: str: Имя индекса, который должен использоваться.
+    """
+    plan = query_plan(db_manager.db_name, query, (1,))
+
+    assert f'USING INDEX {expected_index}' in plan
+    assert 'SCAN sleep_records' not in plan
+    # Сортировка выполняется по индексу, без временного B-дерева
+    assert 'TEMP B-TREE' not in plan
+
+
+def test_create_tables_is_idempotent(db_manager: DatabaseManager):
+    """
+    Тестирует, что повторное создание таблиц и индексов не приводит к ошибкам и дубликатам.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    """
+    db_manager._create_tables()
+    db_manager._create_tables()
+
+    with sqlite3.connect(db_manager.db_name) as conn:
+        indexes = conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' "
+                               "AND tbl_name = 'sleep_records' AND name LIKE 'idx_%'").fetchall()
+    conn.close()
+
+    assert sorted(indexes) == [('idx_sleep_records_unfinished',), ('idx_sleep_records_user_wake',)]
+
+
+# -- Тесты целочисленного хранения времени --
+@pytest.mark.parametrize('value', [
+    datetime(2025, 12, 12, 23, 0, 0),
+    datetime(2025, 12, 13, 7, 30, 15, 123456),
+    datetime(1970, 1, 1),
+])
+def test_datetime_db_conversion_round_trip(value: datetime):
+    """
+    Тестирует, что преобразование времени в целое число для БД и обратно не теряет точности.
+    :param value: datetime: Проверяемое время.
+    """
+    stored = datetime_to_db(value)
+
+    assert isinstance(stored, int)
+    assert datetime_from_db(stored) == value
+
+
+def test_end_sleep_session_stores_duration(db_manager: DatabaseManager):
+    """
+    Тестирует, что при завершении сессии сна сохраняется продолжительность сна в секундах.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    """
+    session_id = db_manager.start_sleep_session(1, datetime(2025, 12, 12, 23, 0, 0, 900000))
+    db_manager.end_sleep_session(session_id, datetime(2025, 12, 13, 7, 30, 0, 100000))
+
+    with sqlite3.connect(db_manager.db_name) as conn:
+        duration = conn.execute("SELECT duration_sec FROM sleep_records WHERE id = ?", (session_id,)).fetchone()[0]
+    conn.close()
+
+    # Как и strftime('%s', ...), целые секунды считаются отдельно для каждого времени
+    assert duration == 8 * 3600 + 30 * 60
+    assert isinstance(duration, int)
+
+
+@pytest.mark.parametrize('sleep_value', [None, '2025-12-12 23:00:00'], ids=['null', 'legacy_text'])
+def test_end_sleep_session_with_invalid_sleep_time(db_manager: DatabaseManager, sleep_value: str | None):
+    """
+    Тестирует завершение сессии, время начала которой не задано или осталось строкой старого формата:
+    сессия завершается без продолжительности, а статистика пользователя не портится.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    :param sleep_value: str | None: Время начала сна в БД.
+    """
+    session_id = db_manager.start_sleep_session(1, datetime(2025, 12, 12, 23, 0, 0))
+    with sqlite3.connect(db_manager.db_name) as conn:
+        conn.execute('UPDATE sleep_records SET sleep_time = ? WHERE id = ?', (sleep_value, session_id))
+    conn.close()
+    wake_time = datetime(2025, 12, 13, 7, 0, 0)
+
+    db_manager.end_sleep_session(session_id, wake_time)
+
+    with sqlite3.connect(db_manager.db_name) as conn:
+        row = conn.execute('SELECT wake_time, duration_sec FROM sleep_records WHERE id = ?', (session_id,)).fetchone()
+    conn.close()
+    assert row == (datetime_to_db(wake_time), None)
+    assert read_user_sleep_stats(db_manager.db_name, 1) is None
+
+
+def test_migrate_iso_timestamps_to_integer(tmp_path, caplog: pytest.LogCaptureFixture):
+    """
+    Тестирует миграцию базы данных старого формата (время строками ISO-8601) в целочисленный формат.
+    Миграция выполняется пачками, поэтому используется размер пачки меньше количества записей.
+    :param tmp_path: Встроенная фикстура pytest для создания временных путей.
+    :param caplog: pytest.LogCaptureFixture: Фикстура pytest для перехвата сообщений логгера.
+    """
+    db_file = str(tmp_path/'test_legacy.db')
+    # База данных в формате до миграции
+    with sqlite3.connect(db_file) as conn:
+        conn.execute('CREATE TABLE users (id INTEGER PRIMARY KEY UNIQUE, name TEXT NOT NULL)')
+        conn.execute('''CREATE TABLE sleep_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
+            sleep_time DATETIME, wake_time DATETIME, sleep_quality INTEGER)''')
+        conn.executemany('INSERT INTO sleep_records (user_id, sleep_time, wake_time) VALUES (?, ?, ?)', [
+            (1, '2025-12-01T22:00:00', '2025-12-02T06:00:00'),
+            (1, '2025-12-02T23:00:00.500000', '2025-12-03T03:00:00'),
+            (1, '2025-12-03T23:00:00', None),
+        ])
+    conn.close()
+
+    with mock.patch.object(DatabaseManager, 'MIGRATION_BATCH_SIZE', 2):
+        manager = DatabaseManager(db_name=db_file)
+
+    with sqlite3.connect(db_file) as conn:
+        rows = conn.execute('SELECT typeof(sleep_time), typeof(wake_time), duration_sec FROM sleep_records '
+                            'ORDER BY id').fetchall()
+    conn.close()
+
+    # Две пачки: по 2 и 1 записи
+    assert 'обработано 2 записей (до ID 2)' in caplog.text
+    assert 'обработано 3 записей (до ID 3)' in caplog.text
+    assert rows == [('integer', 'integer', 8 * 3600), ('integer', 'integer', 4 * 3600), ('integer', 'null', None)]
+    assert manager.get_latest_unfinished_sleep_session(1) == (3, datetime(2025, 12, 3, 23, 0, 0))
+    assert manager.get_sleep_statistic(1) == (2, 12 * 3600, 6 * 3600.0)
+
+
+# -- Тесты агрегированной статистики сна --
+def read_user_sleep_stats(db_name: str, user_id: int) -> tuple | None:
+    """
+    Читает строку агрегированной статистики сна пользователя напрямую из БД.
+    :param db_name: str: Путь к файлу базы данных.
+    :param user_id: int: ID пользователя.
+    :return: tuple | None: (session_count, total_sec, min_sec, max_sec, sum_sq_sec) или None.
+    """
+    with sqlite3.connect(db_name) as conn:
+        row = conn.execute('SELECT session_count, total_sec, min_sec, max_sec, sum_sq_sec '
+                           'FROM user_sleep_stats WHERE user_id = ?', (user_id,)).fetchone()
+    conn.close()
+    return row
+
+
+def test_user_sleep_stats_updated_incrementally(db_manager: DatabaseManager):
+    """
+    Тестирует, что завершение сессии сна обновляет количество, сумму, минимум, максимум и сумму квадратов.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    """
+    user_id = 1
+    durations = [8 * 3600, 4 * 3600, 6 * 3600]
+    for day, duration in enumerate(durations, start=1):
+        sleep_time = datetime(2025, 12, day, 22, 0, 0)
+        session_id = db_manager.start_sleep_session(user_id, sleep_time)
+        db_manager.end_sleep_session(session_id, sleep_time + timedelta(seconds=duration))
+    # Незавершенная сессия не попадает в статистику
+    db_manager.start_sleep_session(user_id, datetime(2025, 12, 5, 22, 0, 0))
+
+    assert read_user_sleep_stats(db_manager.db_name, user_id) == (
+        3, sum(durations), min(durations), max(durations), sum(d * d for d in durations))
+    assert db_manager.get_sleep_statistic(user_id) == (3, 18 * 3600, 6 * 3600.0)
+
+
+def test_user_sleep_stats_recomputed_when_session_ended_again(db_manager: DatabaseManager):
+    """
+    Тестирует, что повторное завершение уже завершенной сессии не учитывает ее в статистике дважды.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    """
+    user_id = 1
+    sleep_time = datetime(2025, 12, 1, 22, 0, 0)
+    session_id = db_manager.start_sleep_session(user_id, sleep_time)
+    db_manager.end_sleep_session(session_id, sleep_time + timedelta(hours=8))
+    db_manager.end_sleep_session(session_id, sleep_time + timedelta(hours=7))
+
+    assert read_user_sleep_stats(db_manager.db_name, user_id) == (1, 7 * 3600, 7 * 3600, 7 * 3600, (7 * 3600) ** 2)
+
+
+def test_rebuild_sleep_statistics(db_manager: DatabaseManager, caplog: pytest.LogCaptureFixture):
+    """
+    Тестирует пересчет статистики сна по исходным записям после ее рассогласования.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    :param caplog: pytest.LogCaptureFixture: Фикстура pytest для перехвата сообщений логгера.
+    """
+    for user_id in (1, 2):
+        sleep_time = datetime(2025, 12, 1, 22, 0, 0)
+        session_id = db_manager.start_sleep_session(user_id, sleep_time)
+        db_manager.end_sleep_session(session_id, sleep_time + timedelta(hours=user_id))
+    # Портим статистику вручную
+    with sqlite3.connect(db_manager.db_name) as conn:
+        conn.execute('UPDATE user_sleep_stats SET session_count = 100, total_sec = 0')
+    conn.close()
+
+    assert db_manager.rebuild_sleep_statistics(1) is True
+    assert 'Статистика сна пересчитана (1).' in caplog.text
+    assert read_user_sleep_stats(db_manager.db_name, 1) == (1, 3600, 3600, 3600, 3600 ** 2)
+    # Статистика другого пользователя не пересчитывалась
+    assert read_user_sleep_stats(db_manager.db_name, 2)[:2] == (100, 0)
+
+    assert db_manager.rebuild_sleep_statistics() is True
+    assert read_user_sleep_stats(db_manager.db_name, 2) == (1, 7200, 7200, 7200, 7200 ** 2)
+
+
+def test_sleep_stats_skip_sessions_without_duration(db_manager: DatabaseManager):
+    """
+    Тестирует, что завершенные сессии без продолжительности (время начала не задано или не преобразовано)
+    одинаково не учитываются при инкрементальном обновлении, пересчете и заполнении статистики миграцией.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    """
+    sleep_time = datetime(2025, 12, 1, 22, 0, 0)
+    session_id = db_manager.start_sleep_session(1, sleep_time)
+    db_manager.end_sleep_session(session_id, sleep_time + timedelta(hours=8))
+    # У пользователя 1 одна сессия без продолжительности, у пользователя 2 - только такие сессии
+    for user_id, sleep_value in ((1, None), (2, None), (2, '2025-12-02 22:00:00')):
+        session_id = db_manager.start_sleep_session(user_id, datetime(2025, 12, 2, 22, 0, 0))
+        with sqlite3.connect(db_manager.db_name) as conn:
+            conn.execute('UPDATE sleep_records SET sleep_time = ? WHERE id = ?', (sleep_value, session_id))
+        conn.close()
+        db_manager.end_sleep_session(session_id, datetime(2025, 12, 3, 6, 0, 0))
+    expected = (1, 8 * 3600, 8 * 3600, 8 * 3600, (8 * 3600) ** 2)
+    assert read_user_sleep_stats(db_manager.db_name, 1) == expected
+    assert read_user_sleep_stats(db_manager.db_name, 2) is None
+
+    assert db_manager.rebuild_sleep_statistics(1) is True
+    assert db_manager.rebuild_sleep_statistics(2) is True
+    assert read_user_sleep_stats(db_manager.db_name, 1) == expected
+    assert read_user_sleep_stats(db_manager.db_name, 2) is None
+    assert db_manager.get_sleep_statistic(1) == (1, 8 * 3600, 8 * 3600.0)
+
+    # Повторное заполнение таблицы статистики миграцией 5
+    with sqlite3.connect(db_manager.db_name) as conn:
+        conn.execute('DROP TABLE user_sleep_stats')
+        conn.execute('PRAGMA user_version = 4')
+    conn.close()
+    DatabaseManager(db_name=db_manager.db_name)._create_tables()
+    assert read_user_sleep_stats(db_manager.db_name, 1) == expected
+    assert read_user_sleep_stats(db_manager.db_name, 2) is None
+
+
+def test_rebuild_sleep_statistics_error_handling(db_manager: DatabaseManager, caplog: pytest.LogCaptureFixture):
+    """
+    Тестирует поведение функции rebuild_sleep_statistics при невозможности установить соединение с базой данных.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    :param caplog: pytest.LogCaptureFixture: Фикстура pytest для перехвата сообщений логгера.
+    """
+    caplog.set_level(logging.ERROR)
+    with mock.patch('database_manager.sqlite3.connect') as mock_connect:
+        mock_connect.side_effect = sqlite3.Error('Simulated DB connection error for rebuild_sleep_statistics')
+
+        assert db_manager.rebuild_sleep_statistics() is False
+        assert ('Ошибка при пересчете статистики сна: '
+                'Simulated DB connection error for rebuild_sleep_statistics') in caplog.text
+
+
+def test_rebuild_stats_command(db_manager: DatabaseManager):
+    """
+    Тестирует команду пересчета статистики сна из командной строки.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    """
+    sleep_time = datetime(2025, 12, 1, 22, 0, 0)
+    session_id = db_manager.start_sleep_session(1, sleep_time)
+    db_manager.end_sleep_session(session_id, sleep_time + timedelta(hours=8))
+    with sqlite3.connect(db_manager.db_name) as conn:
+        conn.execute('DELETE FROM user_sleep_stats')
+    conn.close()
+
+    database_manager.main(['--db', db_manager.db_name, '--rebuild-stats'])
+
+    assert db_manager.get_sleep_statistic(1) == (1, 8 * 3600, 8 * 3600.0)
+
+
+# -- Тесты отложенной записи (write-behind) --
+@pytest.fixture
+def write_behind_db_manager(tmp_path) -> DatabaseManager:
+    """
+    Предоставляет экземпляр DatabaseManager с пулом соединений и очередью отложенной записи.
+    Интервал сброса очереди большой, чтобы записи гарантированно оставались в очереди до чтения.
+    :param tmp_path: Встроенная фикстура pytest для создания временных путей.
+    :yield: DatabaseManager: Экземпляр менеджера с очередью отложенной записи.
+    """
+    db_file = str(tmp_path/'test_db_manager_write_behind.db')
+    manager = DatabaseManager(db_name=db_file, pool=ConnectionPool(), write_behind_interval=10)
+    yield manager
+    manager.close()
+
+
+def test_write_behind_reads_own_writes(write_behind_db_manager: DatabaseManager):
+    """
+    Тестирует, что методы чтения видят записи, которые еще находятся в очереди отложенной записи.
+    :param write_behind_db_manager: DatabaseManager: Менеджер базы данных с очередью отложенной записи.
+    """
+    write_behind_db_manager.add_user(1, 'TestUser')
+    # Кэш известных пользователей ответил бы без обращения к БД
+    write_behind_db_manager.user_cache.clear()
+    session_id = write_behind_db_manager.start_sleep_session(1, datetime(2025, 12, 12, 23, 0, 0))
+    write_behind_db_manager.end_sleep_session(session_id, datetime(2025, 12, 13, 7, 0, 0))
+    write_behind_db_manager.update_sleep_quality(session_id, 5)
+    write_behind_db_manager.add_note(session_id, 'Хорошо')
+
+    assert write_behind_db_manager.get_user_by_id(1) == (1, 'TestUser')
+    assert write_behind_db_manager.get_latest_finished_sleep_session_with_quality(1) == (
+        session_id, datetime(2025, 12, 12, 23, 0, 0), datetime(2025, 12, 13, 7, 0, 0))
+    assert write_behind_db_manager.get_note_by_sleep_record_id(session_id) == 'Хорошо'
+
+
+def test_write_behind_groups_writes(write_behind_db_manager: DatabaseManager):
+    """
+    Тестирует, что записи разных пользователей фиксируются одной транзакцией.
+    :param write_behind_db_manager: DatabaseManager: Менеджер базы данных с очередью отложенной записи.
+    """
+    for user_id in range(1, 21):
+        write_behind_db_manager.add_user(user_id, f'User{user_id}')
+
+    assert write_behind_db_manager._write_behind.flush(timeout=5)
+    assert write_behind_db_manager._write_behind.batches_committed == 1
+
+
+def test_close_flushes_write_behind_queue(write_behind_db_manager: DatabaseManager):
+    """
+    Тестирует, что close() записывает накопленные отложенные изменения в БД.
+    :param write_behind_db_manager: DatabaseManager: Менеджер базы данных с очередью отложенной записи.
+    """
+    write_behind_db_manager.add_user(1, 'TestUser')
+
+    write_behind_db_manager.close()
+
+    with sqlite3.connect(write_behind_db_manager.db_name) as conn:
+        assert conn.execute('SELECT id, name FROM users').fetchall() == [(1, 'TestUser')]
+    conn.close()
+
+
+
+def test_write_during_shutdown_is_not_lost(write_behind_db_manager: DatabaseManager):
+    """
+    Тестирует, что запись обработчика, который еще работает во время остановки очереди, выполняется сразу.
+    :param write_behind_db_manager: DatabaseManager: Менеджер базы данных с очередью отложенной записи.
+    """
+    write_behind_db_manager.add_user(1, 'TestUser')
+    write_behind_db_manager._write_behind.stop()
+
+    write_behind_db_manager.add_user(2, 'LateUser')
+
+    with sqlite3.connect(write_behind_db_manager.db_name) as conn:
+        assert conn.execute('SELECT id, name FROM users ORDER BY id').fetchall() == [(1, 'TestUser'), (2, 'LateUser')]
+    conn.close()
+
+# -- Тесты кэша известных пользователей --
+def test_add_user_skips_db_for_known_user(db_manager: DatabaseManager, mocker: MockFixture):
+    """
+    Тестирует, что повторный add_user с тем же именем не обращается к БД.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    :param mocker: MockFixture: Фикстура pytest_mock для подмены объектов.
+    """
+    db_manager.add_user(1, 'TestUser')
+    spy_connect = mocker.spy(sqlite3, 'connect')
+
+    db_manager.add_user(1, 'TestUser')
+
+    assert spy_connect.call_count == 0
+    assert db_manager.get_user_by_id(1) == (1, 'TestUser')
+    assert spy_connect.call_count == 0
+    assert db_manager.user_cache.stats() == {'size': 1, 'hits': 2, 'misses': 1, 'evictions': 0}
+
+
+def test_add_user_writes_through_changed_name(db_manager: DatabaseManager):
+    """
+    Тестирует, что при изменении имени пользователя в Telegram новое имя записывается в БД и в кэш.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    """
+    db_manager.add_user(1, 'OldName')
+    db_manager.add_user(1, 'NewName')
+
+    assert db_manager.get_user_by_id(1) == (1, 'NewName')
+    db_manager.user_cache.clear()
+    assert db_manager.get_user_by_id(1) == (1, 'NewName')
+
+
+def test_get_user_by_id_fills_cache(db_manager: DatabaseManager):
+    """
+    Тестирует, что пользователь, прочитанный из БД, запоминается в кэше, а отсутствующий - нет.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    """
+    db_manager.add_user(1, 'TestUser')
+    db_manager.user_cache.clear()
+
+    assert db_manager.get_user_by_id(2) is None
+    assert 2 not in db_manager.user_cache
+    assert db_manager.get_user_by_id(1) == (1, 'TestUser')
+    assert 1 in db_manager.user_cache
+
+
+def test_add_user_error_is_not_cached(db_manager: DatabaseManager):
+    """
+    Тестирует, что при ошибке записи пользователь не попадает в кэш и следующий вызов повторяет запись.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    """
+    with mock.patch('database_manager.sqlite3.connect', side_effect=sqlite3.Error('Simulated DB error')):
+        db_manager.add_user(1, 'TestUser')
+    assert 1 not in db_manager.user_cache
+
+    db_manager.add_user(1, 'TestUser')
+    assert db_manager.get_user_by_id(1) == (1, 'TestUser')
+
+
+# -- Тесты индекса горячих сессий --
+def test_hot_session_reads_do_not_touch_db(db_manager: DatabaseManager, mocker: MockFixture):
+    """
+    Тестирует, что после загрузки состояния пользователя поиск сессий не обращается к БД,
+    а методы записи поддерживают индекс в согласованном состоянии.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    :param mocker: MockFixture: Фикстура pytest_mock для подмены объектов.
+    """
+    sleep_time = datetime(2025, 12, 12, 23, 0, 0)
+    wake_time = datetime(2025, 12, 13, 7, 0, 0)
+    # Первое обращение загружает состояние пользователя
+    assert db_manager.get_latest_unfinished_sleep_session(1) == (None, None)
+    session_id = db_manager.start_sleep_session(1, sleep_time)
+    spy_connect = mocker.spy(sqlite3, 'connect')
+
+    assert db_manager.get_latest_unfinished_sleep_session(1) == (session_id, sleep_time)
+    assert spy_connect.call_count == 0
+
+    db_manager.end_sleep_session(session_id, wake_time)
+    db_manager.update_sleep_quality(session_id, 4)
+    spy_connect.reset_mock()
+
+    assert db_manager.get_latest_unfinished_sleep_session(1) == (None, None)
+    assert db_manager.get_latest_finished_sleep_session_without_quality(1, date=wake_time.date()) == (
+        None, None, None)
+    assert db_manager.get_latest_finished_sleep_session_with_quality(1, date=wake_time.date()) == (
+        session_id, sleep_time, wake_time)
+    assert db_manager.get_latest_finished_sleep_session_with_quality(1, date=sleep_time.date()) is None
+    assert spy_connect.call_count == 0
+
+
+def test_hot_session_index_matches_db_after_reload(db_manager: DatabaseManager):
+    """
+    Тестирует, что ответы индекса совпадают с ответами БД после сброса индекса.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    """
+    sleep_time = datetime(2025, 12, 1, 22, 0, 0)
+    db_manager.get_latest_unfinished_sleep_session(1)
+    for day in range(12):
+        session_id = db_manager.start_sleep_session(1, sleep_time + timedelta(days=day))
+        db_manager.end_sleep_session(session_id, sleep_time + timedelta(days=day, hours=8))
+        if day % 2:
+            db_manager.update_sleep_quality(session_id, 3)
+    db_manager.start_sleep_session(1, sleep_time + timedelta(days=12))
+
+    def snapshot() -> tuple:
+        return (db_manager.get_latest_unfinished_sleep_session(1),
+                db_manager.get_latest_finished_sleep_session_without_quality(1),
+                db_manager.get_latest_finished_sleep_session_with_quality(1),
+                db_manager.get_latest_finished_sleep_session_without_quality(1, date=date(2025, 12, 3)),
+                db_manager.get_latest_finished_sleep_session_with_quality(1, date=date(2025, 12, 3)))
+
+    from_memory = snapshot()
+    db_manager.session_index.invalidate()
+    from_db = snapshot()
+
+    assert from_memory == from_db
+    assert from_memory[3][0] is None
+    assert from_memory[4] is not None
+
+
+# -- Тесты атомарного завершения сессии сна --
+@pytest.fixture(params=[True, False], ids=['returning', 'begin_immediate'])
+def returning_mode(request, monkeypatch) -> bool:
+    """
+    Запускает тест дважды: с UPDATE ... RETURNING и с запасным вариантом для SQLite старше 3.35.
+    :param request: Встроенная фикстура pytest с параметром.
+    :param monkeypatch: Встроенная фикстура pytest для подмены атрибутов.
+    :return: bool: True, если используется RETURNING.
+    """
+    monkeypatch.setattr(database_manager, 'SQLITE_SUPPORTS_RETURNING', request.param)
+    return request.param
+
+
+def test_finish_latest_sleep_session(db_manager: DatabaseManager, returning_mode: bool):
+    """
+    Тестирует, что последняя незавершенная сессия завершается, а статистика и индекс сессий обновляются.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    :param returning_mode: bool: Режим выполнения запроса.
+    """
+    sleep_time = datetime(2025, 12, 12, 23, 0, 0, 500)
+    wake_time = datetime(2025, 12, 13, 7, 30, 0)
+    db_manager.start_sleep_session(1, sleep_time - timedelta(days=1))
+    session_id = db_manager.start_sleep_session(1, sleep_time)
+
+    assert db_manager.finish_latest_sleep_session(1, wake_time) == (session_id, sleep_time, wake_time)
+
+    with sqlite3.connect(db_manager.db_name) as conn:
+        row = conn.execute('SELECT wake_time, duration_sec FROM sleep_records WHERE id = ?', (session_id,)).fetchone()
+    conn.close()
+    expected_duration = int((wake_time - sleep_time.replace(microsecond=0)).total_seconds())
+    assert row == (datetime_to_db(wake_time), expected_duration)
+    assert db_manager.get_sleep_statistic(1) == (1, expected_duration, float(expected_duration))
+    assert db_manager.get_latest_finished_sleep_session_without_quality(1) == (session_id, sleep_time, wake_time)
+    # Осталась более ранняя незавершенная сессия
+    assert db_manager.get_latest_unfinished_sleep_session(1)[0] != session_id
+
+
+def test_finish_latest_sleep_session_without_open_session(
+        db_manager: DatabaseManager, returning_mode: bool, caplog: pytest.LogCaptureFixture):
+    """
+    Тестирует, что повторное завершение не находит сессию и не изменяет статистику.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    :param returning_mode: bool: Режим выполнения запроса.
+    :param caplog: pytest.LogCaptureFixture: Фикстура pytest для перехвата сообщений логгера.
+    """
+    sleep_time = datetime(2025, 12, 12, 23, 0, 0)
+    db_manager.start_sleep_session(1, sleep_time)
+    db_manager.finish_latest_sleep_session(1, sleep_time + timedelta(hours=8))
+
+    assert db_manager.finish_latest_sleep_session(1, sleep_time + timedelta(hours=9)) == (None, None, None)
+    assert 'У пользователя (1) нет незавершенной сессии сна.' in caplog.text
+    assert db_manager.get_sleep_statistic(1) == (1, 8 * 3600, 8 * 3600.0)
+
+
+def test_finish_latest_sleep_session_concurrent_calls(tmp_path, returning_mode: bool):
+    """
+    Тестирует, что при одновременных вызовах из разных потоков сессия завершается ровно один раз.
+    :param tmp_path: Встроенная фикстура pytest для создания временных путей.
+    :param returning_mode: bool: Режим выполнения запроса.
+    """
+    manager = DatabaseManager(db_name=str(tmp_path/'test_concurrent_wake.db'), pool=ConnectionPool())
+    manager.start_sleep_session(1, datetime(2025, 12, 12, 23, 0, 0))
+    results = []
+    barrier = threading.Barrier(8)
+
+    def wake():
+        barrier.wait()
+        results.append(manager.finish_latest_sleep_session(1, datetime(2025, 12, 13, 7, 0, 0)))
+
+    threads = [threading.Thread(target=wake) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    manager.close()
+
+    assert sum(1 for result in results if result[0] is not None) == 1
+    assert manager.get_sleep_statistic(1) == (1, 8 * 3600, 8 * 3600.0)
+
+
+def test_finish_latest_sleep_session_error_handling(db_manager: DatabaseManager, caplog: pytest.LogCaptureFixture):
+    """
+    Тестирует поведение метода finish_latest_sleep_session при невозможности установить соединение с базой данных.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    :param caplog: pytest.LogCaptureFixture: Фикстура pytest для перехвата сообщений логгера.
+    """
+    caplog.set_level(logging.ERROR)
+    with mock.patch('database_manager.sqlite3.connect') as mock_connect:
+        mock_connect.side_effect = sqlite3.Error('Simulated DB connection error for finish_latest_sleep_session')
+
+        assert db_manager.finish_latest_sleep_session(1, datetime.now()) == (None, None, None)
+        assert ('Ошибка при завершении последней сессии сна: '
+                'Simulated DB connection error for finish_latest_sleep_session') in caplog.text
+
+
+# -- Тесты снимка состояния пользователя --
+def fill_user_state(db_manager: DatabaseManager) -> dict[str, int]:
+    """
+    Создает для пользователя 1 сессии всех видов: с оценкой и заметкой, без оценки и незавершенную.
+    :param db_manager: DatabaseManager: Менеджер базы данных.
+    :return: dict[str, int]: ID созданных сессий.
+    """
+    sleep_time = datetime(2025, 12, 12, 23, 0, 0)
+    rated_id = db_manager.start_sleep_session(1, sleep_time - timedelta(days=1))
+    db_manager.end_sleep_session(rated_id, sleep_time - timedelta(hours=16))
+    db_manager.update_sleep_quality(rated_id, 4)
+    db_manager.add_note(rated_id, 'Хорошо')
+    unrated_id = db_manager.start_sleep_session(1, sleep_time - timedelta(hours=12))
+    db_manager.end_sleep_session(unrated_id, sleep_time - timedelta(hours=10))
+    open_id = db_manager.start_sleep_session(1, sleep_time)
+    return {'rated': rated_id, 'unrated': unrated_id, 'open': open_id}
+
+
+@pytest.mark.parametrize('from_index', [True, False], ids=['index', 'single_query'])
+def test_get_user_state(db_manager: DatabaseManager, from_index: bool):
+    """
+    Тестирует, что снимок состояния совпадает с результатами отдельных методов чтения
+    (как из индекса горячих сессий, так и одним запросом к БД).
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    :param from_index: bool: True - состояние пользователя уже загружено в индекс.
+    """
+    ids = fill_user_state(db_manager)
+    if from_index:
+        db_manager.get_latest_unfinished_sleep_session(1)
+    else:
+        db_manager.session_index.invalidate()
+        # В буфер из одной сессии оцененная сессия не попадет, и ответ будет получен одним запросом к БД
+        db_manager.session_index.recent_size = 1
+
+    state = db_manager.get_user_state(1, date=date(2025, 12, 12))
+
+    assert state.open_session == (ids['open'], datetime(2025, 12, 12, 23, 0, 0))
+    assert state.last_without_quality[0] == ids['unrated']
+    assert state.last_with_quality == db_manager.get_latest_finished_sleep_session_with_quality(1)
+    assert state.note == 'Хорошо'
+
+
+def test_get_user_state_date_filter(db_manager: DatabaseManager):
+    """
+    Тестирует фильтрацию завершенных сессий по дате пробуждения.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    """
+    fill_user_state(db_manager)
+
+    state = db_manager.get_user_state(1, date=date(2025, 12, 20))
+
+    assert state.open_session is not None
+    assert state.last_without_quality is None
+    assert state.last_with_quality is None
+    assert state.note is None
+
+
+def test_get_user_state_reads_without_db_when_possible(db_manager: DatabaseManager, mocker: MockFixture):
+    """
+    Тестирует, что без сессии с оценкой состояние берется из индекса без обращения к БД,
+    а при ее наличии выполняется один запрос заметки.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    :param mocker: MockFixture: Фикстура pytest_mock для подмены объектов.
+    """
+    db_manager.get_latest_unfinished_sleep_session(1)
+    session_id = db_manager.start_sleep_session(1, datetime(2025, 12, 12, 23, 0, 0))
+    db_manager.end_sleep_session(session_id, datetime(2025, 12, 13, 7, 0, 0))
+    spy_connect = mocker.spy(sqlite3, 'connect')
+
+    assert db_manager.get_user_state(1).last_without_quality[0] == session_id
+    assert spy_connect.call_count == 0
+
+    db_manager.update_sleep_quality(session_id, 5)
+    spy_connect.reset_mock()
+    assert db_manager.get_user_state(1).note is None
+    assert spy_connect.call_count == 1
+
+
+def test_user_state_query_uses_indexes(db_manager: DatabaseManager):
+    """
+    Тестирует, что каждая часть запроса снимка состояния использует индексы.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    """
+    mock_cursor = mock.MagicMock()
+    mock_cursor.fetchall.return_value = []
+    DatabaseManager._select_user_state(mock_cursor, 1, 0, 1)
+    query, params = mock_cursor.execute.call_args[0]
+
+    plan = query_plan(db_manager.db_name, query, params)
+
+    assert 'idx_sleep_records_unfinished' in plan
+    assert 'idx_sleep_records_user_wake' in plan
+    assert 'SCAN sleep_records' not in plan
+
+
+def test_get_user_state_error_handling(db_manager: DatabaseManager, caplog: pytest.LogCaptureFixture):
+    """
+    Тестирует поведение метода get_user_state при невозможности установить соединение с базой данных.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    :param caplog: pytest.LogCaptureFixture: Фикстура pytest для перехвата сообщений логгера.
+    """
+    caplog.set_level(logging.ERROR)
+    with mock.patch('database_manager.sqlite3.connect') as mock_connect:
+        mock_connect.side_effect = sqlite3.Error('Simulated DB connection error for get_user_state')
+
+        assert db_manager.get_user_state(1) == (None, None, None, None)
+        assert ('Ошибка при получении состояния сессий сна пользователя: '
+                'Simulated DB connection error for get_user_state') in caplog.text
+
+
+# -- Тесты фильтра по суткам сна --
+def test_date_filter_is_index_range_search(db_manager: DatabaseManager):
+    """
+    Тестирует, что фильтр по дате пробуждения выполняется поиском диапазона по индексу, а не сканированием.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    """
+    wake_from, wake_to = db_manager._day_bounds(date(2025, 12, 13))
+    plan = query_plan(db_manager.db_name,
+                      'SELECT id, sleep_time, wake_time FROM sleep_records '
+                      'WHERE user_id = ? AND wake_time IS NOT NULL AND sleep_quality IS NULL '
+                      'AND wake_time >= ? AND wake_time < ? ORDER BY wake_time DESC LIMIT 1',
+                      (1, wake_from, wake_to))
+
+    assert 'SEARCH sleep_records USING INDEX idx_sleep_records_user_wake (user_id=? AND wake_time>? AND wake_time<?)' in plan
+
+
+@pytest.mark.parametrize('from_index', [True, False], ids=['index', 'db'])
+def test_day_start_offset(tmp_path, from_index: bool):
+    """
+    Тестирует смещение начала суток: пробуждение в 03:00 при начале суток в 04:00 относится к предыдущим суткам.
+    :param tmp_path: Встроенная фикстура pytest для создания временных путей.
+    :param from_index: bool: True - ответ из индекса горячих сессий, False - запрос к БД.
+    """
+    manager = DatabaseManager(db_name=str(tmp_path/'test_day_offset.db'), day_start_offset=timedelta(hours=4))
+    wake_time = datetime(2025, 12, 13, 3, 0, 0)
+    session_id = manager.start_sleep_session(1, wake_time - timedelta(hours=5))
+    manager.end_sleep_session(session_id, wake_time)
+    if not from_index:
+        manager.session_index.invalidate()
+        manager.session_index.recent_size = 1
+        # Более поздняя сессия вытесняет искомую из буфера
+        later_id = manager.start_sleep_session(1, datetime(2025, 12, 14, 0, 0, 0))
+        manager.end_sleep_session(later_id, datetime(2025, 12, 14, 8, 0, 0))
+
+    assert manager.sleep_day(wake_time) == date(2025, 12, 12)
+    assert manager.sleep_day(datetime(2025, 12, 13, 4, 0, 0)) == date(2025, 12, 13)
+    assert manager.get_latest_finished_sleep_session_without_quality(1, date=date(2025, 12, 12))[0] == session_id
+    assert manager.get_latest_finished_sleep_session_without_quality(1, date=date(2025, 12, 13)) == (None, None, None)
+    assert manager.get_user_state(1, date=date(2025, 12, 12)).last_without_quality[0] == session_id
+
+
+# -- Тесты версий схемы БД --
+def test_new_database_has_latest_schema_version(db_manager: DatabaseManager):
+    """
+    Тестирует, что новая БД получает номер последней миграции в PRAGMA user_version.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    """
+    with sqlite3.connect(db_manager.db_name) as conn:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_MIGRATIONS.latest_version
+    conn.close()
+
+
+def test_current_database_runs_no_migrations(db_manager: DatabaseManager, mocker: MockFixture):
+    """
+    Тестирует, что при запуске с актуальной БД миграции не выполняются.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    :param mocker: MockFixture: Фикстура pytest_mock для подмены объектов.
+    """
+    spy_pending = mocker.spy(SCHEMA_MIGRATIONS, 'pending')
+
+    DatabaseManager(db_name=db_manager.db_name)
+
+    assert spy_pending.call_count == 1
+    assert spy_pending.spy_return == []
+
+
+def test_unversioned_database_keeps_statistics(db_manager: DatabaseManager):
+    """
+    Тестирует, что БД, созданная до появления версий схемы (user_version = 0), проходит миграции
+    без потери данных, а существующая статистика сна не пересчитывается.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    """
+    session_id = db_manager.start_sleep_session(1, datetime(2025, 12, 12, 23, 0, 0))
+    db_manager.end_sleep_session(session_id, datetime(2025, 12, 13, 7, 0, 0))
+    with sqlite3.connect(db_manager.db_name) as conn:
+        conn.execute('UPDATE user_sleep_stats SET session_count = 100')
+        conn.execute('PRAGMA user_version = 0')
+    conn.close()
+
+    manager = DatabaseManager(db_name=db_manager.db_name)
+
+    assert manager.get_sleep_statistic(1)[0] == 100
+    assert manager.get_latest_finished_sleep_session_without_quality(1)[0] == session_id
+    with sqlite3.connect(db_manager.db_name) as conn:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_MIGRATIONS.latest_version
+    conn.close()
+
+
+def test_warm_up_preloads_users_and_sessions(db_manager: DatabaseManager, mocker: MockFixture):
+    """
+    Тестирует прогрев кэша при запуске: недавно активные пользователи и их сессии загружаются пакетно,
+    после чего поиск пользователя и сессий не обращается к БД.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    :param mocker: MockFixture: Фикстура pytest_mock для подмены объектов.
+    """
+    sleep_time = datetime(2025, 12, 12, 23, 0, 0)
+    wake_time = datetime(2025, 12, 13, 7, 0, 0)
+    for user_id in (1, 2, 3):
+        db_manager.add_user(user_id, f'User{user_id}')
+    finished_id = db_manager.start_sleep_session(1, sleep_time)
+    db_manager.end_sleep_session(finished_id, wake_time)
+    db_manager.update_sleep_quality(finished_id, 5)
+    open_id = db_manager.start_sleep_session(2, sleep_time + timedelta(days=1))
+    # Имитируем перезапуск: кэши пусты
+    db_manager.user_cache.clear()
+    db_manager.session_index.invalidate()
+
+    assert db_manager.warm_up(max_users=2) == 2
+    spy_connect = mocker.spy(sqlite3, 'connect')
+
+    assert db_manager.get_user_by_id(2) == (2, 'User2')
+    assert db_manager.get_latest_unfinished_sleep_session(2) == (open_id, sleep_time + timedelta(days=1))
+    assert db_manager.get_latest_finished_sleep_session_with_quality(1, date=wake_time.date()) == (
+        finished_id, sleep_time, wake_time)
+    assert spy_connect.call_count == 0
+    # Пользователь без сессий не поместился в лимит
+    assert 3 not in db_manager.session_index
+
+
+def test_warm_up_reads_limited_window_of_sessions(db_manager: DatabaseManager):
+    """
+    Тестирует, что прогрев выбирает пользователей по последним созданным сессиям, а пользователь, чьи сессии
+    не попали в просматриваемое окно, занимает свободное место и загружается со всеми своими сессиями.
+    :param db_manager: DatabaseManager: Менеджер базы данных, предоставляемый фикстурой.
+    """
+    db_manager.session_index.recent_size = 1
+    sleep_time = datetime(2025, 12, 1, 22, 0, 0)
+    for user_id in (1, 2):
+        db_manager.add_user(user_id, f'User{user_id}')
+    old_id = db_manager.start_sleep_session(1, sleep_time)
+    db_manager.end_sleep_session(old_id, sleep_time + timedelta(hours=8))
+    # Окно из max_users * (recent_size + 1) = 4 последних сессий занято пользователем 2
+    for day in range(1, 5):
+        session_id = db_manager.start_sleep_session(2, sleep_time + timedelta(days=day))
+        db_manager.end_sleep_session(session_id, sleep_time + timedelta(days=day, hours=8))
+    db_manager.user_cache.clear()
+    db_manager.session_index.invalidate()
+
+    assert db_manager.warm_up(max_users=2) == 2
+    assert 1 in db_manager.session_index and 2 in db_manager.session_index
+    assert db_manager.get_latest_finished_sleep_session_without_quality(1)[0] == old_id
@@ -0,0 +1,102 @@
+import os
+import signal
+import threading
+import pytest
+
+import telebot
+from telebot import types
+
+from graceful_shutdown import GracefulShutdown
+
+
+def make_update(update_id: int) -> types.Update:
+    """
+    Создает обновление с текстовым сообщением.
+    :param update_id: int: ID обновления.
+    :return: types.Update: Обновление.
+    """
+    return types.Update.de_json({'update_id': update_id,
+                                 'message': {'message_id': update_id, 'date': 0, 'text': 'Привет',
+                                             'chat': {'id': update_id, 'type': 'private'}}})
+
+
+def test_wait_idle_waits_for_queued_handlers():
+    """ Тестирует, что учитываются и выполняющиеся, и ожидающие в пуле потоков бота обработчики. """
+    bot = telebot.TeleBot('123456:TEST', threaded=True, num_threads=1)
+    release = threading.Event()
+    handled = []
+
+    @bot.message_handler(func=lambda message: True)
+    def slow_handler(message: types.Message):
+        release.wait(5)
+        handled.append(message.message_id)
+
+    shutdown = GracefulShutdown(deadline=5)
+    shutdown.track(bot)
+    bot.process_new_updates([make_update(1), make_update(2)])
+
+    assert shutdown.in_flight == 2
+    assert shutdown.wait_idle(timeout=0.05) is False
+    release.set()
+    assert shutdown.wait_idle(timeout=5) is True
+    assert handled == [1, 2]
+    bot.stop_bot()
+
+
+def test_failed_handler_is_not_counted():
+    """ Тестирует, что обработчик, завершившийся ошибкой (без пула потоков), не остается незавершенным. """
+    bot = telebot.TeleBot('123456:TEST', threaded=False)
+
+    @bot.message_handler(func=lambda message: True)
+    def failing_handler(message: types.Message):
+        raise RuntimeError('DB Error')
+
+    shutdown = GracefulShutdown()
+    shutdown.track(bot)
+    with pytest.raises(RuntimeError):
+        bot.process_new_updates([make_update(1)])
+
+    assert shutdown.in_flight == 0
+
+
+def test_drain_runs_steps_in_order_within_deadline():
+    """ Тестирует порядок шагов, передачу оставшегося времени и продолжение после ошибки и истечения времени. """
+    now = [0.0]
+    shutdown = GracefulShutdown(deadline=10, clock=lambda: now[0])
+    calls = []
+
+    def slow_step(timeout: float):
+        calls.append(('slow', timeout))
+        now[0] += 12
+
+    def failing_step(timeout: float):
+        calls.append(('failing', timeout))
+        raise RuntimeError('network')
+
+    shutdown.add_step('slow', slow_step)
+    shutdown.add_step('failing', failing_step)
+    shutdown.add_step('close', lambda timeout: calls.append(('close', timeout)))
+
+    durations = shutdown.drain()
+
+    assert calls == [('slow', 10), ('failing', 0.0), ('close', 0.0)]
+    assert durations == {'slow': 12, 'failing': 0, 'close': 0}
+
+
+def test_signal_stops_intake_once():
+    """ Тестирует, что сигнал вызывает функции прекращения приема обновлений один раз и не блокирует поток. """
+    stopped = threading.Event()
+    calls = []
+    shutdown = GracefulShutdown()
+    shutdown.on_stop(lambda: (calls.append('stop_polling'), stopped.set()))
+    previous = signal.getsignal(signal.SIGTERM)
+    try:
+        shutdown.install_signals((signal.SIGTERM,))
+        os.kill(os.getpid(), signal.SIGTERM)
+        assert stopped.wait(5)
+        shutdown.request_stop()
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+
+    assert shutdown.stop_requested.is_set()
+    assert calls == ['stop_polling']
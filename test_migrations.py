@@ -0,0 +1,158 @@
+import sqlite3
+import pytest
+
+from migrations import MigrationRegistry, get_user_version, run_in_batches
+
+
+@pytest.fixture
+def conn(tmp_path) -> sqlite3.Connection:
+    """
+    Предоставляет соединение с временной базой данных.
+    :param tmp_path: Встроенная фикстура pytest для создания временных путей.
+    :yield: sqlite3.Connection: Соединение с базой данных.
+    """
+    connection = sqlite3.connect(str(tmp_path/'test_migrations.db'))
+    yield connection
+    connection.close()
+
+
+def make_registry(applied: list[int]) -> MigrationRegistry:
+    """
+    Создает реестр из двух миграций, запоминающих порядок своего выполнения.
+    :param applied: list[int]: Список, в который записываются номера выполненных миграций.
+    :return: MigrationRegistry: Реестр миграций.
+    """
+    registry = MigrationRegistry()
+
+    # Регистрируем не по порядку, выполняться миграции должны по возрастанию номера
+    @registry.register(2, 'индекс')
+    def add_index(connection: sqlite3.Connection, batch_size: int):
+        applied.append(2)
+        with connection:
+            connection.execute('CREATE INDEX IF NOT EXISTS idx_t_x ON t (x)')
+
+    @registry.register(1, 'таблица')
+    def add_table(connection: sqlite3.Connection, batch_size: int):
+        applied.append(1)
+        with connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS t (x INTEGER)')
+
+    return registry
+
+
+def test_migrations_applied_in_order(conn: sqlite3.Connection):
+    """
+    Тестирует, что миграции выполняются по возрастанию номера и версия схемы записывается в user_version.
+    :param conn: sqlite3.Connection: Соединение с временной базой данных.
+    """
+    applied = []
+    registry = make_registry(applied)
+
+    assert registry.migrate(conn) == 2
+    assert applied == [1, 2]
+    assert get_user_version(conn) == 2
+
+
+def test_current_database_skips_ddl(conn: sqlite3.Connection):
+    """
+    Тестирует, что для актуальной БД выполняется только чтение user_version, без DDL-запросов.
+    :param conn: sqlite3.Connection: Соединение с временной базой данных.
+    """
+    applied = []
+    registry = make_registry(applied)
+    registry.migrate(conn)
+    applied.clear()
+    statements = []
+    conn.set_trace_callback(statements.append)
+
+    registry.migrate(conn)
+
+    assert applied == []
+    assert statements == ['PRAGMA user_version']
+
+
+def test_only_pending_migrations_applied(conn: sqlite3.Connection):
+    """
+    Тестирует, что к БД предыдущей версии применяются только новые миграции.
+    :param conn: sqlite3.Connection: Соединение с временной базой данных.
+    """
+    applied = []
+    registry = make_registry(applied)
+    with conn:
+        conn.execute('CREATE TABLE t (x INTEGER)')
+    conn.execute('PRAGMA user_version = 1')
+
+    registry.migrate(conn)
+
+    assert applied == [2]
+
+
+def test_newer_database_is_left_untouched(conn: sqlite3.Connection):
+    """
+    Тестирует, что БД более новой версии, чем известно приложению, не изменяется.
+    :param conn: sqlite3.Connection: Соединение с временной базой данных.
+    """
+    applied = []
+    conn.execute('PRAGMA user_version = 10')
+
+    assert make_registry(applied).migrate(conn) == 10
+    assert applied == []
+
+
+def test_failed_migration_is_retried(conn: sqlite3.Connection):
+    """
+    Тестирует, что версия схемы не увеличивается, если миграция завершилась ошибкой.
+    :param conn: sqlite3.Connection: Соединение с временной базой данных.
+    """
+    registry = MigrationRegistry()
+    calls = []
+
+    @registry.register(1, 'миграция с ошибкой')
+    def failing(connection: sqlite3.Connection, batch_size: int):
+        calls.append(1)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError('Simulated migration error')
+
+    with pytest.raises(sqlite3.OperationalError):
+        registry.migrate(conn)
+    assert get_user_version(conn) == 0
+
+    assert registry.migrate(conn) == 1
+    assert calls == [1, 1]
+
+
+def test_duplicate_version_rejected():
+    """
+    Тестирует, что две миграции с одним номером зарегистрировать нельзя.
+    """
+    registry = MigrationRegistry()
+    registry.register(1, 'первая')(lambda connection, batch_size: None)
+
+    with pytest.raises(ValueError):
+        registry.register(1, 'вторая')
+
+
+def test_run_in_batches_resumes_after_interruption(conn: sqlite3.Connection):
+    """
+    Тестирует, что прерванное пакетное преобразование продолжается с необработанных строк.
+    :param conn: sqlite3.Connection: Соединение с временной базой данных.
+    """
+    with conn:
+        conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, done INTEGER NOT NULL DEFAULT 0)')
+        conn.executemany('INSERT INTO t (id) VALUES (?)', [(i,) for i in range(1, 8)])
+    sql_select = 'SELECT id FROM t WHERE id > ? AND done = 0 ORDER BY id LIMIT ?'
+    batches = []
+
+    def mark_done(cursor: sqlite3.Cursor, rows: list):
+        batches.append([row[0] for row in rows])
+        if len(batches) == 2:
+            raise sqlite3.OperationalError('Simulated interruption')
+        cursor.executemany('UPDATE t SET done = 1 WHERE id = ?', rows)
+
+    with pytest.raises(sqlite3.OperationalError):
+        run_in_batches(conn, sql_select, mark_done, 3, 'Тест')
+
+    # Вторая пачка откатилась, повторный запуск начинает с нее
+    assert run_in_batches(conn, sql_select, mark_done, 3, 'Тест') == 4
+    assert batches == [[1, 2, 3], [4, 5, 6], [4, 5, 6], [7]]
+    assert conn.execute('SELECT COUNT(*) FROM t WHERE done = 0').fetchone() == (0,)
@@ -0,0 +1,168 @@
+import time
+import threading
+import pytest
+from unittest import mock
+
+from telebot import apihelper
+
+from outbound_queue import PRIORITY_BROADCAST, PRIORITY_INTERACTIVE, OutboundQueue, RateLimitedBot
+
+
+def api_error(code: int, retry_after: int | None = None) -> apihelper.ApiTelegramException:
+    """
+    Создает ошибку Bot API с указанным кодом.
+    :param code: int: Код ошибки (например, 429).
+    :param retry_after: int | None: Значение parameters.retry_after ответа.
+    :return: apihelper.ApiTelegramException: Ошибка.
+    """
+    result_json = {'ok': False, 'error_code': code, 'description': 'error'}
+    if retry_after is not None:
+        result_json['parameters'] = {'retry_after': retry_after}
+    return apihelper.ApiTelegramException('sendMessage', None, result_json)
+
+
+class Recorder:
+    """Подмена метода Bot API: запоминает вызовы и их время."""
+    def __init__(self, errors: list[Exception] | None = None):
+        self.calls: list[tuple[float, tuple]] = []
+        self.errors = list(errors or [])
+        self.lock = threading.Lock()
+
+    def __call__(self, *args):
+        with self.lock:
+            self.calls.append((time.monotonic(), args))
+            if self.errors:
+                raise self.errors.pop(0)
+        return args
+
+
+def test_messages_of_one_chat_keep_order():
+    """ Тестирует, что сообщения одного чата отправляются в порядке постановки в очередь. """
+    send = Recorder()
+    outbound = OutboundQueue(global_rate=1000, global_burst=1000, per_chat_rate=1000, per_chat_burst=1000, senders=4)
+    futures = [outbound.submit(send, chat_id, chat_id, i) for i in range(20) for chat_id in (1, 2)]
+    outbound.stop()
+
+    assert [future.result() for future in futures] == [(chat_id, i) for i in range(20) for chat_id in (1, 2)]
+    for chat_id in (1, 2):
+        assert [args[1] for _, args in send.calls if args[0] == chat_id] == list(range(20))
+    assert outbound.stats()['sent'] == 40
+
+
+def test_per_chat_rate_limit():
+    """ Тестирует, что после исчерпания запаса сообщения чата отправляются не чаще per_chat_rate в секунду. """
+    send = Recorder()
+    outbound = OutboundQueue(global_rate=1000, global_burst=1000, per_chat_rate=20, per_chat_burst=2)
+    for i in range(5):
+        outbound.submit(send, 1, i)
+    outbound.stop()
+
+    times = [sent_at for sent_at, _ in send.calls]
+    # Первые два сообщения - из запаса, остальные - с интервалом 1/20 секунды
+    assert times[-1] - times[0] >= 3 * 0.05 * 0.9
+
+
+def test_rate_limited_chat_does_not_block_others():
+    """ Тестирует, что ожидание лимита одного чата не задерживает сообщения другого. """
+    send = Recorder()
+    outbound = OutboundQueue(global_rate=1000, global_burst=1000, per_chat_rate=2, per_chat_burst=1)
+    outbound.submit(send, 1, 'a1')
+    outbound.submit(send, 1, 'a2')
+    other = outbound.submit(send, 2, 'b1')
+
+    assert other.result(timeout=0.3) == ('b1',)
+    outbound.stop()
+
+
+def test_interactive_lane_goes_first():
+    """ Тестирует, что при общем лимите ответы пользователям отправляются раньше рассылки. """
+    send = Recorder()
+    outbound = OutboundQueue(global_rate=20, global_burst=1, per_chat_rate=1000, per_chat_burst=1000, senders=1)
+    for chat_id in range(1, 6):
+        outbound.submit(send, chat_id, 'broadcast', priority=PRIORITY_BROADCAST)
+    outbound.submit(send, 100, 'reply', priority=PRIORITY_INTERACTIVE)
+    outbound.stop()
+
+    order = [args[0] for _, args in send.calls]
+    # Первая рассылка могла уйти до постановки ответа, но ответ обгоняет остальные
+    assert order.index('reply') <= 1
+    stats = outbound.stats()['latency']
+    assert stats['interactive']['count'] == 1
+    assert stats['broadcast']['count'] == 5
+
+
+def test_429_honours_retry_after():
+    """ Тестирует, что ответ 429 откладывает повтор на retry_after секунд и не считается ошибкой. """
+    send = Recorder(errors=[api_error(429, retry_after=1)])
+    outbound = OutboundQueue(global_rate=1000, global_burst=1000, per_chat_rate=1000, per_chat_burst=1000)
+    future = outbound.submit(send, 1, 'text')
+
+    assert future.result(timeout=5) == ('text',)
+    outbound.stop()
+    assert send.calls[1][0] - send.calls[0][0] >= 0.9
+    stats = outbound.stats()
+    assert stats['rate_limited'] == 1
+    assert stats['sent'] == 1
+    assert stats['failed'] == 0
+
+
+def test_server_errors_are_retried_and_client_errors_fail(caplog):
+    """
+    Тестирует повтор при 5xx и немедленную ошибку при 4xx, которая записывается в журнал с ID чата.
+    :param caplog: Встроенная фикстура pytest для проверки журнала.
+    """
+    send = Recorder(errors=[api_error(502), api_error(403)])
+    outbound = OutboundQueue(global_rate=1000, global_burst=1000, per_chat_rate=1000, per_chat_burst=1000,
+                             retry_backoff=0.01, senders=1)
+    retried = outbound.submit(send, 1, 'first')
+    failed = outbound.submit(send, 2, 'second')
+
+    assert retried.result(timeout=5) == ('first',)
+    with pytest.raises(apihelper.ApiTelegramException):
+        failed.result(timeout=5)
+    outbound.stop()
+    stats = outbound.stats()
+    assert stats['retried'] == 1
+    assert stats['failed'] == 1
+    assert 'для чата 2' in caplog.text
+
+
+def test_submit_waits_when_queue_is_full():
+    """ Тестирует ограничение количества ожидающих сообщений. """
+    release = threading.Event()
+    outbound = OutboundQueue(max_pending=1)
+    outbound.submit(lambda: release.wait(5), 1)
+
+    with pytest.raises(TimeoutError):
+        outbound.submit(print, 2, queue_timeout=0.05)
+    release.set()
+    outbound.stop()
+
+
+def test_rate_limited_bot_queues_handler_calls():
+    """ Тестирует, что обертка ставит отправку сообщений в очередь и передает остальные вызовы боту. """
+    bot = mock.MagicMock()
+    message = mock.MagicMock()
+    message.chat.id = 7
+    outbound = OutboundQueue()
+    wrapped = RateLimitedBot(bot, outbound)
+
+    wrapped.send_message(7, 'Привет', reply_markup='markup', timeout=10)
+    wrapped.edit_message_text(chat_id=7, message_id=3, text='Готово')
+    wrapped.reply_to(message, 'Ответ')
+    wrapped.answer_callback_query('42')
+    outbound.stop()
+
+    # timeout - параметр Bot API, а не ожидание места в очереди
+    bot.send_message.assert_called_once_with(7, 'Привет', reply_markup='markup', timeout=10)
+    bot.edit_message_text.assert_called_once_with('Готово', 7, message_id=3)
+    bot.reply_to.assert_called_once_with(message, 'Ответ')
+    bot.answer_callback_query.assert_called_once_with('42')
+
+
+def test_constructor_rejects_non_positive_limits():
+    """ Тестирует, что нулевые лимиты отклоняются. """
+    with pytest.raises(ValueError):
+        OutboundQueue(global_rate=0)
+    with pytest.raises(ValueError):
+        OutboundQueue(per_chat_burst=0)
@@ -0,0 +1,181 @@
+import pytest
+
+from session_index import HotSessionIndex, MISS
+
+
+class FakeClock:
+    """Управляемые часы для проверки удаления простаивающих пользователей."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def load_user(index: HotSessionIndex, user_id: int, open_rows: list[tuple] = (),
+              finished_rows: list[tuple] = ()) -> bool:
+    """
+    Загружает состояние пользователя в индекс, как это делает DatabaseManager.
+    :param index: HotSessionIndex: Индекс горячих сессий.
+    :param user_id: int: ID пользователя.
+    :param open_rows: list[tuple]: Незавершенные сессии (id, sleep_time, wake_time, sleep_quality).
+    :param finished_rows: list[tuple]: Завершенные сессии в порядке убывания времени пробуждения.
+    :return: bool: Результат load().
+    """
+    return index.load(user_id, index.begin_load(), open_rows, finished_rows)
+
+
+def test_unknown_user_is_a_miss():
+    """
+    Тестирует, что для незагруженного пользователя индекс требует обращения к БД.
+    """
+    index = HotSessionIndex()
+
+    assert index.latest_unfinished(1) is MISS
+    assert index.latest_finished(1, with_quality=False) is MISS
+    assert index.stats()['misses'] == 2
+
+
+def test_session_lifecycle_is_served_from_memory():
+    """
+    Тестирует, что начало, завершение и оценка сессии отражаются в индексе.
+    """
+    index = HotSessionIndex()
+    load_user(index, 1)
+    assert index.latest_unfinished(1) is None
+
+    index.session_started(1, 10, 100)
+    assert index.latest_unfinished(1) == (10, 100)
+
+    index.session_finished(1, 10, 500)
+    assert index.latest_unfinished(1) is None
+    assert index.latest_finished(1, with_quality=False) == (10, 100, 500)
+    assert index.latest_finished(1, with_quality=True) is None
+
+    index.quality_updated(10, 5)
+    assert index.latest_finished(1, with_quality=False) is None
+    assert index.latest_finished(1, with_quality=True) == (10, 100, 500)
+    assert index.stats()['misses'] == 0
+
+
+def test_latest_unfinished_is_latest_by_sleep_time():
+    """
+    Тестирует выбор последней по времени начала незавершенной сессии, когда их несколько.
+    """
+    index = HotSessionIndex()
+    load_user(index, 1, open_rows=[(1, 300, None, None), (2, 200, None, None)])
+
+    assert index.latest_unfinished(1) == (1, 300)
+    index.session_finished(1, 1, 400)
+    assert index.latest_unfinished(1) == (2, 200)
+
+
+def test_date_range_filter():
+    """
+    Тестирует фильтрацию по диапазону времени пробуждения.
+    """
+    index = HotSessionIndex()
+    load_user(index, 1, finished_rows=[(3, 250, 300, None), (2, 150, 200, None), (1, 50, 100, None)])
+
+    assert index.latest_finished(1, False, wake_from=150, wake_to=250) == (2, 150, 200)
+    assert index.latest_finished(1, False, wake_from=400, wake_to=500) is None
+
+
+def test_truncated_buffer_falls_back_to_db():
+    """
+    Тестирует, что при переполненном буфере индекс отвечает только тогда, когда ответ точно известен.
+    """
+    index = HotSessionIndex(recent_size=2)
+    # Загружено на одну запись больше размера буфера: есть более старые сессии
+    load_user(index, 1, finished_rows=[(3, 250, 300, 5), (2, 150, 200, 5), (1, 50, 100, None)])
+
+    assert index.latest_finished(1, with_quality=True) == (3, 250, 300)
+    # Сессия без оценки может быть за пределами буфера
+    assert index.latest_finished(1, with_quality=False) is MISS
+    # Все сессии за пределами буфера завершены раньше начала диапазона
+    assert index.latest_finished(1, False, wake_from=250, wake_to=400) is None
+
+
+def test_ring_buffer_keeps_recent_sessions():
+    """
+    Тестирует, что буфер хранит только последние завершенные сессии и отмечает, что история неполная.
+    """
+    index = HotSessionIndex(recent_size=2)
+    load_user(index, 1)
+    for session_id in range(1, 4):
+        index.session_started(1, session_id, session_id * 100)
+        index.session_finished(1, session_id, session_id * 100 + 50)
+
+    assert index.latest_finished(1, with_quality=False) == (3, 300, 350)
+    # Оценка вытесненной сессии не влияет на индекс
+    index.quality_updated(1, 5)
+    assert index.latest_finished(1, with_quality=True) is MISS
+
+
+def test_re_ending_session_reloads_user():
+    """
+    Тестирует, что повторное завершение сессии сбрасывает состояние пользователя.
+    """
+    index = HotSessionIndex()
+    load_user(index, 1, finished_rows=[(1, 50, 100, None)])
+
+    index.session_finished(1, 1, 200)
+
+    assert 1 not in index
+    assert index.latest_finished(1, with_quality=False) is MISS
+
+
+def test_load_after_concurrent_write_is_rejected():
+    """
+    Тестирует, что загрузка, начатая до изменения данных, не сохраняется в индексе.
+    """
+    index = HotSessionIndex()
+    version = index.begin_load()
+    index.session_started(1, 10, 100)
+
+    assert not index.load(1, version, [], [])
+    assert 1 not in index
+
+
+def test_idle_and_overflow_eviction():
+    """
+    Тестирует удаление простаивающих пользователей и вытеснение при переполнении.
+    """
+    clock = FakeClock()
+    index = HotSessionIndex(max_users=2, idle_timeout=60, clock=clock)
+    load_user(index, 1)
+    load_user(index, 2)
+    load_user(index, 3)
+    assert 1 not in index
+    assert index.evictions == 1
+
+    clock.now = 30
+    index.latest_unfinished(3)
+    clock.now = 70
+    # Пользователь 2 простаивает 70 секунд, пользователь 3 - 40 секунд
+    index.latest_unfinished(3)
+    assert 2 not in index
+    assert 3 in index
+    assert index.evictions == 2
+
+
+def test_invalidate_all():
+    """
+    Тестирует полную очистку индекса.
+    """
+    index = HotSessionIndex()
+    load_user(index, 1, open_rows=[(1, 100, None, None)])
+
+    index.invalidate()
+
+    assert len(index) == 0
+    # Обратные ссылки на сессии тоже удалены
+    index.quality_updated(1, 5)
+
+
+def test_invalid_sizes():
+    """
+    Тестирует, что индекс нулевого размера не создается.
+    """
+    with pytest.raises(ValueError):
+        HotSessionIndex(recent_size=0)
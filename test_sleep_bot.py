@@ -2,19 +2,9 @@ import sqlite3
 import pytest
 from unittest.mock import MagicMock, patch
 
-# Мокаем TeleBot до импорта основного файла
-with patch('telebot.TeleBot') as mocked_bot_class:
-    # Создаем фейковый объект бота
-    mock_bot_instance = MagicMock()
-    # КРИТИЧЕСКИ ВАЖНО
-    # Когда функция является декоратором, возвращай эту функцию в целости и сохранности, без изменений
-    mock_bot_instance.message_handler.return_value = lambda func: func
-    mock_bot_instance.callback_query_handler.return_value = lambda func: func
-
-    # При вызове telebot.TeleBot() будет возвращаться фейковый объект бота
-    mocked_bot_class.return_value = mock_bot_instance
-    # Импортируем файл с ботом. Внутри файла sleep_bot.py переменная bot станет нашей пустышкой
-    import sleep_bot
+# Импорт не создает бота и не открывает БД: их создает фабрика create_app() при запуске
+import sleep_bot
+from bot_app import BotSettings
 
 from telebot import types
 from datetime import datetime
@@ -50,6 +40,80 @@ def test_db(tmp_path):
         yield manager
 
 
+@pytest.fixture(autouse=True)
+def mock_bot():
+    """
+    Подменяет бота в модуле 'sleep_bot' фейковым объектом: ответы обработчиков проверяются
+    по вызовам его методов (send_message, edit_message_text и т.д.).
+    :yield: MagicMock: Фейковый бот.
+    """
+    with patch('sleep_bot.bot', MagicMock()) as bot:
+        yield bot
+
+
+@pytest.fixture(autouse=True)
+def conversation_store(tmp_path):
+    """
+    Подменяет хранилище шагов диалога в модуле 'sleep_bot' на хранилище во временном файле,
+    чтобы тесты не затрагивали основной файл БД.
+    :param tmp_path: Встроенная фикстура pytest для создания временных путей.
+    :yield: ConversationStateStore: Тестовое хранилище.
+    """
+    from conversation_state import ConversationStateStore
+    from database_manager import DatabaseManager
+    db_file = str(tmp_path/'test_conversations.db')
+    # Таблицу шагов диалога создают миграции схемы БД
+    DatabaseManager(db_name=db_file).close()
+    store = ConversationStateStore(db_file)
+    with patch('sleep_bot.conversations', store):
+        yield store
+
+
+# -- Тест фабрики приложения --
+def test_create_app_registers_handlers(tmp_path) -> None:
+    """
+    Тест фабрики create_app(): экземпляр получает свои бот, БД и хранилище шагов диалога,
+    обработчики подключаются в порядке объявления.
+    :param tmp_path: Встроенная фикстура pytest для создания временных путей.
+    """
+    db_file = str(tmp_path/'app.db')
+    app = sleep_bot.create_app(BotSettings(token='123456:TEST', db_name=db_file))
+    try:
+        assert app.db.db_name == db_file
+        assert app.conversations.db_name == db_file
+        message_handlers = [handler['function'].__wrapped__ for handler in app.bot.message_handlers]
+        assert message_handlers == [handler for handler, _ in sleep_bot.MESSAGE_HANDLERS]
+        # Шаг диалога проверяется раньше команд и принимает любые сообщения, команды - только текст
+        assert message_handlers[0] is sleep_bot.handle_conversation_step
+        assert app.bot.message_handlers[0]['filters']['content_types'] == sleep_bot.util.content_type_media
+        assert app.bot.message_handlers[1]['filters']['content_types'] == ['text']
+        callback_handlers = [handler['function'].__wrapped__ for handler in app.bot.callback_query_handlers]
+        assert callback_handlers == [sleep_bot.handle_callback]
+    finally:
+        app.close()
+        app.bot.worker_pool.close()
+
+
+def test_run_webhook_bot_generates_secret_for_public_url(monkeypatch) -> None:
+    """
+    Тест регистрации публичного адреса webhook без WEBHOOK_SECRET: секретный токен генерируется,
+    регистрируется в Telegram и проверяется сервером.
+    :param monkeypatch: Встроенная фикстура pytest для изменения окружения.
+    """
+    monkeypatch.setenv('WEBHOOK_URL', 'https://example.com/webhook')
+    monkeypatch.delenv('WEBHOOK_SECRET', raising=False)
+    app = MagicMock()
+    servers = []
+    monkeypatch.setattr('webhook_server.WebhookServer.serve_forever', lambda server: servers.append(server))
+
+    sleep_bot.run_webhook_bot(app)
+
+    secret_token = app.bot.set_webhook.call_args.kwargs['secret_token']
+    assert secret_token
+    assert servers[0].check_secret(secret_token)
+    assert not servers[0].check_secret(None)
+
+
 # -- Тесты команд /start, /help, /recom -- ПРОВЕРЕНО
 def test_send_welcome(test_db) -> None:
     """
@@ -141,7 +205,7 @@ def test_handle_help() -> None:
             all_callbacks.append(button.callback_data)
 
     # Проверяем, что важные команды на месте
-    expected_callbacks = ['/sleep', '/wake', '/quality', '/notes', '/recom', '/statis']
+    expected_callbacks = [sleep_bot.menu_data(cmd) for cmd in ('sleep', 'wake', 'quality', 'notes', 'recom', 'statis')]
     for cmd in expected_callbacks:
         assert cmd in all_callbacks
 
@@ -266,7 +330,7 @@ def test_handle_sleep_successfully(test_db) -> None:
     markup = kwargs_2['reply_markup']
     assert 'Отметить пробуждение' in args_2[1]
     assert isinstance(markup, types.InlineKeyboardMarkup)
-    assert markup.keyboard[0][0].callback_data == '/wake'
+    assert markup.keyboard[0][0].callback_data == sleep_bot.menu_data('wake')
     assert markup.keyboard[0][0].text == 'Я проснулся ☀'
 
 
@@ -342,7 +406,7 @@ def test_handle_wake_successfully(test_db) -> None:
     markup = kwargs_2['reply_markup']
     assert 'Поставить оценку' in args_2[1]
     assert isinstance(markup, types.InlineKeyboardMarkup)
-    assert markup.keyboard[0][0].callback_data == '/quality'
+    assert markup.keyboard[0][0].callback_data == sleep_bot.menu_data('quality')
     assert markup.keyboard[0][0].text == 'Качество сна 💫'
 
 
@@ -371,7 +435,7 @@ def test_handle_wake_without_unfinished_sleep_session(test_db) -> None:
     assert 'Сначала отметьте, когда легли спать' in args[1]
     assert isinstance(markup, types.InlineKeyboardMarkup)
     assert len(markup.keyboard) == 1
-    assert markup.keyboard[0][0].callback_data == '/sleep'
+    assert markup.keyboard[0][0].callback_data == sleep_bot.menu_data('sleep')
     assert markup.keyboard[0][0].text == 'Сладких снов 😴'
 
 
@@ -473,16 +537,14 @@ def test_handle_quality_callback(test_db, quality: str) -> None:
     call = MagicMock()
     call.id = 'callback_id_777'
     call.from_user.id = user_id
-    call.data = f'quality_{quality}_{sleep_record_id}'
     call.message.message_id = message_id
     call.message.chat.id = user_id
 
     # Очищаем историю вызовов перед тестом
     sleep_bot.bot.edit_message_text.reset_mock()
-    sleep_bot.bot.answer_callback_query.reset_mock()
 
-    # Вызываем хендлер
-    sleep_bot.handle_quality_callback(call)
+    # Вызываем хендлер с разобранными данными кнопки
+    sleep_bot.handle_quality_callback(call, sleep_bot.QualityCallback(int(quality), sleep_record_id))
 
     # -- Проверки --
 
@@ -496,10 +558,7 @@ def test_handle_quality_callback(test_db, quality: str) -> None:
     assert isinstance(kwargs['reply_markup'], types.InlineKeyboardMarkup)
     assert len(kwargs['reply_markup'].keyboard) == 1
 
-    # 2. Проверяем, что callback был получен и обработан
-    sleep_bot.bot.answer_callback_query.assert_called_once_with(call.id)
-
-    # 3. Проверяем действительно ли оценка записана в БД
+    # 2. Проверяем действительно ли оценка записана в БД
     with sqlite3.connect(test_db.db_name) as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT sleep_quality FROM sleep_records WHERE id = ?', (sleep_record_id,))
@@ -555,7 +614,6 @@ def test_handle_notes(test_db, setup_type: str) -> None:
 
     # Очищаем историю вызовов перед тестом
     sleep_bot.bot.send_message.reset_mock()
-    sleep_bot.bot.register_next_step_handler.reset_mock()
 
     sleep_bot.handle_notes(message)
 
@@ -564,10 +622,13 @@ def test_handle_notes(test_db, setup_type: str) -> None:
     assert args[0] == user_id
     assert expected_text in args[1]
 
+    # Шаг ввода заметки ожидается только, если заметки еще нет
+    state = sleep_bot.conversations.get(user_id)
     if setup_type == 'without_notes':
-        sleep_bot.bot.register_next_step_handler.assert_called_once()
-        args_step, kwargs_step = sleep_bot.bot.register_next_step_handler.call_args
-        assert args_step[1] == sleep_bot.process_notes_step
+        assert state.step == sleep_bot.NOTE_STEP
+        assert state.data == {'sleep_record_id': session_id}
+    else:
+        assert state is None
 
 
 # -- Тесты для handle_notes_update_callback -- ПРОВЕРЕНО
@@ -592,16 +653,14 @@ def test_handle_notes_update_callback(yes_no: str, expected_text: str) -> None:
     call = MagicMock()
     call.id = 'callback_id_999'
     call.from_user.id = user_id
-    call.data = f'update_{yes_no}_{sleep_record_id}'
     call.message.message_id = message_id
+    call.message.chat.id = user_id
 
     # Очищаем историю вызовов перед тестом
     sleep_bot.bot.edit_message_text.reset_mock()
-    sleep_bot.bot.register_next_step_handler.reset_mock()
-    sleep_bot.bot.answer_callback_query.reset_mock()
 
-    # Вызываем хендлер
-    sleep_bot.handle_notes_update_callback(call)
+    # Вызываем хендлер с разобранными данными кнопки
+    sleep_bot.handle_notes_update_callback(call, sleep_bot.NoteUpdateCallback(yes_no == 'yes', sleep_record_id))
 
     # 1. Проверяем, что текст сообщения обновился (edit_message_text)
     sleep_bot.bot.edit_message_text.assert_called_once()
@@ -609,17 +668,15 @@ def test_handle_notes_update_callback(yes_no: str, expected_text: str) -> None:
     assert kwargs['chat_id'] == user_id
     assert kwargs['message_id'] == message_id
     assert expected_text in kwargs['text']
-    # 2. Проверяем, что callback был получен и обработан
-    sleep_bot.bot.answer_callback_query.assert_called_once_with(call.id)
 
-    # 3. Проверяем регистрацию следующего шага (только для 'yes')
+    # 2. Проверяем сохранение следующего шага (только для 'yes')
+    state = sleep_bot.conversations.get(user_id)
     if yes_no == 'yes':
-        sleep_bot.bot.register_next_step_handler.assert_called_once()
-        # Проверяем, что передали верный ID записи в функцию process_notes_step
-        step_args, _ = sleep_bot.bot.register_next_step_handler.call_args
-        assert step_args[2] == sleep_record_id
+        # Проверяем, что сохранили верный ID записи для process_notes_step
+        assert state.step == sleep_bot.NOTE_STEP
+        assert state.data == {'sleep_record_id': sleep_record_id}
     else:
-        sleep_bot.bot.register_next_step_handler.assert_not_called()
+        assert state is None
 
 
 # -- Тесты для записи заметки к оценке качества сна -- ПРОВЕРЕНО
@@ -705,7 +762,6 @@ def test_process_notes_invalid_connect(test_db) -> None:
     message.text = None
     # Очищаем историю вызовов перед тестом
     sleep_bot.bot.send_message.reset_mock()
-    sleep_bot.bot.register_next_step_handler.reset_mock()
 
     sleep_bot.process_notes_step(message, 1)
 
@@ -714,18 +770,72 @@ def test_process_notes_invalid_connect(test_db) -> None:
     args, kwargs = sleep_bot.bot.send_message.call_args
     assert args[0] == user_id
     assert 'Пожалуйста, отправьте заметку текстом' in args[1]
-    # Проверяем, что бот снова вызвал register_next_step_handler, чтобы ждать текст
-    assert sleep_bot.bot.register_next_step_handler.called
+    # Проверяем, что бот снова сохранил шаг ввода заметки, чтобы ждать текст
+    assert sleep_bot.conversations.get(user_id).data == {'sleep_record_id': 1}
+
+
+@pytest.mark.parametrize('text, expected_text', [
+    ('Спалось хорошо', 'Спасибо, Ваш комментарий записан'),
+    ('/start', 'Ввод заметки прерван'),
+])
+def test_handle_conversation_step(test_db, text: str, expected_text: str) -> None:
+    """
+    Тест продолжения ввода заметки по сохраненному шагу диалога: следующее сообщение чата (в том числе команда)
+    передается process_notes_step, после чего шаг удаляется.
+    :param test_db: Фикстура тестовой базы данных.
+    :param text: str: Текст следующего сообщения.
+    :param expected_text: str: Ключ текста ответа бота.
+    """
+    user_id = 12345
+    test_db.add_user(user_id, 'TestUser')
+    session_id = test_db.start_sleep_session(user_id, datetime(2025, 12, 21, 23, 0, 0))
+    test_db.end_sleep_session(session_id, datetime.now())
+    test_db.update_sleep_quality(session_id, 4)
+    # Шаг сохранен до "перезапуска" бота: в памяти процесса ничего нет
+    sleep_bot.conversations.set(user_id, sleep_bot.NOTE_STEP, {'sleep_record_id': session_id})
+
+    message = MagicMock()
+    message.chat.id = user_id
+    message.text = text
+    sleep_bot.bot.send_message.reset_mock()
+
+    sleep_bot.handle_conversation_step(message)
+
+    args, _ = sleep_bot.bot.send_message.call_args
+    assert expected_text in args[1]
+    assert user_id not in sleep_bot.conversations
+    if text == 'Спалось хорошо':
+        assert test_db.get_note_by_sleep_record_id(session_id) == text
 
 
+
+@pytest.mark.parametrize('text, handler_name', [('/help', 'handle_help'), ('Привет', 'all_other_message')])
+def test_handle_conversation_step_without_step(text: str, handler_name: str) -> None:
+    """
+    Тест сообщения, шаг диалога которого устарел после проверки фильтра: сообщение не теряется,
+    а передается обработчику, который получил бы его без шага.
+    :param text: str: Текст сообщения.
+    :param handler_name: str: Имя ожидаемого обработчика.
+    """
+    message = MagicMock()
+    message.chat.id = 12345
+    message.content_type = 'text'
+    message.text = text
+    handlers = [(MagicMock(wraps=handler) if handler.__name__ == handler_name else handler, filters)
+                for handler, filters in sleep_bot.MESSAGE_HANDLERS]
+
+    with patch.object(sleep_bot, 'MESSAGE_HANDLERS', handlers):
+        sleep_bot.handle_conversation_step(message)
+
+    called = [handler for handler, _ in handlers if isinstance(handler, MagicMock)]
+    called[0].assert_called_once_with(message)
+
 # -- Тесты обработки ошибок -- ПРОВЕРЕНО
 @pytest.mark.parametrize('handler_to_test, db_method_path', [
     (sleep_bot.handle_sleep, 'sleep_bot.db.start_sleep_session'),
-    (sleep_bot.handle_wake, 'sleep_bot.db.end_sleep_session'),
-    (sleep_bot.handle_quality, 'sleep_bot.db.get_latest_finished_sleep_session_without_quality'),
-    (sleep_bot.handle_wake, 'sleep_bot.db.get_latest_unfinished_sleep_session'),
-    (sleep_bot.handle_notes, 'sleep_bot.db.get_latest_finished_sleep_session_with_quality'),
-    (sleep_bot.handle_notes, 'sleep_bot.db.get_note_by_sleep_record_id'),
+    (sleep_bot.handle_wake, 'sleep_bot.db.finish_latest_sleep_session'),
+    (sleep_bot.handle_quality, 'sleep_bot.db.get_user_state'),
+    (sleep_bot.handle_notes, 'sleep_bot.db.get_user_state'),
     (sleep_bot.process_notes_step, 'sleep_bot.db.add_note')
     ])
 def test_handlers_database_error(test_db, mocker: MockFixture, handler_to_test: Callable, db_method_path: str) -> None:
@@ -749,18 +859,12 @@ def test_handlers_database_error(test_db, mocker: MockFixture, handler_to_test:
     dummy_sleep_record_id = 1
 
     # Создаем активную сессию сна, чтобы первая проверка handle_wake прошла успешно
-    if db_method_path == 'sleep_bot.db.end_sleep_session':
+    if db_method_path == 'sleep_bot.db.finish_latest_sleep_session':
         test_db.add_user(user_id, user_name)
         _ = test_db.start_sleep_session(user_id, datetime.now())
-    elif db_method_path == 'sleep_bot.db.get_note_by_sleep_record_id':
-        test_db.add_user(user_id, user_name)
-        session_id = test_db.start_sleep_session(user_id, datetime.now())
-        test_db.end_sleep_session(session_id, datetime.now())
-        test_db.update_sleep_quality(session_id, 5)
 
     # Очищаем историю вызовов перед тестом
     sleep_bot.bot.send_message.reset_mock()
-    sleep_bot.bot.register_next_step_handler.reset_mock()
 
     # Имитируем ошибку при вызове метода БД
     mocker.patch(db_method_path, side_effect=Exception('DB Error'))
@@ -777,24 +881,11 @@ def test_handlers_database_error(test_db, mocker: MockFixture, handler_to_test:
     assert 'DB Error' in args[1]
 
 
-@pytest.mark.parametrize('handler_to_test, error_type', [
-    (sleep_bot.handle_quality_callback, 'IndexError_split'),
-    (sleep_bot.handle_quality_callback, 'ValueError_int'),
-    (sleep_bot.handle_quality_callback, 'DatabaseError'),
-    (sleep_bot.handle_notes_update_callback, 'IndexError_split'),
-    (sleep_bot.handle_notes_update_callback, 'ValueError_int')
-])
-def test_handle_quality_and_notes_update_callback_error(
-        mocker: MockFixture, handler_to_test: Callable, error_type: str) -> None:
-    """
-    Проверка блока except в callback-хендлере.
-    Проверяет три сценария возможных ошибок:
-    1. IndexError - ошибка при разделении(split) полученных данных(call.data) на части.
-    2. ValueError - ошибка при преобразовании в целое число (int).
-    3. DatabaseError - ошибка в методе БД (только для handle_quality_callback)
-    :param mocker: MockFixture: Объект для имитации ошибок (mocking).
-    :param handler_to_test: Callable: Ключ тестируемого хендлера.
-    :param error_type: str: Ключ к типу ошибки.
+def test_handle_quality_callback_db_error(test_db, mocker: MockFixture) -> None:
+    """
+    Проверка блока except в обработчике оценки качества сна: ошибка в методе БД.
+    :param test_db: Фикстура тестовой базы данных.
+    :param mocker: MockFixture: Объект для имитации ошибки (mocking).
     """
     call = MagicMock()
     user_id = 888
@@ -802,25 +893,14 @@ def test_handle_quality_and_notes_update_callback_error(
     call.message.chat.id = user_id
     call.message.message_id = 101
     call.id = 'callback_id_777'
-
-    # Специально ломаем data, чтобы вызвать ошибку при split или приведении к int
-    if error_type == 'IndexError_split':
-        call.data = 'non-separable'
-        expected_error_text = 'list index out of range'
-    elif error_type == 'ValueError_int':
-        call.data = 'not_converted_to_int'
-        expected_error_text = "invalid literal for int() with base 10:"
-    elif error_type == 'DatabaseError':
-        # Корректные данные, чтобы пройти парсинг
-        call.data = 'quality_5_123'
-        mocker.patch('sleep_bot.db.update_sleep_quality', side_effect=Exception('DB Error'))
-        expected_error_text = 'DB Error'
+    call.data = sleep_bot.callback_router.encode(sleep_bot.QualityCallback(5, 123))
+    mocker.patch('sleep_bot.db.update_sleep_quality', side_effect=Exception('DB Error'))
 
     # Очищаем историю вызовов перед тестом
     sleep_bot.bot.send_message.reset_mock()
     sleep_bot.bot.answer_callback_query.reset_mock()
 
-    handler_to_test(call)
+    sleep_bot.handle_callback(call)
 
     # Проверяем, что callback был получен и обработан
     sleep_bot.bot.answer_callback_query.assert_called_once_with(call.id)
@@ -828,17 +908,58 @@ def test_handle_quality_and_notes_update_callback_error(
     sleep_bot.bot.send_message.assert_called_once()
     args, _ = sleep_bot.bot.send_message.call_args
     assert 'произошла ошибка' in args[1]
-    assert expected_error_text in args[1]
+    assert 'DB Error' in args[1]
+
+
+@pytest.mark.parametrize('data', [
+    'non-separable',       # неизвестный префикс
+    'quality_5_123',       # формат кнопок до появления маршрутизатора
+    'q0:5:123',            # кнопка предыдущей версии формата
+    'q1:5',                # не хватает полей
+    'q1:five:123',         # поле не число
+    'q1:9:123',            # оценка вне диапазона 1-5
+    'n1:2:123',            # bool поле не 0/1
+    'm1:unknown',          # неизвестная команда
+    'q1:' + '1' * 70,      # больше 64 байт
+])
+def test_handle_callback_rejects_bad_data(test_db, mocker: MockFixture, data: str) -> None:
+    """
+    Проверяет, что некорректная или устаревшая callback_data отклоняется до вызова обработчиков:
+    пользователь получает просьбу открыть меню заново, а callback подтверждается.
+    :param test_db: Фикстура тестовой базы данных.
+    :param mocker: MockFixture: Объект для имитации вызова функции (mocking).
+    :param data: str: callback_data нажатой кнопки.
+    """
+    call = MagicMock()
+    call.data = data
+    call.id = 'bad_id'
+    call.message.chat.id = 123
+    update_quality = mocker.patch('sleep_bot.db.update_sleep_quality')
+
+    sleep_bot.bot.send_message.reset_mock()
+    sleep_bot.bot.answer_callback_query.reset_mock()
+
+    sleep_bot.handle_callback(call)
+
+    update_quality.assert_not_called()
+    sleep_bot.bot.send_message.assert_called_once()
+    args, _ = sleep_bot.bot.send_message.call_args
+    assert args[0] == 123
+    assert 'кнопка устарела' in args[1]
+    sleep_bot.bot.answer_callback_query.assert_called_once_with(call.id)
 
 
 # -- Тесты для handle_callback -- ПРОВЕРЕНО
 @pytest.mark.parametrize('command_to_test, handler_name', [
-    ('/sleep', 'handle_sleep'),
-    ('/wake', 'handle_wake'),
-    ('/quality', 'handle_quality'),
-    ('/notes', 'handle_notes'),
-    ('/recom', 'handle_recom'),
-    ('/statis', 'handle_statistics')
+    ('m1:sleep', 'sleep'),
+    ('m1:wake', 'wake'),
+    ('m1:quality', 'quality'),
+    ('m1:notes', 'notes'),
+    ('m1:recom', 'recom'),
+    ('m1:statis', 'statis'),
+    # Кнопки сообщений, отправленных до перехода на компактный формат
+    ('/sleep', 'sleep'),
+    ('/statis', 'statis')
 ])
 def test_handle_callback_routing(test_db, mocker: MockFixture, command_to_test: str, handler_name: str) -> None:
     """
@@ -846,7 +967,7 @@ def test_handle_callback_routing(test_db, mocker: MockFixture, command_to_test:
     :param test_db: Фикстура тестовой базы данных.
     :param mocker: MockFixture: Объект для имитации вызова функции (mocking).
     :param command_to_test: Ключ к тестируемой команде.
-    :param handler_name: Ключ к имени хендлера для тестируемой команды.
+    :param handler_name: Ключ к команде в MENU_COMMANDS.
     """
     # Создаем мок для CallbackQuery
     call = MagicMock()
@@ -855,7 +976,8 @@ def test_handle_callback_routing(test_db, mocker: MockFixture, command_to_test:
     call.message.chat.id = 123
 
     # Мокаем целевой хендлер, чтобы он ничего не делал, но помнил, что был вызван
-    mocked_handler = mocker.patch(f'sleep_bot.{handler_name}')
+    mocked_handler = MagicMock()
+    mocker.patch.dict(sleep_bot.MENU_COMMANDS, {handler_name: mocked_handler})
 
     # Очищаем историю вызовов перед тестом
     sleep_bot.bot.answer_callback_query.reset_mock()
@@ -869,12 +991,12 @@ def test_handle_callback_routing(test_db, mocker: MockFixture, command_to_test:
 
 
 @pytest.mark.parametrize('command_to_test, handler_name', [
-    ('/sleep', 'handle_sleep'),
-    ('/wake', 'handle_wake'),
-    ('/quality', 'handle_quality'),
-    ('/notes', 'handle_notes'),
-    ('/recom', 'handle_recom'),
-    ('/statis', 'handle_statistics')
+    ('m1:sleep', 'sleep'),
+    ('m1:wake', 'wake'),
+    ('m1:quality', 'quality'),
+    ('m1:notes', 'notes'),
+    ('m1:recom', 'recom'),
+    ('m1:statis', 'statis')
 ])
 def test_handle_callback_error(mocker: MockFixture, command_to_test: str, handler_name: str) -> None:
     """
@@ -882,7 +1004,7 @@ def test_handle_callback_error(mocker: MockFixture, command_to_test: str, handle
     Проверяет, что если вызванный хендлер выдал ошибку, пользователь получит уведомление, а callback будет подтвержден.
     :param mocker: MockFixture: Объект для имитации ошибки (mocking).
     :param command_to_test: str: Ключ к тестируемой команде.
-    :param handler_name: str: Ключ к имени хендлера для тестируемой команды.
+    :param handler_name: str: Ключ к команде в MENU_COMMANDS.
     """
     call = MagicMock()
     call.data = command_to_test
@@ -890,7 +1012,7 @@ def test_handle_callback_error(mocker: MockFixture, command_to_test: str, handle
     call.message.chat.id = 123
 
     # Имитируем ошибку при вызове хендлера
-    mocker.patch(f'sleep_bot.{handler_name}', side_effect=Exception('Unexpected crash!'))
+    mocker.patch.dict(sleep_bot.MENU_COMMANDS, {handler_name: MagicMock(side_effect=Exception('Unexpected crash!'))})
 
     # Очищаем историю вызовов
     sleep_bot.bot.send_message.reset_mock()
@@ -908,6 +1030,25 @@ def test_handle_callback_error(mocker: MockFixture, command_to_test: str, handle
     sleep_bot.bot.answer_callback_query.assert_called_once_with(call.id)
 
 
+
+def test_handle_callback_skips_answered_call(mocker: MockFixture) -> None:
+    """
+    Проверяет, что нажатие, уже подтвержденное при получении (BOT_EARLY_CALLBACK_ACK), не подтверждается повторно.
+    :param mocker: MockFixture: Объект для имитации вызова функции (mocking).
+    """
+    call = MagicMock()
+    call.data = sleep_bot.menu_data('recom')
+    call.id = 'answered_id'
+    call.answered = True
+    mocked_handler = MagicMock()
+    mocker.patch.dict(sleep_bot.MENU_COMMANDS, {'recom': mocked_handler})
+
+    sleep_bot.bot.answer_callback_query.reset_mock()
+    sleep_bot.handle_callback(call)
+
+    mocked_handler.assert_called_once_with(call.message)
+    sleep_bot.bot.answer_callback_query.assert_not_called()
+
 # -- Тесты для all_other_message --
 def test_all_other_message(test_db) -> None:
     """
@@ -0,0 +1,96 @@
+import pytest
+
+from ttl_cache import TTLCache
+
+
+class FakeClock:
+    """Управляемые часы для проверки времени жизни записей."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_get_counts_hits_and_misses():
+    """
+    Тестирует счетчики попаданий и промахов.
+    """
+    cache = TTLCache(max_size=2)
+    cache.set('a', 1)
+
+    assert cache.get('a') == 1
+    assert cache.get('b', 'default') == 'default'
+    assert cache.stats() == {'size': 1, 'hits': 1, 'misses': 1, 'evictions': 0}
+
+
+def test_least_recently_used_entry_is_evicted():
+    """
+    Тестирует вытеснение давно не использованной записи при переполнении.
+    """
+    cache = TTLCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    # 'a' становится недавно использованной, вытеснена будет 'b'
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert 'c' in cache
+    assert cache.evictions == 1
+
+
+def test_expired_entry_is_a_miss():
+    """
+    Тестирует, что запись старше ttl считается отсутствующей и удаляется.
+    """
+    clock = FakeClock()
+    cache = TTLCache(max_size=10, ttl=60, clock=clock)
+    cache.set('a', 1)
+
+    clock.now = 59
+    assert cache.get('a') == 1
+    clock.now = 60
+    assert 'a' not in cache
+    assert cache.get('a') is None
+    assert len(cache) == 0
+    assert cache.stats() == {'size': 0, 'hits': 1, 'misses': 1, 'evictions': 1}
+
+
+def test_set_refreshes_ttl():
+    """
+    Тестирует, что повторная запись значения продлевает время жизни.
+    """
+    clock = FakeClock()
+    cache = TTLCache(max_size=10, ttl=60, clock=clock)
+    cache.set('a', 1)
+    clock.now = 50
+    cache.set('a', 2)
+    clock.now = 100
+
+    assert cache.get('a') == 2
+
+
+def test_pop_and_clear():
+    """
+    Тестирует удаление записей без изменения счетчиков.
+    """
+    cache = TTLCache()
+    cache.set('a', 1)
+    cache.set('b', 2)
+
+    assert cache.pop('a') == 1
+    assert cache.pop('a', 'default') == 'default'
+    cache.clear()
+
+    assert len(cache) == 0
+    assert cache.stats() == {'size': 0, 'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def test_invalid_max_size():
+    """
+    Тестирует, что кэш нулевого размера не создается.
+    """
+    with pytest.raises(ValueError):
+        TTLCache(max_size=0)
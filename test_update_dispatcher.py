@@ -0,0 +1,163 @@
+import time
+import threading
+import pytest
+
+import telebot
+from telebot import types
+
+from update_dispatcher import OrderedUpdateDispatcher, update_chat_id
+
+
+def make_update(update_id: int, chat_id: int, text: str = '/sleep') -> types.Update:
+    """
+    Создает обновление с сообщением пользователя.
+    :param update_id: int: ID обновления.
+    :param chat_id: int: ID чата.
+    :param text: str: Текст сообщения.
+    :return: types.Update: Обновление.
+    """
+    entities = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}] if text.startswith('/') else []
+    return types.Update.de_json({'update_id': update_id,
+                                 'message': {'message_id': update_id, 'date': 0, 'text': text,
+                                             'chat': {'id': chat_id, 'type': 'private'},
+                                             'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Test'},
+                                             'entities': entities}})
+
+
+def make_callback_update(update_id: int, chat_id: int, data: str) -> types.Update:
+    """
+    Создает обновление с нажатием inline кнопки.
+    :param update_id: int: ID обновления.
+    :param chat_id: int: ID чата.
+    :param data: str: callback_data кнопки.
+    :return: types.Update: Обновление.
+    """
+    user = {'id': chat_id, 'is_bot': False, 'first_name': 'Test'}
+    return types.Update.de_json({'update_id': update_id,
+                                 'callback_query': {'id': str(update_id), 'from': user, 'chat_instance': '1',
+                                                    'data': data,
+                                                    'message': {'message_id': 1, 'date': 0, 'text': 'Кнопки',
+                                                                'chat': {'id': chat_id, 'type': 'private'}}}})
+
+
+def test_update_chat_id():
+    """ Тестирует определение чата для сообщения, нажатия кнопки и обновления без чата. """
+    assert update_chat_id(make_update(1, 10)) == 10
+    assert update_chat_id(make_callback_update(2, 20, '/wake')) == 20
+    assert update_chat_id(types.Update.de_json({'update_id': 3})) is None
+
+
+def test_updates_of_one_chat_keep_order():
+    """ Тестирует, что обновления одного чата обрабатываются по порядку, даже если первое обрабатывается долго. """
+    processed = []
+    lock = threading.Lock()
+
+    def process_updates(updates: list[types.Update]):
+        update = updates[0]
+        # Первое обновление каждого чата обрабатывается дольше следующего
+        if update.message.text == '/sleep':
+            time.sleep(0.05)
+        with lock:
+            processed.append((update.message.chat.id, update.message.text))
+
+    dispatcher = OrderedUpdateDispatcher(process_updates, workers=4)
+    dispatcher.submit([make_update(i * 2 + 1, chat_id, '/sleep') for i, chat_id in enumerate(range(8))] +
+                      [make_update(i * 2 + 2, chat_id, '/wake') for i, chat_id in enumerate(range(8))])
+    dispatcher.stop()
+
+    for chat_id in range(8):
+        assert [text for chat, text in processed if chat == chat_id] == ['/sleep', '/wake']
+
+
+def test_slow_chat_does_not_block_other_queues():
+    """ Тестирует, что медленный чат задерживает только свою очередь. """
+    release = threading.Event()
+    done = threading.Event()
+
+    def process_updates(updates: list[types.Update]):
+        if updates[0].message.chat.id == 0:
+            release.wait(5)
+        else:
+            done.set()
+
+    dispatcher = OrderedUpdateDispatcher(process_updates, workers=2)
+    try:
+        dispatcher.submit([make_update(1, 0), make_update(2, 1)])
+
+        assert done.wait(5)
+        assert dispatcher.queue_for(0) != dispatcher.queue_for(1)
+    finally:
+        release.set()
+        dispatcher.stop()
+
+
+def test_stats_report_depth_and_wait():
+    """ Тестирует метрики глубины очереди и времени ожидания. """
+    release = threading.Event()
+    dispatcher = OrderedUpdateDispatcher(lambda updates: release.wait(5), workers=2)
+    try:
+        dispatcher.submit([make_update(i, 0) for i in range(1, 4)])
+        time.sleep(0.05)
+        busy = dispatcher.stats()[dispatcher.queue_for(0)]
+
+        # Одно обновление обрабатывается, два ждут в очереди
+        assert busy['depth'] == 2
+        assert dispatcher.stats()[dispatcher.queue_for(1)]['depth'] == 0
+    finally:
+        release.set()
+        dispatcher.stop()
+
+    stats = dispatcher.stats()[dispatcher.queue_for(0)]
+    assert stats['depth'] == 0
+    assert stats['processed'] == 3
+    assert stats['max_wait'] >= 0.05
+    assert 0 < stats['avg_wait'] <= stats['max_wait']
+
+
+def test_handler_error_does_not_stop_worker():
+    """ Тестирует, что ошибка обработчика не останавливает обработку следующих обновлений очереди. """
+    processed = []
+
+    def process_updates(updates: list[types.Update]):
+        if updates[0].update_id == 1:
+            raise RuntimeError('сбой обработчика')
+        processed.append(updates[0].update_id)
+
+    dispatcher = OrderedUpdateDispatcher(process_updates, workers=1)
+    dispatcher.submit([make_update(1, 5), make_update(2, 5)])
+    dispatcher.stop()
+
+    assert processed == [2]
+    with pytest.raises(RuntimeError):
+        dispatcher.submit([make_update(3, 5)])
+
+
+def test_install_runs_bot_handlers_in_chat_queue():
+    """ Тестирует, что после подключения к боту обработчики выполняются в потоке очереди чата по порядку. """
+    bot = telebot.TeleBot('123456:TEST')
+    calls = []
+
+    @bot.message_handler(commands=['sleep', 'wake'])
+    def handle(message: types.Message):
+        calls.append((message.text, threading.current_thread().name))
+
+    @bot.callback_query_handler(func=lambda call: True)
+    def handle_callback(call: types.CallbackQuery):
+        calls.append((call.data, threading.current_thread().name))
+
+    dispatcher = OrderedUpdateDispatcher.install(bot, workers=3)
+    bot.process_new_updates([make_update(1, 4, '/sleep'), make_callback_update(2, 4, '/wake'),
+                             make_update(3, 4, '/wake')])
+    dispatcher.stop()
+
+    thread_name = f'update-worker-{dispatcher.queue_for(4)}'
+    assert calls == [('/sleep', thread_name), ('/wake', thread_name), ('/wake', thread_name)]
+    assert bot.threaded is False
+
+
+def test_constructor_rejects_non_positive_limits():
+    """ Тестирует, что нулевое количество очередей или нулевой размер очереди отклоняются. """
+    with pytest.raises(ValueError):
+        OrderedUpdateDispatcher(print, workers=0)
+    with pytest.raises(ValueError):
+        OrderedUpdateDispatcher(print, max_queue_size=0)
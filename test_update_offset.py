@@ -0,0 +1,176 @@
+import pytest
+from unittest import mock
+
+import telebot
+from telebot import types
+
+from database_manager import DatabaseManager
+from update_offset import UPDATE_ID_RESET_AGE, DurableUpdateFilter, RecentUpdateIds, UpdateOffsetStore
+
+
+def make_update(update_id: int, chat_id: int = 1) -> types.Update:
+    """
+    Создает обновление с текстовым сообщением.
+    :param update_id: int: ID обновления.
+    :param chat_id: int: ID чата.
+    :return: types.Update: Обновление.
+    """
+    return types.Update.de_json({'update_id': update_id,
+                                 'message': {'message_id': update_id, 'date': 0, 'text': '/sleep',
+                                             'chat': {'id': chat_id, 'type': 'private'}}})
+
+
+@pytest.fixture
+def db_name(tmp_path) -> str:
+    """
+    Предоставляет временный файл БД, схему которого (в том числе таблицу bot_state) создал DatabaseManager.
+    :param tmp_path: Встроенная фикстура pytest для создания временных путей.
+    :return: str: Путь к файлу БД.
+    """
+    db_file = str(tmp_path/'offset.db')
+    DatabaseManager(db_name=db_file).close()
+    return db_file
+
+
+@pytest.fixture
+def store(db_name: str) -> UpdateOffsetStore:
+    """
+    Предоставляет хранилище смещения во временном файле.
+    :param db_name: str: Путь к файлу БД.
+    :return: UpdateOffsetStore: Хранилище.
+    """
+    return UpdateOffsetStore(db_name)
+
+
+def test_recent_ids_detect_redelivery():
+    """ Тестирует отбрасывание повторов, прием обновлений не по порядку и ID старше окна. """
+    recent = RecentUpdateIds(window=8)
+
+    assert [recent.add(update_id) for update_id in (10, 12, 11, 12, 10)] == [True, True, True, False, False]
+    assert recent.high == 12
+    assert recent.add(30) is True
+    # 25 в окне и еще не получен, 22 - старше окна
+    assert recent.add(25) is True
+    assert recent.add(22) is False
+
+
+def test_recent_ids_start_from_saved_offset():
+    """ Тестирует, что ID не больше сохраненного смещения считаются полученными. """
+    recent = RecentUpdateIds(window=8, high=100)
+
+    assert recent.add(100) is False
+    assert recent.add(95) is False
+    assert recent.add(101) is True
+
+
+def test_store_keeps_largest_offset(store: UpdateOffsetStore):
+    """
+    Тестирует сохранение смещения: меньшее значение не заменяет большее.
+    :param store: UpdateOffsetStore: Хранилище.
+    """
+    assert store.load() == 0
+    store.save(7)
+    store.save(5)
+
+    assert store.load() == 7
+    assert UpdateOffsetStore(store.db_name).load() == 7
+
+
+def test_filter_drops_duplicates_and_resumes_after_restart(store: UpdateOffsetStore):
+    """
+    Тестирует, что повторно доставленные обновления не обрабатываются, а после перезапуска
+    polling продолжается с сохраненного смещения.
+    :param store: UpdateOffsetStore: Хранилище.
+    """
+    bot = telebot.TeleBot('123456:TEST', threaded=False)
+    processed = []
+    bot.process_new_updates = lambda updates: processed.extend(update.update_id for update in updates)
+
+    update_filter = DurableUpdateFilter.install(bot, store)
+    bot.process_new_updates([make_update(1), make_update(2)])
+    # get_updates повторил ту же пачку, пока она обрабатывалась
+    bot.process_new_updates([make_update(2), make_update(3)])
+
+    assert processed == [1, 2, 3]
+    assert bot.last_update_id == 3
+    assert update_filter.stats == {'received': 4, 'duplicates': 1, 'resets': 0, 'last_update_id': 3}
+
+    restarted = telebot.TeleBot('123456:TEST', threaded=False)
+    process_after_restart = restarted.process_new_updates = mock.MagicMock()
+    DurableUpdateFilter.install(restarted, UpdateOffsetStore(store.db_name))
+    restarted.process_new_updates([make_update(3)])
+
+    assert restarted.last_update_id == 3
+    process_after_restart.assert_not_called()
+
+
+def test_offset_advances_even_if_processing_fails(store: UpdateOffsetStore):
+    """
+    Тестирует, что ошибка обработки не возвращает смещение назад и пачка не обрабатывается повторно.
+    :param store: UpdateOffsetStore: Хранилище.
+    """
+    bot = telebot.TeleBot('123456:TEST', threaded=False)
+    bot.process_new_updates = mock.MagicMock(side_effect=RuntimeError('DB Error'))
+    DurableUpdateFilter.install(bot, store)
+
+    with pytest.raises(RuntimeError):
+        bot.process_new_updates([make_update(5)])
+    bot.process_new_updates([make_update(5)])
+
+    assert bot.last_update_id == 5
+    assert store.load() == 5
+
+
+def test_offset_is_saved_after_processing(store: UpdateOffsetStore):
+    """
+    Тестирует, что смещение сохраняется только после передачи пачки обработчикам: при аварийной остановке
+    во время обработки Telegram доставит пачку повторно.
+    :param store: UpdateOffsetStore: Хранилище.
+    """
+    bot = telebot.TeleBot('123456:TEST', threaded=False)
+    saved_during_processing = []
+    bot.process_new_updates = lambda updates: saved_during_processing.append(store.load())
+    DurableUpdateFilter.install(bot, store)
+
+    bot.process_new_updates([make_update(4), make_update(6)])
+
+    assert saved_during_processing == [0]
+    assert store.load() == 6
+
+
+def test_update_id_reset_is_detected(store: UpdateOffsetStore):
+    """
+    Тестирует, что после того как Telegram начал нумерацию заново, новые обновления с меньшими ID
+    обрабатываются, а смещение polling и сохраненное смещение уменьшаются.
+    :param store: UpdateOffsetStore: Хранилище.
+    """
+    bot = telebot.TeleBot('123456:TEST', threaded=False)
+    processed = []
+    bot.process_new_updates = lambda updates: processed.extend(update.update_id for update in updates)
+    update_filter = DurableUpdateFilter.install(bot, store, window=8)
+
+    bot.process_new_updates([make_update(1000)])
+    bot.process_new_updates([make_update(20), make_update(21)])
+    bot.process_new_updates([make_update(21)])
+
+    assert processed == [1000, 20, 21]
+    assert bot.last_update_id == 21
+    assert store.load() == 21
+    assert update_filter.stats['resets'] == 1
+
+
+def test_stale_offset_is_not_used(db_name: str):
+    """
+    Тестирует, что смещение, сохраненное больше недели назад, при запуске не используется.
+    :param db_name: str: Путь к файлу БД.
+    """
+    now = [1_000_000.0]
+    store = UpdateOffsetStore(db_name, clock=lambda: now[0])
+    store.save(500)
+    now[0] += UPDATE_ID_RESET_AGE + 1
+
+    assert store.load() == 500
+    assert store.load(max_age=UPDATE_ID_RESET_AGE) == 0
+    bot = telebot.TeleBot('123456:TEST', threaded=False)
+    DurableUpdateFilter.install(bot, store)
+    assert bot.last_update_id == 0
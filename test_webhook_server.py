@@ -0,0 +1,159 @@
+import json
+import threading
+import pytest
+from http.client import HTTPConnection
+
+from telebot import types
+
+from webhook_server import SECRET_HEADER, WebhookServer
+
+
+def make_update_body(update_id: int) -> bytes:
+    """
+    Создает тело запроса Telegram с текстовым сообщением.
+    :param update_id: int: ID обновления.
+    :return: bytes: JSON обновления.
+    """
+    return json.dumps({'update_id': update_id,
+                       'message': {'message_id': update_id, 'date': 0, 'text': 'Привет',
+                                   'chat': {'id': 1, 'type': 'private'},
+                                   'from': {'id': 1, 'is_bot': False, 'first_name': 'Test'}}}).encode()
+
+
+def post(server: WebhookServer, body: bytes, token: str | None = 'secret', path: str | None = None,
+         extra_headers: dict[str, str] | None = None) -> int:
+    """
+    Отправляет POST-запрос webhook-серверу.
+    :param server: WebhookServer: Запущенный сервер.
+    :param body: bytes: Тело запроса.
+    :param token: str | None: Секретный токен в заголовке запроса.
+    :param path: str | None: Путь запроса (по умолчанию путь сервера).
+    :param extra_headers: dict[str, str] | None: Дополнительные заголовки запроса.
+    :return: int: HTTP-статус ответа.
+    """
+    headers = {'Content-Type': 'application/json', **(extra_headers or {})}
+    if token is not None:
+        headers[SECRET_HEADER] = token
+    conn = HTTPConnection(server.host, server.port, timeout=5)
+    try:
+        conn.request('POST', path or server.path, body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def received() -> list[types.Update]:
+    """
+    Предоставляет список обновлений, переданных обработчику.
+    :return: list[types.Update]: Полученные обновления.
+    """
+    return []
+
+
+@pytest.fixture
+def server(received: list[types.Update]):
+    """
+    Запускает webhook-сервер на свободном порту с секретным токеном 'secret'.
+    :param received: list[types.Update]: Список, в который обработчик складывает обновления.
+    :yield: WebhookServer: Запущенный сервер.
+    """
+    webhook = WebhookServer(received.extend, secret_token='secret', port=0).start()
+    yield webhook
+    webhook.stop()
+
+
+def test_update_is_passed_to_handlers(server: WebhookServer, received: list[types.Update]):
+    """
+    Тестирует, что обновление с верным токеном разбирается и передается обработчикам.
+    :param server: WebhookServer: Запущенный сервер.
+    :param received: list[types.Update]: Полученные обновления.
+    """
+    assert post(server, make_update_body(10)) == 200
+    server.stop()
+
+    assert [update.update_id for update in received] == [10]
+    assert received[0].message.text == 'Привет'
+    assert server.stats['accepted'] == 1
+    assert server.stats['processed'] == 1
+
+
+@pytest.mark.parametrize('token', [None, 'wrong'])
+def test_wrong_secret_is_rejected(server: WebhookServer, received: list[types.Update], token: str | None):
+    """
+    Тестирует, что запрос без секретного токена или с неверным токеном отклоняется.
+    :param server: WebhookServer: Запущенный сервер.
+    :param received: list[types.Update]: Полученные обновления.
+    :param token: str | None: Секретный токен запроса.
+    """
+    assert post(server, make_update_body(1), token=token) == 403
+    server.stop()
+
+    assert received == []
+    assert server.stats['rejected'] == 1
+
+
+def test_invalid_requests_are_rejected(server: WebhookServer):
+    """
+    Тестирует ответы на некорректный JSON, некорректный Content-Length, неизвестный путь
+    и слишком большое тело запроса.
+    :param server: WebhookServer: Запущенный сервер.
+    """
+    server.max_body_size = 1024
+
+    assert post(server, b'not json') == 400
+    assert post(server, make_update_body(1), extra_headers={'Content-Length': 'abc'}) == 400
+    assert post(server, make_update_body(1), path='/other') == 404
+    assert post(server, b'{' + b' ' * 2048 + b'}') == 413
+
+
+def test_full_queue_answers_503():
+    """ Тестирует, что при переполнении очереди обновление не принимается и Telegram получает 503. """
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_process(updates: list[types.Update]):
+        started.set()
+        release.wait(5)
+
+    webhook = WebhookServer(slow_process, port=0, max_queue_size=1).start()
+    try:
+        statuses = [post(webhook, make_update_body(1), token=None)]
+        # Первое обновление забрал обработчик, второе ждет в очереди, третье отклоняется
+        assert started.wait(5)
+        statuses += [post(webhook, make_update_body(i), token=None) for i in (2, 3)]
+    finally:
+        release.set()
+        webhook.stop()
+
+    assert statuses == [200, 200, 503]
+    assert webhook.stats['dropped'] == 1
+    assert webhook.stats['processed'] == 2
+
+
+def test_handler_error_does_not_stop_worker():
+    """ Тестирует, что ошибка обработчика не останавливает обработку следующих обновлений. """
+    processed = []
+
+    def process_updates(updates: list[types.Update]):
+        if updates[0].update_id == 1:
+            raise RuntimeError('сбой обработчика')
+        processed.extend(updates)
+
+    webhook = WebhookServer(process_updates, port=0).start()
+    post(webhook, make_update_body(1), token=None)
+    post(webhook, make_update_body(2), token=None)
+    webhook.stop()
+
+    assert [update.update_id for update in processed] == [2]
+    assert webhook.stats['processed'] == 2
+
+
+def test_constructor_rejects_non_positive_limits():
+    """ Тестирует, что пустая очередь или отсутствие обработчиков очереди отклоняются. """
+    with pytest.raises(ValueError):
+        WebhookServer(print, max_queue_size=0)
+    with pytest.raises(ValueError):
+        WebhookServer(print, workers=0)
@@ -0,0 +1,190 @@
+import sqlite3
+import logging
+import threading
+import pytest
+
+from write_behind import WriteBehindQueue
+
+
+@pytest.fixture
+def db_file(tmp_path) -> str:
+    """
+    Предоставляет путь к временному файлу базы данных с таблицей для тестов.
+    :param tmp_path: Встроенная фикстура pytest для создания временных путей.
+    :return: str: Путь к файлу базы данных.
+    """
+    db_name = str(tmp_path/'test_write_behind.db')
+    with sqlite3.connect(db_name) as conn:
+        conn.execute('CREATE TABLE t (x INTEGER NOT NULL)')
+    conn.close()
+    return db_name
+
+
+def make_queue(db_file: str, **kwargs) -> WriteBehindQueue:
+    """
+    Создает очередь отложенной записи, открывающую новое соединение на каждую пачку.
+    :param db_file: str: Путь к файлу базы данных.
+    :return: WriteBehindQueue: Очередь отложенной записи.
+    """
+    return WriteBehindQueue(lambda: sqlite3.connect(db_file), lambda conn: conn.close(), **kwargs)
+
+
+def count_rows(db_file: str) -> int:
+    """
+    Возвращает количество строк в тестовой таблице.
+    :param db_file: str: Путь к файлу базы данных.
+    :return: int: Количество строк.
+    """
+    conn = sqlite3.connect(db_file)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM t').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_writes_are_grouped_into_batches(db_file: str):
+    """
+    Тестирует групповую фиксацию: много записей фиксируются небольшим количеством транзакций.
+    :param db_file: str: Путь к временному файлу базы данных.
+    """
+    queue = make_queue(db_file, flush_interval=10, batch_size=50)
+    for i in range(100):
+        queue.submit('INSERT INTO t VALUES (?)', (i,))
+
+    assert queue.flush(timeout=5)
+    assert count_rows(db_file) == 100
+    assert queue.batches_committed <= 3
+    queue.stop()
+
+
+def test_flush_key_only_waits_for_pending_key(db_file: str):
+    """
+    Тестирует read-your-writes: flush_key() сбрасывает очередь, только если по ключу есть изменения.
+    :param db_file: str: Путь к временному файлу базы данных.
+    """
+    queue = make_queue(db_file, flush_interval=10)
+    queue.submit('INSERT INTO t VALUES (?)', (1,), key=('t', 1))
+
+    assert not queue.has_pending(('t', 2))
+    assert queue.has_pending(('t', 1))
+    assert queue.flush_key(('t', 1), timeout=5)
+    assert not queue.has_pending(('t', 1))
+    assert count_rows(db_file) == 1
+    queue.stop()
+
+
+def test_stop_drains_queue(db_file: str):
+    """
+    Тестирует, что остановка записывает все накопленные изменения, а записи обработчиков,
+    еще работающих после остановки, выполняются сразу.
+    :param db_file: str: Путь к временному файлу базы данных.
+    """
+    queue = make_queue(db_file, flush_interval=10)
+    for i in range(10):
+        queue.submit('INSERT INTO t VALUES (?)', (i,))
+
+    queue.stop()
+
+    assert count_rows(db_file) == 10
+    queue.submit('INSERT INTO t VALUES (?)', (11,))
+    assert count_rows(db_file) == 11
+
+
+def test_failed_write_does_not_discard_batch(db_file: str, caplog: pytest.LogCaptureFixture):
+    """
+    Тестирует, что ошибочная запись не отменяет остальные записи пачки.
+    :param db_file: str: Путь к временному файлу базы данных.
+    :param caplog: pytest.LogCaptureFixture: Фикстура pytest для перехвата сообщений логгера.
+    """
+    # Логгер приложения может не передавать записи корневому логгеру, поэтому подключаем обработчик caplog напрямую
+    write_behind_logger = logging.getLogger('my_app.write_behind')
+    write_behind_logger.addHandler(caplog.handler)
+    caplog.set_level(logging.WARNING, logger='my_app.write_behind')
+    queue = make_queue(db_file, flush_interval=10)
+    queue.submit('INSERT INTO t VALUES (?)', (1,))
+    # Нарушение NOT NULL
+    queue.submit('INSERT INTO t VALUES (?)', (None,))
+    queue.submit('INSERT INTO t VALUES (?)', (3,))
+
+    assert queue.flush(timeout=5)
+    queue.stop()
+    write_behind_logger.removeHandler(caplog.handler)
+
+    assert count_rows(db_file) == 2
+    assert 'Ошибка при групповой записи' in caplog.text
+    assert 'Ошибка при отложенной записи' in caplog.text
+
+
+def test_submit_blocks_when_queue_is_full(db_file: str):
+    """
+    Тестирует ограничение очереди: при переполнении submit() ждет, пока фоновый поток запишет пачку.
+    :param db_file: str: Путь к временному файлу базы данных.
+    """
+    release_writer = threading.Event()
+
+    def get_connection() -> sqlite3.Connection:
+        # Задерживаем фоновый поток, чтобы очередь успела заполниться
+        release_writer.wait(5)
+        return sqlite3.connect(db_file)
+
+    queue = WriteBehindQueue(get_connection, lambda conn: conn.close(), flush_interval=0, max_pending=2)
+    submitted = threading.Event()
+
+    def producer():
+        for i in range(5):
+            queue.submit('INSERT INTO t VALUES (?)', (i,))
+        submitted.set()
+
+    thread = threading.Thread(target=producer)
+    thread.start()
+
+    assert not submitted.wait(0.2)
+    release_writer.set()
+    thread.join(5)
+    assert submitted.is_set()
+    queue.stop()
+    assert count_rows(db_file) == 5
+
+
+def test_unexpected_error_does_not_stop_writer(db_file: str):
+    """
+    Тестирует, что ошибка вне SQLite (например, при получении соединения) не останавливает фоновый поток
+    и не блокирует ожидающих flush().
+    :param db_file: str: Путь к временному файлу базы данных.
+    """
+    failures = [RuntimeError('Пул соединений закрыт')]
+
+    def get_connection() -> sqlite3.Connection:
+        if failures:
+            raise failures.pop()
+        return sqlite3.connect(db_file)
+
+    queue = WriteBehindQueue(get_connection, lambda conn: conn.close(), flush_interval=0)
+    queue.submit('INSERT INTO t VALUES (?)', (1,), key='lost')
+
+    assert queue.flush(timeout=5)
+    assert not queue.has_pending('lost')
+    queue.submit('INSERT INTO t VALUES (?)', (2,))
+    assert queue.flush(timeout=5)
+    queue.stop()
+    assert count_rows(db_file) == 1
+
+
+def test_flush_key_wait_is_bounded(db_file: str):
+    """
+    Тестирует, что чтение не ждет записи своих изменений дольше заданного времени.
+    :param db_file: str: Путь к временному файлу базы данных.
+    """
+    release_writer = threading.Event()
+
+    def get_connection() -> sqlite3.Connection:
+        release_writer.wait(5)
+        return sqlite3.connect(db_file)
+
+    queue = WriteBehindQueue(get_connection, lambda conn: conn.close(), flush_interval=0)
+    queue.submit('INSERT INTO t VALUES (?)', (1,), key='user')
+
+    assert queue.flush_key('user', timeout=0.1) is False
+    release_writer.set()
+    assert queue.flush_key('user', timeout=5) is True
+    queue.stop()
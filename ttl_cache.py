@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class TTLCache:
+    """
+    Потокобезопасный LRU-кэш ограниченного размера со временем жизни записей.
+
+    При превышении max_size вытесняется запись, к которой дольше всего не обращались.
+    Запись старше ttl секунд считается отсутствующей и удаляется при обращении.
+    Счетчики попаданий, промахов и вытеснений доступны через stats().
+
+    Attributes:
+        max_size (int): Максимальное количество записей.
+        ttl (float | None): Время жизни записи в секундах (None - без ограничения).
+        hits (int): Количество попаданий.
+        misses (int): Количество промахов (включая устаревшие записи).
+        evictions (int): Количество записей, вытесненных из-за переполнения или устаревания.
+    """
+    def __init__(self, max_size: int = 10000, ttl: float | None = 3600.0,
+                 clock: Callable[[], float] = time.monotonic):
+        if max_size < 1:
+            raise ValueError('max_size должен быть больше нуля.')
+        self.max_size: int = max_size
+        self.ttl: float | None = ttl
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+        # ключ -> (значение, время записи); порядок - от давно использованных к недавним
+        self._data: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Возвращает количество записей в кэше (включая еще не удаленные устаревшие)."""
+        with self._lock:
+            return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Проверяет наличие актуальной записи, не изменяя счетчики и порядок LRU."""
+        with self._lock:
+            item = self._data.get(key)
+            return item is not None and not self._is_expired(item[1])
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Возвращает значение по ключу и отмечает запись как недавно использованную.
+        :param key: Hashable: Ключ записи.
+        :param default: Any: Значение, возвращаемое при промахе.
+        :return: Any: Значение из кэша или default.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            if self._is_expired(item[1]):
+                del self._data[key]
+                self.misses += 1
+                self.evictions += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key: Hashable, value: Any):
+        """
+        Сохраняет значение и при переполнении вытесняет давно не использованные записи.
+        :param key: Hashable: Ключ записи.
+        :param value: Any: Значение.
+        """
+        with self._lock:
+            self._data[key] = (value, self._clock())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Удаляет запись (например, при изменении данных в БД), не изменяя счетчики.
+        :param key: Hashable: Ключ записи.
+        :param default: Any: Значение, возвращаемое, если записи нет.
+        :return: Any: Удаленное значение или default.
+        """
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[0]
+
+    def clear(self):
+        """Удаляет все записи из кэша. Счетчики сохраняются."""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict[str, int]:
+        """
+        Возвращает счетчики работы кэша.
+        :return: dict[str, int]: Размер кэша, количество попаданий, промахов и вытеснений.
+        """
+        with self._lock:
+            return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def _is_expired(self, stored_at: float) -> bool:
+        """Проверяет, истекло ли время жизни записи. Вызывается под self._lock."""
+        return self.ttl is not None and self._clock() - stored_at >= self.ttl
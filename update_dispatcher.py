@@ -0,0 +1,154 @@
+import time
+import queue
+import logging
+import threading
+from typing import Callable
+
+from telebot import TeleBot, types
+
+# Получение экземпляра логгера
+logger = logging.getLogger(f'my_app.{__name__}')
+
+
+def update_chat_id(update: types.Update) -> int | None:
+    """
+    Определяет ID чата, к которому относится обновление.
+    :param update: types.Update: Обновление Telegram.
+    :return: int | None: ID чата (для нажатия кнопки - чат сообщения с кнопкой или пользователь), None, если чата нет.
+    """
+    message = update.message or update.edited_message
+    if message is not None:
+        return message.chat.id
+    call = update.callback_query
+    if call is not None:
+        return call.message.chat.id if call.message is not None else call.from_user.id
+    return None
+
+
+class _WorkerQueue:
+    """Очередь одного обработчика со счетчиками времени ожидания."""
+    def __init__(self, max_size: int):
+        # Элементы очереди: (время постановки в очередь, обновление); None - сигнал остановки
+        self.items: queue.Queue[tuple[float, types.Update] | None] = queue.Queue(maxsize=max_size)
+        self.lock = threading.Lock()
+        self.processed: int = 0
+        self.total_wait: float = 0.0
+        self.max_wait: float = 0.0
+
+    def record_wait(self, wait: float):
+        """Учитывает время ожидания обновления в очереди."""
+        with self.lock:
+            self.processed += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+
+class OrderedUpdateDispatcher:
+    """
+    Пул обработчиков обновлений с сохранением порядка для каждого пользователя.
+
+    Обновление направляется в одну из workers очередей по ID чата (chat_id % workers), у каждой очереди
+    свой поток. Поэтому обновления одного пользователя (например, "Сладких снов" и сразу "Я проснулся")
+    обрабатываются строго по очереди, а обновления разных пользователей - параллельно, и медленный чат
+    задерживает только пользователей своей очереди. Обновления без чата распределяются по update_id.
+
+    Очереди ограничены (max_queue_size); если очередь заполнена, submit() ждет, притормаживая получение
+    новых обновлений. Глубина каждой очереди и время ожидания в ней доступны через stats().
+
+    Attributes:
+        workers (int): Количество очередей и потоков-обработчиков.
+        max_queue_size (int): Максимальное количество обновлений в одной очереди.
+    """
+    def __init__(self, process_updates: Callable[[list[types.Update]], None], workers: int = 8,
+                 max_queue_size: int = 1000):
+        if workers < 1 or max_queue_size < 1:
+            raise ValueError('workers и max_queue_size должны быть больше нуля.')
+        self.workers: int = workers
+        self.max_queue_size: int = max_queue_size
+        self._process_updates = process_updates
+        self._queues = [_WorkerQueue(max_queue_size) for _ in range(workers)]
+        self._stopping: bool = False
+        self._threads = [threading.Thread(target=self._run, args=(worker_queue,), name=f'update-worker-{i}',
+                                          daemon=True)
+                         for i, worker_queue in enumerate(self._queues)]
+        for thread in self._threads:
+            thread.start()
+
+    @classmethod
+    def install(cls, bot: TeleBot, workers: int = 8, max_queue_size: int = 1000) -> 'OrderedUpdateDispatcher':
+        """
+        Подключает диспетчер к синхронному боту: все обновления (polling или webhook) проходят через его очереди.
+        Обработчики бота выполняются прямо в потоке очереди, поэтому собственный пул потоков бота отключается.
+        :param bot: TeleBot: Бот с зарегистрированными обработчиками.
+        :param workers: int: Количество очередей и потоков-обработчиков.
+        :param max_queue_size: int: Максимальное количество обновлений в одной очереди.
+        :return: OrderedUpdateDispatcher: Запущенный диспетчер.
+        """
+        dispatcher = cls(bot.process_new_updates, workers=workers, max_queue_size=max_queue_size)
+        bot.threaded = False
+        bot.process_new_updates = dispatcher.submit
+        logger.info(f'Обновления распределяются по {workers} очередям с сохранением порядка для каждого чата.')
+        return dispatcher
+
+    def submit(self, updates: list[types.Update]):
+        """
+        Ставит обновления в очереди их чатов. Если очередь заполнена, ждет освобождения места.
+        :param updates: list[types.Update]: Обновления Telegram.
+        """
+        if self._stopping:
+            raise RuntimeError('Диспетчер обновлений остановлен.')
+        for update in updates:
+            chat_id = update_chat_id(update)
+            key = chat_id if chat_id is not None else update.update_id
+            self._queues[key % self.workers].items.put((time.monotonic(), update))
+
+    def queue_for(self, chat_id: int) -> int:
+        """
+        Возвращает номер очереди, в которую попадают обновления чата.
+        :param chat_id: int: ID чата.
+        :return: int: Номер очереди.
+        """
+        return chat_id % self.workers
+
+    def stats(self) -> list[dict[str, float]]:
+        """
+        Возвращает метрики очередей.
+        :return: list[dict[str, float]]: Для каждой очереди: глубина (depth), количество обработанных
+            обновлений (processed), среднее и максимальное время ожидания в секундах (avg_wait, max_wait).
+        """
+        result = []
+        for worker_queue in self._queues:
+            with worker_queue.lock:
+                processed = worker_queue.processed
+                result.append({'depth': worker_queue.items.qsize(), 'processed': processed,
+                               'avg_wait': worker_queue.total_wait / processed if processed else 0.0,
+                               'max_wait': worker_queue.max_wait})
+        return result
+
+    def stop(self, timeout: float | None = 10.0):
+        """
+        Останавливает потоки после обработки обновлений, уже поставленных в очереди.
+        :param timeout: float | None: Максимальное время ожидания каждого потока в секундах.
+        """
+        if self._stopping:
+            return
+        self._stopping = True
+        for worker_queue in self._queues:
+            worker_queue.items.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        logger.info(f'Диспетчер обновлений остановлен, обработано обновлений: '
+                    f'{sum(worker_queue.processed for worker_queue in self._queues)}.')
+
+    def _run(self, worker_queue: _WorkerQueue):
+        """Цикл потока очереди: по одному передает обновления обработчикам бота."""
+        while True:
+            item = worker_queue.items.get()
+            if item is None:
+                return
+            enqueued_at, update = item
+            worker_queue.record_wait(time.monotonic() - enqueued_at)
+            try:
+                self._process_updates([update])
+            except Exception as e:
+                logger.error(f'Ошибка при обработке обновления {update.update_id}: {e}', exc_info=True)
@@ -0,0 +1,227 @@
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Callable
+
+from telebot import TeleBot, types
+
+from connection_pool import ConnectionPool, DEFAULT_PRAGMAS, apply_pragmas
+
+# Получение экземпляра логгера
+logger = logging.getLogger(f'my_app.{__name__}')
+
+# После недели без обновлений Telegram выбирает ID следующего обновления случайно, а не по порядку
+UPDATE_ID_RESET_AGE = 7 * 24 * 3600
+
+
+class RecentUpdateIds:
+    """
+    Скользящее окно ID последних обновлений в виде битовой карты.
+
+    Бит i означает, что обновление с ID (high - i) уже получено, где high - наибольший полученный ID.
+    Окно из window ID занимает window бит, а проверка и добавление - несколько операций с целым числом
+    независимо от количества обработанных обновлений. ID старше окна считаются уже полученными.
+
+    Attributes:
+        window (int): Размер окна (количество последних ID).
+        high (int): Наибольший полученный ID (0, если обновлений еще не было).
+    """
+    def __init__(self, window: int = 4096, high: int = 0):
+        if window < 1:
+            raise ValueError('window должен быть больше нуля.')
+        self.window: int = window
+        self.high: int = high
+        self._mask: int = (1 << window) - 1
+        # Все ID не больше high (например, сохраненного смещения) считаются полученными
+        self._bits: int = self._mask if high else 0
+
+    def add(self, update_id: int) -> bool:
+        """
+        Отмечает ID обновления как полученный.
+        :param update_id: int: ID обновления.
+        :return: bool: True, если обновление получено впервые, False - если это повторная доставка.
+        """
+        if update_id > self.high:
+            self._bits = ((self._bits << (update_id - self.high)) | 1) & self._mask
+            self.high = update_id
+            return True
+        age = self.high - update_id
+        if age >= self.window or self._bits >> age & 1:
+            return False
+        self._bits |= 1 << age
+        return True
+
+
+class UpdateOffsetStore:
+    """
+    Хранит ID последнего обработанного обновления и время его сохранения в таблице SQLite bot_state.
+    Таблицу создает миграция схемы БД (DatabaseManager).
+
+    Attributes:
+        db_name (str): Путь к файлу базы данных SQLite.
+        pool (ConnectionPool | None): Пул постоянных соединений или None для режима "соединение на запрос".
+        name (str): Имя записи (позволяет хранить смещения нескольких ботов в одной БД).
+    """
+    def __init__(self, db_name: str = 'sleep_tracker.db', pool: ConnectionPool | None = None,
+                 name: str = 'last_update_id', pragmas: dict[str, str | int] | None = None,
+                 clock: Callable[[], float] = time.time):
+        self.db_name: str = db_name
+        self.pool: ConnectionPool | None = pool
+        self.name: str = name
+        self._clock = clock
+        # journal_mode устанавливает DatabaseManager, остальные настройки действуют только на соединение
+        self._pragmas = {key: value for key, value in (DEFAULT_PRAGMAS if pragmas is None else pragmas).items()
+                         if key != 'journal_mode'}
+
+    def load(self, max_age: float | None = None) -> int:
+        """
+        Возвращает ID последнего обработанного обновления.
+        :param max_age: float | None: Если смещение сохранено раньше, чем max_age секунд назад, оно не используется.
+        :return: int: ID обновления (0, если он еще не сохранялся или устарел).
+        """
+        rows = dict(self._execute(lambda conn: conn.execute('SELECT name, value FROM bot_state WHERE name IN (?, ?)',
+                                                            (self.name, self._saved_at_name)).fetchall()))
+        update_id = rows.get(self.name, 0)
+        saved_at = rows.get(self._saved_at_name)
+        if update_id and max_age is not None and saved_at is not None and self._clock() - saved_at > max_age:
+            logger.info(f'Смещение {update_id} сохранено более {max_age:.0f} с назад и не используется: '
+                        f'Telegram мог начать нумерацию обновлений заново.')
+            return 0
+        return update_id
+
+    def save(self, update_id: int):
+        """
+        Сохраняет ID последнего обработанного обновления (меньшее значение не заменяет большее).
+        :param update_id: int: ID обновления.
+        """
+        self._write(update_id, 'MAX(value, excluded.value)')
+
+    def reset(self, update_id: int = 0):
+        """
+        Заменяет сохраненное смещение, в том числе меньшим значением (после того как Telegram начал нумерацию заново).
+        :param update_id: int: ID обновления.
+        """
+        self._write(update_id, 'excluded.value')
+
+    @property
+    def _saved_at_name(self) -> str:
+        """Имя записи со временем сохранения смещения."""
+        return f'{self.name}_saved_at'
+
+    def _write(self, update_id: int, update_value: str):
+        """Записывает смещение (значение при конфликте задает update_value) и время записи."""
+        def write(conn: sqlite3.Connection):
+            with conn:
+                conn.execute('INSERT INTO bot_state (name, value) VALUES (?, ?) '
+                             f'ON CONFLICT (name) DO UPDATE SET value = {update_value}', (self.name, update_id))
+                conn.execute('INSERT OR REPLACE INTO bot_state (name, value) VALUES (?, ?)',
+                             (self._saved_at_name, int(self._clock())))
+        self._execute(write)
+
+    def _execute(self, operation: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Выполняет операцию на соединении из пула или на новом соединении, которое затем закрывается."""
+        if self.pool is not None:
+            conn = self.pool.acquire(self.db_name, self._pragmas)
+            try:
+                return operation(conn)
+            finally:
+                self.pool.release(conn)
+        conn = sqlite3.connect(self.db_name)
+        try:
+            apply_pragmas(conn, self._pragmas)
+            return operation(conn)
+        finally:
+            conn.close()
+
+
+class DurableUpdateFilter:
+    """
+    Отбрасывает повторно доставленные обновления и сохраняет смещение long polling между запусками.
+
+    telebot запоминает ID последнего обновления только в памяти, и при перезапуске (или повторе get_updates,
+    пока обновления еще обрабатываются в очередях OrderedUpdateDispatcher) те же обновления могут быть
+    обработаны повторно: например, открыть вторую сессию сна. DurableUpdateFilter при получении пачки
+    обновлений отбрасывает уже полученные (RecentUpdateIds), сразу продвигает bot.last_update_id, передает
+    новые обновления дальше и после этого сохраняет ID последнего из них (UpdateOffsetStore). При запуске
+    polling продолжается с сохраненного смещения, а повторная доставка стоит одной проверки бита
+    вместо обработчика и запросов к БД.
+
+    Смещение сохраняется после передачи пачки обработчикам (с OrderedUpdateDispatcher - после постановки
+    в очереди): обновления, не дошедшие до обработчиков из-за аварийной остановки процесса, Telegram доставит
+    повторно. Если ID обновлений начались заново (после недели без обновлений Telegram выбирает их случайно),
+    окно повторов и смещение сбрасываются, а смещение старше недели при запуске не используется.
+
+    Attributes:
+        stats (dict[str, int]): Количество полученных (received) и отброшенных повторных (duplicates) обновлений,
+            сбросов нумерации (resets) и ID последнего принятого обновления (last_update_id).
+    """
+    def __init__(self, process_updates: Callable[[list[types.Update]], None], store: UpdateOffsetStore,
+                 window: int = 4096):
+        self._process_updates = process_updates
+        self._store = store
+        self._lock = threading.Lock()
+        offset = store.load(max_age=UPDATE_ID_RESET_AGE)
+        self._recent = RecentUpdateIds(window, high=offset)
+        self.stats: dict[str, int] = {'received': 0, 'duplicates': 0, 'resets': 0, 'last_update_id': offset}
+
+    @classmethod
+    def install(cls, bot: TeleBot, store: UpdateOffsetStore, window: int = 4096) -> 'DurableUpdateFilter':
+        """
+        Подключает фильтр к боту: оборачивает process_new_updates и восстанавливает смещение polling.
+        :param bot: TeleBot: Бот (обработчики и другие обертки process_new_updates уже подключены).
+        :param store: UpdateOffsetStore: Хранилище смещения.
+        :param window: int: Размер окна ID для поиска повторных доставок.
+        :return: DurableUpdateFilter: Подключенный фильтр.
+        """
+        update_filter = cls(bot.process_new_updates, store, window=window)
+
+        def process_new(updates: list[types.Update]):
+            try:
+                update_filter.process_updates(updates)
+            finally:
+                # Следующий get_updates запросит обновления после принятых, даже если они еще в очередях
+                # (после сброса нумерации смещение уменьшается)
+                bot.last_update_id = update_filter.stats['last_update_id']
+        bot.last_update_id = update_filter.stats['last_update_id']
+        bot.process_new_updates = process_new
+        logger.info(f'Обработка обновлений продолжается после ID {bot.last_update_id}, '
+                    f'повторные доставки отбрасываются (окно {window}).')
+        return update_filter
+
+    def accept(self, updates: list[types.Update]) -> list[types.Update]:
+        """
+        Отбирает впервые полученные обновления. Если ID пачки намного меньше уже полученных (Telegram начал
+        нумерацию заново), сбрасывает окно повторов и сохраненное смещение.
+        :param updates: list[types.Update]: Полученные обновления.
+        :return: list[types.Update]: Обновления, которые нужно обработать.
+        """
+        with self._lock:
+            if updates and min(update.update_id for update in updates) < self._recent.high - self._recent.window:
+                logger.warning(f'ID обновлений начались заново (после {self._recent.high}): '
+                               f'окно повторов и смещение сброшены.')
+                self._recent = RecentUpdateIds(self._recent.window)
+                self._store.reset()
+                self.stats['resets'] += 1
+            fresh = [update for update in updates if self._recent.add(update.update_id)]
+            duplicates = len(updates) - len(fresh)
+            self.stats['received'] += len(updates)
+            self.stats['duplicates'] += duplicates
+            self.stats['last_update_id'] = self._recent.high
+        if duplicates:
+            logger.info(f'Отброшено повторно доставленных обновлений: {duplicates}.')
+        return fresh
+
+    def process_updates(self, updates: list[types.Update]):
+        """
+        Передает дальше только впервые полученные обновления и после этого сохраняет ID последнего из них.
+        :param updates: list[types.Update]: Полученные обновления.
+        """
+        fresh = self.accept(updates)
+        if not fresh:
+            return
+        try:
+            self._process_updates(fresh)
+        finally:
+            # Ошибка обработчика не возвращает пачку: повторная обработка могла бы повторить ее действия
+            self._store.save(max(update.update_id for update in fresh))
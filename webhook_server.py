@@ -0,0 +1,196 @@
+import hmac
+import json
+import queue
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+from telebot import types
+
+# Получение экземпляра логгера
+logger = logging.getLogger(f'my_app.{__name__}')
+
+# Заголовок, в котором Telegram передает секретный токен, указанный в setWebhook
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class _WebhookRequestHandler(BaseHTTPRequestHandler):
+    """Обработчик HTTP-запросов от Telegram: проверяет запрос и ставит обновление в очередь."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server: WebhookServer = self.server.webhook
+        if self.path.split('?', 1)[0] != server.path:
+            self._reply(404)
+            return
+        if not server.check_secret(self.headers.get(SECRET_HEADER)):
+            server.count('rejected')
+            logger.warning(f'Webhook: отклонен запрос с неверным секретным токеном от {self.client_address[0]}.')
+            self._reply(403)
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            server.count('rejected')
+            logger.warning(f'Webhook: некорректный заголовок Content-Length от {self.client_address[0]}.')
+            # Тело запроса не прочитано, поэтому соединение дальше не используется
+            self.close_connection = True
+            self._reply(400)
+            return
+        if length <= 0 or length > server.max_body_size:
+            server.count('rejected')
+            self._reply(413 if length > 0 else 400)
+            return
+        try:
+            update = types.Update.de_json(json.loads(self.rfile.read(length)))
+        except (ValueError, TypeError, KeyError) as e:
+            server.count('rejected')
+            logger.warning(f'Webhook: некорректное обновление: {e}')
+            self._reply(400)
+            return
+        # Переполненная очередь - ответ 503: Telegram повторит доставку позже
+        self._reply(200 if server.enqueue(update) else 503)
+
+    def do_GET(self):
+        self._reply(405)
+
+    def _reply(self, status: int):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        # Журнал каждого запроса не нужен
+        pass
+
+
+class WebhookServer:
+    """
+    Легковесный HTTP-сервер для приема обновлений Telegram в режиме webhook.
+
+    Каждый POST-запрос на path проверяется по секретному токену (заголовок X-Telegram-Bot-Api-Secret-Token),
+    тело разбирается в types.Update и ставится в ограниченную очередь (max_queue_size), после чего Telegram
+    сразу получает ответ 200. Фоновые потоки (workers) забирают обновления из очереди и передают их
+    в process_updates (обычно TeleBot.process_new_updates). Если очередь переполнена, запрос получает
+    ответ 503, и Telegram повторяет доставку позже, поэтому память сервера не растет при всплеске нагрузки.
+
+    Attributes:
+        host (str): Адрес, на котором сервер принимает соединения.
+        port (int): Порт сервера (0 - любой свободный, фактический порт доступен после start()).
+        path (str): Путь, на который Telegram отправляет обновления.
+        max_queue_size (int): Максимальное количество обновлений, ожидающих обработки.
+        max_body_size (int): Максимальный размер тела запроса в байтах.
+        stats (dict[str, int]): Счетчики принятых (accepted), отклоненных (rejected), сброшенных
+            из-за переполнения очереди (dropped) и обработанных (processed) обновлений.
+    """
+    def __init__(self, process_updates: Callable[[list[types.Update]], None], secret_token: str | None = None,
+                 host: str = '127.0.0.1', port: int = 8443, path: str = '/webhook',
+                 max_queue_size: int = 1000, workers: int = 1, max_body_size: int = 1024 * 1024):
+        if max_queue_size < 1 or workers < 1:
+            raise ValueError('max_queue_size и workers должны быть больше нуля.')
+        self.host: str = host
+        self.port: int = port
+        self.path: str = path
+        self.max_queue_size: int = max_queue_size
+        self.max_body_size: int = max_body_size
+        self.stats: dict[str, int] = {'accepted': 0, 'rejected': 0, 'dropped': 0, 'processed': 0}
+        self._process_updates = process_updates
+        self._secret_token = secret_token
+        self._queue: queue.Queue[types.Update | None] = queue.Queue(maxsize=max_queue_size)
+        self._stats_lock = threading.Lock()
+        self._server: ThreadingHTTPServer | None = None
+        self._threads: list[threading.Thread] = []
+        self._workers = workers
+
+    @property
+    def queue_depth(self) -> int:
+        """Количество обновлений, ожидающих обработки."""
+        return self._queue.qsize()
+
+    def check_secret(self, token: str | None) -> bool:
+        """
+        Проверяет секретный токен запроса (сравнение за постоянное время).
+        :param token: str | None: Значение заголовка X-Telegram-Bot-Api-Secret-Token.
+        :return: bool: True, если токен совпадает или проверка не настроена.
+        """
+        if not self._secret_token:
+            return True
+        return token is not None and hmac.compare_digest(token.encode(), self._secret_token.encode())
+
+    def enqueue(self, update: types.Update) -> bool:
+        """
+        Ставит обновление в очередь, не дожидаясь свободного места.
+        :param update: types.Update: Обновление Telegram.
+        :return: bool: True, если обновление принято, False, если очередь переполнена.
+        """
+        try:
+            self._queue.put_nowait(update)
+        except queue.Full:
+            self.count('dropped')
+            logger.warning(f'Webhook: очередь обновлений переполнена ({self.max_queue_size}), '
+                           f'обновление {update.update_id} будет доставлено повторно.')
+            return False
+        self.count('accepted')
+        return True
+
+    def count(self, name: str):
+        """Увеличивает счетчик stats[name]."""
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def start(self) -> 'WebhookServer':
+        """Запускает обработчики очереди и HTTP-сервер в фоновых потоках."""
+        self._server = ThreadingHTTPServer((self.host, self.port), _WebhookRequestHandler)
+        self._server.daemon_threads = True
+        self._server.webhook = self
+        self.port = self._server.server_address[1]
+        if not self._secret_token:
+            logger.warning('Webhook-сервер принимает запросы без проверки секретного токена.')
+        self._threads = [threading.Thread(target=self._run_worker, name=f'webhook-worker-{i}', daemon=True)
+                         for i in range(self._workers)]
+        self._threads.append(threading.Thread(target=self._server.serve_forever, name='webhook-server', daemon=True))
+        for thread in self._threads:
+            thread.start()
+        logger.info(f'Webhook-сервер принимает обновления на http://{self.host}:{self.port}{self.path}.')
+        return self
+
+    def serve_forever(self):
+        """Запускает сервер и блокирует вызывающий поток до остановки (Ctrl+C)."""
+        self.start()
+        try:
+            for thread in self._threads:
+                thread.join()
+        except KeyboardInterrupt:
+            logger.info('Webhook-сервер остановлен пользователем.')
+        finally:
+            self.stop()
+
+    def stop(self, timeout: float | None = 10.0):
+        """
+        Прекращает прием запросов и ждет обработки обновлений, уже поставленных в очередь.
+        :param timeout: float | None: Максимальное время ожидания каждого потока в секундах.
+        """
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        for _ in range(self._workers):
+            self._queue.put(None)
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
+        logger.info(f'Webhook-сервер остановлен: {self.stats}.')
+
+    def _run_worker(self):
+        """Цикл фонового потока: передает обновления из очереди обработчикам бота."""
+        while True:
+            update = self._queue.get()
+            if update is None:
+                return
+            try:
+                self._process_updates([update])
+            except Exception as e:
+                logger.error(f'Webhook: ошибка при обработке обновления {update.update_id}: {e}', exc_info=True)
+            self.count('processed')
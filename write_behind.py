@@ -0,0 +1,232 @@
+import sqlite3
+import logging
+import threading
+import time
+from collections import Counter, deque
+from typing import Callable, Hashable
+
+# Получение экземпляра логгера
+logger = logging.getLogger(f'my_app.{__name__}')
+
+# Максимальное время (в секундах), которое чтение ждет записи своих изменений
+READ_FLUSH_TIMEOUT = 5.0
+
+
+class WriteBehindQueue:
+    """
+    Очередь отложенной записи с групповой фиксацией (group commit).
+
+    Низкоприоритетные записи (например, INSERT OR IGNORE пользователя или оценка качества сна) не выполняются
+    сразу, а складываются в очередь. Фоновый поток раз в flush_interval секунд (или когда набралось batch_size
+    записей) выполняет их пачкой в одной транзакции. Поэтому количество fsync растет с количеством пачек,
+    а не с количеством сообщений пользователей.
+
+    Каждая запись помечается ключом (например, ('users', user_id)). Перед чтением данных по ключу
+    вызывается flush_key(): если по этому ключу есть незаписанные изменения, очередь сбрасывается синхронно,
+    так что пользователь всегда видит свои собственные записи (read-your-writes).
+
+    Очередь не теряет записи и не блокирует потоки навсегда: ошибка пачки записывается в журнал, и фоновый поток
+    продолжает работу; если он все же завершился, оставшиеся записи выполняет вызывающий поток, а записи,
+    поставленные после начала остановки (stop), выполняются сразу, после уже накопленных.
+
+    Attributes:
+        flush_interval (float): Максимальное время (в секундах) ожидания перед записью пачки.
+        batch_size (int): Максимальное количество записей в одной транзакции.
+        max_pending (int): Максимальное количество записей в очереди; при переполнении submit() ждет.
+    """
+    def __init__(self, get_connection: Callable[[], sqlite3.Connection],
+                 release_connection: Callable[[sqlite3.Connection], None],
+                 flush_interval: float = 0.05, batch_size: int = 100, max_pending: int = 10000):
+        self.flush_interval: float = flush_interval
+        self.batch_size: int = batch_size
+        self.max_pending: int = max_pending
+        self._get_connection = get_connection
+        self._release_connection = release_connection
+        self._condition = threading.Condition()
+        # Элементы очереди: (порядковый номер, SQL-запрос, параметры, ключ)
+        self._queue: deque[tuple[int, str, tuple, Hashable]] = deque()
+        # Количество незаписанных изменений по каждому ключу (включая пачку, которая сейчас записывается)
+        self._pending_keys: Counter = Counter()
+        self._submitted_seq: int = 0
+        self._committed_seq: int = 0
+        self._batches_committed: int = 0
+        self._flush_requested: bool = False
+        self._stopping: bool = False
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    @property
+    def batches_committed(self) -> int:
+        """Количество транзакций (пачек), зафиксированных фоновым потоком."""
+        return self._batches_committed
+
+    def submit(self, sql: str, params: tuple, key: Hashable = None):
+        """
+        Ставит запись в очередь. Если очередь переполнена, ждет, пока фоновый поток ее разгрузит.
+        После начала остановки (или если фоновый поток завершился) запись выполняется сразу в вызывающем потоке.
+        :param sql: str: SQL-запрос на изменение данных.
+        :param params: tuple: Параметры запроса.
+        :param key: Hashable: Ключ данных, которые затрагивает запись (для read-your-writes).
+        """
+        with self._condition:
+            while not self._stopping and self._thread.is_alive() and len(self._queue) >= self.max_pending:
+                self._condition.wait(1.0)
+            if not self._stopping and self._thread.is_alive():
+                self._submitted_seq += 1
+                self._queue.append((self._submitted_seq, sql, params, key))
+                self._pending_keys[key] += 1
+                # Будим фоновый поток, когда появилась первая запись или набралась полная пачка
+                if len(self._queue) == 1 or len(self._queue) >= self.batch_size:
+                    self._condition.notify_all()
+                return
+        # Очередь останавливается: запись выполняется сразу, после уже накопленных записей
+        self.flush(READ_FLUSH_TIMEOUT)
+        self._write_batch([(0, sql, params, key)])
+
+    def has_pending(self, key: Hashable) -> bool:
+        """
+        Проверяет, есть ли незаписанные изменения по ключу.
+        :param key: Hashable: Ключ данных.
+        :return: bool: True, если изменения еще не зафиксированы в БД.
+        """
+        with self._condition:
+            return self._pending_keys[key] > 0
+
+    def flush_key(self, key: Hashable, timeout: float | None = READ_FLUSH_TIMEOUT) -> bool:
+        """
+        Синхронно сбрасывает очередь, только если по ключу есть незаписанные изменения.
+        :param key: Hashable: Ключ данных, которые собираются прочитать.
+        :param timeout: float | None: Максимальное время ожидания в секундах.
+        :return: bool: True, если все изменения по ключу зафиксированы, False, если истекло время ожидания
+            (чтение продолжается без них).
+        """
+        if not self.has_pending(key):
+            return True
+        if self.flush(timeout):
+            return True
+        logger.warning(f'Изменения по ключу {key!r} не записаны за {timeout} с, чтение выполняется без них.')
+        return False
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Ждет, пока все записи, поставленные в очередь до вызова, будут зафиксированы в БД.
+        :param timeout: float | None: Максимальное время ожидания в секундах.
+        :return: bool: True, если записи зафиксированы, False, если истекло время ожидания.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            target_seq = self._submitted_seq
+            self._flush_requested = True
+            self._condition.notify_all()
+            while self._committed_seq < target_seq and self._thread.is_alive():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                # Ожидание частями: фоновый поток мог завершиться, не зафиксировав записи
+                self._condition.wait(1.0 if remaining is None else min(remaining, 1.0))
+            if self._committed_seq >= target_seq:
+                return True
+        self._write_pending_here()
+        return True
+
+    def stop(self, timeout: float | None = 10.0):
+        """
+        Останавливает фоновый поток, предварительно записав все накопленные изменения.
+        :param timeout: float | None: Максимальное время ожидания в секундах.
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            # Записи, оставшиеся в очереди завершившегося с ошибкой потока
+            self._write_pending_here()
+        logger.info(f'Очередь отложенной записи остановлена, зафиксировано пачек: {self._batches_committed}.')
+
+    def _run(self):
+        """Цикл фонового потока: собирает пачку и фиксирует ее одной транзакцией."""
+        while True:
+            with self._condition:
+                while not self._queue and not self._stopping:
+                    self._condition.wait()
+                # Даем пачке набраться, если не требуется срочный сброс
+                deadline = time.monotonic() + self.flush_interval
+                while (len(self._queue) < self.batch_size and not self._stopping
+                       and not self._flush_requested):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if not self._queue and self._stopping:
+                    return
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                if not self._queue:
+                    self._flush_requested = False
+                # Место в очереди освободилось
+                self._condition.notify_all()
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    # Ошибка одной пачки не должна останавливать поток и блокировать ожидающих flush()
+                    logger.error(f'Ошибка отложенной записи, потеряно записей: {len(batch)}: {e}', exc_info=True)
+                self._mark_committed(batch)
+
+    def _mark_committed(self, batch: list[tuple[int, str, tuple, Hashable]]):
+        """Отмечает пачку как записанную и будит ожидающих flush()."""
+        with self._condition:
+            for _, _, _, key in batch:
+                self._pending_keys[key] -= 1
+                if self._pending_keys[key] <= 0:
+                    del self._pending_keys[key]
+            self._committed_seq = max(self._committed_seq, batch[-1][0])
+            self._batches_committed += 1
+            self._condition.notify_all()
+
+    def _write_pending_here(self):
+        """Записывает оставшиеся в очереди записи в вызывающем потоке (фоновый поток завершился)."""
+        with self._condition:
+            batch = list(self._queue)
+            self._queue.clear()
+            # Пачка, которую завершившийся поток не успел отметить, считается обработанной
+            self._committed_seq = max(self._committed_seq, self._submitted_seq - len(batch))
+            self._condition.notify_all()
+        if not batch:
+            return
+        logger.warning(f'Фоновый поток отложенной записи не работает, записей выполняется синхронно: {len(batch)}.')
+        try:
+            self._write_batch(batch)
+        except Exception as e:
+            logger.error(f'Ошибка отложенной записи, потеряно записей: {len(batch)}: {e}', exc_info=True)
+        self._mark_committed(batch)
+
+    def _write_batch(self, batch: list[tuple[int, str, tuple, Hashable]]):
+        """
+        Записывает пачку одной транзакцией. Если транзакция не удалась, записи выполняются по одной,
+        чтобы одна ошибочная запись не отменила остальные.
+        :param batch: list: Элементы очереди.
+        """
+        conn = None
+        try:
+            conn = self._get_connection()
+            try:
+                with conn:
+                    cursor = conn.cursor()
+                    for _, sql, params, _ in batch:
+                        cursor.execute(sql, params)
+                logger.debug(f'Зафиксирована пачка отложенных записей: {len(batch)}.')
+                return
+            except Exception as e:
+                logger.warning(f'Ошибка при групповой записи, записи будут выполнены по одной: {e}')
+            for _, sql, params, _ in batch:
+                try:
+                    with conn:
+                        conn.execute(sql, params)
+                except Exception as e:
+                    logger.error(f'Ошибка при отложенной записи ({sql.strip()}, {params}): {e}', exc_info=True)
+        except Exception as e:
+            logger.error(f'Ошибка соединения при отложенной записи, потеряно записей: {len(batch)}: {e}',
+                         exc_info=True)
+        finally:
+            if conn:
+                self._release_connection(conn)